@@ -0,0 +1,120 @@
+"""
+Benchmark importing the files of a large project into the database.
+
+Creates a project with `--files` files in an in-memory workspace (using the
+source code in this repository as realistic content), `--duplicates` of them
+already stored in the database, and imports them with
+`StateManager.import_files`, committing to an SQLite database on disk.
+Compares storing the contents one by one with `FileContent.store` (as
+before, `LegacyImport`) with storing them in bulk, and reports the number of
+SQL statements executed and the time to import and commit the files.
+
+Usage:
+
+    python -m benchmarks.bulk_file_import [--files 3000] [--duplicates 300]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from glob import glob
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import event, select
+
+from core.config import DBConfig, FileSystemType, get_config
+from core.db.models import FileContent
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.disk.vfs import VirtualFileSystem
+from core.state.state_manager import StateManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LegacyImport:
+    """The previous import loop, storing the contents one by one."""
+
+    def __init__(self, state_manager: StateManager):
+        self.state_manager = state_manager
+
+    async def import_files(self):
+        sm = self.state_manager
+        session = sm.current_session
+        for path, hash in sm.file_system.list_hashes().items():
+            content = sm.file_system.read(path)
+            result = await session.execute(select(FileContent).where(FileContent.id == hash))
+            fc = result.scalar_one_or_none()
+            if fc is None:
+                fc = FileContent(id=hash, content=content)
+                session.add(fc)
+            sm.next_state.save_file(path, fc, external=True)
+
+
+def read_sources() -> list[str]:
+    sources = []
+    for path in sorted(glob(os.path.join(ROOT, "core/**/*.py"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sources.append(f.read())
+    return sources
+
+
+async def run(db_path: str, n_files: int, n_duplicates: int, legacy: bool) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+    FileContent.cache.clear()
+
+    session_manager = SessionManager(DBConfig(url=url))
+    n_statements = 0
+
+    def count_statement(*args):
+        nonlocal n_statements
+        n_statements += 1
+
+    event.listen(session_manager.engine.sync_engine, "before_cursor_execute", count_statement)
+
+    sm = StateManager(session_manager)
+    await sm.create_project("benchmark")
+    await sm.commit()
+
+    sources = read_sources()
+    contents = {f"src/module{i % 50}/file{i}.py": f"# file {i}\n" + sources[i % len(sources)] for i in range(n_files)}
+    # Some of the contents are already in the database (eg. from another project)
+    sm.current_session.add_all(
+        FileContent(id=VirtualFileSystem.hash_string(content), content=content)
+        for content in list(contents.values())[:n_duplicates]
+    )
+    await sm.current_session.commit()
+    for path, content in contents.items():
+        sm.file_system.save(path, content)
+
+    n_statements = 0
+    t0 = perf_counter()
+    if legacy:
+        await LegacyImport(sm).import_files()
+    else:
+        await sm.import_files()
+    await sm.commit()
+    t_import = perf_counter() - t0
+
+    assert len(sm.current_state.files) == n_files
+    await sm.rollback()
+    return {"statements": n_statements, "import": t_import}
+
+
+def main(n_files: int, n_duplicates: int):
+    get_config().fs.type = FileSystemType.MEMORY
+
+    with TemporaryDirectory() as tmpdir:
+        for name, legacy in [("one by one", True), ("bulk", False)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{name}.db"), n_files, n_duplicates, legacy))
+            print(f"{name:>10}: {r['statements']:5d} SQL statements, import and commit {1000 * r['import']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=3000, help="Number of files in the project")
+    parser.add_argument("--duplicates", type=int, default=300, help="Number of contents already in the database")
+    args = parser.parse_args()
+    main(args.files, args.duplicates)
@@ -0,0 +1,140 @@
+"""
+Benchmark compression of file contents and LLM requests in the database.
+
+Creates a project with `--files` files and `--requests` LLM requests (each
+with a system prompt and a number of project files embedded in the user
+message, like the agents do), using the source code and prompts in this
+repository as realistic content, and reports the database size and the time
+to load the project with `StateManager.load_project`, both with the values
+stored uncompressed (as before) and compressed.
+
+Usage:
+
+    python -m benchmarks.compression [--files 500] [--requests 300] [--files-per-request 20]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from glob import glob
+from hashlib import sha1
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import core.db.compression
+from core.config import DBConfig, FileSystemType, get_config
+from core.db.models import Branch, File, FileContent, LLMRequest, Project, ProjectState
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.state.state_manager import StateManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_sources(pattern: str) -> list[str]:
+    sources = []
+    for path in sorted(glob(os.path.join(ROOT, pattern), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sources.append(f.read())
+    return sources
+
+
+async def populate(url: str, n_files: int, n_requests: int, files_per_request: int):
+    sources = read_sources("core/**/*.py")
+    prompts = read_sources("core/prompts/**/*.prompt")
+
+    manager = SessionManager(DBConfig(url=url))
+    session = await manager.start()
+    project = Project(name="benchmark")
+    state = ProjectState.create_initial_state(Branch(project=project))
+    session.add(state)
+
+    contents = []
+    for i in range(n_files):
+        # Make every file unique, as in a real project
+        content = f"# file {i}\n" + sources[i % len(sources)]
+        contents.append(content)
+        fc = FileContent(id=sha1(content.encode("utf-8")).hexdigest(), content=content)
+        state.files.append(File(path=f"src/module{i % 20}/file{i}.py", content=fc))
+
+    for i in range(n_requests):
+        embedded = "\n\n".join(contents[(i * 7 + j) % n_files] for j in range(files_per_request))
+        response = contents[i % n_files]
+        session.add(
+            LLMRequest(
+                branch=state.branch,
+                project_state=state,
+                agent="Developer",
+                provider="openai",
+                model="gpt-4o",
+                temperature=0.5,
+                messages=[
+                    {"role": "system", "content": prompts[i % len(prompts)]},
+                    {"role": "user", "content": f"Here are the project files:\n\n{embedded}"},
+                    {"role": "assistant", "content": response},
+                ],
+                prompts=[],
+                response=response,
+                prompt_tokens=len(embedded) // 4,
+                completion_tokens=len(response) // 4,
+                duration=1.0,
+                status="success",
+            )
+        )
+    await session.commit()
+    await manager.close()
+    return project.id
+
+
+async def load(url: str, project_id) -> float:
+    state_manager = StateManager(SessionManager(DBConfig(url=url)))
+    t0 = perf_counter()
+    state = await state_manager.load_project(project_id=project_id)
+    t = perf_counter() - t0
+    assert all(file.content.content for file in state.files)
+    await state_manager.rollback()
+    return t
+
+
+async def run(db_path: str, n_files: int, n_requests: int, files_per_request: int) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+
+    t0 = perf_counter()
+    project_id = await populate(url, n_files, n_requests, files_per_request)
+    t_populate = perf_counter() - t0
+    t_load = min([await load(url, project_id) for _ in range(5)])
+
+    return {
+        "size": os.path.getsize(db_path),
+        "populate": t_populate,
+        "load": t_load,
+    }
+
+
+def main(n_files: int, n_requests: int, files_per_request: int):
+    get_config().fs.type = FileSystemType.MEMORY
+    threshold = core.db.compression.COMPRESS_THRESHOLD
+
+    with TemporaryDirectory() as tmpdir:
+        results = {}
+        for name, compress_threshold in [("uncompressed", float("inf")), ("compressed", threshold)]:
+            # An infinite threshold stores all the values uncompressed
+            core.db.compression.COMPRESS_THRESHOLD = compress_threshold
+            db_path = os.path.join(tmpdir, f"{name}.db")
+            results[name] = r = asyncio.run(run(db_path, n_files, n_requests, files_per_request))
+            print(
+                f"{name:>12}: {r['size'] / 1024 / 1024:7.1f} MB, "
+                f"populate {r['populate']:5.2f} s, load_project {1000 * r['load']:6.1f} ms"
+            )
+
+        print(f"compression ratio: {results['uncompressed']['size'] / results['compressed']['size']:.1f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500, help="Number of files in the project")
+    parser.add_argument("--requests", type=int, default=300, help="Number of LLM requests")
+    parser.add_argument("--files-per-request", type=int, default=20, help="Number of files embedded in each request")
+    args = parser.parse_args()
+    main(args.files, args.requests, args.files_per_request)
@@ -0,0 +1,140 @@
+"""
+Benchmark conversation copying overhead in long LLM conversation loops.
+
+Simulates the `chat_with_breakdown` and `get_relevant_files` loops (large
+prompts with file contents, many LLM calls on the same growing
+conversation) against a fake LLM client, and compares the previous
+`Convo` behaviour (deep copy on every fork, request log copy on every
+attempt, line-by-line dedent of every message) with the copy-on-write `Convo`.
+
+Usage:
+
+    python -m benchmarks.convo_fork [--iterations 20] [--files 50] [--file-size 20000]
+
+Reports wall time per LLM call and peak memory allocated (via tracemalloc).
+"""
+
+import asyncio
+import tracemalloc
+from argparse import ArgumentParser
+from copy import deepcopy
+from time import perf_counter
+
+from core.config import LLMConfig, LLMProvider
+from core.llm.base import BaseLLMClient
+from core.llm.convo import Convo
+
+
+class LegacyConvo(Convo):
+    """Convo with the old semantics: plain message dicts, deep copied on fork."""
+
+    @staticmethod
+    def _dedent(text: str) -> str:
+        indent = len(text)
+        lines = text.splitlines()
+        for line in lines:
+            if line.strip():
+                indent = min(indent, len(line) - len(line.lstrip()))
+        return "\n".join(line[indent:].rstrip() for line in lines)
+
+    @property
+    def messages(self):
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages):
+        self._messages = list(messages)
+
+    def add(self, role, content, name=None):
+        message = {"role": role, "content": self._dedent(content)}
+        if name is not None:
+            message["name"] = name
+        self._messages.append(message)
+        return self
+
+    def snapshot(self):
+        return self._messages[:]
+
+    def fork(self):
+        child = LegacyConvo()
+        child.messages = deepcopy(self.messages)
+        child.prompt_log = deepcopy(self.prompt_log)
+        return child
+
+
+class FakeClient(BaseLLMClient):
+    provider = LLMProvider.ANTHROPIC
+
+    def _init_client(self):
+        pass
+
+    async def _make_request(self, convo, temperature=None, json_mode=False):
+        return "x" * 2000, 0, 0
+
+
+def make_files(n_files: int, file_size: int) -> str:
+    return "\n\n".join(
+        f"## file_{i}.js\n```\n{('// line ' + str(i) + chr(10)) * (file_size // 10)}```" for i in range(n_files)
+    )
+
+
+async def chat_with_breakdown(convo_class, llm, files: str, iterations: int) -> int:
+    convo = convo_class("You are a senior developer.").user(f"Project files:\n{files}\n\nBreak down the task.")
+    convo.assistant("Initial breakdown. " * 200)
+    calls = 0
+    for i in range(iterations):
+        if len(convo.messages) > 11:
+            convo.messages = convo.messages[:3] + convo.messages[5:]
+        convo.user(f"Please change step {i}.")
+        breakdown, _ = await llm(convo)
+        calls += 1
+        convo.assistant(breakdown)
+    return calls
+
+
+async def get_relevant_files(convo_class, llm, files: str, iterations: int) -> int:
+    convo = convo_class("You are a senior developer.").user(f"Project files:\n{files}\n\nPick the relevant files.")
+    calls = 0
+    for i in range(iterations):
+        if len(convo.messages) >= 23:
+            convo.messages = convo.messages[:2]
+        response, _ = await llm(convo, temperature=0)
+        calls += 1
+        convo.assistant(response)
+        convo.user(f"Here are the files you asked to read:\n{files[: len(files) // 10]}")
+    return calls
+
+
+async def measure(name: str, convo_class, llm, files: str, iterations: int):
+    for scenario in (chat_with_breakdown, get_relevant_files):
+        tracemalloc.start()
+        t0 = perf_counter()
+        calls = await scenario(convo_class, llm, files, iterations)
+        duration = perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{name:>14} {scenario.__name__:>20}: {1000 * duration / calls:.2f} ms/call, "
+            f"peak memory {peak / 1024 / 1024:.2f} MB"
+        )
+
+
+async def main(iterations: int, n_files: int, file_size: int):
+    files = make_files(n_files, file_size)
+    print(f"Prompt includes {len(files) / 1024:.0f} KB of file contents, {iterations} LLM calls per scenario\n")
+
+    llm = FakeClient(LLMConfig(provider=LLMProvider.ANTHROPIC, model="fake"))
+    # Warm up (the first call imports the provider SDKs)
+    await llm(Convo().user("hello"))
+
+    await measure("previous Convo", LegacyConvo, llm, files, iterations)
+    await measure("copy-on-write", Convo, llm, files, iterations)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20, help="Number of LLM calls per scenario")
+    parser.add_argument("--files", type=int, default=50, help="Number of files in the prompt")
+    parser.add_argument("--file-size", type=int, default=20000, help="Size of each file (bytes)")
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.files, args.file_size))
@@ -0,0 +1,149 @@
+"""
+Benchmark storing project files in shared file manifests.
+
+Simulates a project with `--files` files and `--steps` steps, where each
+step changes `--changes` files, committing every step to an SQLite database
+on disk, the way `StateManager` does. Compares the previous storage, where
+every state had its own `File` row for every file (`LegacyFile`), with the
+file manifests, and reports:
+
+- database size and number of rows used to store the files
+- mean and p95 commit latency
+- time to load the files of a state from the middle of the branch
+
+Usage:
+
+    python -m benchmarks.file_manifests [--files 500] [--steps 2000] [--changes 3]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from hashlib import sha1
+from statistics import mean, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from uuid import UUID
+
+from sqlalchemy import ForeignKey, UniqueConstraint, func, select
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.config import DBConfig
+from core.db.models import Base, Branch, File, FileContent, FileManifest, Project, ProjectState
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+
+
+class LegacyFile(Base):
+    """The previous File model, with a row per file in each project state."""
+
+    __tablename__ = "legacy_files"
+    __table_args__ = (UniqueConstraint("project_state_id", "path"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    project_state_id: Mapped[UUID] = mapped_column(ForeignKey("project_states.id", ondelete="CASCADE"))
+    content_id: Mapped[str] = mapped_column(ForeignKey("file_contents.id", ondelete="RESTRICT"))
+    path: Mapped[str] = mapped_column()
+    meta: Mapped[dict] = mapped_column(default=dict, server_default="{}")
+
+
+def make_content(path: str, version: int) -> FileContent:
+    content = f"// {path} v{version}\n" + "export function f(x) {\n  return x * 2;\n}\n" * 20
+    return FileContent(id=sha1(content.encode("utf-8")).hexdigest(), content=content)
+
+
+def file_paths(n_files: int) -> list[str]:
+    return [f"src/module{i % 25}/sub{i % 4}/file{i}.js" for i in range(n_files)]
+
+
+async def run(db_path: str, n_files: int, n_steps: int, n_changes: int, legacy: bool) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+
+    manager = SessionManager(DBConfig(url=url))
+    session = await manager.start()
+    if legacy:
+        await session.run_sync(lambda s: LegacyFile.__table__.create(s.connection()))
+
+    paths = file_paths(n_files)
+    contents = {path: make_content(path, 0) for path in paths}
+    session.add_all(contents.values())
+
+    state = ProjectState.create_initial_state(Branch(project=Project(name="benchmark")))
+    session.add(state)
+    if not legacy:
+        state.files = [File(path=path, content=fc) for path, fc in contents.items()]
+    await session.commit()
+    if legacy:
+        session.add_all(
+            LegacyFile(project_state_id=state.id, content_id=fc.id, path=path) for path, fc in contents.items()
+        )
+        await session.commit()
+
+    latencies = []
+    for i in range(n_steps):
+        state = await state.create_next_state()
+        for j in range(n_changes):
+            path = paths[(i * n_changes + j) * 7 % n_files]
+            fc = make_content(path, i + 1)
+            session.add(fc)
+            if legacy:
+                contents[path] = fc
+            else:
+                state.get_file_by_path(path).content = fc
+
+        t0 = perf_counter()
+        if legacy:
+            # Flush the state first, so its ID can be used in the file rows (as was done by the relationship)
+            await session.flush()
+            session.add_all(
+                LegacyFile(project_state_id=state.id, content_id=fc.id, path=path) for path, fc in contents.items()
+            )
+        await session.commit()
+        latencies.append(perf_counter() - t0)
+
+        # Keep only the current state in the session, like StateManager does
+        session.expunge_all()
+        session.add(state)
+
+    session.expunge_all()
+    middle = (await session.execute(select(ProjectState).where(ProjectState.step_index == n_steps // 2))).scalar_one()
+    t0 = perf_counter()
+    if legacy:
+        result = await session.execute(select(LegacyFile).where(LegacyFile.project_state_id == middle.id))
+        n_loaded = len(result.scalars().all())
+    else:
+        n_loaded = len(await middle.awaitable_attrs.files)
+    t_load = perf_counter() - t0
+    assert n_loaded == n_files
+
+    model = LegacyFile if legacy else FileManifest
+    n_rows = (await session.execute(select(func.count()).select_from(model))).scalar_one()
+    await manager.close()
+
+    return {
+        "size": os.path.getsize(db_path),
+        "rows": n_rows,
+        "mean": mean(latencies),
+        "p95": quantiles(latencies, n=20)[-1],
+        "load": t_load,
+    }
+
+
+def main(n_files: int, n_steps: int, n_changes: int):
+    with TemporaryDirectory() as tmpdir:
+        for name, legacy in [("file rows", True), ("manifests", False)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{name}.db"), n_files, n_steps, n_changes, legacy))
+            print(
+                f"{name:>9}: {r['size'] / 1024 / 1024:7.1f} MB, {r['rows']:8d} rows, "
+                f"commit {1000 * r['mean']:6.2f} ms mean {1000 * r['p95']:6.2f} ms p95, load {1000 * r['load']:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500, help="Number of files in the project")
+    parser.add_argument("--steps", type=int, default=2000, help="Number of steps in the project")
+    parser.add_argument("--changes", type=int, default=3, help="Number of files changed in each step")
+    args = parser.parse_args()
+    main(args.files, args.steps, args.changes)
@@ -0,0 +1,121 @@
+"""
+Benchmark the database size and project loading time of a long-lived project.
+
+Simulates `--steps` agent steps on a project with `--files` files, stored
+in an SQLite database on disk. Every step logs an LLM request and a command
+run, and changes a file; every `--task-steps` steps a task is finished.
+Compares keeping the whole history (as before) with compacting it
+periodically (see `Branch.compact()`), and reports the number of stored
+project states, the database size and the time to load the project.
+
+Usage:
+
+    python -m benchmarks.history_compaction [--files 500] [--steps 1000] [--task-steps 50]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import func, select, text
+
+from core.config import DBConfig, FileSystemType, LLMProvider, get_config
+from core.db.models import FileContent, ProjectState
+from core.db.models.project_state import TaskStatus
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.llm.request_log import LLMRequestLog
+from core.proc.exec_log import ExecLog
+from core.state.state_manager import StateManager
+
+
+def file_content(path: str, version: int) -> str:
+    return f"// {path} v{version}\n" + "export function f(x) {\n  return x * 2;\n}\n" * 20
+
+
+async def run(db_path: str, n_files: int, n_steps: int, task_steps: int, compact: bool) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+    FileContent.cache.clear()
+    get_config().history.compact_interval = 50 if compact else 0
+
+    sm = StateManager(SessionManager(DBConfig(url=url)))
+    project = await sm.create_project("benchmark")
+    project_id = project.id
+    await sm.commit()
+    paths = [f"src/module{i % 25}/file{i}.js" for i in range(n_files)]
+    await sm.save_files({path: file_content(path, 0) for path in paths})
+    sm.next_state.tasks = [
+        {"description": f"Task {i}", "status": TaskStatus.TODO} for i in range(n_steps // task_steps + 1)
+    ]
+    await sm.commit()
+
+    for i in range(n_steps):
+        request_log = LLMRequestLog(
+            provider=LLMProvider.OPENAI,
+            model="gpt-4o",
+            temperature=0.5,
+            messages=[{"role": "user", "content": f"Implement step {i}\n" + file_content(paths[0], i)}],
+            response=file_content(paths[0], i),
+        )
+        await sm.log_llm_request(request_log)
+        exec_log = ExecLog(
+            duration=1.0,
+            cmd="npm test",
+            cwd=".",
+            timeout=None,
+            env={},
+            status_code=0,
+            stdout="ok\n" * 200,
+            stderr="",
+            analysis="",
+            success=True,
+        )
+        await sm.log_command_run(exec_log)
+
+        path = paths[i * 7 % n_files]
+        await sm.save_file(path, file_content(path, i + 1))
+        sm.next_state.steps = sm.next_state.steps + [{"id": i, "completed": True}]
+        if (i + 1) % task_steps == 0:
+            sm.next_state.current_task["status"] = TaskStatus.DONE
+            sm.next_state.flag_tasks_as_modified()
+            sm.next_state.steps = []
+        await sm.commit(wait=False)
+
+    await sm.wait_for_commit()
+    await sm.rollback()
+
+    async with sm.session_manager as session:
+        n_states = (await session.execute(select(func.count()).select_from(ProjectState))).scalar_one()
+        await session.execute(text("VACUUM"))
+
+    t0 = perf_counter()
+    await sm.load_project(project_id=project_id)
+    await sm.current_state.load_file_contents()
+    t_load = perf_counter() - t0
+    await sm.rollback()
+
+    return {"states": n_states, "size": os.path.getsize(db_path), "load": t_load}
+
+
+def main(n_files: int, n_steps: int, task_steps: int):
+    get_config().fs.type = FileSystemType.MEMORY
+
+    with TemporaryDirectory() as tmpdir:
+        for name, compact in [("full history", False), ("compacted", True)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{name}.db"), n_files, n_steps, task_steps, compact))
+            print(
+                f"{name:>12}: {r['states']:5d} states, database {r['size'] / 1024 / 1024:6.1f} MB, "
+                f"load_project {1000 * r['load']:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500, help="Number of files in the project")
+    parser.add_argument("--steps", type=int, default=1000, help="Number of steps to run")
+    parser.add_argument("--task-steps", type=int, default=50, help="Number of steps per task")
+    args = parser.parse_args()
+    main(args.files, args.steps, args.task_steps)
@@ -0,0 +1,238 @@
+"""
+Benchmark the hot database queries on a large database.
+
+Loads `--projects` synthetic projects with `--steps` project states each
+(and an LLM request, command log and user input per state) into the
+database, and runs the queries used when loading, navigating and
+compacting a project (see `HOT_QUERIES`) on the last project. Prints the
+query plan and average latency of each query, flags the full table scans,
+and exits with an error if there are any.
+
+The database is a temporary SQLite file by default; use `--url` to run
+the benchmark on another database (eg. `postgresql+asyncpg://...`). The
+synthetic projects are deleted at the end.
+
+Usage:
+
+    python -m benchmarks.hot_queries [--projects 20] [--steps 2000] [--repeat 50] [--url URL]
+"""
+
+import asyncio
+import os.path
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Optional
+from uuid import uuid4
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import DBConfig
+from core.db.models import Branch, ExecLog, LLMRequest, Project, ProjectState, Specification, UserInput
+from core.db.models.file_manifest import chunked
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+
+# Queries run by the models, by name, built from the last project's branch and middle state
+HOT_QUERIES: dict[str, Callable[[dict], object]] = {
+    "Project.get_branch": lambda ctx: select(Branch).where(
+        Branch.project_id == ctx["project_id"], Branch.name == Branch.DEFAULT
+    ),
+    "Branch.get_last_state": lambda ctx: select(ProjectState)
+    .where(ProjectState.branch_id == ctx["branch_id"])
+    .order_by(ProjectState.step_index.desc())
+    .limit(1),
+    "Branch.get_state_at_step": lambda ctx: select(ProjectState).where(
+        ProjectState.branch_id == ctx["branch_id"], ProjectState.step_index == ctx["step_index"]
+    ),
+    "ProjectState.rebuild (snapshot)": lambda ctx: select(func.max(ProjectState.step_index)).where(
+        ProjectState.branch_id == ctx["branch_id"],
+        ProjectState.step_index <= ctx["step_index"],
+        ProjectState.patch.is_(None),
+    ),
+    "ProjectState.delete_after": lambda ctx: select(ProjectState.id).where(
+        ProjectState.branch_id == ctx["branch_id"], ProjectState.step_index > ctx["step_index"]
+    ),
+    "LLMRequest by project_state_id": lambda ctx: select(LLMRequest.id).where(
+        LLMRequest.project_state_id == ctx["state_id"]
+    ),
+    "LLMRequest by branch_id": lambda ctx: select(LLMRequest.id).where(LLMRequest.branch_id == ctx["branch_id"]),
+    "ExecLog by project_state_id": lambda ctx: select(ExecLog.id).where(ExecLog.project_state_id == ctx["state_id"]),
+    "ExecLog by branch_id": lambda ctx: select(ExecLog.id).where(ExecLog.branch_id == ctx["branch_id"]),
+    "UserInput by project_state_id": lambda ctx: select(UserInput.id).where(
+        UserInput.project_state_id == ctx["state_id"]
+    ),
+    "UserInput by branch_id": lambda ctx: select(UserInput.id).where(UserInput.branch_id == ctx["branch_id"]),
+}
+
+
+async def load_project(session: AsyncSession, n_steps: int) -> dict:
+    """Insert a synthetic project, with a log of each type per state."""
+    project = Project(name="benchmark")
+    branch = Branch(project=project)
+    spec = Specification()
+    session.add_all([project, branch, spec])
+    await session.flush()
+
+    states = []
+    prev_state_id = None
+    for step_index in range(1, n_steps + 1):
+        state_id = uuid4()
+        states.append(
+            {
+                "id": state_id,
+                "branch_id": branch.id,
+                "prev_state_id": prev_state_id,
+                "specification_id": spec.id,
+                "step_index": step_index,
+                "epics": [],
+                "tasks": [],
+                "steps": [{"id": step_index}],
+                "iterations": [],
+                "knowledge_base": {},
+                "modified_files": {},
+                "patch": None if step_index % ProjectState.SNAPSHOT_INTERVAL == 1 else [],
+            }
+        )
+        prev_state_id = state_id
+
+    logs = {"branch_id": branch.id, "started_at": datetime.now()}
+    for chunk in chunked(states):
+        await session.execute(insert(ProjectState), chunk)
+        await session.execute(
+            insert(LLMRequest),
+            [
+                dict(
+                    logs,
+                    project_state_id=state["id"],
+                    provider="openai",
+                    model="gpt-4o",
+                    temperature=0.5,
+                    response="ok",
+                    prompt_tokens=100,
+                    completion_tokens=100,
+                    duration=1.0,
+                    status="success",
+                )
+                for state in chunk
+            ],
+        )
+        await session.execute(
+            insert(ExecLog),
+            [
+                dict(
+                    logs,
+                    project_state_id=state["id"],
+                    duration=1.0,
+                    cmd="npm test",
+                    cwd=".",
+                    env={},
+                    timeout=None,
+                    status_code=0,
+                    stdout="ok",
+                    stderr="",
+                    analysis="",
+                    success=True,
+                )
+                for state in chunk
+            ],
+        )
+        await session.execute(
+            insert(UserInput),
+            [
+                {"branch_id": branch.id, "project_state_id": state["id"], "question": "Continue?", "cancelled": False}
+                for state in chunk
+            ],
+        )
+
+    middle = states[n_steps // 2]
+    return {
+        "project_id": project.id,
+        "branch_id": branch.id,
+        "state_id": middle["id"],
+        "step_index": middle["step_index"],
+    }
+
+
+async def explain(session: AsyncSession, stmt) -> list[str]:
+    dialect = session.bind.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "sqlite":
+        result = await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+        return [row.detail for row in result]
+    result = await session.execute(text(f"EXPLAIN {sql}"))
+    return [row[0] for row in result]
+
+
+def is_full_scan(plan: list[str]) -> bool:
+    # SQLite reports "SCAN <table>" (without an index) and Postgres "Seq Scan on <table>"
+    return any((line.startswith("SCAN ") and " USING " not in line) or "Seq Scan" in line for line in plan)
+
+
+async def run(url: str, n_projects: int, n_steps: int, n_repeat: int) -> list[str]:
+    run_migrations(DBConfig(url=url))
+    session_manager = SessionManager(DBConfig(url=url))
+
+    t0 = perf_counter()
+    project_ids = []
+    async with session_manager as session:
+        for _ in range(n_projects):
+            ctx = await load_project(session, n_steps)
+            project_ids.append(ctx["project_id"])
+            await session.commit()
+        # Update the planner statistics, as after a long-running project
+        await session.execute(text("ANALYZE"))
+    print(f"Loaded {n_projects} projects with {n_steps} steps in {perf_counter() - t0:.1f} s\n")
+
+    full_scans = []
+    async with session_manager as session:
+        for name, build_query in HOT_QUERIES.items():
+            stmt = build_query(ctx)
+            plan = await explain(session, stmt)
+            t0 = perf_counter()
+            for _ in range(n_repeat):
+                (await session.execute(stmt)).all()
+            latency = (perf_counter() - t0) / n_repeat
+            flag = "  FULL TABLE SCAN" if is_full_scan(plan) else ""
+            if flag:
+                full_scans.append(name)
+            print(f"{name}: {1000 * latency:.2f} ms{flag}")
+            for line in plan:
+                print(f"    {line}")
+
+        # Deleting the later states also nulls out the references from the logs (via foreign keys)
+        state = await session.get(ProjectState, ctx["state_id"])
+        t0 = perf_counter()
+        await state.delete_after()
+        await session.commit()
+        print(f"\nProjectState.delete_after ({n_steps - ctx['step_index']} states): {perf_counter() - t0:.2f} s")
+
+        t0 = perf_counter()
+        for project_id in project_ids:
+            await Project.delete_by_id(session, project_id)
+        await session.commit()
+        print(f"Deleting the projects: {perf_counter() - t0:.2f} s")
+
+    return full_scans
+
+
+def main(url: Optional[str], n_projects: int, n_steps: int, n_repeat: int):
+    with TemporaryDirectory() as tmpdir:
+        full_scans = asyncio.run(
+            run(url or f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'hot_queries.db')}", n_projects, n_steps, n_repeat)
+        )
+    if full_scans:
+        sys.exit(f"\nFull table scans in: {', '.join(full_scans)}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--projects", type=int, default=20, help="Number of projects in the database")
+    parser.add_argument("--steps", type=int, default=2000, help="Number of steps per project")
+    parser.add_argument("--repeat", type=int, default=50, help="Number of times each query is run")
+    parser.add_argument("--url", help="Database URL (defaults to a temporary SQLite database)")
+    args = parser.parse_args()
+    main(args.url, args.projects, args.steps, args.repeat)
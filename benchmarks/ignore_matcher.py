@@ -0,0 +1,150 @@
+"""
+Benchmark ignore matching on a large synthetic workspace.
+
+Creates a workspace with `--files` files (most of them in `node_modules`,
+the rest in a source tree with some ignored build artifacts and logs), and
+compares the previous `IgnoreMatcher` (fnmatch against every pattern, a
+UTF-8 decode of up to 128KB of each file) with the compiled matcher:
+
+- walking the workspace the way `LocalDiskVFS` lists files, with ignored
+  directories pruned (cold, and again with warm caches)
+- checking every path in the workspace directly, without pruning (as
+  happens for paths reported by the workspace watcher)
+
+Usage:
+
+    python -m benchmarks.ignore_matcher [--files 50000] [--src-ratio 0.1]
+"""
+
+import os
+import os.path
+from argparse import ArgumentParser
+from fnmatch import fnmatch
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from core.config import DEFAULT_IGNORE_PATHS, IGNORE_SIZE_THRESHOLD
+from core.disk.ignore import IgnoreMatcher
+
+
+class LegacyIgnoreMatcher:
+    """The previous IgnoreMatcher implementation."""
+
+    def __init__(self, root_path, ignore_paths, *, ignore_size_threshold=None):
+        self.root_path = root_path
+        self.ignore_paths = ignore_paths
+        self.ignore_size_threshold = ignore_size_threshold
+
+    def ignore(self, path):
+        full_path = os.path.normpath(os.path.join(self.root_path, path))
+        return self._is_in_ignore_list(path) or self._is_large_file(full_path) or self._is_binary(full_path)
+
+    def _is_in_ignore_list(self, path):
+        name = os.path.basename(path)
+        for pattern in self.ignore_paths:
+            if fnmatch(name, pattern) or fnmatch(path, pattern):
+                return True
+        return False
+
+    def _is_large_file(self, full_path):
+        if self.ignore_size_threshold is None:
+            return False
+        if os.path.isdir(full_path):
+            return False
+        if not os.path.isfile(full_path):
+            return True
+        try:
+            return bool(os.path.getsize(full_path) > self.ignore_size_threshold)
+        except:  # noqa
+            return True
+
+    def _is_binary(self, full_path):
+        if os.path.isdir(full_path):
+            return False
+        if not os.path.isfile(full_path):
+            return True
+        try:
+            with open(full_path, "r", encoding="utf-8") as f:
+                f.read(128 * 1024)
+            return False
+        except:  # noqa
+            return True
+
+
+def make_workspace(root: str, n_files: int, src_ratio: float) -> list[str]:
+    """
+    Create the synthetic workspace.
+
+    :return: Relative paths of all the created files.
+    """
+    paths = []
+    n_src = int(n_files * src_ratio)
+    source = "export function f(x) {\n  return x * 2;\n}\n" * 100
+
+    for i in range(n_files - n_src):
+        paths.append(f"node_modules/pkg{i // 200}/lib/sub{i % 7}/file{i}.js")
+    for i in range(n_src):
+        if i % 20 == 0:
+            paths.append(f"build/chunk{i}.js")
+        elif i % 20 == 1:
+            paths.append(f"src/module{i % 30}/debug{i}.log")
+        else:
+            paths.append(f"src/module{i % 30}/component{i}.js")
+
+    for path in paths:
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(source)
+    return paths
+
+
+def walk(root: str, matcher) -> list[str]:
+    files = []
+    for dpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not matcher.ignore(os.path.relpath(os.path.join(dpath, d), root))]
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(dpath, filename), root)
+            if not matcher.ignore(path):
+                files.append(Path(path).as_posix())
+    return files
+
+
+def timed(fn, *args):
+    t0 = perf_counter()
+    result = fn(*args)
+    return perf_counter() - t0, result
+
+
+def main(n_files: int, src_ratio: float):
+    with TemporaryDirectory() as root:
+        t, paths = timed(make_workspace, root, n_files, src_ratio)
+        print(f"Created {len(paths)} files in {t:.1f}s\n")
+
+        matchers = {
+            "previous": LegacyIgnoreMatcher(root, DEFAULT_IGNORE_PATHS, ignore_size_threshold=IGNORE_SIZE_THRESHOLD),
+            "compiled": IgnoreMatcher(root, DEFAULT_IGNORE_PATHS, ignore_size_threshold=IGNORE_SIZE_THRESHOLD),
+        }
+
+        listed = {}
+        for name, matcher in matchers.items():
+            t_cold, listed[name] = timed(walk, root, matcher)
+            t_warm, _ = timed(walk, root, matcher)
+            print(
+                f"{name:>8} walk: {1000 * t_cold:8.1f} ms cold, {1000 * t_warm:8.1f} ms warm ({len(listed[name])} files)"
+            )
+
+        for name, matcher in matchers.items():
+            t, ignored = timed(lambda m: sum(m.ignore(p) for p in paths), matcher)
+            print(f"{name:>8} check all paths: {1000 * t:8.1f} ms ({ignored} ignored)")
+
+        assert sorted(listed["previous"]) == sorted(listed["compiled"])
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=50_000, help="Number of files in the workspace")
+    parser.add_argument("--src-ratio", type=float, default=0.1, help="Ratio of files outside node_modules")
+    args = parser.parse_args()
+    main(args.files, args.src_ratio)
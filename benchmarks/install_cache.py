@@ -0,0 +1,133 @@
+"""
+Benchmark restoring project dependencies from the install cache.
+
+Generates a synthetic `node_modules` tree with `--packages` packages of
+`--files` files each (with the size distribution of a typical JS package,
+and a `.bin` symlink per package), stores it in an install cache, and
+restores it into `--projects` new workspaces, with hard links and with
+copies. Reports the time to store the tree (the overhead of a cache miss,
+on top of `npm install`), the mean time to restore it, the disk space used
+by the cache and the cache statistics. Pass `--npm` to also time a real
+`npm install` of the same number of (small) local packages, for reference.
+
+Usage:
+
+    python -m benchmarks.install_cache [--packages 800] [--files 30] [--projects 5] [--npm]
+"""
+
+import asyncio
+import json
+import os
+import random
+import shutil
+from argparse import ArgumentParser
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from core.proc.install_cache import InstallCache
+from core.proc.process_manager import ProcessManager
+
+FILE_SIZES = [200, 1_000, 4_000, 12_000, 40_000]
+
+
+def make_tree(root: str, n_packages: int, n_files: int):
+    rnd = random.Random(0)
+    os.makedirs(os.path.join(root, "node_modules", ".bin"))
+    for i in range(n_packages):
+        pkg = os.path.join(root, "node_modules", f"pkg-{i}")
+        os.makedirs(os.path.join(pkg, "lib"))
+        with open(os.path.join(pkg, "package.json"), "w") as f:
+            json.dump({"name": f"pkg-{i}", "version": "1.0.0", "main": "lib/file0.js"}, f)
+        for j in range(n_files):
+            with open(os.path.join(pkg, "lib", f"file{j}.js"), "w") as f:
+                f.write(f"// pkg-{i} file{j}\n" + "x" * rnd.choice(FILE_SIZES))
+        os.symlink(f"../pkg-{i}/lib/file0.js", os.path.join(root, "node_modules", ".bin", f"pkg-{i}"))
+    with open(os.path.join(root, "package.json"), "w") as f:
+        json.dump({"dependencies": {f"pkg-{i}": "1.0.0" for i in range(n_packages)}}, f)
+
+
+def disk_usage(*paths: str) -> int:
+    # Hard-linked files are only counted once
+    seen = set()
+    total = 0
+    for path in paths:
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                st = os.lstat(os.path.join(dirpath, name))
+                if st.st_ino not in seen:
+                    seen.add(st.st_ino)
+                    total += st.st_blocks * 512
+    return total
+
+
+async def npm_install(root: str, n_packages: int) -> float:
+    packages = os.path.join(root, "packages")
+    for i in range(n_packages):
+        os.makedirs(os.path.join(packages, f"pkg-{i}"))
+        with open(os.path.join(packages, f"pkg-{i}", "package.json"), "w") as f:
+            json.dump({"name": f"pkg-{i}", "version": "1.0.0"}, f)
+    project = os.path.join(root, "project")
+    os.makedirs(project)
+    with open(os.path.join(project, "package.json"), "w") as f:
+        json.dump({"dependencies": {f"pkg-{i}": f"file:../packages/pkg-{i}" for i in range(n_packages)}}, f)
+
+    pm = ProcessManager(root_dir=project)
+    t0 = perf_counter()
+    await pm.run_command("npm install --install-links --no-audit --no-fund --offline", show_output=False)
+    elapsed = perf_counter() - t0
+    await pm.stop_watcher()
+    return elapsed
+
+
+def main(n_packages: int, n_files: int, n_projects: int, npm: bool):
+    with TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "src")
+        make_tree(src, n_packages, n_files)
+        key = InstallCache.make_key(src)
+        tree_size = disk_usage(os.path.join(src, "node_modules"))
+        print(f"node_modules: {n_packages * (n_files + 1)} files, {tree_size / 1024 / 1024:.1f} MB on disk")
+
+        t0 = perf_counter()
+        shutil.copytree(os.path.join(src, "node_modules"), os.path.join(tmpdir, "copy"), symlinks=True)
+        print(f"copytree: {perf_counter() - t0:.2f} s")
+
+        for hardlink in [True, False]:
+            path = os.path.join(tmpdir, f"cache-{hardlink}")
+            cache = InstallCache(path, max_size=10 * 1024 * 1024 * 1024, max_age=3600, hardlink=hardlink)
+            t0 = perf_counter()
+            cache.store(key, src)
+            t_store = perf_counter() - t0
+
+            restore_times = []
+            for i in range(n_projects):
+                dst = os.path.join(tmpdir, f"project-{hardlink}-{i}")
+                os.makedirs(dst)
+                t0 = perf_counter()
+                assert cache.restore(key, dst)
+                restore_times.append(perf_counter() - t0)
+
+            usage = disk_usage(path, *(os.path.join(tmpdir, f"project-{hardlink}-{i}") for i in range(n_projects)))
+            print(
+                f"{'hard links' if hardlink else 'copies':>10}: store {t_store:.2f} s, "
+                f"restore {mean(restore_times):.2f} s mean, "
+                f"disk usage of the cache and {n_projects} projects {usage / 1024 / 1024:.1f} MB, "
+                f"stats {cache.stats()}"
+            )
+            for i in range(n_projects):
+                shutil.rmtree(os.path.join(tmpdir, f"project-{hardlink}-{i}"))
+            shutil.rmtree(path)
+
+        if npm:
+            elapsed = asyncio.run(npm_install(os.path.join(tmpdir, "npm"), n_packages))
+            print(f"npm install ({n_packages} local packages): {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packages", type=int, default=800, help="Number of packages in node_modules")
+    parser.add_argument("--files", type=int, default=30, help="Number of files per package")
+    parser.add_argument("--projects", type=int, default=5, help="Number of projects to restore the tree into")
+    parser.add_argument("--npm", action="store_true", help="Also time a real npm install (of local packages)")
+    args = parser.parse_args()
+    main(args.packages, args.files, args.projects, args.npm)
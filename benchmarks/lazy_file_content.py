@@ -0,0 +1,128 @@
+"""
+Benchmark lazy loading of file contents for a large imported project.
+
+Creates a project with `--files` files (using the source code in this
+repository as realistic content, as if imported by the Importer agent), then
+loads it with `StateManager.load_project` and runs `--steps` steps, each
+reading the contents of `--relevant` relevant files (as the agent prompts do)
+and changing one of them. Compares loading all the file contents together
+with the files (as before) with loading them on demand, and reports:
+
+- time to load the project, and memory allocated while loading it
+- mean and p95 latency of the steps (loading the contents and committing)
+- number of file contents in memory at the end
+
+Usage:
+
+    python -m benchmarks.lazy_file_content [--files 5000] [--steps 200] [--relevant 5]
+"""
+
+import asyncio
+import os.path
+import tracemalloc
+from argparse import ArgumentParser
+from glob import glob
+from hashlib import sha1
+from statistics import mean, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from core.config import DBConfig, FileSystemType, get_config
+from core.db.models import Branch, File, FileContent, Project, ProjectState
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.state.state_manager import StateManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_sources() -> list[str]:
+    sources = []
+    for path in sorted(glob(os.path.join(ROOT, "core/**/*.py"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sources.append(f.read())
+    return sources
+
+
+def file_path(i: int) -> str:
+    return f"src/module{i % 50}/file{i}.py"
+
+
+async def populate(url: str, n_files: int):
+    sources = read_sources()
+    manager = SessionManager(DBConfig(url=url))
+    session = await manager.start()
+    project = Project(name="benchmark")
+    state = ProjectState.create_initial_state(Branch(project=project))
+    session.add(state)
+
+    for i in range(n_files):
+        # Make every file unique, as in a real project
+        content = f"# file {i}\n" + sources[i % len(sources)]
+        fc = FileContent(id=sha1(content.encode("utf-8")).hexdigest(), content=content)
+        state.files.append(File(path=file_path(i), content=fc))
+
+    await session.commit()
+    await manager.close()
+    return project.id
+
+
+async def run(db_path: str, n_files: int, n_steps: int, n_relevant: int, eager: bool) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+    project_id = await populate(url, n_files)
+    FileContent.cache.clear()
+
+    state_manager = StateManager(SessionManager(DBConfig(url=url)))
+    tracemalloc.start()
+    t0 = perf_counter()
+    await state_manager.load_project(project_id=project_id)
+    if eager:
+        # Previously, all the contents were loaded together with the files
+        await state_manager.current_state.load_file_contents()
+    t_load = perf_counter() - t0
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    latencies = []
+    for i in range(n_steps):
+        t0 = perf_counter()
+        paths = [file_path((i * n_relevant + j) * 7 % n_files) for j in range(n_relevant)]
+        await state_manager.current_state.load_file_contents(paths)
+        assert all(state_manager.current_state.get_file_by_path(path).content.content for path in paths)
+        await state_manager.save_file(paths[0], f"# step {i}\n")
+        await state_manager.commit()
+        latencies.append(perf_counter() - t0)
+
+    n_cached = len(FileContent.cache)
+    await state_manager.rollback()
+
+    return {
+        "load": t_load,
+        "memory": memory,
+        "mean": mean(latencies),
+        "p95": quantiles(latencies, n=20)[-1],
+        "cached": n_cached,
+    }
+
+
+def main(n_files: int, n_steps: int, n_relevant: int):
+    get_config().fs.type = FileSystemType.MEMORY
+
+    with TemporaryDirectory() as tmpdir:
+        for name, eager in [("eager", True), ("lazy", False)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{name}.db"), n_files, n_steps, n_relevant, eager))
+            print(
+                f"{name:>5}: load_project {1000 * r['load']:7.1f} ms, {r['memory'] / 1024 / 1024:6.1f} MB, "
+                f"step {1000 * r['mean']:6.2f} ms mean {1000 * r['p95']:6.2f} ms p95, "
+                f"{r['cached']} contents in memory"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000, help="Number of files in the project")
+    parser.add_argument("--steps", type=int, default=200, help="Number of steps to run")
+    parser.add_argument("--relevant", type=int, default=5, help="Number of files read in each step")
+    args = parser.parse_args()
+    main(args.files, args.steps, args.relevant)
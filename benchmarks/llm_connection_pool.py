@@ -0,0 +1,126 @@
+"""
+Benchmark per-request connection overhead of LLM clients.
+
+Starts a local fake OpenAI-compatible server streaming SSE responses and
+compares creating a new SDK client for each request (the old `get_llm()`
+behaviour) with using the shared clients from `LLMClientPool`.
+
+Usage:
+
+    python -m benchmarks.llm_connection_pool [--requests 200] [--latency 0.005]
+
+The fake server adds `--latency` seconds of delay to each new connection,
+simulating the TCP + TLS handshake cost of a real remote API.
+"""
+
+import asyncio
+import json
+from argparse import ArgumentParser
+from time import perf_counter
+
+from openai import AsyncOpenAI
+
+from core.config import LLMConfig
+from core.llm.client_pool import LLMClientPool
+
+CHUNKS = ["Hello", ", ", "world", "!"]
+
+
+class FakeSSEServer:
+    def __init__(self, handshake_latency: float):
+        self.handshake_latency = handshake_latency
+        self.connections = 0
+        self.requests = 0
+
+    def _response_body(self) -> bytes:
+        events = []
+        for chunk in CHUNKS:
+            data = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "fake",
+                "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}],
+            }
+            events.append(f"data: {json.dumps(data)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return "".join(events).encode("utf-8")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_latency)
+        body = self._response_body()
+        try:
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in headers.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+
+                self.requests += 1
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: text/event-stream\r\n"
+                    b"Connection: keep-alive\r\n" + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_requests(make_client, config: LLMConfig, n_requests: int) -> float:
+    t0 = perf_counter()
+    for _ in range(n_requests):
+        client = make_client()
+        stream = await client.chat.completions.create(
+            model=config.model,
+            messages=[{"role": "user", "content": "hello"}],
+            stream=True,
+        )
+        async for _chunk in stream:
+            pass
+    return perf_counter() - t0
+
+
+async def main(n_requests: int, latency: float):
+    server = FakeSSEServer(latency)
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    config = LLMConfig(model="fake", base_url=f"http://127.0.0.1:{port}/v1", api_key="fake")
+
+    async with srv:
+        unpooled_clients = []
+
+        def new_client():
+            client = AsyncOpenAI(api_key=config.api_key, base_url=config.base_url)
+            unpooled_clients.append(client)
+            return client
+
+        def pooled_client():
+            return LLMClientPool.get(AsyncOpenAI, config, api_key=config.api_key, base_url=config.base_url)
+
+        for name, factory in [("new client per request", new_client), ("pooled client", pooled_client)]:
+            server.connections = server.requests = 0
+            duration = await run_requests(factory, config, n_requests)
+            print(
+                f"{name:>24}: {n_requests} requests in {duration:.2f}s "
+                f"({1000 * duration / n_requests:.2f} ms/request), "
+                f"{server.connections} connections opened"
+            )
+
+        for client in unpooled_clients:
+            await client.close()
+        await LLMClientPool.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests to make")
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated handshake latency (seconds)")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency))
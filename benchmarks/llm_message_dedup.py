@@ -0,0 +1,184 @@
+"""
+Benchmark the volume of LLM request logs written to the database.
+
+Simulates `--requests` LLM requests made during long conversations: every
+request sends the system prompt, a listing of `--files` project files (using
+the source code in this repository as realistic content) and the
+conversation so far, which grows by a reply and a follow-up message with
+each request, and restarts every `--turns` requests (with an updated file
+listing). Each request is logged with `StateManager.log_llm_request` and
+committed to an SQLite database on disk.
+
+Compares storing the whole messages and prompts with every request (as
+before, `LegacyLog`) with storing each message once (see `LLMMessage`), and
+reports the number of bytes of SQL parameters written, the database size
+and the time to log the requests.
+
+Usage:
+
+    python -m benchmarks.llm_message_dedup [--requests 500] [--files 50] [--turns 20]
+"""
+
+import asyncio
+import json
+import os.path
+from argparse import ArgumentParser
+from glob import glob
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import event, text
+
+from core.config import DBConfig, FileSystemType, LLMProvider, get_config
+from core.db.compression import compress
+from core.db.models import LLMRequest
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.llm.request_log import LLMRequestLog
+from core.state.state_manager import StateManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYSTEM_PROMPT = "You are a world class full stack software developer working in a team.\n" * 60
+
+
+class LegacyLog:
+    """The previous request log, with the messages and prompts stored in each request."""
+
+    def __init__(self, state_manager: StateManager):
+        self.state_manager = state_manager
+
+    async def create_table(self):
+        await self.state_manager.current_session.execute(
+            text("CREATE TABLE legacy_llm_requests (id INTEGER PRIMARY KEY, messages BLOB, prompts BLOB)")
+        )
+
+    async def log_llm_request(self, request_log: LLMRequestLog):
+        sm = self.state_manager
+        session = sm.current_session
+        request = LLMRequest(
+            project_state=sm.current_state,
+            branch=sm.current_state.branch,
+            provider=request_log.provider,
+            model=request_log.model,
+            temperature=request_log.temperature,
+            response=request_log.response,
+            prompt_tokens=request_log.prompt_tokens,
+            completion_tokens=request_log.completion_tokens,
+            duration=request_log.duration,
+            status=request_log.status,
+            error=request_log.error,
+        )
+        session.add(request)
+        await session.flush()
+        await session.execute(
+            text("INSERT INTO legacy_llm_requests (id, messages, prompts) VALUES (:id, :messages, :prompts)"),
+            {
+                "id": request.id,
+                "messages": compress(json.dumps(request_log.messages)),
+                "prompts": compress(json.dumps(request_log.prompts)),
+            },
+        )
+
+
+def read_sources() -> list[str]:
+    sources = []
+    for path in sorted(glob(os.path.join(ROOT, "core/**/*.py"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sources.append(f.read())
+    return sources
+
+
+def file_listing(sources: list[str], n_files: int, version: int) -> str:
+    return "\n".join(
+        f"**`src/module{i % 10}/file{i}.py`**:\n```\n# v{version}\n{sources[(version + i) % len(sources)]}```\n"
+        for i in range(n_files)
+    )
+
+
+def request_logs(n_requests: int, n_files: int, n_turns: int):
+    sources = read_sources()
+    for i in range(n_requests):
+        turn = i % n_turns
+        if turn == 0:
+            listing = file_listing(sources, n_files, i)
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Here are the project files:\n{listing}\nImplement task {i}."},
+            ]
+            prompts = [{"template": "developer/breakdown.prompt", "context": {"files": listing, "task": i}}]
+        else:
+            reply = f"Step {i}: updated the file\n```\n{sources[i % len(sources)][:2000]}```\n"
+            messages = messages + [
+                {"role": "assistant", "content": reply},
+                {"role": "user", "content": f"The tests failed with error {i}, please fix it."},
+            ]
+            prompts = prompts + [{"template": "developer/iteration.prompt", "context": {"error": i}}]
+        yield LLMRequestLog(
+            provider=LLMProvider.OPENAI,
+            model="gpt-4o",
+            temperature=0.5,
+            messages=messages,
+            prompts=prompts,
+            response=f"Response {i}\n" * 50,
+        )
+
+
+async def run(db_path: str, n_requests: int, n_files: int, n_turns: int, legacy: bool) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+
+    session_manager = SessionManager(DBConfig(url=url))
+    n_bytes = 0
+
+    def count_bytes(conn, cursor, statement, parameters, context, executemany):
+        nonlocal n_bytes
+        for params in parameters if executemany else [parameters]:
+            values = params.values() if isinstance(params, dict) else params
+            n_bytes += sum(len(value) for value in values if isinstance(value, (str, bytes)))
+
+    sm = StateManager(session_manager)
+    await sm.create_project("benchmark")
+    await sm.commit()
+    legacy_log = LegacyLog(sm)
+    if legacy:
+        await legacy_log.create_table()
+        await sm.current_session.commit()
+
+    event.listen(session_manager.engine.sync_engine, "before_cursor_execute", count_bytes)
+    t0 = perf_counter()
+    for request_log in request_logs(n_requests, n_files, n_turns):
+        if legacy:
+            await legacy_log.log_llm_request(request_log)
+        else:
+            await sm.log_llm_request(request_log)
+        await sm.current_session.commit()
+    t_log = perf_counter() - t0
+    event.remove(session_manager.engine.sync_engine, "before_cursor_execute", count_bytes)
+
+    await sm.rollback()
+    async with sm.session_manager as session:
+        await session.execute(text("VACUUM"))
+
+    return {"bytes": n_bytes, "size": os.path.getsize(db_path), "log": t_log}
+
+
+def main(n_requests: int, n_files: int, n_turns: int):
+    get_config().fs.type = FileSystemType.MEMORY
+
+    with TemporaryDirectory() as tmpdir:
+        for name, legacy in [("per request", True), ("deduplicated", False)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{name}.db"), n_requests, n_files, n_turns, legacy))
+            print(
+                f"{name:>12}: {r['bytes'] / 1024 / 1024:7.2f} MB written, "
+                f"database {r['size'] / 1024 / 1024:6.2f} MB, log {1000 * r['log'] / n_requests:5.2f} ms/request"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="Number of LLM requests to log")
+    parser.add_argument("--files", type=int, default=50, help="Number of files in the listing")
+    parser.add_argument("--turns", type=int, default=20, help="Number of requests per conversation")
+    args = parser.parse_args()
+    main(args.requests, args.files, args.turns)
@@ -0,0 +1,78 @@
+"""
+Benchmark the memory used to capture the output of a long-running process.
+
+Starts a background Python process through the process manager (like a
+development server) that writes `--size` MB of log lines, waits for it
+to exit, and reports the peak memory allocated in the parent process
+(measured with `tracemalloc`) and the amount of output kept. Runs with
+the configured capture sizes (see `ProcessOutputConfig`), optionally
+spilling the output to disk, and with an unbounded capture (as before,
+keeping all the output in memory).
+
+Usage:
+
+    python -m benchmarks.output_capture [--size 200]
+"""
+
+import asyncio
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from core.config import ProcessOutputConfig, get_config
+from core.proc.process_manager import ProcessManager
+
+LINE = "[server] GET /api/items?page=1 200 in 12ms " + "x" * 50 + "\n"
+
+
+def child_command(size_mb: int) -> str:
+    n_lines = size_mb * 1024 * 1024 // len(LINE)
+    script = f"import sys; [sys.stdout.write({LINE!r} * 1000) for _ in range({n_lines} // 1000)]"
+    return f'{sys.executable} -c "{script}"'
+
+
+async def run(size_mb: int) -> tuple[float, int, int]:
+    exited = asyncio.Event()
+
+    async def exit_handler(process):
+        exited.set()
+
+    with TemporaryDirectory() as tmpdir:
+        pm = ProcessManager(root_dir=tmpdir, exit_handler=exit_handler)
+        tracemalloc.start()
+        t0 = perf_counter()
+        process = await pm.start_process(child_command(size_mb), bg=True)
+        await exited.wait()
+        elapsed = perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        kept = len(process.stdout)
+        await pm.stop_watcher()
+
+    return elapsed, peak, kept
+
+
+def main(size_mb: int):
+    config = get_config()
+    unbounded = 2 * size_mb * 1024 * 1024
+    variants = [
+        ("head + tail", config.process_output),
+        ("spill to disk", config.process_output.model_copy(update={"spill": True})),
+        ("unbounded", ProcessOutputConfig(head_size=unbounded, tail_size=unbounded)),
+    ]
+    for name, process_output in variants:
+        config.process_output = process_output
+        elapsed, peak, kept = asyncio.run(run(size_mb))
+        print(
+            f"{name:>13}: {size_mb} MB in {elapsed:5.2f} s, peak memory {peak / 1024 / 1024:7.2f} MB, "
+            f"kept {kept / 1024 / 1024:7.2f} MB in memory"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=200, help="Output size (in MB)")
+    args = parser.parse_args()
+    main(args.size)
@@ -0,0 +1,132 @@
+"""
+Benchmark how fast the process manager notices that a process exited.
+
+Runs `--runs` short commands with `ProcessManager.run_command()`, and
+starts `--runs` short background processes, measuring the time until
+`run_command()` returns and until the exit handler is called. The same is
+done with the old approach (see `legacy_run_command()` and
+`legacy_watch()`), which polled the process state with psutil: in a loop
+while reading the output of a command, and every 100 ms (or every second
+when idle) in the watcher of the background processes. Reports the mean
+latency, the CPU time and the number of `psutil.Process` objects created.
+
+Usage:
+
+    python -m benchmarks.process_exit [--runs 50]
+"""
+
+import asyncio
+import os
+from argparse import ArgumentParser
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time
+
+import psutil
+
+from core.proc.process_manager import LocalProcess, ProcessManager
+
+COMMAND = "echo done"
+LEGACY_BUSY_WAIT_INTERVAL = 0.1
+LEGACY_WATCHER_IDLE_INTERVAL = 1.0
+
+
+class CountingProcess(psutil.Process):
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingProcess.created += 1
+        super().__init__(*args, **kwargs)
+
+
+def legacy_is_running(process: LocalProcess) -> bool:
+    try:
+        return psutil.Process(process.pid).is_running()
+    except psutil.NoSuchProcess:
+        return False
+
+
+async def legacy_run_command(cmd: str, cwd: str):
+    process = await LocalProcess.start(cmd, cwd=cwd, env=dict(os.environ), bg=False)
+    while legacy_is_running(process):
+        await process.read_output(LEGACY_BUSY_WAIT_INTERVAL)
+    await process.wait()
+    await process.read_output(0)
+
+
+async def legacy_watch(processes: list[LocalProcess], exited: dict[LocalProcess, float]):
+    while True:
+        procs = [p for p in processes if p not in exited]
+        if not procs:
+            await asyncio.sleep(LEGACY_WATCHER_IDLE_INTERVAL)
+            continue
+        for process in procs:
+            await process.read_output()
+            if not legacy_is_running(process):
+                exited[process] = perf_counter()
+        await asyncio.sleep(LEGACY_BUSY_WAIT_INTERVAL)
+
+
+async def measure_commands(n_runs: int, cwd: str, legacy: bool) -> list[float]:
+    pm = ProcessManager(root_dir=cwd)
+    latencies = []
+    for _ in range(n_runs):
+        t0 = perf_counter()
+        if legacy:
+            await legacy_run_command(COMMAND, cwd)
+        else:
+            await pm.run_command(COMMAND)
+        latencies.append(perf_counter() - t0)
+    await pm.stop_watcher()
+    return latencies
+
+
+async def measure_background(n_runs: int, cwd: str, legacy: bool) -> list[float]:
+    exited: dict[LocalProcess, float] = {}
+
+    async def exit_handler(process: LocalProcess):
+        exited[process] = perf_counter()
+
+    # With the legacy approach, the exits are detected by `legacy_watch()` instead
+    pm = ProcessManager(root_dir=cwd, exit_handler=None if legacy else exit_handler)
+    processes = []
+    watcher = asyncio.create_task(legacy_watch(processes, exited)) if legacy else None
+
+    latencies = []
+    for _ in range(n_runs):
+        process = await pm.start_process(COMMAND)
+        processes.append(process)
+        # The time the process exited, as seen by the event loop
+        await asyncio.shield(process._exited)
+        t_exit = perf_counter()
+        while process not in exited:
+            await asyncio.sleep(0.001)
+        latencies.append(exited[process] - t_exit)
+
+    if watcher:
+        watcher.cancel()
+    await pm.stop_watcher()
+    return latencies
+
+
+def main(n_runs: int):
+    psutil.Process = CountingProcess
+    with TemporaryDirectory() as tmpdir:
+        for name, legacy in [("event-driven", False), ("polling", True)]:
+            for kind, measure in [("run_command", measure_commands), ("exit handler", measure_background)]:
+                CountingProcess.created = 0
+                cpu0 = process_time()
+                latencies = asyncio.run(measure(n_runs, tmpdir, legacy))
+                cpu = process_time() - cpu0
+                print(
+                    f"{name:>12} {kind:>12}: {1000 * mean(latencies):7.2f} ms mean, "
+                    f"{1000 * max(latencies):7.2f} ms max, {1000 * cpu / n_runs:6.2f} ms CPU per run, "
+                    f"{CountingProcess.created / n_runs:7.1f} psutil.Process per run"
+                )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50, help="Number of commands and background processes to run")
+    args = parser.parse_args()
+    main(args.runs)
@@ -0,0 +1,116 @@
+"""
+Benchmark reading the output of a command through the process manager.
+
+Runs a Python child process writing `--size` MB of output to stdout (in
+lines, with some multi-byte characters) and captures it with
+`ProcessManager.run_command()`, passing each chunk to an output handler
+as the UI would. Then reads `--legacy-size` MB the way the process manager
+used to (a byte at a time, each read wrapped in `asyncio.wait_for`, with
+string concatenation, see `legacy_run_command()`), which is too slow to
+run on the full size. Reports the throughput and the CPU time spent in the
+parent process per MB of output.
+
+Usage:
+
+    python -m benchmarks.process_output [--size 100] [--legacy-size 1]
+"""
+
+import asyncio
+import sys
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time
+
+from core.proc.process_manager import NONBLOCK_READ_TIMEOUT, ProcessManager
+
+LEGACY_BUSY_WAIT_INTERVAL = 0.1
+
+LINE = "output line with a few multi-byte characters: é€😀 " + "x" * 40 + "\n"
+
+
+def child_command(size_mb: int) -> str:
+    n_lines = size_mb * 1024 * 1024 // len(LINE.encode())
+    script = (
+        f"import sys; line = {LINE!r}.encode(); "
+        f"[sys.stdout.buffer.write(line * 1000) for _ in range({n_lines} // 1000)]"
+    )
+    return f'{sys.executable} -c "{script}"'
+
+
+async def legacy_nonblock_read(reader: asyncio.StreamReader, timeout: float) -> str:
+    buffer = ""
+    while True:
+        try:
+            data = await asyncio.wait_for(reader.read(1), timeout)
+            if not data:
+                return buffer
+            buffer += data.decode("utf-8", errors="ignore")
+        except asyncio.TimeoutError:
+            return buffer
+
+
+async def legacy_run_command(cmd: str, cwd: str, output_handler) -> str:
+    process = await asyncio.create_subprocess_shell(
+        cmd,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout = ""
+    stderr = ""
+    while True:
+        out = await legacy_nonblock_read(process.stdout, NONBLOCK_READ_TIMEOUT)
+        err = await legacy_nonblock_read(process.stderr, NONBLOCK_READ_TIMEOUT)
+        stdout += out
+        stderr += err
+        if out or err:
+            await output_handler(out, err)
+        if process.returncode is not None and not out and not err:
+            break
+        if process.stdout.at_eof() and process.stderr.at_eof():
+            await process.wait()
+            break
+        await asyncio.sleep(LEGACY_BUSY_WAIT_INTERVAL)
+    return stdout
+
+
+async def measure(size_mb: int, legacy: bool) -> tuple[float, float, int]:
+    received = 0
+
+    async def output_handler(out: str, err: str):
+        nonlocal received
+        received += len(out) + len(err)
+
+    cmd = child_command(size_mb)
+    with TemporaryDirectory() as tmpdir:
+        t0 = perf_counter()
+        cpu0 = process_time()
+        if legacy:
+            stdout = await legacy_run_command(cmd, tmpdir, output_handler)
+        else:
+            pm = ProcessManager(root_dir=tmpdir, output_handler=output_handler)
+            _, stdout, _ = await pm.run_command(cmd)
+            await pm.stop_watcher()
+        elapsed = perf_counter() - t0
+        cpu = process_time() - cpu0
+
+    assert received == len(stdout), "output handler didn't receive all the output"
+    return elapsed, cpu, len(stdout.encode())
+
+
+def main(size_mb: int, legacy_size_mb: int):
+    for name, size, legacy in [("chunked reader", size_mb, False), ("byte-at-a-time", legacy_size_mb, True)]:
+        elapsed, cpu, n_bytes = asyncio.run(measure(size, legacy))
+        mb = n_bytes / 1024 / 1024
+        print(
+            f"{name:>14}: {mb:6.1f} MB in {elapsed:7.2f} s, {mb / elapsed:8.2f} MB/s, "
+            f"{1000 * cpu / mb:8.2f} ms CPU per MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=100, help="Output size (in MB) for the process manager")
+    parser.add_argument("--legacy-size", type=int, default=1, help="Output size (in MB) for the legacy reader")
+    args = parser.parse_args()
+    main(args.size, args.legacy_size)
@@ -0,0 +1,106 @@
+"""
+Benchmark storage of project states with and without delta encoding.
+
+Simulates a project with `--steps` steps, where each step adds or updates
+a few items in the project plan (epics, tasks, steps, iterations), and
+commits it to an SQLite database on disk, the way `StateManager` does.
+Compares a full copy of the plan in every state (the previous behaviour,
+equivalent to `SNAPSHOT_INTERVAL = 1`) with delta encoding, and reports:
+
+- database size
+- mean and p95 commit latency
+- time to load a state from the middle of the branch
+
+Usage:
+
+    python -m benchmarks.project_state_deltas [--steps 2000] [--interval 50]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from statistics import mean, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from core.config import DBConfig
+from core.db.models import Branch, Project, ProjectState
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+
+
+def advance(state: ProjectState, i: int):
+    """Make changes to the project plan typical of a single step."""
+    if i % 200 == 0:
+        state.epics = state.epics + [{"name": f"Epic {i}", "description": "Epic description " * 20}]
+    if i % 20 == 0:
+        state.tasks = state.tasks + [
+            {"description": f"Task {i} " + "task description " * 30, "instructions": "x" * 500, "status": "todo"}
+        ]
+    if i % 20 == 19:
+        state.tasks[-1]["status"] = "done"
+        state.flag_tasks_as_modified()
+    state.steps = state.steps + [{"id": str(i), "type": "save_file", "save_file": {"path": f"src/f{i}.js"}}]
+    if i % 5 == 0:
+        state.iterations = state.iterations + [{"id": str(i), "user_feedback": "feedback " * 40, "status": "done"}]
+    state.relevant_files = [f"src/f{j}.js" for j in range(max(0, i - 10), i)]
+
+
+async def run(db_path: str, n_steps: int, interval: int) -> dict:
+    ProjectState.SNAPSHOT_INTERVAL = interval
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+
+    manager = SessionManager(DBConfig(url=url))
+    session = await manager.start()
+    branch = Branch(project=Project(name="benchmark"))
+    state = ProjectState.create_initial_state(branch)
+    session.add(state)
+    await session.commit()
+
+    latencies = []
+    for i in range(n_steps):
+        state = await state.create_next_state()
+        advance(state, i)
+        t0 = perf_counter()
+        await session.commit()
+        latencies.append(perf_counter() - t0)
+        # Keep only the current state in the session, like StateManager does
+        session.expunge_all()
+        session.add(state)
+
+    expected = (state.tasks, state.steps)
+    session.expunge_all()
+    branch = await Branch.get_by_id(session, branch.id)
+
+    t0 = perf_counter()
+    await branch.get_state_at_step(n_steps // 2 + interval // 2)
+    t_load = perf_counter() - t0
+    last = await branch.get_last_state()
+    assert (last.tasks, last.steps) == expected
+    await manager.close()
+
+    return {
+        "size": os.path.getsize(db_path),
+        "mean": mean(latencies),
+        "p95": quantiles(latencies, n=20)[-1],
+        "load": t_load,
+    }
+
+
+def main(n_steps: int, interval: int):
+    with TemporaryDirectory() as tmpdir:
+        for name, snapshot_interval in [("full copy", 1), ("delta", interval)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{snapshot_interval}.db"), n_steps, snapshot_interval))
+            print(
+                f"{name:>9}: {r['size'] / 1024 / 1024:7.1f} MB, commit {1000 * r['mean']:6.2f} ms mean "
+                f"{1000 * r['p95']:6.2f} ms p95, load {1000 * r['load']:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=2000, help="Number of steps in the project")
+    parser.add_argument("--interval", type=int, default=ProjectState.SNAPSHOT_INTERVAL, help="Snapshot interval")
+    args = parser.parse_args()
+    main(args.steps, args.interval)
@@ -0,0 +1,116 @@
+"""
+Benchmark commit-heavy workloads with the SQLite connection profiles.
+
+Simulates `--steps` agent steps on a project with `--files` files, stored
+in an SQLite database on disk. In each step the agent logs `--requests`
+LLM requests, saves a file and commits the state (waiting for the commit),
+with no LLM latency, so the time is spent in the database. Compares the
+default profile (a new connection for each session, rollback journal with
+full fsyncs, as before) with the performance profile (see `SQLiteProfile`),
+and reports the number of database connections opened, the mean time to
+log a request and to commit a step, and the total time.
+
+Usage:
+
+    python -m benchmarks.sqlite_profile [--files 500] [--steps 200] [--requests 3]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import event
+
+from core.config import DBConfig, FileSystemType, LLMProvider, SQLiteProfile, get_config
+from core.db.models import FileContent
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.llm.request_log import LLMRequestLog
+from core.state.state_manager import StateManager
+
+
+def file_content(path: str, version: int) -> str:
+    return f"// {path} v{version}\n" + "export function f(x) {\n  return x * 2;\n}\n" * 20
+
+
+async def run(db_path: str, n_files: int, n_steps: int, n_requests: int, profile: SQLiteProfile) -> dict:
+    config = DBConfig(url=f"sqlite+aiosqlite:///{db_path}", sqlite_profile=profile)
+    run_migrations(config)
+    FileContent.cache.clear()
+
+    session_manager = SessionManager(config)
+    n_connections = 0
+
+    def count_connection(*args):
+        nonlocal n_connections
+        n_connections += 1
+
+    event.listen(session_manager.engine.sync_engine, "connect", count_connection)
+
+    sm = StateManager(session_manager)
+    await sm.create_project("benchmark")
+    await sm.commit()
+    paths = [f"src/module{i % 25}/file{i}.js" for i in range(n_files)]
+    await sm.save_files({path: file_content(path, 0) for path in paths})
+    await sm.commit()
+
+    n_connections = 0
+    request_times = []
+    commit_times = []
+    t_start = perf_counter()
+    for i in range(n_steps):
+        for j in range(n_requests):
+            request_log = LLMRequestLog(
+                provider=LLMProvider.OPENAI,
+                model="gpt-4o",
+                temperature=0.5,
+                messages=[{"role": "user", "content": f"Step {i}, request {j}"}],
+                response=file_content(paths[0], i),
+            )
+            t0 = perf_counter()
+            await sm.log_llm_request(request_log)
+            request_times.append(perf_counter() - t0)
+
+        path = paths[i * 7 % n_files]
+        await sm.save_file(path, file_content(path, i + 1))
+        sm.next_state.steps = sm.next_state.steps + [{"id": i, "completed": True}]
+
+        t0 = perf_counter()
+        await sm.commit()
+        commit_times.append(perf_counter() - t0)
+    t_total = perf_counter() - t_start
+
+    await sm.rollback()
+    await session_manager.dispose()
+
+    return {
+        "connections": n_connections,
+        "request": mean(request_times),
+        "commit": mean(commit_times),
+        "total": t_total,
+    }
+
+
+def main(n_files: int, n_steps: int, n_requests: int):
+    get_config().fs.type = FileSystemType.MEMORY
+
+    with TemporaryDirectory() as tmpdir:
+        for profile in SQLiteProfile:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{profile.value}.db"), n_files, n_steps, n_requests, profile))
+            print(
+                f"{profile.value:>11}: {r['connections']:4d} connections, "
+                f"log_llm_request {1000 * r['request']:5.2f} ms mean, commit {1000 * r['commit']:6.2f} ms mean, "
+                f"total {r['total']:5.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500, help="Number of files in the project")
+    parser.add_argument("--steps", type=int, default=200, help="Number of steps to run")
+    parser.add_argument("--requests", type=int, default=3, help="Number of LLM requests per step")
+    args = parser.parse_args()
+    main(args.files, args.steps, args.requests)
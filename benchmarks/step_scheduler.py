@@ -0,0 +1,111 @@
+"""
+Benchmark running the task steps with the step scheduler.
+
+Generates `--tasks` synthetic Developer tasks of `--steps` steps each (file
+writes, some of them to the same file, and commands), and runs them with
+simulated step durations (a file write is an LLM call, `--file-time`
+seconds, and a command takes `--command-time` seconds): one step at a time,
+with the old approach (see `legacy_batch()`: all the remaining file writes
+in parallel whenever the current step is a file write, everything else one
+by one), and with the step scheduler, without and with the ordering hints
+from `parse_task`. Reports the mean time per task, the number of
+commits per task and the number of steps that were run before a step they
+depend on (which the old approach does for files after a command).
+
+Usage:
+
+    python -m benchmarks.step_scheduler [--tasks 20] [--steps 20] [--max-parallel 8]
+"""
+
+import asyncio
+import random
+from argparse import ArgumentParser
+from statistics import mean
+from time import perf_counter
+
+from core.agents.step_scheduler import ready_steps, step_dependencies
+
+COMMANDS = ["npm install", "npm run build", "npx prisma generate", "npm test"]
+
+
+def make_task(rnd: random.Random, n_steps: int, hints: bool) -> list[dict]:
+    steps = []
+    for i in range(n_steps):
+        if rnd.random() < 0.25:
+            step = {"type": "command", "command": {"command": rnd.choice(COMMANDS), "timeout": 60}}
+        else:
+            # Some files are written more than once (eg. first a stub, then the implementation)
+            path = f"src/file{rnd.randrange(n_steps)}.js"
+            step = {"type": "save_file", "save_file": {"path": path}}
+        step["id"] = f"step-{i}"
+        step["completed"] = False
+        if hints:
+            # The step only needs a few of the earlier steps
+            step["depends_on"] = [f"step-{j}" for j in range(i) if rnd.random() < 0.15]
+        steps.append(step)
+    return steps
+
+
+def legacy_batch(steps: list[dict]) -> list[dict]:
+    unfinished = [step for step in steps if not step["completed"]]
+    if unfinished[0]["type"] == "save_file":
+        return [step for step in unfinished if step["type"] == "save_file"]
+    return unfinished[:1]
+
+
+async def run_step(step: dict, file_time: float, command_time: float):
+    await asyncio.sleep(file_time if step["type"] == "save_file" else command_time)
+
+
+async def run_task(steps: list[dict], mode: str, max_parallel: int, file_time: float, command_time: float):
+    dependencies = step_dependencies(steps)
+    commits = 0
+    out_of_order = 0
+    while any(not step["completed"] for step in steps):
+        if mode == "sequential":
+            batch = [next(step for step in steps if not step["completed"])]
+        elif mode == "legacy":
+            batch = legacy_batch(steps)
+        else:
+            batch = ready_steps(steps, max_parallel)
+
+        for step in batch:
+            i = steps.index(step)
+            out_of_order += any(not steps[j]["completed"] for j in dependencies[i])
+        await asyncio.gather(*(run_step(step, file_time, command_time) for step in batch))
+        for step in batch:
+            step["completed"] = True
+        commits += 1
+    return commits, out_of_order
+
+
+def main(n_tasks: int, n_steps: int, max_parallel: int, file_time: float, command_time: float):
+    for mode, hints in [("sequential", False), ("legacy", False), ("scheduler", False), ("scheduler", True)]:
+        rnd = random.Random(0)
+        times = []
+        commits = []
+        out_of_order = 0
+        for _ in range(n_tasks):
+            steps = make_task(rnd, n_steps, hints)
+            t0 = perf_counter()
+            n_commits, n_out_of_order = asyncio.run(run_task(steps, mode, max_parallel, file_time, command_time))
+            times.append(perf_counter() - t0)
+            commits.append(n_commits)
+            out_of_order += n_out_of_order
+
+        name = f"{mode} (hints)" if hints else mode
+        print(
+            f"{name:>17}: {mean(times):6.2f} s per task, {mean(commits):5.1f} commits per task, "
+            f"{out_of_order:4d} steps run before their dependencies"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=20, help="Number of tasks")
+    parser.add_argument("--steps", type=int, default=20, help="Number of steps per task")
+    parser.add_argument("--max-parallel", type=int, default=8, help="Maximum number of steps run at the same time")
+    parser.add_argument("--file-time", type=float, default=0.2, help="Simulated time to write a file (seconds)")
+    parser.add_argument("--command-time", type=float, default=0.1, help="Simulated time to run a command (seconds)")
+    args = parser.parse_args()
+    main(args.tasks, args.steps, args.max_parallel, args.file_time, args.command_time)
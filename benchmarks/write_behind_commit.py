@@ -0,0 +1,93 @@
+"""
+Benchmark committing project states in the background (write-behind).
+
+Simulates `--steps` agent steps on a project with `--files` files, stored
+in an SQLite database on disk. In each step the agent waits for an LLM
+response (simulated with a `--llm-latency` ms sleep), logs the request,
+saves a file and the state is committed, the way the Orchestrator does.
+Compares waiting for each commit to finish (as before) with writing it in
+the background while the next step waits for the LLM, and reports the mean
+step time and the time spent waiting for the commits.
+
+Usage:
+
+    python -m benchmarks.write_behind_commit [--files 2000] [--steps 50] [--llm-latency 100]
+"""
+
+import asyncio
+import os.path
+from argparse import ArgumentParser
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from core.config import DBConfig, FileSystemType, LLMProvider, get_config
+from core.db.models import FileContent
+from core.db.session import SessionManager
+from core.db.setup import run_migrations
+from core.llm.request_log import LLMRequestLog
+from core.state.state_manager import StateManager
+
+
+def file_content(path: str, version: int) -> str:
+    return f"// {path} v{version}\n" + "export function f(x) {\n  return x * 2;\n}\n" * 20
+
+
+async def run(db_path: str, n_files: int, n_steps: int, llm_latency: float, write_behind: bool) -> dict:
+    url = f"sqlite+aiosqlite:///{db_path}"
+    run_migrations(DBConfig(url=url))
+    FileContent.cache.clear()
+
+    sm = StateManager(SessionManager(DBConfig(url=url)))
+    await sm.create_project("benchmark")
+    await sm.commit()
+    paths = [f"src/module{i % 25}/file{i}.js" for i in range(n_files)]
+    await sm.save_files({path: file_content(path, 0) for path in paths})
+    await sm.commit()
+
+    step_times = []
+    commit_times = []
+    for i in range(n_steps):
+        t0 = perf_counter()
+
+        # The agent waits for the LLM, then logs the request and saves the changes
+        await asyncio.sleep(llm_latency)
+        request_log = LLMRequestLog(provider=LLMProvider.OPENAI, model="gpt-4o", temperature=0.5)
+        await sm.log_llm_request(request_log)
+        path = paths[i * 7 % n_files]
+        await sm.save_file(path, file_content(path, i + 1))
+        sm.next_state.steps = sm.next_state.steps + [{"id": i, "completed": True}]
+
+        t1 = perf_counter()
+        await sm.commit(wait=not write_behind)
+        commit_times.append(perf_counter() - t1)
+        step_times.append(perf_counter() - t0)
+
+    await sm.wait_for_commit()
+    await sm.rollback()
+
+    return {
+        "step": mean(step_times),
+        "commit": mean(commit_times),
+    }
+
+
+def main(n_files: int, n_steps: int, llm_latency: float):
+    get_config().fs.type = FileSystemType.MEMORY
+
+    with TemporaryDirectory() as tmpdir:
+        for name, write_behind in [("blocking", False), ("write-behind", True)]:
+            r = asyncio.run(run(os.path.join(tmpdir, f"{name}.db"), n_files, n_steps, llm_latency, write_behind))
+            print(
+                f"{name:>12}: step {1000 * r['step']:6.1f} ms mean, "
+                f"blocked on commit {1000 * r['commit']:5.1f} ms mean"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000, help="Number of files in the project")
+    parser.add_argument("--steps", type=int, default=50, help="Number of steps to run")
+    parser.add_argument("--llm-latency", type=float, default=100, help="Simulated LLM latency (ms)")
+    args = parser.parse_args()
+    main(args.files, args.steps, args.llm_latency / 1000)
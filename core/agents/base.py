@@ -4,6 +4,7 @@ from core.agents.response import AgentResponse
 from core.config import get_config
 from core.db.models import ProjectState
 from core.llm.base import BaseLLMClient, LLMError
+from core.llm.cache import LLMResponseCache
 from core.log import get_logger
 from core.proc.process_manager import ProcessManager
 from core.state.state_manager import StateManager
@@ -102,6 +103,8 @@ class BaseAgent:
         :param placeholder: Placeholder text for the input field.
         :return: User response.
         """
+        # Make sure the work so far is saved before waiting for the user
+        await self.state_manager.wait_for_commit()
         response = await self.ui.ask_question(
             question,
             buttons=buttons,
@@ -188,7 +191,13 @@ class BaseAgent:
         llm_config = config.llm_for_agent(name)
         client_class = BaseLLMClient.for_provider(llm_config.provider)
         stream_handler = self.stream_handler if stream_output else None
-        llm_client = client_class(llm_config, stream_handler=stream_handler, error_handler=self.error_handler)
+        cache = LLMResponseCache.from_config(config.llm_cache) if llm_config.cache else None
+        llm_client = client_class(
+            llm_config,
+            stream_handler=stream_handler,
+            error_handler=self.error_handler,
+            cache=cache,
+        )
 
         async def client(convo, **kwargs) -> Any:
             """
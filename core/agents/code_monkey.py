@@ -137,6 +137,9 @@ class CodeMonkey(FileDiffMixin, BaseAgent):
 
     async def describe_files(self) -> AgentResponse:
         llm = self.get_llm(DESCRIBE_FILES_AGENT_NAME)
+        await self.current_state.load_file_contents(
+            file.path for file in self.current_state.files if not file.meta.get("description")
+        )
         to_describe = {
             file.path: file.content.content for file in self.current_state.files if not file.meta.get("description")
         }
@@ -213,7 +216,7 @@ class CodeMonkey(FileDiffMixin, BaseAgent):
         )
 
         await self.state_manager.save_file(file_path, new_content)
-        self.next_state.complete_step("save_file")
+        self.next_state.complete_step("save_file", self.step.get("id"))
 
         input_required = self.state_manager.get_input_required(new_content, file_path)
         if input_required:
@@ -1,6 +1,5 @@
 import json
 import sys
-from copy import deepcopy
 from typing import TYPE_CHECKING, Optional
 
 import jsonref
@@ -82,12 +81,6 @@ class AgentConvo(Convo):
         )
         return self
 
-    def fork(self) -> "AgentConvo":
-        child = AgentConvo(self.agent_instance)
-        child.messages = deepcopy(self.messages)
-        child.prompt_log = deepcopy(self.prompt_log)
-        return child
-
     def trim(self, trim_index: int, trim_count: int) -> "AgentConvo":
         """
         Trim the conversation starting from the given index by 1 message.
@@ -1,6 +1,6 @@
 import json
 from enum import Enum
-from typing import Annotated, Literal, Union
+from typing import Annotated, Literal, Optional, Union
 from uuid import uuid4
 
 from pydantic import BaseModel, Field
@@ -37,23 +37,33 @@ class SaveFileOptions(BaseModel):
     path: str
 
 
-class SaveFileStep(BaseModel):
+class BaseStep(BaseModel):
+    depends_on: Optional[list[int]] = Field(
+        description=(
+            "Numbers (counting from 1) of the earlier steps that must be done before this step can start "
+            "(omit if not sure)"
+        ),
+        default=None,
+    )
+
+
+class SaveFileStep(BaseStep):
     type: Literal[StepType.SAVE_FILE] = StepType.SAVE_FILE
     save_file: SaveFileOptions
     related_api_endpoints: list[str] = Field(description="API endpoints that are implemented in this file", default=[])
 
 
-class CommandStep(BaseModel):
+class CommandStep(BaseStep):
     type: Literal[StepType.COMMAND] = StepType.COMMAND
     command: CommandOptions
 
 
-class HumanInterventionStep(BaseModel):
+class HumanInterventionStep(BaseStep):
     type: Literal[StepType.HUMAN_INTERVENTION] = StepType.HUMAN_INTERVENTION
     human_intervention_description: str
 
 
-class UtilityFunction(BaseModel):
+class UtilityFunction(BaseStep):
     type: Literal[StepType.UTILITY_FUNCTION] = StepType.UTILITY_FUNCTION
     file: str
     function_name: str
@@ -260,11 +270,36 @@ class Developer(ChatWithBreakdownMixin, RelevantFilesMixin, BaseAgent):
     def set_next_steps(self, response: TaskSteps, source: str):
         # For logging/debugging purposes, we don't want to remove the finished steps
         # until we're done with the task.
-        unique_steps = self.remove_duplicate_steps({**response.model_dump()})
+        data = response.model_dump()
+        # The ordering hints refer to the steps by their number, the scheduler needs their IDs
+        ids = [uuid4().hex for _ in data["steps"]]
+        for i, step in enumerate(data["steps"]):
+            if step.get("depends_on") is not None:
+                step["depends_on"] = [ids[n - 1] for n in step["depends_on"] if 1 <= n <= i]
+            step["id"] = ids[i]
+
+        all_steps = data["steps"]
+        unique_steps = self.remove_duplicate_steps(data)
+
+        # Hints referring to a dropped duplicate step now refer to the step kept for the same file
+        kept_ids = {step["id"] for step in unique_steps["steps"]}
+        kept_by_path = {
+            step["save_file"]["path"]: step["id"] for step in unique_steps["steps"] if step["type"] == "save_file"
+        }
+        replaced = {
+            step["id"]: kept_by_path.get(step["save_file"]["path"]) if step["type"] == "save_file" else None
+            for step in all_steps
+            if step["id"] not in kept_ids
+        }
+        for step in unique_steps["steps"]:
+            if step.get("depends_on"):
+                depends_on = [replaced.get(step_id, step_id) for step_id in step["depends_on"]]
+                step["depends_on"] = list(dict.fromkeys(step_id for step_id in depends_on if step_id))
+
         finished_steps = [step for step in self.current_state.steps if step["completed"]]
         self.next_state.steps = finished_steps + [
             {
-                "id": uuid4().hex,
+                "id": step["id"],
                 "completed": False,
                 "source": source,
                 "iteration_index": len(self.current_state.iterations),
@@ -279,7 +314,7 @@ class Developer(ChatWithBreakdownMixin, RelevantFilesMixin, BaseAgent):
 
         # Process steps attribute
         for step in data["steps"]:
-            if isinstance(step, SaveFileStep) and any(
+            if step["type"] == "save_file" and any(
                 s["type"] == "save_file" and s["save_file"]["path"] == step["save_file"]["path"] for s in unique_steps
             ):
                 continue
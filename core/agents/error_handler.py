@@ -61,6 +61,8 @@ class ErrorHandler(BaseAgent):
         * status_code - exit code for the command (or None if the command timed out)
         * stdout - standard output of the command
         * stderr - standard error of the command
+        * step_id - ID of the step that ran the command (other steps, eg. file
+          writes, may have run in parallel with it)
 
         :return: AgentResponse
         """
@@ -69,6 +71,7 @@ class ErrorHandler(BaseAgent):
         status_code = details.get("status_code")
         stdout = details.get("stdout", "")
         stderr = details.get("stderr", "")
+        step_id = details.get("step_id")
 
         if not message:
             raise ValueError("No error message provided in command error response")
@@ -85,13 +88,19 @@ class ErrorHandler(BaseAgent):
             log.info("Skipping command error debug (requested by user)")
             return AgentResponse.done(self)
 
+        steps = self.current_state.steps
+        step_index = next(
+            (i for i, step in enumerate(steps) if step_id and step.get("id") == step_id),
+            steps.index(self.current_state.current_step),
+        )
+        step_id = steps[step_index].get("id")
+
         llm = self.get_llm(stream_output=True)
         convo = AgentConvo(self).template(
             "debug",
-            task_steps=self.current_state.steps,
+            task_steps=steps,
             current_task=self.current_state.current_task,
-            # FIXME: can this break?
-            step_index=self.current_state.steps.index(self.current_state.current_step),
+            step_index=step_index,
             cmd=cmd,
             timeout=timeout,
             stdout=stdout,
@@ -116,6 +125,10 @@ class ErrorHandler(BaseAgent):
             }
         ]
         # TODO: maybe have ProjectState.finished_steps as well? would make the debug/ran_command prompts nicer too
-        self.next_state.steps = [s for s in self.current_state.steps if s.get("completed") is True]
+        # The steps completed in parallel with the failed command are kept (they're only completed in
+        # the next state), and the failed command is removed along with the remaining steps
+        self.next_state.steps = [
+            s for s in self.next_state.steps if s.get("completed") is True and s.get("id") != step_id
+        ]
         # No need to call complete_step() here as we've just removed the steps so that Developer can break down the iteration
         return AgentResponse.done(self)
@@ -6,9 +6,11 @@ from pydantic import BaseModel, Field
 from core.agents.base import BaseAgent
 from core.agents.convo import AgentConvo
 from core.agents.response import AgentResponse
+from core.config import get_config
 from core.llm.parser import JSONParser
 from core.log import get_logger
 from core.proc.exec_log import ExecLog
+from core.proc.output_capture import excerpt
 from core.proc.process_manager import ProcessManager
 from core.state.state_manager import StateManager
 from core.ui.base import AgentSource, UIBase, UISource
@@ -105,10 +107,16 @@ class Executor(BaseAgent):
         log.info(f"Running command `{cmd}` with timeout {timeout}s")
         status_code, stdout, stderr = await self.process_manager.run_command(cmd, timeout=timeout)
 
-        llm_response = await self.check_command_output(cmd, timeout, stdout, stderr, status_code)
+        # Only the most relevant part of the output is sent to the LLM and logged (the
+        # beginning and the end), the user has already seen the whole output in the UI
+        config = get_config().process_output
+        prompt_stdout = excerpt(stdout, config.prompt_excerpt_size)
+        prompt_stderr = excerpt(stderr, config.prompt_excerpt_size)
+        llm_response = await self.check_command_output(cmd, timeout, prompt_stdout, prompt_stderr, status_code)
 
         duration = (datetime.now(timezone.utc) - started_at).total_seconds()
 
+        step_id = self.step.get("id")
         self.complete()
         self.next_state.action = f'Run "{cmd_name}"'
 
@@ -120,8 +128,8 @@ class Executor(BaseAgent):
             env={},
             timeout=timeout,
             status_code=status_code,
-            stdout=stdout,
-            stderr=stderr,
+            stdout=excerpt(stdout, config.log_excerpt_size),
+            stderr=excerpt(stderr, config.log_excerpt_size),
             analysis=llm_response.analysis,
             success=llm_response.success,
         )
@@ -137,9 +145,10 @@ class Executor(BaseAgent):
             {
                 "cmd": cmd,
                 "timeout": timeout,
-                "stdout": stdout,
-                "stderr": stderr,
+                "stdout": prompt_stdout,
+                "stderr": prompt_stderr,
                 "status_code": status_code,
+                "step_id": step_id,
             },
         )
 
@@ -176,5 +185,6 @@ class Executor(BaseAgent):
         This is intentional, so that the error handler can decide what to do with the
         information we give it.
         """
+        step_id = self.step.get("id")
         self.step = None
-        self.next_state.complete_step("command")
+        self.next_state.complete_step("command", step_id)
@@ -1,3 +1,5 @@
+import asyncio
+from typing import Callable, Optional
 from uuid import uuid4
 
 from core.agents.base import BaseAgent
@@ -5,7 +7,7 @@ from core.agents.convo import AgentConvo
 from core.agents.mixins import FileDiffMixin
 from core.agents.response import AgentResponse
 from core.config import FRONTEND_AGENT_NAME
-from core.llm.parser import DescriptiveCodeBlockParser
+from core.llm.parser import CodeBlock, DescriptiveCodeBlockParser, ParsedBlocks
 from core.log import get_logger
 from core.telemetry import telemetry
 from core.templates.registry import PROJECT_TEMPLATES
@@ -92,12 +94,9 @@ class Frontend(FileDiffMixin, BaseAgent):
             description=description,
             user_feedback=None,
         )
-        response = await llm(convo, parser=DescriptiveCodeBlockParser())
-        response_blocks = response.blocks
+        response = await self.generate_and_process(llm, convo)
         convo.assistant(response.original_response)
 
-        await self.process_response(response_blocks)
-
         self.next_state.epics[-1]["messages"] = convo.messages
         self.next_state.epics[-1]["fe_iteration_done"] = (
             "done" in response.original_response[-20:].lower().strip() or len(convo.messages) > 11
@@ -119,12 +118,9 @@ class Frontend(FileDiffMixin, BaseAgent):
         convo.user(
             "Ok, now think carefully about your previous response. If the response ends by mentioning something about continuing with the implementation, continue but don't implement any files that have already been implemented. If your last response doesn't end by mentioning continuing, respond only with `DONE` and with nothing else."
         )
-        response = await llm(convo, parser=DescriptiveCodeBlockParser())
-        response_blocks = response.blocks
+        response = await self.generate_and_process(llm, convo)
         convo.assistant(response.original_response)
 
-        await self.process_response(response_blocks)
-
         self.next_state.epics[-1]["messages"] = convo.messages
         self.next_state.epics[-1]["fe_iteration_done"] = (
             "done" in response.original_response[-20:].lower().strip() or len(convo.messages) > 15
@@ -179,9 +175,7 @@ class Frontend(FileDiffMixin, BaseAgent):
             description=self.current_state.epics[0]["description"],
             user_feedback=answer.text,
         )
-        response = await llm(convo, parser=DescriptiveCodeBlockParser())
-
-        await self.process_response(response.blocks)
+        await self.generate_and_process(llm, convo)
 
         return False
 
@@ -204,6 +198,7 @@ class Frontend(FileDiffMixin, BaseAgent):
             )
 
             inputs = []
+            await self.current_state.load_file_contents()
             for file in self.current_state.files:
                 if not file.content:
                     continue
@@ -216,50 +211,119 @@ class Frontend(FileDiffMixin, BaseAgent):
 
         return AgentResponse.done(self)
 
-    async def process_response(self, response_blocks: list) -> AgentResponse:
+    async def generate_and_process(self, llm: Callable, convo: AgentConvo) -> ParsedBlocks:
+        """
+        Get the response from the LLM and process the blocks in it.
+
+        While the response is streamed, the files are prepared in the
+        background as soon as their blocks are complete: the new contents
+        are stored (see `StateManager.stage_files()`) and the diffs shown.
+        The files are only saved to the project (and the commands run)
+        after the request succeeded, from the final response, so an attempt
+        that fails or is retried doesn't leave partial changes behind.
+
+        :param llm: LLM client to use.
+        :param convo: Conversation to send to the LLM.
+        :return: The parsed response.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        prepared = set()
+
+        async def worker():
+            while (block := await queue.get()) is not None:
+                file_path = self.get_block_file_path(block)
+                if file_path:
+                    content = block.content.strip()
+                    await self.state_manager.stage_files({file_path: content})
+                    await self.show_file_diff(file_path, content)
+                    prepared.add((file_path, content))
+
+        worker_task = asyncio.create_task(worker())
+        try:
+            response = await llm(convo, parser=DescriptiveCodeBlockParser(on_block=queue.put_nowait))
+        finally:
+            queue.put_nowait(None)
+            await worker_task
+
+        await self.process_response(response.blocks, prepared)
+        return response
+
+    async def process_response(
+        self, response_blocks: list[CodeBlock], prepared: Optional[set[tuple[str, str]]] = None
+    ) -> AgentResponse:
         """
         Processes the response blocks from the LLM.
 
         :param response_blocks: The response blocks from the LLM.
+        :param prepared: Files (path and content) whose diffs were already shown.
         :return: AgentResponse.done(self)
         """
         for block in response_blocks:
-            description = block.description.strip()
-            content = block.content.strip()
-
-            # Split description into lines and check the last line for file path
-            description_lines = description.split("\n")
-            last_line = description_lines[-1].strip()
-
-            if "file:" in last_line:
-                # Extract file path from the last line - get everything after "file:"
-                file_path = last_line[last_line.index("file:") + 5 :].strip()
-                file_path = file_path.strip("\"'`")
-                new_content = content
-                old_content = self.current_state.get_file_content_by_path(file_path)
-                n_new_lines, n_del_lines = self.get_line_changes(old_content, new_content)
-                await self.ui.send_file_status(file_path, "done", source=self.ui_source)
-                await self.ui.generate_diff(
-                    file_path, old_content, new_content, n_new_lines, n_del_lines, source=self.ui_source
-                )
-                await self.state_manager.save_file(file_path, new_content)
-
-            elif "command:" in last_line:
-                # Split multiple commands and execute them sequentially
-                commands = content.strip().split("\n")
-                for command in commands:
-                    command = command.strip()
-                    if command:
-                        # Add "cd client" prefix if not already present
-                        if not command.startswith("cd "):
-                            command = f"cd client && {command}"
-                        await self.send_message(f"Running command: `{command}`...")
-                        await self.process_manager.run_command(command)
-            else:
-                log.info(f"Unknown block description: {description}")
+            await self.process_block(block, prepared)
 
         return AgentResponse.done(self)
 
+    async def show_file_diff(self, file_path: str, new_content: str):
+        """
+        Show the changes of the file in the UI.
+
+        :param file_path: Path of the file.
+        :param new_content: New content of the file.
+        """
+        await self.current_state.load_file_contents([file_path])
+        old_content = self.current_state.get_file_content_by_path(file_path)
+        n_new_lines, n_del_lines = self.get_line_changes(old_content, new_content)
+        await self.ui.send_file_status(file_path, "done", source=self.ui_source)
+        await self.ui.generate_diff(
+            file_path, old_content, new_content, n_new_lines, n_del_lines, source=self.ui_source
+        )
+
+    @staticmethod
+    def get_block_file_path(block: CodeBlock) -> Optional[str]:
+        """
+        Get the path of the file saved by the response block.
+
+        :param block: The response block from the LLM.
+        :return: File path, or None if the block doesn't save a file.
+        """
+        # The file path is on the last line of the description
+        last_line = block.description.strip().split("\n")[-1].strip()
+        if "file:" not in last_line:
+            return None
+        # Extract file path from the last line - get everything after "file:"
+        return last_line[last_line.index("file:") + 5 :].strip().strip("\"'`")
+
+    async def process_block(self, block: CodeBlock, prepared: Optional[set[tuple[str, str]]] = None):
+        """
+        Process a single response block: save the file or run the commands.
+
+        :param block: The response block from the LLM.
+        :param prepared: Files (path and content) whose diffs were already shown.
+        """
+        description = block.description.strip()
+        content = block.content.strip()
+        last_line = description.split("\n")[-1].strip()
+        file_path = self.get_block_file_path(block)
+
+        if file_path:
+            if not prepared or (file_path, content) not in prepared:
+                await self.show_file_diff(file_path, content)
+            await self.state_manager.save_file(file_path, content)
+
+        elif "command:" in last_line:
+            # Split multiple commands and execute them sequentially
+            commands = content.strip().split("\n")
+            for command in commands:
+                command = command.strip()
+                if command:
+                    # Add "cd client" prefix if not already present
+                    if not command.startswith("cd "):
+                        command = f"cd client && {command}"
+                    await self.send_message(f"Running command: `{command}`...")
+                    await self.process_manager.run_command(command)
+        else:
+            log.info(f"Unknown block description: {description}")
+
     async def apply_template(self, options: dict = {}):
         """
         Applies a template to the frontend.
@@ -64,6 +64,7 @@ class Importer(BaseAgent):
 
         self.send_message("Analyzing project ...")
 
+        await self.current_state.load_file_contents()
         convo = AgentConvo(self).template(
             "analyze_project", relevant_files=relevant_files, example_spec=EXAMPLE_PROJECT_DESCRIPTION
         )
@@ -86,7 +87,7 @@ class Importer(BaseAgent):
             }
         ]
 
-        n_lines = sum(len(f.content.content.splitlines()) for f in self.current_state.files)
+        n_lines = await self.current_state.count_lines()
         await telemetry.trace_code_event(
             "existing-project",
             {
@@ -175,6 +175,7 @@ class RelevantFilesMixin:
             read_files = [
                 file for file in self.current_state.files if file.path in (getattr(action, "read_files", []) or [])
             ]
+            await self.current_state.load_file_contents(file.path for file in read_files)
 
             convo.remove_last_x_messages(1)
             convo.assistant(llm_response.original_response)
@@ -187,6 +188,7 @@ class RelevantFilesMixin:
         relevant_files = [path for path in relevant_files if path in existing_files]
         self.current_state.relevant_files = relevant_files
         self.next_state.relevant_files = relevant_files
+        await self.current_state.load_file_contents(file.path for file in self.current_state.relevant_file_objects)
 
         return AgentResponse.done(self)
 
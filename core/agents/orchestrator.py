@@ -18,12 +18,15 @@ from core.agents.legacy_handler import LegacyHandler
 from core.agents.problem_solver import ProblemSolver
 from core.agents.response import AgentResponse, ResponseType
 from core.agents.spec_writer import SpecWriter
+from core.agents.step_scheduler import ready_steps
 from core.agents.task_completer import TaskCompleter
 from core.agents.tech_lead import TechLead
 from core.agents.tech_writer import TechnicalWriter
 from core.agents.troubleshooter import Troubleshooter
+from core.config import get_config
 from core.db.models.project_state import IterationStatus, TaskStatus
 from core.log import get_logger
+from core.proc.install_cache import npm_install
 from core.telemetry import telemetry
 
 log = get_logger(__name__)
@@ -68,11 +71,12 @@ class Orchestrator(BaseAgent, GitMixin):
         # handle_done() and let us do other per-step processing (eg. describing files) in between agent runs.
         while True:
             await self.update_stats()
+            await self.load_prompt_files()
 
             agent = self.create_agent(response)
 
-            # In case where agent is a list, run all agents in parallel.
-            # Only one agent type can be run in parallel at a time (for now). See handle_parallel_responses().
+            # In case where agent is a list (of the agents for the task steps that are ready to run),
+            # run all agents in parallel. See handle_parallel_responses().
             if isinstance(agent, list):
                 tasks = [single_agent.run() for single_agent in agent]
                 log.debug(
@@ -80,33 +84,15 @@ class Orchestrator(BaseAgent, GitMixin):
                 )
                 responses = await asyncio.gather(*tasks)
                 response = self.handle_parallel_responses(agent[0], responses)
-
-                should_update_knowledge_base = any(
-                    "src/pages/" in single_agent.step.get("save_file", {}).get("path", "")
-                    or "src/api/" in single_agent.step.get("save_file", {}).get("path", "")
-                    or len(single_agent.step.get("related_api_endpoints")) > 0
-                    for single_agent in agent
-                )
-
-                if should_update_knowledge_base:
-                    files_with_implemented_apis = [
-                        {
-                            "path": single_agent.step.get("save_file", {}).get("path", None),
-                            "related_api_endpoints": single_agent.step.get("related_api_endpoints"),
-                            "line": 0,  # TODO implement getting the line number here
-                        }
-                        for single_agent in agent
-                        if len(single_agent.step.get("related_api_endpoints")) > 0
-                    ]
-                    await self.state_manager.update_apis(files_with_implemented_apis)
-                    await self.state_manager.update_implemented_pages_and_apis()
+                await self.update_knowledge_base(agent)
 
             else:
                 log.debug(f"Running agent {agent.__class__.__name__} (step {self.current_state.step_index})")
                 response = await agent.run()
+                await self.update_knowledge_base([agent])
 
             if response.type == ResponseType.EXIT:
-                log.debug(f"Agent {agent.__class__.__name__} requested exit")
+                log.debug(f"Agent {self.agent_name(agent)} requested exit")
                 break
 
             if response.type == ResponseType.DONE:
@@ -114,6 +100,7 @@ class Orchestrator(BaseAgent, GitMixin):
                 continue
 
         # TODO: rollback changes to "next" so they aren't accidentally committed?
+        await self.state_manager.wait_for_commit()
         return True
 
     async def install_dependencies(self):
@@ -127,7 +114,34 @@ class Orchestrator(BaseAgent, GitMixin):
         node_modules_path = os.path.join(self.state_manager.get_full_project_root(), "node_modules")
         if not os.path.exists(node_modules_path):
             await self.send_message("Installing project dependencies...")
-            await self.process_manager.run_command("npm install", show_output=False)
+            await npm_install(self.process_manager, show_output=False)
+
+    async def update_knowledge_base(self, agents: List[BaseAgent]):
+        """
+        Update the knowledge base with the pages and APIs implemented by the CodeMonkey steps.
+
+        :param agents: Agents that were run.
+        """
+        file_agents = [agent for agent in agents if isinstance(agent, CodeMonkey) and agent.step]
+        should_update_knowledge_base = any(
+            "src/pages/" in single_agent.step.get("save_file", {}).get("path", "")
+            or "src/api/" in single_agent.step.get("save_file", {}).get("path", "")
+            or len(single_agent.step.get("related_api_endpoints")) > 0
+            for single_agent in file_agents
+        )
+
+        if should_update_knowledge_base:
+            files_with_implemented_apis = [
+                {
+                    "path": single_agent.step.get("save_file", {}).get("path", None),
+                    "related_api_endpoints": single_agent.step.get("related_api_endpoints"),
+                    "line": 0,  # TODO implement getting the line number here
+                }
+                for single_agent in file_agents
+                if len(single_agent.step.get("related_api_endpoints")) > 0
+            ]
+            await self.state_manager.update_apis(files_with_implemented_apis)
+            await self.state_manager.update_implemented_pages_and_apis()
 
     def handle_parallel_responses(self, agent: BaseAgent, responses: List[AgentResponse]) -> AgentResponse:
         """
@@ -137,22 +151,26 @@ class Orchestrator(BaseAgent, GitMixin):
         should return a single response that represents the combined responses
         of all agents.
 
-        :param agent: The original agent that was run in parallel.
+        The responses are checked in the order of the task steps: the first
+        response that is neither DONE nor INPUT_REQUIRED (eg. an error) is
+        returned as is, otherwise the files requiring input from all agents
+        are combined into a single INPUT_REQUIRED response.
+
+        :param agent: The first agent that was run in parallel.
         :param responses: List of responses from all agents.
         :return: Combined response.
         """
-        response = AgentResponse.done(agent)
-        if isinstance(agent, CodeMonkey):
-            files = []
-            for single_response in responses:
-                if single_response.type == ResponseType.INPUT_REQUIRED:
-                    files += single_response.data.get("files", [])
-                    break
-            if files:
-                response = AgentResponse.input_required(agent, files)
-            return response
-        else:
-            raise ValueError(f"Unhandled parallel agent type: {agent.__class__.__name__}")
+        for single_response in responses:
+            if single_response.type not in [ResponseType.DONE, ResponseType.INPUT_REQUIRED]:
+                return single_response
+
+        files = []
+        for single_response in responses:
+            if single_response.type == ResponseType.INPUT_REQUIRED:
+                files += single_response.data.get("files", [])
+        if files:
+            return AgentResponse.input_required(agent, files)
+        return AgentResponse.done(agent)
 
     async def offline_changes_check(self):
         """
@@ -197,7 +215,19 @@ class Orchestrator(BaseAgent, GitMixin):
 
         log.info("Offline changes check done.")
 
-    async def handle_done(self, agent: BaseAgent, response: AgentResponse) -> AgentResponse:
+    @staticmethod
+    def agent_name(agent: Union[List[BaseAgent], BaseAgent]) -> str:
+        """
+        Get the name of the agent, or of the agents run in parallel, for logging.
+
+        :param agent: Agent or list of agents.
+        :return: Agent class name(s).
+        """
+        if isinstance(agent, list):
+            return ", ".join(single_agent.__class__.__name__ for single_agent in agent)
+        return agent.__class__.__name__
+
+    async def handle_done(self, agent: Union[List[BaseAgent], BaseAgent], response: AgentResponse) -> AgentResponse:
         """
         Handle the DONE response from the agent and commit current state to the database.
 
@@ -216,14 +246,15 @@ class Orchestrator(BaseAgent, GitMixin):
         n_finished_steps = n_steps - len(self.next_state.unfinished_steps)
 
         log.debug(
-            f"Agent {agent.__class__.__name__} is done, "
+            f"Agent {self.agent_name(agent)} is done, "
             f"committing state for step {self.current_state.step_index}: "
             f"{n_finished_epics}/{n_epics} epics, "
             f"{n_finished_tasks}/{n_tasks} tasks, "
             f"{n_finished_iterations}/{n_iterations} iterations, "
             f"{n_finished_steps}/{n_steps} dev steps."
         )
-        await self.state_manager.commit()
+        # The state is written in the background, while the next agent starts working
+        await self.state_manager.commit(wait=False)
 
         # If there are any new or modified files changed outside Pythagora,
         # this is a good time to add them to the project. If any of them have
@@ -287,9 +318,11 @@ class Orchestrator(BaseAgent, GitMixin):
             return Developer(self.state_manager, self.ui)
 
         if state.current_step:
-            # Execute next step in the task
-            # TODO: this can be parallelized in the future
-            return self.create_agent_for_step(state.current_step)
+            # Execute the next steps in the task; the steps that don't depend on each other run in parallel
+            steps = ready_steps(state.steps, get_config().step_scheduler.max_parallel)
+            if len(steps) == 1:
+                return self.create_agent_for_step(steps[0])
+            return [self.create_agent_for_step(step) for step in steps]
 
         if state.unfinished_iterations:
             current_iteration_status = state.current_iteration["status"]
@@ -327,14 +360,10 @@ class Orchestrator(BaseAgent, GitMixin):
         # We have just finished the task, call Troubleshooter to ask the user to review
         return Troubleshooter(self.state_manager, self.ui)
 
-    def create_agent_for_step(self, step: dict) -> Union[List[BaseAgent], BaseAgent]:
+    def create_agent_for_step(self, step: dict) -> BaseAgent:
         step_type = step.get("type")
         if step_type == "save_file":
-            steps = self.current_state.get_steps_of_type("save_file")
-            parallel = []
-            for step in steps:
-                parallel.append(CodeMonkey(self.state_manager, self.ui, step=step))
-            return parallel
+            return CodeMonkey(self.state_manager, self.ui, step=step)
         elif step_type == "command":
             return self.executor.for_step(step)
         elif step_type == "human_intervention":
@@ -396,14 +425,22 @@ class Orchestrator(BaseAgent, GitMixin):
                 source,
             )
 
-        total_files = 0
-        total_lines = 0
-        for file in self.current_state.files:
-            total_files += 1
-            total_lines += len(file.content.content.splitlines())
-
-        telemetry.set("num_files", total_files)
-        telemetry.set("num_lines", total_lines)
+        telemetry.set("num_files", len(self.current_state.files))
+        telemetry.set("num_lines", await self.current_state.count_lines())
 
         stats = telemetry.get_project_stats()
         await self.ui.send_project_stats(stats)
+
+    async def load_prompt_files(self):
+        """
+        Load the contents of the files included in the agent prompts.
+
+        The prompts include only the relevant (and modified) files if they're
+        known, otherwise all the files in the project (see the `files_list`
+        prompt partial), so only those contents are loaded.
+        """
+        state = self.current_state
+        if state.relevant_files:
+            await state.load_file_contents(file.path for file in state.relevant_file_objects)
+        else:
+            await state.load_file_contents()
@@ -0,0 +1,87 @@
+import os.path
+from typing import Optional
+
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Steps that can run in parallel with other steps; all other step types (eg. utility
+# functions, which are handled by the Developer) always run alone, in order
+PARALLEL_STEP_TYPES = {"save_file", "command", "human_intervention"}
+
+# Steps that ask the user or change the project environment: these run one at a time, in order
+SEQUENTIAL_STEP_TYPES = {"command", "human_intervention"}
+
+
+def _step_path(step: dict) -> str:
+    return os.path.normpath(step["save_file"]["path"])
+
+
+def depends_on(step: dict, earlier: dict) -> bool:
+    """
+    Check whether a task step must run after an earlier step.
+
+    A step depends on an earlier step if:
+    * either of them is not one of `PARALLEL_STEP_TYPES`;
+    * it lists the earlier step in its `depends_on` hint (from `parse_task`);
+    * both write the same file;
+    * both are commands or human interventions;
+    * one is a command or human intervention and the other writes a file,
+      unless the step lists its dependencies explicitly (`depends_on` is set).
+
+    :param step: Step to check.
+    :param earlier: A step before it in the task.
+    :return: True if `step` can only start after `earlier` is completed.
+    """
+    step_type = step.get("type")
+    earlier_type = earlier.get("type")
+    if step_type not in PARALLEL_STEP_TYPES or earlier_type not in PARALLEL_STEP_TYPES:
+        return True
+
+    hint = step.get("depends_on")
+    if hint and earlier.get("id") in hint:
+        return True
+
+    if step_type == "save_file" and earlier_type == "save_file":
+        return _step_path(step) == _step_path(earlier)
+    if step_type in SEQUENTIAL_STEP_TYPES and earlier_type in SEQUENTIAL_STEP_TYPES:
+        return True
+
+    # A file and a command (or human intervention): without a hint, the command might use
+    # the file, or the file might build on what the command did (eg. installed or generated)
+    return hint is None
+
+
+def step_dependencies(steps: list[dict]) -> list[set[int]]:
+    """
+    Build the dependency graph of the task steps.
+
+    :param steps: Task steps, in order.
+    :return: For each step, indices of the earlier steps it depends on (see `depends_on()`).
+    """
+    return [{j for j in range(i) if depends_on(step, steps[j])} for i, step in enumerate(steps)]
+
+
+def ready_steps(steps: list[dict], max_steps: Optional[int] = None) -> list[dict]:
+    """
+    Get the unfinished task steps that can run now, in parallel.
+
+    A step is ready when all the steps it depends on are completed. The
+    first unfinished step is always ready, and the ready steps are returned
+    in the task order, so the choice doesn't depend on which of the previous
+    steps finished first.
+
+    :param steps: Task steps, in order.
+    :param max_steps: Maximum number of steps to return (None for no limit).
+    :return: List of the steps that can run now.
+    """
+    dependencies = step_dependencies(steps)
+    ready = [
+        step
+        for step, deps in zip(steps, dependencies)
+        if not step.get("completed") and all(steps[j].get("completed") for j in deps)
+    ]
+    if max_steps is not None:
+        ready = ready[:max_steps]
+    log.debug(f"Steps ready to run: {[step.get('id') for step in ready]}")
+    return ready
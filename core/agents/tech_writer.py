@@ -37,7 +37,7 @@ class TechnicalWriter(BaseAgent):
         n_finished = n_tasks - n_unfinished
         pct_finished = int(n_finished / n_tasks * 100)
         n_files = len(self.current_state.files)
-        n_lines = sum(len(f.content.content.splitlines()) for f in self.current_state.files)
+        n_lines = await self.current_state.count_lines()
         await self.ui.send_message(
             "\n\n".join(
                 [
@@ -90,6 +90,8 @@ def parse_arguments() -> Namespace:
         --project: Load a specific project
         --branch: Load a specific branch
         --step: Load a specific step in a project/branch
+        --delete: Delete a specific project
+        --compact: Compact the history of all projects (or the one given with --project)
         --llm-endpoint: Use specific API endpoint for the given provider
         --llm-key: Use specific LLM key for the given provider
         --import-v0: Import data from a v0 (gpt-pilot) database with the given path
@@ -115,6 +117,11 @@ def parse_arguments() -> Namespace:
     parser.add_argument("--branch", help="Load a specific branch", type=UUID, required=False)
     parser.add_argument("--step", help="Load a specific step in a project/branch", type=int, required=False)
     parser.add_argument("--delete", help="Delete a specific project", type=UUID, required=False)
+    parser.add_argument(
+        "--compact",
+        help="Compact the history of all projects (or the one given with --project)",
+        action="store_true",
+    )
     parser.add_argument(
         "--llm-endpoint",
         help="Use specific API endpoint for the given provider",
@@ -292,6 +299,21 @@ async def delete_project(db: SessionManager, project_id: UUID) -> bool:
     return await sm.delete_project(project_id)
 
 
+async def compact_history(db: SessionManager, project_id: Optional[UUID] = None) -> bool:
+    """
+    Compact the history of a project, or of all projects.
+
+    :param db: Database session manager.
+    :param project_id: Project ID (optional, compacts all projects if not provided).
+    :return: True if the history was compacted successfully.
+    """
+
+    sm = StateManager(db)
+    n_deleted = await sm.compact_history(project_id)
+    print(f"Deleted {n_deleted} old project states")
+    return True
+
+
 def show_config():
     """
     Print the current configuration to stdout.
@@ -6,12 +6,21 @@ from argparse import Namespace
 from asyncio import run
 
 from core.agents.orchestrator import Orchestrator
-from core.cli.helpers import delete_project, init, list_projects, list_projects_json, load_project, show_config
+from core.cli.helpers import (
+    compact_history,
+    delete_project,
+    init,
+    list_projects,
+    list_projects_json,
+    load_project,
+    show_config,
+)
 from core.config import LLMProvider, get_config
 from core.db.session import SessionManager
 from core.db.v0importer import LegacyDatabaseImporter
 from core.llm.anthropic_client import CustomAssertionError
 from core.llm.base import APIError, BaseLLMClient
+from core.llm.client_pool import LLMClientPool
 from core.log import get_logger
 from core.state.state_manager import StateManager
 from core.telemetry import telemetry
@@ -28,6 +37,7 @@ async def cleanup(ui: UIBase):
     if not telemetry_sent:
         await telemetry.send()
         telemetry_sent = True
+    await LLMClientPool.close()
     await ui.stop()
 
 
@@ -275,6 +285,8 @@ async def async_main(
     elif args.delete:
         success = await delete_project(db, args.delete)
         return success
+    elif args.compact:
+        return await compact_history(db, args.project)
 
     telemetry.set("user_contact", args.email)
     if args.extension_version:
@@ -308,11 +320,26 @@ async def async_main(
     return success
 
 
+async def run_and_close_db(ui: UIBase, db: SessionManager, args: Namespace) -> bool:
+    """
+    Run the main application coroutine and close the database connections.
+
+    :param ui: User interface.
+    :param db: Database session manager.
+    :param args: Command-line arguments.
+    :return: True if the application ran successfully, False otherwise.
+    """
+    try:
+        return await async_main(ui, db, args)
+    finally:
+        await db.dispose()
+
+
 def run_pythagora():
     ui, db, args = init()
     if not ui or not db:
         return -1
-    success = run(async_main(ui, db, args))
+    success = run(run_and_close_db(ui, db, args))
     return 0 if success else -1
 
 
@@ -74,6 +74,15 @@ class LLMProvider(str, Enum):
     AZURE = "azure"
 
 
+class ContextOverflowPolicy(str, Enum):
+    """
+    What to do when a prompt doesn't fit in the model's context window.
+    """
+
+    ERROR = "error"
+    TRIM = "trim"
+
+
 class UIAdapter(str, Enum):
     """
     Supported UI adapters.
@@ -111,6 +120,20 @@ class ProviderConfig(_StrictModel):
         None,
         description="Extra provider-specific configuration",
     )
+    max_connections: int = Field(
+        default=20,
+        description="Maximum number of concurrent HTTP connections to the provider's API",
+        ge=1,
+    )
+    max_keepalive_connections: int = Field(
+        default=10,
+        description="Maximum number of idle HTTP connections kept open for reuse",
+        ge=0,
+    )
+    http2: bool = Field(
+        default=False,
+        description="Use HTTP/2 for the provider's API (requires the `h2` package)",
+    )
 
 
 class AgentLLMConfig(_StrictModel):
@@ -129,6 +152,15 @@ class AgentLLMConfig(_StrictModel):
         ge=0.0,
         le=1.0,
     )
+    cache: bool = Field(
+        default=False,
+        description="Cache responses to identical requests and reuse them instead of calling the LLM again",
+    )
+    context_overflow: ContextOverflowPolicy = Field(
+        default=ContextOverflowPolicy.ERROR,
+        description="What to do if the prompt doesn't fit in the model's context window: "
+        "fail without calling the LLM (error), or drop the oldest messages from the conversation (trim)",
+    )
 
 
 class LLMConfig(_StrictModel):
@@ -166,6 +198,29 @@ class LLMConfig(_StrictModel):
         None,
         description="Extra provider-specific configuration",
     )
+    max_connections: int = Field(
+        default=20,
+        description="Maximum number of concurrent HTTP connections to the provider's API",
+        ge=1,
+    )
+    max_keepalive_connections: int = Field(
+        default=10,
+        description="Maximum number of idle HTTP connections kept open for reuse",
+        ge=0,
+    )
+    http2: bool = Field(
+        default=False,
+        description="Use HTTP/2 for the provider's API (requires the `h2` package)",
+    )
+    cache: bool = Field(
+        default=False,
+        description="Cache responses to identical requests and reuse them instead of calling the LLM again",
+    )
+    context_overflow: ContextOverflowPolicy = Field(
+        default=ContextOverflowPolicy.ERROR,
+        description="What to do if the prompt doesn't fit in the model's context window: "
+        "fail without calling the LLM (error), or drop the oldest messages from the conversation (trim)",
+    )
 
     @classmethod
     def from_provider_and_agent_configs(cls, provider: ProviderConfig, agent: AgentLLMConfig):
@@ -178,9 +233,73 @@ class LLMConfig(_StrictModel):
             connect_timeout=provider.connect_timeout,
             read_timeout=provider.read_timeout,
             extra=provider.extra,
+            max_connections=provider.max_connections,
+            max_keepalive_connections=provider.max_keepalive_connections,
+            http2=provider.http2,
+            cache=agent.cache,
+            context_overflow=agent.context_overflow,
         )
 
 
+class LLMCacheConfig(_StrictModel):
+    """
+    Configuration for the on-disk LLM response cache.
+
+    The cache is only used by agents that have `cache` enabled
+    in their LLM configuration.
+    """
+
+    path: str = Field(
+        join(ROOT_DIR, "data", "cache", "llm-responses.db"),
+        description="Path to the SQLite database holding the cached responses",
+    )
+    max_size: int = Field(
+        256 * 1024 * 1024,
+        description="Maximum total size (in bytes) of cached responses before least recently used ones are evicted",
+        ge=0,
+    )
+    max_age: int = Field(
+        30 * 24 * 60 * 60,
+        description="Maximum age (in seconds) of a cached response before it is evicted",
+        ge=0,
+    )
+
+
+class InstallCacheConfig(_StrictModel):
+    """
+    Configuration for the shared cache of installed project dependencies.
+
+    When enabled, the `node_modules` trees installed by `npm install` are
+    kept in a content-addressed store, keyed on the `package.json` and
+    `package-lock.json` files, and restored from there into the projects
+    with the same dependencies instead of running `npm install` again.
+    """
+
+    enabled: bool = Field(False, description="Whether to use the dependency install cache")
+    path: str = Field(
+        join(ROOT_DIR, "data", "cache", "installs"),
+        description="Directory holding the cached dependency trees (can be shared between workspaces)",
+    )
+    max_size: int = Field(
+        10 * 1024 * 1024 * 1024,
+        description="Maximum total size (in bytes) of the cached files before least recently used trees are evicted",
+        ge=0,
+    )
+    max_age: int = Field(
+        30 * 24 * 60 * 60,
+        description="Maximum age (in seconds) of a cached tree before it is evicted",
+        ge=0,
+    )
+    hardlink: bool = Field(
+        False,
+        description=(
+            "Restore the files as hard links to the cache if they can't be reflinked, instead of copying "
+            "them; the links share the cached files, so only enable it if node_modules is never modified "
+            "in place (the cache must be on the same filesystem as the workspace)"
+        ),
+    )
+
+
 class PromptConfig(_StrictModel):
     """
     Configuration for prompt templates:
@@ -220,6 +339,15 @@ class LogConfig(_StrictModel):
     )
 
 
+class SQLiteProfile(str, Enum):
+    """
+    SQLite connection settings (see `core.db.session`).
+    """
+
+    DEFAULT = "default"
+    PERFORMANCE = "performance"
+
+
 class DBConfig(_StrictModel):
     """
     Configuration for database connections.
@@ -234,6 +362,10 @@ class DBConfig(_StrictModel):
         description="Database connection URL",
     )
     debug_sql: bool = Field(False, description="Log all SQL queries to the console")
+    sqlite_profile: SQLiteProfile = Field(
+        SQLiteProfile.DEFAULT,
+        description="SQLite connection settings: `performance` enables WAL journaling and reuses the connection",
+    )
 
     @field_validator("url")
     @classmethod
@@ -249,6 +381,92 @@ class DBConfig(_StrictModel):
         raise ValueError(f"Unsupported database URL scheme in: {v}")
 
 
+class HistoryConfig(_StrictModel):
+    """
+    Configuration for keeping the project history.
+
+    If enabled, the old project states are periodically squashed into
+    checkpoints at the task boundaries (see `Branch.compact()`). This is
+    opt-in, as the deleted states can no longer be loaded (with `--step`),
+    and their LLM requests and command logs are deleted with them.
+    """
+
+    keep_last: int = Field(
+        100,
+        description="Number of most recent project states that are always kept",
+        ge=1,
+    )
+    compact_interval: int = Field(
+        0,
+        description="Compact the project history every this many steps (0 to disable, the default)",
+        ge=0,
+    )
+
+
+class ProcessOutputConfig(_StrictModel):
+    """
+    Configuration for capturing the output of the commands and processes.
+
+    Only the beginning and the end of the output of each process are kept
+    in memory (see `OutputCapture`); optionally, the whole output is also
+    saved to (temporary) files on disk.
+    """
+
+    head_size: int = Field(
+        16 * 1024,
+        description="Number of characters kept from the beginning of the output",
+        ge=0,
+    )
+    tail_size: int = Field(
+        256 * 1024,
+        description="Number of characters kept from the end of the output",
+        ge=1,
+    )
+    spill: bool = Field(
+        False,
+        description="Save the whole output to files on disk (see `spill_dir`)",
+    )
+    spill_dir: Optional[str] = Field(
+        None,
+        description="Directory for the saved output (defaults to the system temporary directory)",
+    )
+    spill_segment_size: int = Field(
+        1024 * 1024,
+        description="Number of characters saved per file",
+        ge=1,
+    )
+    spill_max_size: int = Field(
+        256 * 1024 * 1024,
+        description="Maximum number of characters saved per process, before the oldest files are removed",
+        ge=1,
+    )
+    prompt_excerpt_size: int = Field(
+        16 * 1024,
+        description="Maximum number of characters of the output included in the LLM prompts",
+        ge=1,
+    )
+    log_excerpt_size: int = Field(
+        64 * 1024,
+        description="Maximum number of characters of the output stored in the command log",
+        ge=1,
+    )
+
+
+class StepSchedulerConfig(_StrictModel):
+    """
+    Configuration for running the task steps.
+
+    The steps that don't depend on each other (eg. files that can be written
+    independently) are run in parallel (see `ready_steps()`).
+    """
+
+    max_parallel: int = Field(
+        8,
+        description="Maximum number of task steps run at the same time (1 to run them one by one)",
+        ge=1,
+    )
+
+
 class PlainUIConfig(_StrictModel):
     """
     Configuration for plaintext console UI.
@@ -303,12 +521,16 @@ class FileSystemConfig(_StrictModel):
     )
     ignore_paths: list[str] = Field(
         DEFAULT_IGNORE_PATHS,
-        description="List of paths to ignore when scanning for files and folders",
+        description="List of paths to ignore when scanning for files and folders (.gitignore syntax)",
     )
     ignore_size_threshold: int = Field(
         IGNORE_SIZE_THRESHOLD,
         description="Files larger than this size should be ignored",
     )
+    watch: bool = Field(
+        True,
+        description="Watch the workspace for changes instead of rescanning all files on each check",
+    )
 
 
 class Config(_StrictModel):
@@ -392,9 +614,14 @@ class Config(_StrictModel):
             ),
         }
     )
+    llm_cache: LLMCacheConfig = LLMCacheConfig()
+    install_cache: InstallCacheConfig = InstallCacheConfig()
     prompt: PromptConfig = PromptConfig()
     log: LogConfig = LogConfig()
     db: DBConfig = DBConfig()
+    history: HistoryConfig = HistoryConfig()
+    process_output: ProcessOutputConfig = ProcessOutputConfig()
+    step_scheduler: StepSchedulerConfig = StepSchedulerConfig()
     ui: UIConfig = PlainUIConfig()
     fs: FileSystemConfig = FileSystemConfig()
 
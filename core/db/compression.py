@@ -0,0 +1,94 @@
+"""
+Transparent compression for large text and JSON database columns.
+
+Values are stored as binary, with a one-byte header indicating the encoding:
+raw UTF-8 (for values too small to benefit from compression), or zlib.
+Values stored as text before the compression was introduced are returned
+as they are.
+"""
+
+import json
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+# Encoding of the stored value, indicated by the first byte
+ENCODING_RAW = b"\x00"
+ENCODING_ZLIB = b"\x01"
+
+# Values smaller than this (in bytes) are stored uncompressed
+COMPRESS_THRESHOLD = 128
+
+# zlib compression level (1-9), higher is smaller but slower to compress
+COMPRESSION_LEVEL = 6
+
+
+def compress(text: str) -> bytes:
+    """
+    Encode the text for storage, compressing it if it's worth it.
+
+    :param text: Text to compress.
+    :return: Encoded value.
+    """
+    data = text.encode("utf-8")
+    if len(data) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        if len(compressed) < len(data):
+            return ENCODING_ZLIB + compressed
+    return ENCODING_RAW + data
+
+
+def decompress(value: bytes) -> str:
+    """
+    Decode the stored value.
+
+    :param value: Value encoded with `compress()`.
+    :return: The original text.
+    """
+    value = bytes(value)
+    encoding, data = value[:1], value[1:]
+    if encoding == ENCODING_ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    if encoding == ENCODING_RAW:
+        return data.decode("utf-8")
+    raise ValueError(f"Unknown encoding of compressed value: {encoding!r}")
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored compressed."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress(value)
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+        return decompress(value)
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON column stored compressed."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress(json.dumps(value))
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return json.loads(value)
+        return json.loads(decompress(value))
+
+
+__all__ = ["compress", "decompress", "CompressedText", "CompressedJSON"]
@@ -0,0 +1,109 @@
+"""
+Minimal JSON Patch (RFC 6902) support for delta-encoded project states.
+
+Only the "add", "remove" and "replace" operations are generated and
+supported, which is enough to describe any change between two JSON
+documents.
+"""
+
+from copy import deepcopy
+from typing import Any
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _diff(old: Any, new: Any, path: str, ops: list[dict]):
+    if type(old) is type(new) and old == new:
+        return
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, f"{path}/{_escape(key)}", ops)
+            else:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": deepcopy(value)})
+
+    elif isinstance(old, list) and isinstance(new, list) and old and new:
+        common = min(len(old), len(new))
+        for i in range(common):
+            _diff(old[i], new[i], f"{path}/{i}", ops)
+        # Remove from the end so the indices of the remaining items don't shift
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/-", "value": deepcopy(new[i])})
+
+    else:
+        ops.append({"op": "replace", "path": path, "value": deepcopy(new)})
+
+
+def make_patch(old: dict, new: dict) -> list[dict]:
+    """
+    Create a JSON patch that transforms `old` into `new`.
+
+    Lists are compared item by item, which keeps the patch small for the
+    typical changes to the project plan (items appended or updated in place).
+
+    The values in the patch are copies, so later changes to `new` don't
+    affect the patch.
+
+    :param old: The original document.
+    :param new: The changed document.
+    :return: List of patch operations.
+    """
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def apply_patch(doc: dict, patch: list[dict]) -> dict:
+    """
+    Apply a JSON patch to the document, in place.
+
+    :param doc: The document to modify.
+    :param patch: List of patch operations created with `make_patch()`.
+    :return: The modified document.
+    """
+    for op in patch:
+        tokens = [_unescape(token) for token in op["path"].split("/")[1:]]
+        if not tokens:
+            raise ValueError("Patching the document root is not supported")
+
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        key = tokens[-1]
+        if isinstance(parent, list):
+            if op["op"] == "add":
+                if key == "-":
+                    parent.append(op["value"])
+                else:
+                    parent.insert(int(key), op["value"])
+            elif op["op"] == "remove":
+                del parent[int(key)]
+            elif op["op"] == "replace":
+                parent[int(key)] = op["value"]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op['op']}")
+        else:
+            if op["op"] in ("add", "replace"):
+                parent[key] = op["value"]
+            elif op["op"] == "remove":
+                del parent[key]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op['op']}")
+
+    return doc
+
+
+__all__ = ["make_patch", "apply_patch"]
@@ -0,0 +1,89 @@
+"""Add file manifest references and history compaction
+
+Revision ID: 1611e28033e2
+Revises: 57d0e5c348e0
+Create Date: 2025-02-12 10:37:05.412900
+
+"""
+
+import json
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "1611e28033e2"
+down_revision: Union[str, None] = "57d0e5c348e0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Number of manifests converted at once
+BATCH_SIZE = 500
+
+
+def _load(value):
+    # Raw JSON columns are returned as strings by some drivers
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def upgrade() -> None:
+    from core.db.models.file_manifest import FileManifest
+
+    op.create_table(
+        "file_manifest_refs",
+        sa.Column("manifest_id", sa.String(), nullable=False),
+        sa.Column("ref_id", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["manifest_id"],
+            ["file_manifests.id"],
+            name=op.f("fk_file_manifest_refs_manifest_id_file_manifests"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("manifest_id", "ref_id", name=op.f("pk_file_manifest_refs")),
+    )
+    with op.batch_alter_table("file_manifest_refs", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_file_manifest_refs_ref_id"), ["ref_id"], unique=False)
+
+    with op.batch_alter_table("project_states", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_project_states_manifest_id"), ["manifest_id"], unique=False)
+        batch_op.create_index(batch_op.f("ix_project_states_specification_id"), ["specification_id"], unique=False)
+
+    with op.batch_alter_table("branches", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("compacted_step", sa.Integer(), server_default="0", nullable=False))
+
+    # Index the references of the existing manifests
+    conn = op.get_bind()
+    last_id = None
+    while True:
+        query = "SELECT id, entries FROM file_manifests"
+        if last_id is not None:
+            query += " WHERE id > :last_id"
+        rows = conn.execute(sa.text(f"{query} ORDER BY id LIMIT {BATCH_SIZE}"), {"last_id": last_id}).all()
+        if not rows:
+            break
+
+        refs = [
+            {"manifest_id": row.id, "ref_id": ref_id}
+            for row in rows
+            for ref_id in FileManifest.get_refs(_load(row.entries))
+        ]
+        if refs:
+            conn.execute(
+                sa.text("INSERT INTO file_manifest_refs (manifest_id, ref_id) VALUES (:manifest_id, :ref_id)"), refs
+            )
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("branches", schema=None) as batch_op:
+        batch_op.drop_column("compacted_step")
+
+    with op.batch_alter_table("project_states", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_project_states_specification_id"))
+        batch_op.drop_index(batch_op.f("ix_project_states_manifest_id"))
+
+    with op.batch_alter_table("file_manifest_refs", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_file_manifest_refs_ref_id"))
+
+    op.drop_table("file_manifest_refs")
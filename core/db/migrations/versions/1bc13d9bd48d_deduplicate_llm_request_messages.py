@@ -0,0 +1,173 @@
+"""Deduplicate LLM request messages
+
+Revision ID: 1bc13d9bd48d
+Revises: 1611e28033e2
+Create Date: 2025-02-14 16:02:48.733500
+
+"""
+
+import json
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "1bc13d9bd48d"
+down_revision: Union[str, None] = "1611e28033e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+log = logging.getLogger("alembic.runtime.migration")
+
+# Number of requests converted at once
+BATCH_SIZE = 500
+
+FIELDS = ("messages", "prompts")
+
+
+def _load(value) -> list:
+    from core.db.compression import decompress
+
+    if value is None:
+        return []
+    if isinstance(value, (bytes, memoryview)):
+        value = decompress(value)
+    # Raw JSON columns are returned as strings by some drivers
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def upgrade() -> None:
+    from core.db.compression import compress
+    from core.db.models.llm_message import LLMMessage
+
+    op.create_table(
+        "llm_messages",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_llm_messages")),
+    )
+    op.create_table(
+        "llm_request_messages",
+        sa.Column("request_id", sa.Integer(), nullable=False),
+        sa.Column("field", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("message_id", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["message_id"],
+            ["llm_messages.id"],
+            name=op.f("fk_llm_request_messages_message_id_llm_messages"),
+            ondelete="RESTRICT",
+        ),
+        sa.ForeignKeyConstraint(
+            ["request_id"],
+            ["llm_requests.id"],
+            name=op.f("fk_llm_request_messages_request_id_llm_requests"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("request_id", "field", "position", name=op.f("pk_llm_request_messages")),
+    )
+    with op.batch_alter_table("llm_request_messages", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_llm_request_messages_message_id"), ["message_id"], unique=False)
+
+    # Store the messages of the existing requests once
+    conn = op.get_bind()
+    stored = set()
+    n_refs = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(
+                f"SELECT id, messages, prompts FROM llm_requests WHERE id > :last_id ORDER BY id LIMIT {BATCH_SIZE}"
+            ),
+            {"last_id": last_id},
+        ).all()
+        if not rows:
+            break
+
+        messages = []
+        refs = []
+        for row in rows:
+            for field in FIELDS:
+                for position, message in enumerate(_load(getattr(row, field))):
+                    message_id = LLMMessage.hash_message(message)
+                    if message_id not in stored:
+                        stored.add(message_id)
+                        messages.append({"id": message_id, "data": compress(json.dumps(message))})
+                    refs.append({"request_id": row.id, "field": field, "position": position, "message_id": message_id})
+
+        if messages:
+            conn.execute(sa.text("INSERT INTO llm_messages (id, data) VALUES (:id, :data)"), messages)
+        if refs:
+            conn.execute(
+                sa.text(
+                    "INSERT INTO llm_request_messages (request_id, field, position, message_id) "
+                    "VALUES (:request_id, :field, :position, :message_id)"
+                ),
+                refs,
+            )
+        n_refs += len(refs)
+        last_id = rows[-1].id
+
+    if n_refs:
+        log.info(f"Deduplicated LLM request messages: {n_refs} -> {len(stored)}")
+
+    with op.batch_alter_table("llm_requests", schema=None) as batch_op:
+        batch_op.drop_column("prompts")
+        batch_op.drop_column("messages")
+
+
+def downgrade() -> None:
+    from core.db.compression import compress
+
+    with op.batch_alter_table("llm_requests", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("messages", sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column("prompts", sa.LargeBinary(), nullable=True))
+
+    # Store the messages in each request again
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(f"SELECT id FROM llm_requests WHERE id > :last_id ORDER BY id LIMIT {BATCH_SIZE}"),
+            {"last_id": last_id},
+        ).all()
+        if not rows:
+            break
+
+        request_ids = [row.id for row in rows]
+        values = {request_id: {field: [] for field in FIELDS} for request_id in request_ids}
+        refs = conn.execute(
+            sa.text(
+                "SELECT r.request_id, r.field, m.data FROM llm_request_messages r "
+                "JOIN llm_messages m ON m.id = r.message_id "
+                "WHERE r.request_id IN :request_ids ORDER BY r.request_id, r.field, r.position"
+            ).bindparams(sa.bindparam("request_ids", expanding=True)),
+            {"request_ids": request_ids},
+        )
+        for ref in refs:
+            values[ref.request_id][ref.field].append(_load(ref.data))
+
+        conn.execute(
+            sa.text("UPDATE llm_requests SET messages = :messages, prompts = :prompts WHERE id = :id"),
+            [
+                {
+                    "id": request_id,
+                    "messages": compress(json.dumps(value["messages"])),
+                    "prompts": compress(json.dumps(value["prompts"])),
+                }
+                for request_id, value in values.items()
+            ],
+        )
+        last_id = rows[-1].id
+
+    with op.batch_alter_table("llm_requests", schema=None) as batch_op:
+        batch_op.alter_column("messages", existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.alter_column("prompts", existing_type=sa.LargeBinary(), nullable=False)
+
+    with op.batch_alter_table("llm_request_messages", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_llm_request_messages_message_id"))
+
+    op.drop_table("llm_request_messages")
+    op.drop_table("llm_messages")
@@ -0,0 +1,80 @@
+"""Delta-encode project states
+
+Revision ID: 245adcb684a2
+Revises: 3968d770dced
+Create Date: 2025-02-03 11:24:09.518734
+
+"""
+
+import json
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import sqlite
+
+# revision identifiers, used by Alembic.
+revision: str = "245adcb684a2"
+down_revision: Union[str, None] = "3968d770dced"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DELTA_FIELDS = (
+    "epics",
+    "tasks",
+    "steps",
+    "iterations",
+    "knowledge_base",
+    "relevant_files",
+    "modified_files",
+    "docs",
+)
+NOT_NULL_FIELDS = ("epics", "tasks", "steps", "iterations", "knowledge_base", "modified_files")
+
+
+def _load(value):
+    # Raw JSON columns are returned as strings by some drivers
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def upgrade() -> None:
+    # Existing states all become full snapshots (patch is NULL)
+    with op.batch_alter_table("project_states", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("patch", sa.JSON(), nullable=True))
+        for field in NOT_NULL_FIELDS:
+            batch_op.alter_column(field, existing_type=sqlite.JSON(), nullable=True)
+
+
+def downgrade() -> None:
+    from core.db.json_patch import apply_patch
+
+    # Store the full project plan in every delta-encoded state
+    conn = op.get_bind()
+    columns = ", ".join(DELTA_FIELDS)
+    rows = conn.execute(
+        sa.text(
+            f"SELECT id, branch_id, step_index, patch, {columns} FROM project_states ORDER BY branch_id, step_index"
+        )
+    ).all()
+
+    branch_id = None
+    data = None
+    for row in rows:
+        if row.patch is None:
+            branch_id = row.branch_id
+            data = {field: _load(getattr(row, field)) for field in DELTA_FIELDS}
+            continue
+
+        if row.branch_id != branch_id or data is None:
+            raise RuntimeError(f"No snapshot found for delta-encoded state {row.id}")
+
+        apply_patch(data, _load(row.patch))
+        conn.execute(
+            sa.text(f"UPDATE project_states SET {', '.join(f'{f} = :{f}' for f in DELTA_FIELDS)} WHERE id = :id"),
+            {"id": row.id, **{field: json.dumps(value) for field, value in data.items()}},
+        )
+
+    with op.batch_alter_table("project_states", schema=None) as batch_op:
+        for field in NOT_NULL_FIELDS:
+            batch_op.alter_column(field, existing_type=sqlite.JSON(), nullable=False)
+        batch_op.drop_column("patch")
@@ -0,0 +1,126 @@
+"""Compress file contents and LLM requests
+
+Revision ID: 57d0e5c348e0
+Revises: 82166c94f2b3
+Create Date: 2025-02-07 14:12:53.118300
+
+"""
+
+import json
+import logging
+from typing import Callable, Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "57d0e5c348e0"
+down_revision: Union[str, None] = "82166c94f2b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+log = logging.getLogger("alembic.runtime.migration")
+
+# Number of rows converted at once
+BATCH_SIZE = 500
+
+
+def _json_text(value) -> str:
+    # Raw JSON columns are returned as strings by some drivers
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _size(value) -> int:
+    if value is None:
+        return 0
+    return len(value if isinstance(value, (str, bytes)) else json.dumps(value))
+
+
+def _convert(
+    table: str,
+    column: str,
+    new_type: sa.types.TypeEngine,
+    convert: Callable,
+    nullable: bool,
+    server_default: Union[str, None] = None,
+):
+    """
+    Convert the column to the new type, converting the values in Python.
+
+    The values are written to a new column, which then replaces the old one.
+
+    :return: Total size of the old and the new values.
+    """
+    tmp_column = f"{column}_tmp"
+    op.add_column(table, sa.Column(tmp_column, new_type, nullable=True))
+
+    conn = op.get_bind()
+    old_size = new_size = 0
+    last_id = None
+    while True:
+        query = f"SELECT id, {column} FROM {table}"
+        if last_id is not None:
+            query += " WHERE id > :last_id"
+        rows = conn.execute(sa.text(f"{query} ORDER BY id LIMIT {BATCH_SIZE}"), {"last_id": last_id}).all()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            old_value = getattr(row, column)
+            new_value = convert(old_value) if old_value is not None else None
+            updates.append({"id": row.id, "value": new_value})
+            old_size += _size(old_value)
+            new_size += _size(new_value)
+        conn.execute(sa.text(f"UPDATE {table} SET {tmp_column} = :value WHERE id = :id"), updates)
+        last_id = rows[-1].id
+
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.drop_column(column)
+        batch_op.alter_column(
+            tmp_column,
+            new_column_name=column,
+            existing_type=new_type,
+            nullable=nullable,
+            server_default=server_default,
+        )
+
+    return old_size, new_size
+
+
+def upgrade() -> None:
+    from core.db.compression import compress
+
+    for table, columns in [
+        ("file_contents", [("content", compress, False)]),
+        (
+            "llm_requests",
+            [
+                ("messages", lambda v: compress(_json_text(v)), False),
+                ("prompts", lambda v: compress(_json_text(v)), False),
+                ("response", compress, True),
+            ],
+        ),
+    ]:
+        old_size = new_size = 0
+        for column, convert, nullable in columns:
+            sizes = _convert(table, column, sa.LargeBinary(), convert, nullable)
+            old_size += sizes[0]
+            new_size += sizes[1]
+        if new_size:
+            log.info(
+                f"Compressed {table}: {old_size / 1024 / 1024:.1f} MB -> {new_size / 1024 / 1024:.1f} MB "
+                f"(ratio {old_size / new_size:.1f})"
+            )
+
+
+def downgrade() -> None:
+    from core.db.compression import decompress
+
+    def _decompress(value) -> str:
+        return value if isinstance(value, str) else decompress(value)
+
+    _convert("file_contents", "content", sa.String(), _decompress, False)
+    _convert("llm_requests", "messages", sa.JSON(), _decompress, False)
+    _convert("llm_requests", "prompts", sa.JSON(), _decompress, False, server_default="[]")
+    _convert("llm_requests", "response", sa.String(), _decompress, True)
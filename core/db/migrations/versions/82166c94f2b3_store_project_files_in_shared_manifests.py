@@ -0,0 +1,129 @@
+"""Store project files in shared manifests
+
+Revision ID: 82166c94f2b3
+Revises: 245adcb684a2
+Create Date: 2025-02-05 09:41:27.234000
+
+"""
+
+import json
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "82166c94f2b3"
+down_revision: Union[str, None] = "245adcb684a2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _load(value):
+    # Raw JSON columns are returned as strings by some drivers
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def upgrade() -> None:
+    from core.db.models.file_manifest import FileManifest
+
+    op.create_table(
+        "file_manifests",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("entries", sa.JSON(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_file_manifests")),
+    )
+    with op.batch_alter_table("project_states", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("manifest_id", sa.String(), nullable=True))
+        batch_op.create_foreign_key(
+            batch_op.f("fk_project_states_manifest_id_file_manifests"),
+            "file_manifests",
+            ["manifest_id"],
+            ["id"],
+            ondelete="RESTRICT",
+        )
+
+    # Convert the files of each state to a manifest tree
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.text("SELECT project_state_id, path, content_id, meta FROM files ORDER BY project_state_id")
+    ).all()
+    files_by_state = {}
+    for row in rows:
+        entry = {"content_id": row.content_id}
+        meta = _load(row.meta)
+        if meta:
+            entry["meta"] = meta
+        files_by_state.setdefault(row.project_state_id, {})[row.path] = entry
+
+    stored = set()
+    for state_id, files in files_by_state.items():
+        manifest_id, manifests = FileManifest.build(files)
+        new_manifests = [
+            {"id": key, "entries": json.dumps(value)} for key, value in manifests.items() if key not in stored
+        ]
+        if new_manifests:
+            conn.execute(sa.text("INSERT INTO file_manifests (id, entries) VALUES (:id, :entries)"), new_manifests)
+            stored.update(manifests)
+        conn.execute(
+            sa.text("UPDATE project_states SET manifest_id = :manifest_id WHERE id = :id"),
+            {"id": state_id, "manifest_id": manifest_id},
+        )
+
+    op.drop_table("files")
+
+
+def downgrade() -> None:
+    op.create_table(
+        "files",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("project_state_id", sa.Uuid(), nullable=False),
+        sa.Column("content_id", sa.String(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("meta", sa.JSON(), server_default="{}", nullable=False),
+        sa.ForeignKeyConstraint(
+            ["content_id"], ["file_contents.id"], name=op.f("fk_files_content_id_file_contents"), ondelete="RESTRICT"
+        ),
+        sa.ForeignKeyConstraint(
+            ["project_state_id"],
+            ["project_states.id"],
+            name=op.f("fk_files_project_state_id_project_states"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_files")),
+        sa.UniqueConstraint("project_state_id", "path", name=op.f("uq_files_project_state_id")),
+    )
+
+    # Store the files of each state as separate rows again
+    conn = op.get_bind()
+    manifests = {row.id: _load(row.entries) for row in conn.execute(sa.text("SELECT id, entries FROM file_manifests"))}
+    states = conn.execute(sa.text("SELECT id, manifest_id FROM project_states WHERE manifest_id IS NOT NULL")).all()
+    for state in states:
+        files = []
+        queue = [(state.manifest_id, "")]
+        while queue:
+            manifest_id, prefix = queue.pop()
+            for name, entry in manifests[manifest_id].items():
+                if "manifest_id" in entry:
+                    queue.append((entry["manifest_id"], f"{prefix}{name}/"))
+                else:
+                    files.append(
+                        {
+                            "project_state_id": state.id,
+                            "path": f"{prefix}{name}",
+                            "content_id": entry["content_id"],
+                            "meta": json.dumps(entry.get("meta", {})),
+                        }
+                    )
+        conn.execute(
+            sa.text(
+                "INSERT INTO files (project_state_id, path, content_id, meta) "
+                "VALUES (:project_state_id, :path, :content_id, :meta)"
+            ),
+            files,
+        )
+
+    with op.batch_alter_table("project_states", schema=None) as batch_op:
+        batch_op.drop_constraint(batch_op.f("fk_project_states_manifest_id_file_manifests"), type_="foreignkey")
+        batch_op.drop_column("manifest_id")
+    op.drop_table("file_manifests")
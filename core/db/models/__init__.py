@@ -8,6 +8,8 @@ from .branch import Branch
 from .exec_log import ExecLog
 from .file import File
 from .file_content import FileContent
+from .file_manifest import FileManifest, FileManifestRef
+from .llm_message import LLMMessage, LLMRequestMessage
 from .llm_request import LLMRequest
 from .project import Project
 from .project_state import ProjectState
@@ -21,7 +23,11 @@ __all__ = [
     "ExecLog",
     "File",
     "FileContent",
+    "FileManifest",
+    "FileManifestRef",
+    "LLMMessage",
     "LLMRequest",
+    "LLMRequestMessage",
     "Project",
     "ProjectState",
     "Specification",
@@ -1,21 +1,45 @@
+from copy import deepcopy
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional, Union
 from uuid import UUID, uuid4
 
-from sqlalchemy import ForeignKey, inspect, select
+from sqlalchemy import ForeignKey, Index, delete, inspect, select, update
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
 from core.db.models import Base
+from core.log import get_logger
 
 if TYPE_CHECKING:
     from sqlalchemy.ext.asyncio import AsyncSession
 
     from core.db.models import ExecLog, LLMRequest, Project, ProjectState, UserInput
 
+log = get_logger(__name__)
+
+
+def _get_progress(plan: dict) -> tuple:
+    """
+    Get the progress of the project plan, for detecting the task boundaries.
+
+    :param plan: The project plan fields of a state.
+    :return: Numbers of finished and planned epics and tasks.
+    """
+    from core.db.models.project_state import TaskStatus
+
+    epics = plan["epics"] or []
+    tasks = plan["tasks"] or []
+    return (
+        sum(1 for epic in epics if epic.get("completed")),
+        len(epics),
+        sum(1 for task in tasks if task.get("status") == TaskStatus.DONE),
+        len(tasks),
+    )
+
 
 class Branch(Base):
     __tablename__ = "branches"
+    __table_args__ = (Index("ix_branches_project_id_name", "project_id", "name"),)
 
     DEFAULT = "main"
 
@@ -26,6 +50,8 @@ class Branch(Base):
     # Attributes
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     name: Mapped[str] = mapped_column(default=DEFAULT)
+    # States up to this step were already compacted (see `compact()`)
+    compacted_step: Mapped[int] = mapped_column(default=0, server_default="0")
 
     # Relationships
     project: Mapped["Project"] = relationship(back_populates="branches", lazy="selectin")
@@ -53,6 +79,9 @@ class Branch(Base):
         """
         Get the last project state of the branch.
 
+        The project plan of delta-encoded states is rebuilt from the
+        preceding snapshot and patches.
+
         :return: The last step of the branch, or None if there are no steps.
         """
 
@@ -68,12 +97,18 @@ class Branch(Base):
             .order_by(ProjectState.step_index.desc())
             .limit(1)
         )
-        return result.scalar_one_or_none()
+        state = result.scalar_one_or_none()
+        if state is not None:
+            await state.rebuild()
+        return state
 
     async def get_state_at_step(self, step_index: int) -> Optional["ProjectState"]:
         """
         Get the project state at the given step index for the branch.
 
+        The project plan of delta-encoded states is rebuilt from the
+        preceding snapshot and patches.
+
         :return: The indicated step within the branch, or None if there's no such step.
         """
 
@@ -86,4 +121,179 @@ class Branch(Base):
         result = await session.execute(
             select(ProjectState).where((ProjectState.branch_id == self.id) & (ProjectState.step_index == step_index))
         )
-        return result.scalar_one_or_none()
+        state = result.scalar_one_or_none()
+        if state is not None:
+            await state.rebuild()
+        return state
+
+    async def compact(self, keep_last: int) -> int:
+        """
+        Squash the old project states of the branch into checkpoints.
+
+        The states before the last `keep_last` ones are deleted, except for
+        the checkpoints: the first state, and the states in which the
+        project progress (finished or planned epics and tasks) changed.
+        The LLM requests and command logs of the deleted states are deleted
+        as well (with the messages not used by other requests), while the
+        user inputs are moved to the next checkpoint.
+
+        The checkpoints that were delta-encoded against a deleted state are
+        stored as full snapshots, and linked to the previous checkpoint.
+        The file manifests, file contents and specifications that were only
+        used by the deleted states are deleted.
+
+        Only the states after the last compaction are processed, so this can
+        be run periodically (see `StateManager.compact_history()`). This
+        doesn't commit the changes.
+
+        :param keep_last: Number of most recent states to keep (at least 1).
+        :return: Number of deleted states.
+        """
+        from core.db.json_patch import apply_patch
+        from core.db.models import (
+            ExecLog,
+            FileContent,
+            FileManifest,
+            LLMMessage,
+            LLMRequest,
+            LLMRequestMessage,
+            ProjectState,
+            Specification,
+            UserInput,
+        )
+        from core.db.models.file_manifest import chunked
+        from core.db.models.project_state import DELTA_FIELDS
+
+        if keep_last < 1:
+            raise ValueError("At least one project state must be kept.")
+
+        session: "AsyncSession" = inspect(self).async_session
+        if session is None:
+            raise ValueError("Branch instance not associated with a DB session.")
+
+        result = await session.execute(
+            select(func.max(ProjectState.step_index)).where(ProjectState.branch_id == self.id)
+        )
+        last_step = result.scalar_one()
+        if last_step is None:
+            return 0
+        compacted_step = self.compacted_step
+        until = last_step - keep_last
+        if until <= compacted_step:
+            return 0
+
+        # The project plan is rebuilt from the last snapshot in the already compacted states
+        result = await session.execute(
+            select(func.max(ProjectState.step_index)).where(
+                ProjectState.branch_id == self.id,
+                ProjectState.step_index <= compacted_step,
+                ProjectState.patch.is_(None),
+            )
+        )
+        first_step = result.scalar_one() or 0
+
+        rows = await session.stream(
+            select(
+                ProjectState.id,
+                ProjectState.step_index,
+                ProjectState.specification_id,
+                ProjectState.manifest_id,
+                ProjectState.patch,
+                *[getattr(ProjectState, field) for field in DELTA_FIELDS],
+            )
+            .where(
+                ProjectState.branch_id == self.id,
+                ProjectState.step_index >= first_step,
+                ProjectState.step_index <= until + 1,
+            )
+            .order_by(ProjectState.step_index)
+        )
+
+        plan = None
+        prev_step = None
+        prev_key = None
+        checkpoint_id = None
+        squashed = []
+        # Deleted states by the checkpoint they're squashed into
+        squashed_into: dict[UUID, list[UUID]] = {}
+        # Previous checkpoint and the full plan (if it was delta-encoded) of the checkpoints to update
+        relinks: dict[UUID, tuple[UUID, Optional[dict]]] = {}
+        manifest_ids = set()
+        specification_ids = set()
+
+        async for row in rows:
+            if row.patch is None:
+                plan = {field: getattr(row, field) for field in DELTA_FIELDS}
+            elif plan is None or row.step_index != prev_step + 1:
+                raise ValueError(f"Missing step before step {row.step_index} of delta-encoded branch {self.id}")
+            else:
+                apply_patch(plan, row.patch)
+            prev_step = row.step_index
+
+            key = _get_progress(plan)
+            if row.step_index > compacted_step and row.step_index <= until and key == prev_key:
+                squashed.append(row.id)
+                manifest_ids.add(row.manifest_id)
+                specification_ids.add(row.specification_id)
+            else:
+                if squashed:
+                    squashed_into[row.id] = squashed
+                    relinks[row.id] = (checkpoint_id, deepcopy(plan) if row.patch is not None else None)
+                    squashed = []
+                checkpoint_id = row.id
+            prev_key = key
+
+        n_deleted = sum(len(ids) for ids in squashed_into.values())
+        if n_deleted:
+            deleted_ids = [state_id for ids in squashed_into.values() for state_id in ids]
+            # Unlink the checkpoints first, so they're not deleted together with their previous states
+            for ids in chunked(list(relinks)):
+                await session.execute(
+                    update(ProjectState)
+                    .where(ProjectState.id.in_(ids))
+                    .values(prev_state_id=None)
+                    .execution_options(synchronize_session=False)
+                )
+
+            message_ids = set()
+            for ids in chunked(deleted_ids):
+                request_ids = select(LLMRequest.id).where(LLMRequest.project_state_id.in_(ids))
+                result = await session.execute(
+                    select(LLMRequestMessage.message_id).where(LLMRequestMessage.request_id.in_(request_ids))
+                )
+                message_ids.update(result.scalars())
+                await session.execute(delete(LLMRequestMessage).where(LLMRequestMessage.request_id.in_(request_ids)))
+                await session.execute(delete(LLMRequest).where(LLMRequest.project_state_id.in_(ids)))
+                await session.execute(delete(ExecLog).where(ExecLog.project_state_id.in_(ids)))
+            for state_id, squashed_ids in squashed_into.items():
+                for ids in chunked(squashed_ids):
+                    await session.execute(
+                        update(UserInput)
+                        .where(UserInput.project_state_id.in_(ids))
+                        .values(project_state_id=state_id)
+                        .execution_options(synchronize_session=False)
+                    )
+            for ids in chunked(deleted_ids):
+                await session.execute(
+                    delete(ProjectState).where(ProjectState.id.in_(ids)).execution_options(synchronize_session=False)
+                )
+
+            for state_id, (prev_state_id, snapshot) in relinks.items():
+                values = {"prev_state_id": prev_state_id}
+                if snapshot is not None:
+                    values.update(snapshot, patch=None)
+                await session.execute(
+                    update(ProjectState)
+                    .where(ProjectState.id == state_id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+
+            await Specification.delete_unreferenced(session, specification_ids)
+            content_ids = await FileManifest.delete_unreferenced(session, manifest_ids - {None})
+            await FileContent.delete_unreferenced(session, content_ids)
+            await LLMMessage.delete_unreferenced(session, message_ids)
+
+        log.debug(f"Compacted steps {compacted_step + 1}-{until} of branch {self.id}, deleted {n_deleted} states")
+        self.compacted_step = until
+        return n_deleted
@@ -1,43 +1,126 @@
-from typing import TYPE_CHECKING, Optional
-from uuid import UUID
+from copy import deepcopy
+from typing import Optional
 
-from sqlalchemy import ForeignKey, UniqueConstraint
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import inspect
 
-from core.db.models import Base
+from core.db.models.file_content import FileContent
 
-if TYPE_CHECKING:
-    from core.db.models import FileContent, ProjectState
 
+class File:
+    """
+    A file in the project state.
 
-class File(Base):
-    __tablename__ = "files"
-    __table_args__ = (UniqueConstraint("project_state_id", "path"),)
+    Files aren't stored as separate database rows: the files of a project state
+    are stored in the tree of shared file manifests (see `FileManifest`), and
+    loaded as File objects when `ProjectState.files` is first accessed.
 
-    # ID and parent FKs
-    id: Mapped[int] = mapped_column(primary_key=True)
-    project_state_id: Mapped[UUID] = mapped_column(ForeignKey("project_states.id", ondelete="CASCADE"))
-    content_id: Mapped[str] = mapped_column(ForeignKey("file_contents.id", ondelete="RESTRICT"))
+    The file only references its content by hash, the content itself is loaded
+    on demand into the shared `FileContent.cache`. Contents not yet stored in
+    the database, and the contents loaded with `state.load_file_contents()`,
+    are kept by the file (and not by its clones in the next states), so they
+    stay available for the current step even if they're evicted from the cache.
+    """
 
-    # Attributes
-    path: Mapped[str] = mapped_column()
-    meta: Mapped[dict] = mapped_column(default=dict, server_default="{}")
+    def __init__(
+        self,
+        path: str,
+        content: Optional[FileContent] = None,
+        meta: Optional[dict] = None,
+        content_id: Optional[str] = None,
+    ):
+        """
+        Initialize the file object.
+
+        Either the content object, or the ID of the content stored in the
+        database must be given.
+
+        :param path: The file path, relative to the project root.
+        :param content: The file content object.
+        :param meta: File metadata (eg. description).
+        :param content_id: The content hash.
+        """
+        self.path = path
+        self.meta = meta if meta is not None else {}
+        self._content = None
+        if content is not None:
+            self.content = content
+        elif content_id is not None:
+            self.content_id = content_id
+        else:
+            raise ValueError("Either content or content_id must be provided")
+
+    @property
+    def content(self) -> FileContent:
+        """
+        The file content object.
+
+        Contents loaded from the database are served from the shared cache,
+        so they must be loaded first with `await state.load_file_contents()`.
 
-    # Relationships
-    project_state: Mapped[Optional["ProjectState"]] = relationship(back_populates="files", lazy="raise")
-    content: Mapped["FileContent"] = relationship(back_populates="files", lazy="selectin")
+        :return: The file content object.
+        """
+        if self._content is not None:
+            return self._content
+
+        fc = FileContent.cache.get(self.content_id)
+        if fc is None:
+            raise ValueError(
+                f"Content of file {self.path} is not loaded, use `await state.load_file_contents()` to load it first."
+            )
+        return fc
+
+    @content.setter
+    def content(self, content: FileContent):
+        self._content = content
+        self.content_id = content.id
+        FileContent.cache.add(content)
+
+    @property
+    def is_content_loaded(self) -> bool:
+        """
+        Whether the file keeps its content object (see `keep_content()`).
+        """
+        return self._content is not None
+
+    def keep_content(self, content: FileContent):
+        """
+        Keep the content loaded from the database, regardless of the file content cache.
+
+        :param content: The file content object.
+        """
+        self._content = content
+
+    @property
+    def is_content_stored(self) -> bool:
+        """
+        Whether the file content is stored in the database (or at least added to the session).
+        """
+        return self._content is None or not inspect(self._content).transient
+
+    def __repr__(self) -> str:
+        return f"<File(path={self.path!r}, content_id={self.content_id!r})>"
 
     def clone(self) -> "File":
         """
         Clone the file object, to be used in a new project state.
 
-        The clone references the same file content object as the original.
+        The clone references the same file content as the original. Contents
+        already stored in the database aren't kept by the clone.
 
         :return: The cloned file object.
         """
-        return File(
-            project_state=None,
-            content_id=self.content_id,
-            path=self.path,
-            meta=self.meta,
-        )
+        clone = File(path=self.path, content_id=self.content_id, meta=self.meta)
+        if self._content is not None and (inspect(self._content).transient or inspect(self._content).pending):
+            clone._content = self._content
+        return clone
+
+    def get_manifest_entry(self) -> dict:
+        """
+        Get the file entry for the file manifest.
+
+        :return: The entry with the content ID and metadata.
+        """
+        entry = {"content_id": self.content_id}
+        if self.meta:
+            entry["meta"] = deepcopy(self.meta)
+        return entry
@@ -1,26 +1,112 @@
-from typing import TYPE_CHECKING
+from collections import OrderedDict
+from typing import Iterable, Optional
 
-from sqlalchemy import delete, distinct, select
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, make_transient_to_detached, mapped_column
+from sqlalchemy.orm.util import identity_key
 
+from core.db.compression import CompressedText
 from core.db.models import Base
+from core.db.models.file_manifest import chunked
+from core.log import get_logger
 
-if TYPE_CHECKING:
-    from core.db.models import File
+log = get_logger(__name__)
+
+
+class FileContentCache:
+    """
+    Bounded LRU cache of file contents, keyed by the content hash.
+
+    The cache is shared by all the project states, so the contents of the
+    files that didn't change between the states are only kept in memory once,
+    and only as long as they're recently used. The contents added together
+    (eg. loaded by a single `FileContent.load()` call) are never evicted by
+    each other, so the cache may temporarily exceed its size if they don't fit.
+
+    The number of lines of each content is remembered even after the content
+    is evicted, for the project stats (see `ProjectState.count_lines()`).
+    """
+
+    def __init__(self, max_size: int):
+        """
+        Initialize the cache.
+
+        :param max_size: Maximum total size of the cached contents, in characters.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._items: OrderedDict[str, "FileContent"] = OrderedDict()
+        self._line_counts: dict[str, int] = {}
+
+    def __contains__(self, content_id: str) -> bool:
+        return content_id in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, content_id: str) -> Optional["FileContent"]:
+        """
+        Get the content from the cache, marking it as recently used.
+
+        :param content_id: The content hash.
+        :return: The file content object, or None if not cached.
+        """
+        fc = self._items.get(content_id)
+        if fc is not None:
+            self._items.move_to_end(content_id)
+        return fc
+
+    def get_line_count(self, content_id: str) -> Optional[int]:
+        """
+        Get the number of lines of the content, if it was ever cached.
+
+        :param content_id: The content hash.
+        :return: Number of lines, or None if not known.
+        """
+        return self._line_counts.get(content_id)
+
+    def add(self, *contents: "FileContent"):
+        """
+        Add the contents to the cache, evicting the least recently used ones if needed.
+
+        :param contents: The file content objects to add.
+        """
+        for fc in contents:
+            old = self._items.pop(fc.id, None)
+            if old is not None:
+                self.size -= len(old.content)
+            self._items[fc.id] = fc
+            self.size += len(fc.content)
+            if fc.id not in self._line_counts:
+                self._line_counts[fc.id] = len(fc.content.splitlines())
+
+        while self.size > self.max_size and len(self._items) > len(contents):
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted.content)
+
+    def clear(self):
+        """
+        Remove all the contents from the cache.
+        """
+        self._items.clear()
+        self._line_counts.clear()
+        self.size = 0
 
 
 class FileContent(Base):
     __tablename__ = "file_contents"
 
+    # Contents of the files are loaded on demand into this cache (see `File.content`)
+    cache = FileContentCache(max_size=64 * 1024 * 1024)
+
     # ID and parent FKs
     id: Mapped[str] = mapped_column(primary_key=True)
 
     # Attributes
-    content: Mapped[str] = mapped_column()
-
-    # Relationships
-    files: Mapped[list["File"]] = relationship(back_populates="content", lazy="raise")
+    content: Mapped[str] = mapped_column(CompressedText)
 
     @classmethod
     async def store(cls, session: AsyncSession, hash: str, content: str) -> "FileContent":
@@ -36,23 +122,131 @@ class FileContent(Base):
         :param content: The file content as unicode string.
         :return: The file content object.
         """
-        result = await session.execute(select(FileContent).where(FileContent.id == hash))
-        fc = result.scalar_one_or_none()
-        if fc is not None:
-            return fc
+        return (await cls.store_many(session, {hash: content}))[hash]
 
-        fc = cls(id=hash, content=content)
-        session.add(fc)
+    @classmethod
+    async def store_many(cls, session: AsyncSession, contents: dict[str, str]) -> dict[str, "FileContent"]:
+        """
+        Store multiple file contents in the database.
 
-        return fc
+        The hashes already in the database are checked with a single query
+        (per chunk), and the missing contents are inserted in bulk, ignoring
+        the ones inserted concurrently. The returned content objects are
+        attached to the session as persistent objects, without loading the
+        existing contents from the database.
+
+        :param session: The database session.
+        :param contents: File contents (as unicode strings) by their hash.
+        :return: The file content objects by their hash.
+        """
+        stored = {}
+        for hash in contents:
+            fc = cls.cache.get(hash)
+            if fc is not None and fc in session:
+                stored[hash] = fc
+
+        missing = [hash for hash in contents if hash not in stored]
+        existing = set()
+        for ids in chunked(missing):
+            result = await session.execute(select(FileContent.id).where(FileContent.id.in_(ids)))
+            existing.update(result.scalars())
+
+        new_rows = [{"id": hash, "content": contents[hash]} for hash in missing if hash not in existing]
+        if new_rows:
+            log.debug(f"Inserting {len(new_rows)} new file contents")
+            insert = postgresql_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+            stmt = insert(FileContent).on_conflict_do_nothing(index_elements=["id"])
+            for rows in chunked(new_rows):
+                await session.execute(stmt, rows)
+
+        for hash in missing:
+            fc = session.sync_session.identity_map.get(identity_key(FileContent, hash))
+            if fc is None:
+                # The row is in the database, so the object can be attached as if it was loaded from it
+                fc = cls(id=hash, content=contents[hash])
+                make_transient_to_detached(fc)
+                session.add(fc)
+            stored[hash] = fc
+
+        cls.cache.add(*stored.values())
+        return stored
+
+    @classmethod
+    async def load(cls, session: AsyncSession, content_ids: Iterable[str]) -> dict[str, "FileContent"]:
+        """
+        Load the file contents that aren't already cached into the cache.
+
+        The requested contents that are already cached are added to the cache
+        again together with the loaded ones, so loading can't evict them.
+
+        :param session: The database session.
+        :param content_ids: The hashes of the contents to load.
+        :return: All the requested contents, by their hash.
+        """
+        cached = {}
+        ids = []
+        for content_id in set(content_ids):
+            fc = cls.cache.get(content_id)
+            if fc is not None:
+                cached[content_id] = fc
+            else:
+                ids.append(content_id)
+
+        contents = []
+        if ids:
+            log.debug(f"Loading {len(ids)} file contents")
+            for chunk in chunked(ids):
+                result = await session.execute(select(FileContent).where(FileContent.id.in_(chunk)))
+                contents.extend(result.scalars())
+
+            missing = set(ids) - {fc.id for fc in contents}
+            if missing:
+                raise ValueError(f"File contents not found in the database: {', '.join(sorted(missing))}")
+
+        cls.cache.add(*cached.values(), *contents)
+        return {**cached, **{fc.id: fc for fc in contents}}
+
+    @classmethod
+    async def delete_unreferenced(cls, session: AsyncSession, content_ids: set[str]):
+        """
+        Delete the given file contents if they're no longer referenced by any FileManifest object.
+
+        Only the given contents are checked, using the `FileManifestRef.ref_id`
+        index, so this doesn't need to scan all the manifests like
+        `delete_orphans()`.
+
+        :param session: The database session.
+        :param content_ids: IDs of the contents that may no longer be referenced
+            (see `FileManifest.delete_unreferenced()`).
+        """
+        from core.db.models import FileManifestRef
+
+        n_deleted = 0
+        for ids in chunked(list(content_ids)):
+            result = await session.execute(select(FileManifestRef.ref_id).where(FileManifestRef.ref_id.in_(ids)))
+            referenced = set(result.scalars())
+            unreferenced = [content_id for content_id in ids if content_id not in referenced]
+            if unreferenced:
+                await session.execute(delete(FileContent).where(FileContent.id.in_(unreferenced)))
+                n_deleted += len(unreferenced)
+
+        if n_deleted:
+            log.debug(f"Deleted {n_deleted} unreferenced file contents")
 
     @classmethod
     async def delete_orphans(cls, session: AsyncSession):
         """
-        Delete FileContent objects that are not referenced by any File object.
+        Delete FileContent objects that are not referenced by any FileManifest object.
 
         :param session: The database session.
         """
-        from core.db.models import File
+        from core.db.models import FileManifest
+
+        result = await session.execute(select(FileManifest.entries))
+        referenced = {
+            entry["content_id"] for entries in result.scalars() for entry in entries.values() if "content_id" in entry
+        }
 
-        await session.execute(delete(FileContent).where(~FileContent.id.in_(select(distinct(File.content_id)))))
+        result = await session.execute(select(FileContent.id))
+        for ids in chunked([content_id for content_id in result.scalars() if content_id not in referenced]):
+            await session.execute(delete(FileContent).where(FileContent.id.in_(ids)))
@@ -0,0 +1,256 @@
+import json
+from hashlib import sha1
+from typing import Optional
+
+from sqlalchemy import ForeignKey, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
+
+from core.db.models import Base
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Maximum number of IDs to look up in a single query
+QUERY_CHUNK_SIZE = 500
+
+
+def chunked(items: list, size: int = QUERY_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class FileManifest(Base):
+    """
+    Contents of a directory in the project.
+
+    Manifests form a Merkle tree: each entry is either a file (with its content
+    ID and metadata), or a subdirectory (with the ID of its manifest), and the
+    manifest ID is the hash of its entries. A project state references the
+    manifest of the project root, so the states with the same files share the
+    same manifests, and changing a file only creates new manifests for the
+    directories on its path.
+
+    File entries are `{"content_id": ..., "meta": {...}}` (meta is omitted if
+    empty), and directory entries are `{"manifest_id": ...}`. The IDs
+    referenced by the entries are also stored as `FileManifestRef` rows, so
+    the unreferenced manifests and contents can be found without scanning
+    all the manifests (see `delete_unreferenced()`).
+    """
+
+    __tablename__ = "file_manifests"
+
+    # ID and parent FKs
+    id: Mapped[str] = mapped_column(primary_key=True)
+
+    # Attributes
+    entries: Mapped[dict] = mapped_column()
+
+    # Relationships
+    refs: Mapped[list["FileManifestRef"]] = relationship(cascade="all", passive_deletes=True, lazy="raise")
+
+    @staticmethod
+    def hash_entries(entries: dict) -> str:
+        """
+        Calculate the manifest ID from its entries.
+
+        :param entries: Manifest entries.
+        :return: The manifest ID.
+        """
+        data = json.dumps(entries, sort_keys=True, separators=(",", ":"))
+        return sha1(data.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def build(cls, files: dict[str, dict]) -> tuple[Optional[str], dict[str, dict]]:
+        """
+        Build the manifest tree for the files.
+
+        :param files: File entries, by path.
+        :return: Tuple with the ID of the root manifest (None if there are
+            no files), and the entries of all the manifests in the tree, by ID.
+        """
+        if not files:
+            return None, {}
+
+        # Each node is a tuple of (subdirectories, file entries)
+        root = ({}, {})
+        for path, entry in files.items():
+            *dirs, name = path.split("/")
+            node = root
+            for dirname in dirs:
+                node = node[0].setdefault(dirname, ({}, {}))
+            node[1][name] = entry
+
+        manifests = {}
+
+        def _build(node: tuple[dict, dict]) -> str:
+            entries = {name: {"manifest_id": _build(child)} for name, child in node[0].items()}
+            entries.update(node[1])
+            manifest_id = cls.hash_entries(entries)
+            manifests[manifest_id] = entries
+            return manifest_id
+
+        return _build(root), manifests
+
+    @classmethod
+    def load(cls, session: Session, manifest_id: str) -> tuple[dict[str, dict], set[str]]:
+        """
+        Load the file entries in the manifest tree.
+
+        Each level of the tree is loaded with a single query. This uses
+        a sync session, so from async code it must be called through
+        `AsyncSession.run_sync()` or an awaitable attribute.
+
+        :param session: The (sync) database session.
+        :param manifest_id: ID of the root manifest.
+        :return: Tuple with the file entries by path, and the IDs of all
+            the manifests in the tree.
+        """
+        files = {}
+        manifest_ids = set()
+        # Identical directories share the manifest, so there can be more than one path
+        level = {manifest_id: [""]}
+        while level:
+            next_level = {}
+            for ids in chunked(list(level)):
+                rows = session.execute(select(FileManifest.id, FileManifest.entries).where(FileManifest.id.in_(ids)))
+                for row in rows:
+                    manifest_ids.add(row.id)
+                    for prefix in level[row.id]:
+                        for name, entry in row.entries.items():
+                            if "manifest_id" in entry:
+                                next_level.setdefault(entry["manifest_id"], []).append(f"{prefix}{name}/")
+                            else:
+                                files[f"{prefix}{name}"] = entry
+
+            missing = set(level) - manifest_ids
+            if missing:
+                raise ValueError(f"File manifests not found: {', '.join(sorted(missing))}")
+            level = next_level
+
+        return files, manifest_ids
+
+    @classmethod
+    def store(cls, session: Session, manifests: dict[str, dict], known_ids: set[str] = frozenset()):
+        """
+        Add the manifests that aren't stored yet to the session.
+
+        :param session: The (sync) database session.
+        :param manifests: Manifest entries, by ID.
+        :param known_ids: IDs of manifests known to be already stored.
+        """
+        pending_ids = {obj.id for obj in session.new if isinstance(obj, FileManifest)}
+        new_ids = [manifest_id for manifest_id in manifests if manifest_id not in known_ids | pending_ids]
+
+        stored_ids = set()
+        for ids in chunked(new_ids):
+            stored_ids.update(session.execute(select(FileManifest.id).where(FileManifest.id.in_(ids))).scalars())
+
+        for manifest_id in new_ids:
+            if manifest_id not in stored_ids:
+                entries = manifests[manifest_id]
+                refs = [FileManifestRef(ref_id=ref_id) for ref_id in cls.get_refs(entries)]
+                session.add(FileManifest(id=manifest_id, entries=entries, refs=refs))
+
+    @staticmethod
+    def get_refs(entries: dict) -> set[str]:
+        """
+        Get the IDs of the subdirectory manifests and file contents referenced by the entries.
+
+        :param entries: Manifest entries.
+        :return: Referenced manifest and content IDs.
+        """
+        return {entry.get("manifest_id") or entry["content_id"] for entry in entries.values()}
+
+    @classmethod
+    async def delete_unreferenced(cls, session: AsyncSession, manifest_ids: set[str]) -> set[str]:
+        """
+        Delete the given manifests, and their subdirectory manifests, if they're no longer referenced.
+
+        Only the given manifests are checked, using the `ProjectState.manifest_id`
+        and `FileManifestRef.ref_id` indexes, so this doesn't need to scan
+        all the manifests like `delete_orphans()`. The manifests are deleted
+        top-down, so the subdirectories of a deleted manifest are checked
+        after the manifest is deleted.
+
+        :param session: The database session.
+        :param manifest_ids: IDs of the manifests that may no longer be referenced
+            (eg. by the deleted project states).
+        :return: IDs of the file contents referenced by the deleted manifests,
+            to be checked with `FileContent.delete_unreferenced()`.
+        """
+        from core.db.models import ProjectState
+
+        content_ids = set()
+        n_deleted = 0
+        candidates = set(manifest_ids)
+        while candidates:
+            referenced = set()
+            for ids in chunked(list(candidates)):
+                result = await session.execute(
+                    select(ProjectState.manifest_id).where(ProjectState.manifest_id.in_(ids))
+                )
+                referenced.update(result.scalars())
+                result = await session.execute(select(FileManifestRef.ref_id).where(FileManifestRef.ref_id.in_(ids)))
+                referenced.update(result.scalars())
+
+            unreferenced = [manifest_id for manifest_id in candidates if manifest_id not in referenced]
+            candidates = set()
+            for ids in chunked(unreferenced):
+                result = await session.execute(select(FileManifest.entries).where(FileManifest.id.in_(ids)))
+                for entries in result.scalars():
+                    for entry in entries.values():
+                        if "manifest_id" in entry:
+                            candidates.add(entry["manifest_id"])
+                        else:
+                            content_ids.add(entry["content_id"])
+                await session.execute(delete(FileManifestRef).where(FileManifestRef.manifest_id.in_(ids)))
+                await session.execute(delete(FileManifest).where(FileManifest.id.in_(ids)))
+            n_deleted += len(unreferenced)
+
+        if n_deleted:
+            log.debug(f"Deleted {n_deleted} unreferenced file manifests")
+        return content_ids
+
+    @classmethod
+    async def delete_orphans(cls, session: AsyncSession):
+        """
+        Delete FileManifest objects that are not part of the file tree of any ProjectState object.
+
+        :param session: The database session.
+        """
+        from core.db.models import ProjectState
+
+        result = await session.execute(select(FileManifest.id, FileManifest.entries))
+        entries = {row.id: row.entries for row in result}
+
+        result = await session.execute(select(ProjectState.manifest_id).where(ProjectState.manifest_id.is_not(None)))
+        reachable = set()
+        queue = list(set(result.scalars()))
+        while queue:
+            manifest_id = queue.pop()
+            if manifest_id in reachable or manifest_id not in entries:
+                continue
+            reachable.add(manifest_id)
+            queue.extend(entry["manifest_id"] for entry in entries[manifest_id].values() if "manifest_id" in entry)
+
+        for ids in chunked([manifest_id for manifest_id in entries if manifest_id not in reachable]):
+            await session.execute(delete(FileManifest).where(FileManifest.id.in_(ids)))
+
+
+class FileManifestRef(Base):
+    """
+    Reference from a file manifest to a subdirectory manifest or a file content.
+
+    Manifests and contents are identified by their hashes, so the same
+    table holds both kinds of references.
+    """
+
+    __tablename__ = "file_manifest_refs"
+
+    # ID and parent FKs
+    manifest_id: Mapped[str] = mapped_column(ForeignKey("file_manifests.id", ondelete="CASCADE"), primary_key=True)
+    ref_id: Mapped[str] = mapped_column(primary_key=True, index=True)
+
+    def __repr__(self) -> str:
+        return f"<FileManifestRef(manifest_id={self.manifest_id}, ref_id={self.ref_id})>"
@@ -0,0 +1,132 @@
+import json
+from hashlib import sha1
+
+from sqlalchemy import ForeignKey, delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.db.compression import CompressedJSON
+from core.db.models import Base
+from core.db.models.file_manifest import chunked
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+
+class LLMMessage(Base):
+    """
+    Message (or prompt) of an LLM request.
+
+    Consecutive requests repeat the system prompt, the file listings and the
+    earlier conversation, so each message is stored only once, identified by
+    its hash, and the requests reference them (see `LLMRequestMessage`).
+    """
+
+    __tablename__ = "llm_messages"
+
+    # ID and parent FKs
+    id: Mapped[str] = mapped_column(primary_key=True)
+
+    # Attributes
+    data: Mapped[dict] = mapped_column(CompressedJSON)
+
+    @staticmethod
+    def hash_message(message: dict) -> str:
+        """
+        Calculate the message ID from its data.
+
+        :param message: The message.
+        :return: The message ID.
+        """
+        data = json.dumps(message, sort_keys=True, separators=(",", ":"))
+        return sha1(data.encode("utf-8")).hexdigest()
+
+    @classmethod
+    async def store_many(cls, session: AsyncSession, messages: list[dict]) -> list[str]:
+        """
+        Store the messages that aren't already stored in the database.
+
+        The stored messages are checked with a single query (per chunk), and
+        the missing ones are inserted in bulk, ignoring the ones inserted
+        concurrently.
+
+        :param session: The database session.
+        :param messages: The messages to store.
+        :return: IDs of the messages, in the same order.
+        """
+        message_ids = [cls.hash_message(message) for message in messages]
+        new_messages = dict(zip(message_ids, messages))
+
+        for ids in chunked(list(new_messages)):
+            result = await session.execute(select(LLMMessage.id).where(LLMMessage.id.in_(ids)))
+            for message_id in result.scalars():
+                del new_messages[message_id]
+
+        if new_messages:
+            insert = postgresql_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+            stmt = insert(LLMMessage).on_conflict_do_nothing(index_elements=["id"])
+            rows = [{"id": message_id, "data": message} for message_id, message in new_messages.items()]
+            for chunk in chunked(rows):
+                await session.execute(stmt, chunk)
+
+        return message_ids
+
+    @classmethod
+    async def delete_unreferenced(cls, session: AsyncSession, message_ids: set[str]):
+        """
+        Delete the given messages if they're no longer referenced by any LLMRequest object.
+
+        Only the given messages are checked, using the `LLMRequestMessage.message_id`
+        index.
+
+        :param session: The database session.
+        :param message_ids: IDs of the messages that may no longer be referenced
+            (eg. by the deleted requests).
+        """
+        n_deleted = 0
+        for ids in chunked(list(message_ids)):
+            result = await session.execute(
+                select(LLMRequestMessage.message_id).where(LLMRequestMessage.message_id.in_(ids))
+            )
+            referenced = set(result.scalars())
+            unreferenced = [message_id for message_id in ids if message_id not in referenced]
+            if unreferenced:
+                await session.execute(delete(LLMMessage).where(LLMMessage.id.in_(unreferenced)))
+                n_deleted += len(unreferenced)
+
+        if n_deleted:
+            log.debug(f"Deleted {n_deleted} unreferenced LLM messages")
+
+    @classmethod
+    async def delete_orphans(cls, session: AsyncSession):
+        """
+        Delete LLMMessage objects that are not referenced by any LLMRequest object.
+
+        :param session: The database session.
+        """
+        await session.execute(
+            delete(LLMMessage).where(~LLMMessage.id.in_(select(LLMRequestMessage.message_id).distinct()))
+        )
+
+
+class LLMRequestMessage(Base):
+    """
+    Reference from an LLM request to one of its messages (or prompts).
+    """
+
+    __tablename__ = "llm_request_messages"
+
+    # Request fields whose items are stored as messages
+    MESSAGES = "messages"
+    PROMPTS = "prompts"
+
+    # ID and parent FKs
+    request_id: Mapped[int] = mapped_column(ForeignKey("llm_requests.id", ondelete="CASCADE"), primary_key=True)
+    field: Mapped[str] = mapped_column(primary_key=True)
+    position: Mapped[int] = mapped_column(primary_key=True)
+    message_id: Mapped[str] = mapped_column(ForeignKey("llm_messages.id", ondelete="RESTRICT"), index=True)
+
+    def __repr__(self) -> str:
+        return f"<LLMRequestMessage(request_id={self.request_id}, field={self.field}, position={self.position})>"
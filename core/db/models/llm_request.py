@@ -2,12 +2,14 @@ from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 from uuid import UUID
 
-from sqlalchemy import ForeignKey, inspect
+from sqlalchemy import ForeignKey, false, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
+from core.db.compression import CompressedText
 from core.db.models import Base
+from core.db.models.llm_message import LLMMessage, LLMRequestMessage
 from core.llm.request_log import LLMRequestLog
 
 if TYPE_CHECKING:
@@ -20,8 +22,11 @@ class LLMRequest(Base):
 
     # ID and parent FKs
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    branch_id: Mapped[UUID] = mapped_column(ForeignKey("branches.id", ondelete="CASCADE"))
-    project_state_id: Mapped[Optional[UUID]] = mapped_column(ForeignKey("project_states.id", ondelete="SET NULL"))
+    branch_id: Mapped[UUID] = mapped_column(ForeignKey("branches.id", ondelete="CASCADE"), index=True)
+    project_state_id: Mapped[Optional[UUID]] = mapped_column(
+        ForeignKey("project_states.id", ondelete="SET NULL"),
+        index=True,
+    )
 
     # Attributes
     started_at: Mapped[datetime] = mapped_column(server_default=func.now())
@@ -29,21 +34,28 @@ class LLMRequest(Base):
     provider: Mapped[str] = mapped_column()
     model: Mapped[str] = mapped_column()
     temperature: Mapped[float] = mapped_column()
-    messages: Mapped[list[dict]] = mapped_column()
-    prompts: Mapped[list[str]] = mapped_column(server_default="[]")
-    response: Mapped[Optional[str]] = mapped_column()
+    # The messages and prompts are stored separately (see `get_messages()`), and the
+    # responses are large, so they're stored compressed
+    response: Mapped[Optional[str]] = mapped_column(CompressedText)
     prompt_tokens: Mapped[int] = mapped_column()
     completion_tokens: Mapped[int] = mapped_column()
     duration: Mapped[float] = mapped_column()
     status: Mapped[str] = mapped_column()
     error: Mapped[Optional[str]] = mapped_column()
+    cache_hit: Mapped[bool] = mapped_column(default=False, server_default=false())
 
     # Relationships
     branch: Mapped["Branch"] = relationship(back_populates="llm_requests", lazy="raise")
     project_state: Mapped["ProjectState"] = relationship(back_populates="llm_requests", lazy="raise")
+    message_refs: Mapped[list["LLMRequestMessage"]] = relationship(
+        order_by=(LLMRequestMessage.field, LLMRequestMessage.position),
+        cascade="all",
+        passive_deletes=True,
+        lazy="raise",
+    )
 
     @classmethod
-    def from_request_log(
+    async def from_request_log(
         cls,
         project_state: "ProjectState",
         agent: Optional["BaseAgent"],
@@ -53,7 +65,9 @@ class LLMRequest(Base):
         Store the request log in the database.
 
         Note this just creates the request log object. It is committed to the
-        database only when the DB session itself is comitted.
+        database only when the DB session itself is comitted. The messages
+        and prompts that aren't already stored are inserted right away, as
+        they're shared with the other requests (see `LLMMessage`).
 
         :param project_state: Project state to associate the request log with.
         :param agent: Agent that made the request (if the caller was an agent).
@@ -62,21 +76,61 @@ class LLMRequest(Base):
         """
         session: AsyncSession = inspect(project_state).async_session
 
+        message_refs = []
+        for field, messages in [
+            (LLMRequestMessage.MESSAGES, request_log.messages),
+            (LLMRequestMessage.PROMPTS, request_log.prompts),
+        ]:
+            message_ids = await LLMMessage.store_many(session, messages)
+            message_refs.extend(
+                LLMRequestMessage(field=field, position=i, message_id=message_id)
+                for i, message_id in enumerate(message_ids)
+            )
+
         obj = cls(
             project_state=project_state,
             branch=project_state.branch,
-            agent=agent.agent_type,
+            agent=agent.agent_type if agent else None,
             provider=request_log.provider,
             model=request_log.model,
             temperature=request_log.temperature,
-            messages=request_log.messages,
-            prompts=request_log.prompts,
+            message_refs=message_refs,
             response=request_log.response,
             prompt_tokens=request_log.prompt_tokens,
             completion_tokens=request_log.completion_tokens,
             duration=request_log.duration,
             status=request_log.status,
             error=request_log.error,
+            cache_hit=request_log.cache_hit,
         )
         session.add(obj)
         return obj
+
+    async def get_messages(self) -> list[dict]:
+        """
+        Get the messages sent to the LLM.
+
+        :return: List of messages.
+        """
+        return await self._load_messages(LLMRequestMessage.MESSAGES)
+
+    async def get_prompts(self) -> list[dict]:
+        """
+        Get the prompt templates (with their context) used in the messages.
+
+        :return: List of prompts.
+        """
+        return await self._load_messages(LLMRequestMessage.PROMPTS)
+
+    async def _load_messages(self, field: str) -> list[dict]:
+        session: AsyncSession = inspect(self).async_session
+        if session is None:
+            raise ValueError("LLMRequest instance not associated with a DB session.")
+
+        result = await session.execute(
+            select(LLMMessage.data)
+            .join(LLMRequestMessage, LLMRequestMessage.message_id == LLMMessage.id)
+            .where(LLMRequestMessage.request_id == self.id, LLMRequestMessage.field == field)
+            .order_by(LLMRequestMessage.position)
+        )
+        return list(result.scalars())
@@ -4,7 +4,7 @@ from typing import TYPE_CHECKING, Optional, Union
 from unicodedata import normalize
 from uuid import UUID, uuid4
 
-from sqlalchemy import and_, delete, inspect, select
+from sqlalchemy import and_, delete, inspect, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
 from sqlalchemy.sql import func
@@ -125,6 +125,13 @@ class Project(Base):
         :param project_id: The project ID
         :return: Number of rows deleted.
         """
+        from core.db.models import Branch, ProjectState
 
+        # Unlink the states first, so they're not deleted through a chain of cascades (one per state)
+        await session.execute(
+            update(ProjectState)
+            .where(ProjectState.branch_id.in_(select(Branch.id).where(Branch.project_id == project_id)))
+            .values(prev_state_id=None)
+        )
         result = await session.execute(delete(Project).where(Project.id == project_id))
         return result.rowcount
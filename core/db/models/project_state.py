@@ -1,19 +1,34 @@
+import json
 from copy import deepcopy
 from datetime import datetime
-from typing import TYPE_CHECKING, Optional, Union
+from itertools import chain
+from typing import TYPE_CHECKING, Iterable, Optional, Union
 from uuid import UUID, uuid4
 
-from sqlalchemy import ForeignKey, UniqueConstraint, delete, inspect
+from sqlalchemy import (
+    JSON,
+    ForeignKey,
+    Index,
+    UniqueConstraint,
+    delete,
+    event,
+    inspect,
+    null,
+    select,
+    text,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
 from sqlalchemy.sql import func
 
+from core.db.json_patch import apply_patch, make_patch
 from core.db.models import Base, FileContent
 from core.log import get_logger
 
 if TYPE_CHECKING:
-    from core.db.models import Branch, ExecLog, File, FileContent, LLMRequest, Specification, UserInput
+    from core.db.models import Branch, ExecLog, File, FileContent, FileManifest, LLMRequest, Specification, UserInput
 
 log = get_logger(__name__)
 
@@ -46,33 +61,67 @@ class IterationStatus:
     DONE = "done"
 
 
+# Project plan fields that are delta-encoded (see ProjectState.patch)
+DELTA_FIELDS = (
+    "epics",
+    "tasks",
+    "steps",
+    "iterations",
+    "knowledge_base",
+    "relevant_files",
+    "modified_files",
+    "docs",
+)
+
+
 class ProjectState(Base):
     __tablename__ = "project_states"
     __table_args__ = (
         UniqueConstraint("prev_state_id"),
         UniqueConstraint("branch_id", "step_index"),
+        # Finds the snapshot to rebuild a delta-encoded state from (see `rebuild()`)
+        Index(
+            "ix_project_states_snapshots",
+            "branch_id",
+            "step_index",
+            sqlite_where=text("patch IS NULL"),
+            postgresql_where=text("patch IS NULL"),
+        ),
         {"sqlite_autoincrement": True},
     )
 
+    # Every SNAPSHOT_INTERVAL-th step stores the full project plan, the steps
+    # in between store only a JSON patch against the previous step. Set to 1
+    # to store a full copy of the plan in every step.
+    SNAPSHOT_INTERVAL = 50
+
     # ID and parent FKs
     id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid4)
     branch_id: Mapped[UUID] = mapped_column(ForeignKey("branches.id", ondelete="CASCADE"))
     prev_state_id: Mapped[Optional[UUID]] = mapped_column(ForeignKey("project_states.id", ondelete="CASCADE"))
-    specification_id: Mapped[int] = mapped_column(ForeignKey("specifications.id"))
+    specification_id: Mapped[int] = mapped_column(ForeignKey("specifications.id"), index=True)
 
     # Attributes
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     step_index: Mapped[int] = mapped_column(default=1, server_default="1")
-    epics: Mapped[list[dict]] = mapped_column(default=list)
-    tasks: Mapped[list[dict]] = mapped_column(default=list)
-    steps: Mapped[list[dict]] = mapped_column(default=list)
-    iterations: Mapped[list[dict]] = mapped_column(default=list)
-    knowledge_base: Mapped[dict] = mapped_column(default=dict, server_default="{}")
+    # The plan fields are NULL in the database for delta-encoded states
+    epics: Mapped[list[dict]] = mapped_column(default=list, nullable=True)
+    tasks: Mapped[list[dict]] = mapped_column(default=list, nullable=True)
+    steps: Mapped[list[dict]] = mapped_column(default=list, nullable=True)
+    iterations: Mapped[list[dict]] = mapped_column(default=list, nullable=True)
+    knowledge_base: Mapped[dict] = mapped_column(default=dict, server_default="{}", nullable=True)
     relevant_files: Mapped[Optional[list[str]]] = mapped_column(default=None)
-    modified_files: Mapped[dict] = mapped_column(default=dict)
+    modified_files: Mapped[dict] = mapped_column(default=dict, nullable=True)
     docs: Mapped[Optional[list[dict]]] = mapped_column(default=None)
     run_command: Mapped[Optional[str]] = mapped_column()
     action: Mapped[Optional[str]] = mapped_column()
+    # Root of the file manifest tree, or NULL if there are no files (see the `files` property)
+    manifest_id: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("file_manifests.id", ondelete="RESTRICT"),
+        index=True,
+    )
+    # JSON patch against the previous state, or NULL for full snapshots
+    patch: Mapped[Optional[list[dict]]] = mapped_column(JSON(none_as_null=True), default=None)
 
     # Relationships
     branch: Mapped["Branch"] = relationship(back_populates="states", lazy="selectin")
@@ -84,16 +133,146 @@ class ProjectState(Base):
         cascade="delete",
     )
     next_state: Mapped[Optional["ProjectState"]] = relationship(back_populates="prev_state", lazy="raise")
-    files: Mapped[list["File"]] = relationship(
-        back_populates="project_state",
-        lazy="selectin",
-        cascade="all,delete-orphan",
-    )
+    manifest: Mapped[Optional["FileManifest"]] = relationship(lazy="raise")
     specification: Mapped["Specification"] = relationship(back_populates="project_states", lazy="selectin")
     llm_requests: Mapped[list["LLMRequest"]] = relationship(back_populates="project_state", cascade="all", lazy="raise")
     user_inputs: Mapped[list["UserInput"]] = relationship(back_populates="project_state", cascade="all", lazy="raise")
     exec_logs: Mapped[list["ExecLog"]] = relationship(back_populates="project_state", cascade="all", lazy="raise")
 
+    # Delta encoding bookkeeping (not mapped): the state to diff against
+    # (while it's in memory) or its stored plan, and our own plan as it was
+    # last written to or loaded from the database.
+    _delta_base = None
+    _base_json = None
+    _stored_json = None
+    _stored_data = None
+
+    # File manifest bookkeeping (not mapped): the File objects (once loaded),
+    # the file entries stored in `manifest_id`, and the IDs of the manifests
+    # known to be in the database.
+    _files = None
+    _stored_files = None
+    _known_manifests = frozenset()
+
+    @property
+    def files(self) -> list["File"]:
+        """
+        Files in the project at this step.
+
+        The files are loaded from the file manifest tree on first access.
+        States loaded from the database must load them with
+        `await state.awaitable_attrs.files` before accessing them from async
+        code, and their contents with `await state.load_file_contents()`.
+        Changes to the files are stored when the session is committed.
+
+        :return: List of files.
+        """
+        if self._files is None:
+            self._load_files()
+        return self._files
+
+    @files.setter
+    def files(self, files: list["File"]):
+        self._files = files
+
+    def _load_files(self):
+        """
+        Load the files from the file manifest tree.
+
+        The file contents aren't loaded, see `load_file_contents()`.
+        """
+        from core.db.models import File, FileManifest
+
+        if self.manifest_id is None:
+            self._files = []
+            self._stored_files = {}
+            return
+
+        session = inspect(self).session
+        if session is None:
+            raise ValueError("ProjectState instance not associated with a DB session.")
+
+        entries, manifest_ids = FileManifest.load(session, self.manifest_id)
+        self._files = [
+            File(path=path, content_id=entry["content_id"], meta=deepcopy(entry.get("meta", {})))
+            for path, entry in sorted(entries.items())
+        ]
+        self._stored_files = entries
+        self._known_manifests = frozenset(manifest_ids)
+
+    async def load_file_contents(self, paths: Optional[Iterable[str]] = None):
+        """
+        Load the contents of the files into the file content cache.
+
+        Only the contents that aren't already cached are fetched from the
+        database. The files keep the loaded contents (see `File.keep_content()`),
+        so they can be used for as long as this state is, regardless of the
+        cache size. This must be called before accessing the `content` of the
+        files from sync code (eg. prompt templates).
+
+        :param paths: Paths of the files to load, or None to load all the files.
+        """
+        files = await self.awaitable_attrs.files
+        if paths is not None:
+            paths = set(paths)
+            files = [file for file in files if file.path in paths]
+
+        files = [file for file in files if not file.is_content_loaded]
+        if not files:
+            return
+
+        session: AsyncSession = inspect(self).async_session
+        commit_task = session.info.get("commit_task")
+        if commit_task is not None and any(file.content_id not in FileContent.cache for file in files):
+            # The session can't be used while this state is committed in the background
+            # (see `StateManager.commit()`), after which we're in a new session.
+            await commit_task
+            session = inspect(self).async_session
+        contents = await FileContent.load(session, [file.content_id for file in files])
+        for file in files:
+            file.keep_content(contents[file.content_id])
+
+    async def count_lines(self) -> int:
+        """
+        Count the lines of code in all the files.
+
+        Only the contents that were never loaded before are fetched from the
+        database, as the file content cache remembers the line counts.
+
+        :return: Total number of lines in the project.
+        """
+        files = await self.awaitable_attrs.files
+        cache = FileContent.cache
+        await self.load_file_contents([file.path for file in files if cache.get_line_count(file.content_id) is None])
+        return sum(cache.get_line_count(file.content_id) or 0 for file in files)
+
+    def _store_files(self, session: Session):
+        """
+        Store the file manifests for the files, if they were changed.
+
+        Only the manifests of the directories with changed files are new, the
+        rest are shared with the previous state.
+
+        :param session: The (sync) database session.
+        """
+        from core.db.models import FileManifest
+
+        files = {file.path: file.get_manifest_entry() for file in self._files}
+        if files == self._stored_files:
+            return
+
+        stored = self._stored_files or {}
+        for file in self._files:
+            if files[file.path] != stored.get(file.path) and not file.is_content_stored:
+                session.add(file.content)
+
+        manifest_id, manifests = FileManifest.build(files)
+        FileManifest.store(session, manifests, self._known_manifests)
+        if manifest_id != self.manifest_id:
+            self.manifest_id = manifest_id
+        self._stored_files = files
+        self._known_manifests = frozenset(manifests)
+
     @property
     def unfinished_steps(self) -> list[dict]:
         """
@@ -224,49 +403,229 @@ class ProjectState(Base):
         :param session: The SQLAlchemy session.
         :return: The new ProjectState object.
         """
-        if not self.id:
+        if not self.id or not inspect(self).has_identity:
             raise ValueError("Cannot create next state for unsaved state.")
 
+        # We're read-only from now on, so the changes to our files are stored first
+        session: AsyncSession = inspect(self).async_session
+        if self._files is not None:
+            await session.run_sync(self._store_files)
+
+        # NOTE: we only need the await here because of the tests, in live, the
+        # load_project() method on StateManager makes sure that the files are
+        # loaded.
+        await self.awaitable_attrs.files
+
+        new_state = self.build_next_state()
+        new_state.link_prev_state()
+        session.add(new_state)
+        return new_state
+
+    def build_next_state(self) -> "ProjectState":
+        """
+        Create the next project state for the branch, in memory only.
+
+        Unlike `create_next_state()`, this doesn't use the database, nor
+        modifies the objects in the session (except for marking this state
+        as read-only), so it can be done while this state is being committed
+        (see `StateManager.commit()`). Once this state is committed, the new
+        state must be linked to it with `link_prev_state()` before it's added
+        to the session.
+
+        The files of this state must be loaded.
+
+        :return: The new ProjectState object.
+        """
         if "next_state" in self.__dict__:
             raise ValueError(f"Next state already exists for state with id={self.id}.")
 
         new_state = ProjectState(
-            branch=self.branch,
-            prev_state=self,
+            id=uuid4(),
             step_index=self.step_index + 1,
-            specification=self.specification,
             epics=deepcopy(self.epics),
             tasks=deepcopy(self.tasks),
             steps=deepcopy(self.steps),
             iterations=deepcopy(self.iterations),
             knowledge_base=deepcopy(self.knowledge_base),
-            files=[],
             relevant_files=deepcopy(self.relevant_files),
             modified_files=deepcopy(self.modified_files),
             docs=deepcopy(self.docs),
             run_command=self.run_command,
         )
+        # Set the relationships without the backrefs, so the related objects aren't modified
+        set_committed_value(new_state, "branch", self.branch)
+        set_committed_value(new_state, "prev_state", self)
+        set_committed_value(new_state, "specification", self.specification)
+        set_committed_value(self, "next_state", new_state)
+
+        if new_state.step_index % self.SNAPSHOT_INTERVAL != 0:
+            new_state._delta_base = self
+        # We won't be written anymore, so our base state can be released
+        if self._delta_base is not None and self._delta_base._stored_json is not None:
+            self._base_json = self._delta_base._stored_json
+            self._delta_base = None
+
+        new_state.files = [file.clone() for file in self.files]
+        return new_state
+
+    def link_prev_state(self):
+        """
+        Link the state created with `build_next_state()` to the previous state.
+
+        The previous state must be stored in the database (or at least
+        flushed). The new state shares the file manifests with it.
+        """
+        prev_state = self.prev_state
+        self.prev_state_id = prev_state.id
+        self.branch_id = prev_state.branch_id
+        # If the specification was replaced, the key is set from the relationship on flush
+        self.specification_id = prev_state.specification_id
+        self.manifest_id = prev_state.manifest_id
+        self._stored_files = prev_state._stored_files
+        self._known_manifests = prev_state._known_manifests
+
+    async def rebuild(self):
+        """
+        Restore the project plan of a state loaded from the database.
+
+        For delta-encoded states, this loads the last full snapshot before
+        this state, and applies the patches of all the states in between.
+
+        This must be called on every state loaded from the database that
+        will be used or modified (see `Branch.get_last_state()` and
+        `Branch.get_state_at_step()`).
+        """
+        if self.patch is None:
+            self._stored_json = json.dumps(self._get_delta_fields())
+            self._stored_data = None
+            return
 
         session: AsyncSession = inspect(self).async_session
-        session.add(new_state)
+        last_snapshot = (
+            select(func.max(ProjectState.step_index))
+            .where(
+                ProjectState.branch_id == self.branch_id,
+                ProjectState.step_index <= self.step_index,
+                ProjectState.patch.is_(None),
+            )
+            .scalar_subquery()
+        )
+        result = await session.execute(
+            select(
+                ProjectState.step_index,
+                ProjectState.patch,
+                *[getattr(ProjectState, field) for field in DELTA_FIELDS],
+            )
+            .where(
+                ProjectState.branch_id == self.branch_id,
+                ProjectState.step_index >= last_snapshot,
+                ProjectState.step_index <= self.step_index,
+            )
+            .order_by(ProjectState.step_index)
+        )
+        rows = result.all()
+        if not rows or rows[0].patch is not None:
+            raise ValueError(f"No snapshot found for delta-encoded state with id={self.id}")
 
-        # NOTE: we only need the await here because of the tests, in live, the
-        # load_project() and commit() methods on StateManager make sure that
-        # the the files are eagerly loaded.
-        for file in await self.awaitable_attrs.files:
-            clone = file.clone()
-            new_state.files.append(clone)
+        data = {field: getattr(rows[0], field) for field in DELTA_FIELDS}
+        for prev_row, row in zip(rows, rows[1:]):
+            if row.step_index != prev_row.step_index + 1:
+                raise ValueError(f"Missing step {prev_row.step_index + 1} for delta-encoded state with id={self.id}")
+            if row.step_index == self.step_index:
+                self._base_json = json.dumps(data)
+            apply_patch(data, row.patch)
 
-        return new_state
+        log.debug(f"Rebuilt state for step {self.step_index} from {len(rows) - 1} patches")
+        for field in DELTA_FIELDS:
+            set_committed_value(self, field, data[field])
+        self._stored_json = json.dumps(data)
+        self._stored_data = None
+
+    def _get_delta_fields(self) -> dict:
+        return {field: getattr(self, field) for field in DELTA_FIELDS}
+
+    def _get_stored_data(self) -> Optional[dict]:
+        """
+        Get the project plan as it's stored in the database.
+
+        :return: The plan fields, or None if not known.
+        """
+        if self._stored_json is None:
+            return None
+        if self._stored_data is None:
+            self._stored_data = json.loads(self._stored_json)
+        return self._stored_data
 
-    def complete_step(self, step_type: str):
+    def _get_base_data(self) -> Optional[dict]:
+        """
+        Get the stored project plan of the previous state.
+
+        :return: The plan fields, or None if this state should be a full snapshot.
+        """
+        if self._delta_base is not None:
+            return self._delta_base._get_stored_data()
+        if self._base_json is not None:
+            return json.loads(self._base_json)
+        return None
+
+    def _encode(self, force: bool) -> bool:
+        """
+        Prepare the project plan for writing to the database.
+
+        Computes the patch against the previous state, or flags all the plan
+        fields as modified if this state is a full snapshot.
+
+        :param force: Whether to encode even if the plan wasn't modified (eg.
+            because the previous state was changed).
+        :return: True if the state needs to be written, False otherwise.
+        """
+        if self.patch is not None and self._stored_json is None:
+            # Delta-encoded state that was loaded without rebuilding the plan
+            return False
+
+        if not force:
+            # Like any other JSON column, in-place changes must be flagged to be saved
+            attrs = inspect(self).attrs
+            if not any(attrs[field].history.has_changes() for field in DELTA_FIELDS):
+                return False
+
+        data = self._get_delta_fields()
+        data_json = json.dumps(data)
+        if data_json == self._stored_json and not force:
+            return False
+
+        base = self._get_base_data()
+        if base is None:
+            self.patch = None
+            # Make sure the complete plan is written, even if it was modified
+            # in place without flagging the changes
+            for field in DELTA_FIELDS:
+                if field in self.__dict__:
+                    flag_modified(self, field)
+        else:
+            self.patch = make_patch(base, data)
+
+        self._stored_json = data_json
+        self._stored_data = None
+        return True
+
+    def complete_step(self, step_type: str, step_id: Optional[str] = None):
+        """
+        Mark a step as completed.
+
+        :param step_type: Type of the step to complete.
+        :param step_id: ID of the step to complete (if not set, or not found,
+            the first unfinished step of the given type is completed).
+        """
         if not self.unfinished_steps:
             raise ValueError("There are no unfinished steps to complete")
         if "next_state" in self.__dict__:
             raise ValueError("Current state is read-only (already has a next state).")
 
-        log.debug(f"Completing step {self.unfinished_steps[0]['type']}")
-        self.get_steps_of_type(step_type)[0]["completed"] = True
+        steps = self.get_steps_of_type(step_type)
+        step = next((s for s in steps if step_id and s.get("id") == step_id), steps[0])
+        log.debug(f"Completing step {step['type']} ({step.get('id')})")
+        step["completed"] = True
         flag_modified(self, "steps")
 
     def complete_task(self):
@@ -411,17 +770,16 @@ class ProjectState(Base):
             raise ValueError("Current state is read-only (already has a next state).")
 
         file = self.get_file_by_path(path)
+        if path not in self.modified_files and not external:
+            # The original content must be loaded (see `load_file_contents()`)
+            self.modified_files[path] = file.content.content if file else ""
+
         if file:
-            original_content = file.content.content
             file.content = content
         else:
-            original_content = ""
             file = File(path=path, content=content)
             self.files.append(file)
 
-        if path not in self.modified_files and not external:
-            self.modified_files[path] = original_content
-
         self.relevant_files = self.relevant_files or []
         if path not in self.relevant_files:
             self.relevant_files.append(path)
@@ -432,15 +790,20 @@ class ProjectState(Base):
         """
         Delete all states in the branch after this one.
         """
+        from core.db.models import Branch
 
         session: AsyncSession = inspect(self).async_session
 
         log.debug(f"Deleting all project states in branch {self.branch_id} after {self.id}")
+        later_states = (ProjectState.branch_id == self.branch_id) & (ProjectState.step_index > self.step_index)
+        # Unlink the states first, so they're not deleted through a chain of cascades (one per state)
+        await session.execute(update(ProjectState).where(later_states).values(prev_state_id=None))
+        await session.execute(delete(ProjectState).where(later_states))
+        # The later steps will be created again, so they must be compacted again
         await session.execute(
-            delete(ProjectState).where(
-                ProjectState.branch_id == self.branch_id,
-                ProjectState.step_index > self.step_index,
-            )
+            update(Branch)
+            .where(Branch.id == self.branch_id, Branch.compacted_step > self.step_index)
+            .values(compacted_step=self.step_index)
         )
 
     def get_last_iteration_steps(self) -> list:
@@ -493,3 +856,73 @@ class ProjectState(Base):
         :return: True if the current epic is a feature, False otherwise.
         """
         return self.epics and self.current_epic and self.current_epic.get("source") == "feature"
+
+
+@event.listens_for(Session, "before_flush")
+def _encode_project_states(session: Session, _flush_context, _instances):
+    """
+    Compute the patches for the project states about to be written.
+
+    If a state is written, its next state (if any) must be re-encoded
+    as well, since its patch is relative to the written state.
+    """
+    states = {obj for obj in chain(session.new, session.dirty) if isinstance(obj, ProjectState)}
+    next_states = (state.__dict__.get("next_state") for state in list(states))
+    states.update(state for state in next_states if state is not None and state in session)
+
+    written = set()
+    # Previous states first, so the next states are diffed against the new data
+    for state in sorted(states, key=lambda s: s.step_index or 0):
+        force = state in session.new or (state._delta_base is not None and state._delta_base in written)
+        if state._encode(force):
+            written.add(state)
+
+
+@event.listens_for(ProjectState, "before_insert")
+@event.listens_for(ProjectState, "before_update")
+def _strip_delta_fields(_mapper, _connection, state: ProjectState):
+    """
+    Store NULL in place of the project plan for delta-encoded states.
+    """
+    if state.patch is None:
+        return
+
+    state.__dict__["_stripped_fields"] = {field: state.__dict__.get(field) for field in DELTA_FIELDS}
+    for field in DELTA_FIELDS:
+        setattr(state, field, null())
+
+
+@event.listens_for(ProjectState, "after_insert")
+@event.listens_for(ProjectState, "after_update")
+def _restore_delta_fields(_mapper, _connection, state: ProjectState):
+    """
+    Put the project plan back after a delta-encoded state has been written.
+    """
+    stripped = state.__dict__.pop("_stripped_fields", None)
+    if stripped is None:
+        # Full snapshot, the column defaults may have been applied on insert
+        state._stored_json = json.dumps(state._get_delta_fields())
+        state._stored_data = None
+        return
+
+    for field, value in stripped.items():
+        set_committed_value(state, field, value)
+
+
+@event.listens_for(Session, "before_commit")
+def _store_file_manifests(session: Session):
+    """
+    Store the file manifests for the project states with changed files.
+
+    Changes to the files don't mark the state as modified, so this checks
+    all the states in the session that have the files loaded, except the
+    read-only ones (with a next state, see `create_next_state()`).
+    """
+    for obj in list(chain(session.new, session.identity_map.values())):
+        if (
+            isinstance(obj, ProjectState)
+            and obj._files is not None
+            and "next_state" not in obj.__dict__
+            and obj not in session.deleted
+        ):
+            obj._store_files(session)
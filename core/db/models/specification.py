@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from core.db.models import Base
+from core.db.models.file_manifest import chunked
 
 if TYPE_CHECKING:
     from core.db.models import ProjectState
@@ -57,6 +58,29 @@ class Specification(Base):
         )
         return clone
 
+    @classmethod
+    async def delete_unreferenced(cls, session: AsyncSession, specification_ids: set[int]):
+        """
+        Delete the given Specification objects if they're no longer referenced by any ProjectState object.
+
+        Only the given specifications are checked, using the
+        `ProjectState.specification_id` index.
+
+        :param session: The database session.
+        :param specification_ids: IDs of the specifications that may no longer be
+            referenced (eg. by the deleted project states).
+        """
+        from core.db.models import ProjectState
+
+        for ids in chunked(list(specification_ids)):
+            result = await session.execute(
+                select(distinct(ProjectState.specification_id)).where(ProjectState.specification_id.in_(ids))
+            )
+            referenced = set(result.scalars())
+            unreferenced = [spec_id for spec_id in ids if spec_id not in referenced]
+            if unreferenced:
+                await session.execute(delete(Specification).where(Specification.id.in_(unreferenced)))
+
     @classmethod
     async def delete_orphans(cls, session: AsyncSession):
         """
@@ -1,11 +1,27 @@
-from sqlalchemy import event
+from sqlalchemy import event, make_url
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from core.config import DBConfig
+from core.config import DBConfig, SQLiteProfile
 from core.log import get_logger
 
 log = get_logger(__name__)
 
+# Connection settings of the SQLite performance profile. With WAL journaling, a
+# commit appends to the log instead of rewriting the database file, and with
+# synchronous=NORMAL it's only synced to disk when the log is checkpointed.
+SQLITE_PERFORMANCE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are in KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "memory",
+}
+
+# Number of prepared statements cached by each SQLite connection
+SQLITE_CACHED_STATEMENTS = 256
+
 
 class SessionManager:
     """
@@ -25,8 +41,29 @@ class SessionManager:
         :param config: Database configuration.
         """
         self.config = config
+        url = make_url(config.url)
+        self.tuned_sqlite = (
+            url.get_backend_name() == "sqlite"
+            and url.database not in (None, "", ":memory:")
+            and config.sqlite_profile == SQLiteProfile.PERFORMANCE
+        )
+
+        engine_args = {}
+        if self.tuned_sqlite:
+            # Keep one connection (with its page and statement caches) open for all the
+            # sessions. There's normally one session at a time, but the extra connections
+            # are opened (and closed) as needed instead of waiting for the pooled one.
+            engine_args = {
+                "poolclass": AsyncAdaptedQueuePool,
+                "pool_size": 1,
+                "max_overflow": -1,
+                "connect_args": {"cached_statements": SQLITE_CACHED_STATEMENTS},
+            }
         self.engine = create_async_engine(
-            self.config.url, echo=config.debug_sql, echo_pool="debug" if config.debug_sql else None
+            self.config.url,
+            echo=config.debug_sql,
+            echo_pool="debug" if config.debug_sql else None,
+            **engine_args,
         )
         self.SessionClass = async_sessionmaker(self.engine, expire_on_commit=False)
         self.session = None
@@ -40,10 +77,13 @@ class SessionManager:
 
         if self.config.url.startswith("sqlite"):
             # Note that SQLite uses NullPool by default, meaning every session creates a
-            # database "connection". This is fine and preferred for SQLite because
-            # it's a local file. PostgreSQL or other database use a real connection pool
-            # by default.
+            # database "connection". This is fine for SQLite because it's a local file,
+            # but the performance profile keeps the connection open (see `__init__`).
+            # PostgreSQL or other database use a real connection pool by default.
             dbapi_connection.execute("pragma foreign_keys=on")
+            if self.tuned_sqlite:
+                for name, value in SQLITE_PERFORMANCE_PRAGMAS.items():
+                    dbapi_connection.execute(f"pragma {name}={value}")
 
     async def start(self) -> AsyncSession:
         if self.session is not None:
@@ -65,6 +105,19 @@ class SessionManager:
         await self.session.close()
         self.session = None
 
+    async def dispose(self):
+        """
+        Close the pooled database connections.
+
+        With the SQLite performance profile, the WAL is checkpointed first,
+        so the database file is complete and the WAL file is truncated.
+        """
+        if self.tuned_sqlite:
+            async with self.engine.connect() as conn:
+                await conn.exec_driver_sql("pragma wal_checkpoint(truncate)")
+            log.debug(f"Checkpointed the WAL of database {self.config.url}")
+        await self.engine.dispose()
+
     async def __aenter__(self) -> AsyncSession:
         return await self.start()
 
@@ -1,7 +1,79 @@
+import os
 import os.path
-from fnmatch import fnmatch
+import re
+import stat
+import sys
+from codecs import getincrementaldecoder
+from functools import lru_cache
 from typing import Optional
 
+# How much of the file to inspect when checking if it's binary
+BINARY_SNIFF_SIZE = 8 * 1024
+
+# Maximum number of cached per-file (size, binary) verdicts
+FILE_CACHE_SIZE = 100_000
+
+# Maximum number of cached directory matches
+DIR_CACHE_SIZE = 10_000
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translate a gitignore-style glob into a regular expression.
+
+    "*" and "?" don't match "/", "**" matches across directories, and
+    character classes ("[a-z]", "[!0-9]") are supported.
+
+    :param pattern: Glob pattern (without negation or trailing slash).
+    :return: Regular expression (not anchored).
+    """
+    if pattern.startswith("**/"):
+        prefix = "(?:.*/)?"
+        pattern = pattern[3:]
+    else:
+        prefix = ""
+
+    i, n = 0, len(pattern)
+    result = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("/**/", i):
+            result.append("/(?:.*/)?")
+            i += 4
+            continue
+        if pattern.startswith("/**", i) and i + 3 == n:
+            result.append("/.*")
+            i += 3
+            continue
+        if c == "*":
+            if pattern.startswith("**", i):
+                result.append(".*")
+                i += 2
+            else:
+                result.append("[^/]*")
+                i += 1
+            continue
+        if c == "?":
+            result.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2 if pattern[i + 1 : i + 2] in ("!", "^") else i + 1)
+            if end < 0:
+                result.append(re.escape(c))
+            else:
+                chars = pattern[i + 1 : end].replace("\\", "\\\\")
+                if chars[0] in ("!", "^"):
+                    chars = "^" + chars[1:]
+                result.append(f"(?!/)[{chars}]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(c))
+        i += 1
+
+    return prefix + "".join(result)
+
 
 class IgnoreMatcher:
     """
@@ -19,10 +91,15 @@ class IgnoreMatcher:
         """
         Initialize the IgnoreMatcher object.
 
-        Ignore paths are matched agains the file name and the full path,
-        and may include shell-like wildcards ("*" for any number of characters,
-        "?" for a single character). Paths are normalized, so "/" works on both
-        Unix and Windows, and Windows matching is case insensitive.
+        Ignore paths follow the .gitignore syntax: patterns without a slash
+        match the file or directory name at any level, patterns with a slash
+        are relative to the root, a trailing "/" matches only directories, a
+        leading "!" re-includes a previously ignored path, and "**" matches
+        any number of directories. Everything inside an ignored directory is
+        ignored. Paths are normalized, so "/" works on both Unix and Windows,
+        and Windows matching is case insensitive.
+
+        All patterns are compiled into a single regular expression.
 
         :param root_path: Root path to use when checking files on disk.
         :param ignore_paths: List of patterns to ignore.
@@ -32,94 +109,156 @@ class IgnoreMatcher:
         self.ignore_paths = ignore_paths
         self.ignore_size_threshold = ignore_size_threshold
 
-    def ignore(self, path: str) -> bool:
+        self._negated: dict[str, bool] = {}
+        self._file_regex = self._compile(dirs=False)
+        self._dir_regex = self._compile(dirs=True)
+        self._file_cache: dict[str, tuple[int, int, bool]] = {}
+        self._is_dir_ignored = lru_cache(maxsize=DIR_CACHE_SIZE)(self._is_dir_ignored)
+
+    def _compile(self, dirs: bool) -> Optional[re.Pattern]:
+        """
+        Compile the patterns into a single regular expression.
+
+        The rules are joined in reverse order, so that the first alternative
+        that matches is the last matching rule, which decides the outcome
+        (see `_is_in_ignore_list`).
+
+        :param dirs: Whether to include directory-only rules.
+        :return: The compiled regular expression, or None if there are no rules.
+        """
+        alternatives = []
+        for i, pattern in enumerate(self.ignore_paths):
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+            elif pattern.startswith("\\"):
+                pattern = pattern[1:]
+
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern or (dir_only and not dirs):
+                continue
+
+            # Patterns with a slash (other than at the end) are relative to the root
+            if "/" in pattern:
+                regex = _translate(pattern.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + _translate(pattern)
+
+            name = f"r{i}"
+            self._negated[name] = negated
+            alternatives.append(f"(?P<{name}>{regex})")
+
+        if not alternatives:
+            return None
+
+        flags = re.IGNORECASE if sys.platform == "win32" else 0
+        return re.compile("|".join(reversed(alternatives)), flags)
+
+    def ignore(self, path: str, check_content: bool = True) -> bool:
         """
         Check if the given path matches any of the ignore patterns.
 
         :param path: (Relative) path to the file or directory to check
+        :param check_content: Whether to open the file to check if it's binary
+            (can be skipped if the file is already known to be a text file).
         :return: True if the path matches any of the ignore patterns, False otherwise
         """
+        # We use "/" internally on all platforms, including win32
+        path = os.path.normpath(path).replace(os.sep, "/")
+        full_path = os.path.join(self.root_path, path)
 
-        full_path = os.path.normpath(os.path.join(self.root_path, path))
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            st = None
 
-        if self._is_in_ignore_list(path):
+        is_dir = st is not None and stat.S_ISDIR(st.st_mode)
+        if self._is_in_ignore_list(path, is_dir):
             return True
 
-        if self._is_large_file(full_path):
+        if is_dir:
+            return False
+
+        if st is None:
+            # Files that don't exist are ignored if we'd otherwise need to check them
+            return check_content or self.ignore_size_threshold is not None
+
+        # Symlinks to files are followed, but anything else (eg. sockets) is ignored
+        if not stat.S_ISREG(st.st_mode):
+            return True
+
+        if self.ignore_size_threshold is not None and st.st_size > self.ignore_size_threshold:
             return True
 
         # Binary files are always ignored
-        if self._is_binary(full_path):
+        if check_content and self._is_binary(path, full_path, st):
             return True
 
         return False
 
-    def _is_in_ignore_list(self, path: str) -> bool:
+    def _is_in_ignore_list(self, path: str, is_dir: bool = False) -> bool:
         """
-        Check if the given path matches any of the ignore patterns.
-
-        Both the (relative) file path and the file (base) name are matched.
+        Check if the given path, or any of its parent directories, is ignored.
 
-        :param path: The path to the file or directory to check
+        :param path: The normalized path to the file or directory to check.
+        :param is_dir: Whether the path is a directory.
         :return: True if the path matches any of the ignore patterns, False otherwise.
         """
-        name = os.path.basename(path)
-        for pattern in self.ignore_paths:
-            if fnmatch(name, pattern) or fnmatch(path, pattern):
-                return True
-        return False
-
-    def _is_large_file(self, full_path: str) -> bool:
-        """
-        Check if the given file is larger than the threshold.
+        parent, _, _ = path.rpartition("/")
+        if parent and self._is_dir_ignored(parent):
+            return True
+        return self._match(path, is_dir)
 
-        This also returns True if the file doesn't or is not a regular file (eg.
-        it's a symlink), since we want to ignore those kinds of files as well.
+    def _is_dir_ignored(self, path: str) -> bool:
+        # Cached per instance in __init__, as parent directories are checked for each file
+        return self._is_in_ignore_list(path, True)
 
-        :param path: Full path to the file to check.
-        :return: True if the file is larger than the threshold, False otherwise.
-        """
-        if self.ignore_size_threshold is None:
+    def _match(self, path: str, is_dir: bool) -> bool:
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is None:
             return False
 
-        # We don't handle directories here
-        if os.path.isdir(full_path):
-            return False
+        m = regex.fullmatch(path)
+        return m is not None and not self._negated[m.lastgroup]
 
-        if not os.path.isfile(full_path):
-            return True
-
-        try:
-            return bool(os.path.getsize(full_path) > self.ignore_size_threshold)
-        except:  # noqa
-            return True
-
-    def _is_binary(self, full_path: str) -> bool:
+    def _is_binary(self, path: str, full_path: str, st: os.stat_result) -> bool:
         """
         Check if the given file is binary and should be ignored.
 
-        This also returns True if the file doesn't or is not a regular file (eg.
-        it's a symlink), or can't be opened, since we want to ignore those too.
+        The verdict is cached for as long as the file size and modification
+        time stay the same. Files with a NUL byte or invalid UTF-8 in the first
+        few kilobytes are considered binary, as are the files we can't open.
 
-        :param path: Full path to the file to check.
+        :param path: Normalized path to the file.
+        :param full_path: Full path to the file to check.
+        :param st: Stat of the file.
         :return: True if the file should be ignored, False otherwise.
         """
-
-        # We don't handle directories here
-        if os.path.isdir(full_path):
-            return False
-
-        if not os.path.isfile(full_path):
-            return True
+        cached = self._file_cache.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
 
         try:
-            with open(full_path, "r", encoding="utf-8") as f:
-                f.read(128 * 1024)
-            return False
+            with open(full_path, "rb") as f:
+                data = f.read(BINARY_SNIFF_SIZE)
+            binary = b"\0" in data
+            if not binary:
+                # Allow a multibyte character cut off at the end of the sample
+                getincrementaldecoder("utf-8")().decode(data, final=len(data) < BINARY_SNIFF_SIZE)
         except:  # noqa
             # If we can't open the file for any reason (eg. PermissionError), it's
             # best to ignore it anyway
-            return True
+            binary = True
+
+        if len(self._file_cache) >= FILE_CACHE_SIZE:
+            self._file_cache.clear()
+        self._file_cache[path] = (st.st_mtime_ns, st.st_size, binary)
+        return binary
 
 
 __all__ = ["IgnoreMatcher"]
@@ -0,0 +1,148 @@
+import json
+import os
+import os.path
+from time import time_ns
+from typing import NamedTuple, Optional
+
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+INDEX_VERSION = 1
+
+# Location of the persistent index, relative to the project root
+WORKSPACE_INDEX_PATH = os.path.join(".gpt-pilot", "workspace-index.json")
+
+# Files modified this recently are never trusted from the index: a second
+# write within the file system's timestamp granularity could leave size and
+# mtime unchanged (the "racy clean" problem), so we re-hash them instead.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class IndexEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    inode: int
+    hash: str
+
+
+class WorkspaceIndex:
+    """
+    Stat-based index of the workspace files and their content hashes.
+
+    Maps each (relative) path to the size, modification time and inode the
+    file had when it was last hashed. If the file still has the same stat
+    signature, the stored hash is reused without opening the file.
+
+    If `path` is set, the index is loaded from and persisted to that JSON
+    file, so that it survives restarts. Otherwise it's kept in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the index.
+
+        :param path: Full path to the index file (optional).
+        """
+        self.path = path
+        self.entries: dict[str, IndexEntry] = {}
+        self.dirty = False
+        if path:
+            self.load()
+
+    def lookup(self, path: str, stat: os.stat_result) -> Optional[str]:
+        """
+        Get the stored content hash for an unchanged file.
+
+        :param path: Path to the file, relative to project root.
+        :param stat: Current stat of the file.
+        :return: The content hash, or None if the file is new or may have changed.
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        if (entry.size, entry.mtime_ns, entry.inode) != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return None
+        return entry.hash
+
+    def update(self, path: str, stat: os.stat_result, hash: str):
+        """
+        Record the content hash of a file.
+
+        Recently modified files are not recorded (see `RACY_WINDOW_NS`) and
+        will be hashed again on the next lookup.
+
+        :param path: Path to the file, relative to project root.
+        :param stat: Stat of the file at the time its content was read.
+        :param hash: Hash of the file content.
+        """
+        if time_ns() - stat.st_mtime_ns < RACY_WINDOW_NS:
+            self.discard(path)
+            return
+
+        entry = IndexEntry(stat.st_size, stat.st_mtime_ns, stat.st_ino, hash)
+        if self.entries.get(path) != entry:
+            self.entries[path] = entry
+            self.dirty = True
+
+    def discard(self, path: str):
+        """
+        Remove a file from the index.
+
+        :param path: Path to the file, relative to project root.
+        """
+        if self.entries.pop(path, None) is not None:
+            self.dirty = True
+
+    def prune(self, paths: set[str]):
+        """
+        Remove all files from the index except the given ones.
+
+        :param paths: Paths of the files currently in the workspace.
+        """
+        for path in list(self.entries):
+            if path not in paths:
+                self.discard(path)
+
+    def load(self):
+        """
+        Load the index from disk.
+
+        A missing, unreadable or incompatible index file is not an error,
+        the index just starts out empty.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                log.debug(f"Ignoring workspace index {self.path} with unknown version")
+                return
+            self.entries = {path: IndexEntry(*entry) for path, entry in data["files"].items()}
+        except FileNotFoundError:
+            return
+        except Exception as err:  # noqa
+            log.warning(f"Error loading workspace index {self.path}: {err}")
+            self.entries = {}
+
+    def save(self):
+        """
+        Persist the index to disk, if it has changed.
+
+        The index is written to a temporary file first and then atomically
+        moved into place, so a crash never leaves a partial index behind.
+        """
+        if not self.path or not self.dirty:
+            return
+
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "files": self.entries}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as err:
+            log.warning(f"Error saving workspace index {self.path}: {err}")
+
+
+__all__ = ["WorkspaceIndex", "WORKSPACE_INDEX_PATH"]
@@ -2,8 +2,11 @@ import os
 import os.path
 from hashlib import sha1
 from pathlib import Path
+from typing import Optional
 
 from core.disk.ignore import IgnoreMatcher
+from core.disk.index import WorkspaceIndex
+from core.disk.watcher import WorkspaceWatcher
 from core.log import get_logger
 
 log = get_logger(__name__)
@@ -80,6 +83,24 @@ class VirtualFileSystem:
         content = self.read(path)
         return self.hash_string(content)
 
+    def list_hashes(self, prefix: str = None) -> dict[str, str]:
+        """
+        Return the content hashes of all files in the project.
+
+        The hashes are computed the same way as `hash_string()`, so they
+        can be compared with the stored file content IDs.
+
+        :param prefix: Optional prefix to filter files for.
+        :return: Dictionary mapping file paths to their content hashes.
+        """
+        return {path: self.hash(path) for path in self.list(prefix)}
+
+    def close(self):
+        """
+        Release any resources held by the file system interface.
+        """
+        pass
+
     @staticmethod
     def hash_string(content: str) -> str:
         return sha1(content.encode("utf-8")).hexdigest()
@@ -119,6 +140,8 @@ class LocalDiskVFS(VirtualFileSystem):
         create: bool = True,
         allow_existing: bool = True,
         ignore_matcher: IgnoreMatcher = None,
+        index: Optional[WorkspaceIndex] = None,
+        watcher: Optional[WorkspaceWatcher] = None,
     ):
         if not os.path.isdir(root):
             if create:
@@ -132,8 +155,15 @@ class LocalDiskVFS(VirtualFileSystem):
         if ignore_matcher is None:
             ignore_matcher = IgnoreMatcher(root, [])
 
+        if index is None:
+            index = WorkspaceIndex()
+
         self.root = root
         self.ignore_matcher = ignore_matcher
+        self.index = index
+        self.watcher = watcher
+        # Hashes of all the files in the workspace, kept up to date using the watcher
+        self.hashes: Optional[dict[str, str]] = None
 
     def get_full_path(self, path: str) -> str:
         return os.path.abspath(os.path.normpath(os.path.join(self.root, path)))
@@ -143,6 +173,11 @@ class LocalDiskVFS(VirtualFileSystem):
         os.makedirs(os.path.dirname(full_path), exist_ok=True)
         with open(full_path, "w", encoding="utf-8") as f:
             f.write(content)
+        if "\r" in content:
+            # Reading the file back will translate the line endings
+            self.index.discard(path)
+        else:
+            self.index.update(path, os.lstat(full_path), self.hash_string(content))
         log.debug(f"Saved file {path} ({len(content)} bytes) to {full_path}")
 
     def read(self, path: str) -> str:
@@ -162,11 +197,113 @@ class LocalDiskVFS(VirtualFileSystem):
         if os.path.isfile(full_path):
             try:
                 os.remove(full_path)
+                self.index.discard(path)
                 log.debug(f"Removed file {path} from {full_path}")
             except Exception as err:  # noqa
                 log.error(f"Failed to remove file {path}: {err}", exc_info=True)
 
+    def hash(self, path: str) -> str:
+        full_path = self.get_full_path(path)
+        try:
+            stat = os.lstat(full_path)
+        except OSError:
+            raise ValueError(f"File not found: {path}")
+
+        hash = self.index.lookup(path, stat)
+        if hash is None:
+            hash = self.hash_string(self.read(path))
+            self.index.update(path, stat, hash)
+        return hash
+
+    def list_hashes(self, prefix: str = None) -> dict[str, str]:
+        if self.watcher is None:
+            hashes = self._hash_files(self.list(prefix))
+            if not prefix:
+                self.index.prune(set(hashes))
+        else:
+            hashes = self._refresh()
+            if prefix:
+                hashes = {path: hashes[path] for path in self._filter_by_prefix(list(hashes), prefix)}
+            else:
+                hashes = dict(hashes)
+
+        self.index.save()
+        return hashes
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.hashes = None
+        self.index.save()
+
+    def _hash_files(self, paths: list[str]) -> dict[str, str]:
+        hashes = {}
+        for path in paths:
+            try:
+                hashes[path] = self.hash(path)
+            except (ValueError, UnicodeDecodeError):
+                # Removed since we listed it, or not valid UTF-8 after the part
+                # checked by the ignore matcher
+                log.debug(f"Skipping file {path} that can't be read")
+        return hashes
+
+    def _refresh(self) -> dict[str, str]:
+        """
+        Update the file hashes with the changes reported by the watcher.
+
+        If the watcher doesn't know what changed, the whole workspace is
+        rescanned (still using the workspace index to avoid reading files).
+
+        :return: Hashes of all the files in the workspace.
+        """
+        changes = self.watcher.changes()
+        if changes is None or self.hashes is None:
+            self.hashes = self._hash_files(self._walk_files())
+            self.index.prune(set(self.hashes))
+            return self.hashes
+
+        for path in changes:
+            full_path = self.get_full_path(path)
+            known = self.hashes.pop(path, None) is not None
+            if os.path.isfile(full_path):
+                if self._is_ignored(path, full_path):
+                    continue
+                try:
+                    self.hashes[path] = self.hash(path)
+                except (ValueError, UnicodeDecodeError):
+                    self.index.discard(path)
+            else:
+                self.index.discard(path)
+                if not known:
+                    # Could be a removed directory
+                    prefix = path + "/"
+                    for removed in [p for p in self.hashes if p.startswith(prefix)]:
+                        del self.hashes[removed]
+                        self.index.discard(removed)
+
+        return self.hashes
+
+    def _is_ignored(self, path: str, full_path: str) -> bool:
+        # Never list the index itself (or its temporary file)
+        if self.index.path and full_path.startswith(self.index.path):
+            return True
+
+        # Files we've already seen unchanged are known not to be binary,
+        # so we don't need to open them again
+        try:
+            known = self.index.lookup(path, os.lstat(full_path)) is not None
+        except OSError:
+            known = False
+
+        return self.ignore_matcher.ignore(path, check_content=not known)
+
     def _get_file_list(self) -> list[str]:
+        if self.watcher is not None:
+            return list(self._refresh())
+        return self._walk_files()
+
+    def _walk_files(self) -> list[str]:
         files = []
         for dpath, dirnames, filenames in os.walk(self.root):
             # Modify in place to prevent recursing into ignored directories
@@ -177,10 +314,11 @@ class LocalDiskVFS(VirtualFileSystem):
             ]
 
             for filename in filenames:
-                path = os.path.relpath(os.path.join(dpath, filename), self.root)
-                if not self.ignore_matcher.ignore(path):
-                    # We use "/" internally on all platforms, including win32
-                    files.append(Path(path).as_posix())
+                full_path = os.path.join(dpath, filename)
+                # We use "/" internally on all platforms, including win32
+                path = Path(os.path.relpath(full_path, self.root)).as_posix()
+                if not self._is_ignored(path, full_path):
+                    files.append(path)
 
         return files
 
@@ -0,0 +1,334 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import os.path
+import struct
+import sys
+from pathlib import Path
+from typing import Iterator, Optional
+
+from core.disk.ignore import IgnoreMatcher
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# See inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class WorkspaceWatcher:
+    """
+    Track which files in the workspace were created, modified or deleted.
+
+    Watchers only report changed paths; it's up to the caller to check
+    whether the files still exist, whether they should be ignored, and what
+    their contents are. Paths inside ignored directories are never reported.
+    """
+
+    def __init__(self, root: str, ignore_matcher: IgnoreMatcher):
+        """
+        Initialize the watcher.
+
+        :param root: Root directory to watch.
+        :param ignore_matcher: Ignore matcher for the workspace.
+        """
+        self.root = str(root)
+        self.ignore_matcher = ignore_matcher
+
+    def start(self):
+        """
+        Start watching the workspace.
+
+        :raise OSError: If the watcher can't be started.
+        """
+        pass
+
+    def stop(self):
+        """
+        Stop watching the workspace and release the resources.
+        """
+        pass
+
+    def changes(self) -> Optional[set[str]]:
+        """
+        Return the paths changed since the previous call.
+
+        If the watcher can't tell what changed (eg. on the first call, or
+        if it lost track of the events), it returns None and the caller
+        should rescan the whole workspace instead.
+
+        :return: Set of changed paths relative to root, or None.
+        """
+        raise NotImplementedError()
+
+    def _relpath(self, full_path: str) -> str:
+        # We use "/" internally on all platforms, including win32
+        return Path(os.path.relpath(full_path, self.root)).as_posix()
+
+    def _walk(self, top: str) -> Iterator[tuple[str, list[str]]]:
+        """
+        Walk the directory tree, skipping the ignored directories.
+
+        :param top: Full path to the directory to start in.
+        :return: Iterator of (full directory path, file names) tuples.
+        """
+        for dpath, dirnames, filenames in os.walk(top):
+            # Modify in place to prevent recursing into ignored directories
+            dirnames[:] = [d for d in dirnames if not self.ignore_matcher.ignore(self._relpath(os.path.join(dpath, d)))]
+            yield dpath, filenames
+
+
+class PollingWatcher(WorkspaceWatcher):
+    """
+    Portable watcher that finds changes by comparing file stats.
+
+    Each call to `changes()` walks the workspace and stats the files, but
+    never opens them.
+    """
+
+    def __init__(self, root: str, ignore_matcher: IgnoreMatcher):
+        super().__init__(root, ignore_matcher)
+        self.stats: Optional[dict[str, tuple[int, int, int]]] = None
+
+    def stop(self):
+        self.stats = None
+
+    def _poll(self) -> dict[str, tuple[int, int, int]]:
+        stats = {}
+        for dpath, filenames in self._walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dpath, filename)
+                try:
+                    st = os.lstat(full_path)
+                except OSError:
+                    continue
+                stats[self._relpath(full_path)] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return stats
+
+    def changes(self) -> Optional[set[str]]:
+        old_stats = self.stats
+        self.stats = self._poll()
+        if old_stats is None:
+            return None
+
+        return {path for path in old_stats.keys() | self.stats.keys() if old_stats.get(path) != self.stats.get(path)}
+
+
+class InotifyWatcher(WorkspaceWatcher):
+    """
+    Linux watcher using inotify(7).
+
+    The kernel queues the events as the files change, and the watcher
+    collects them in the background (if started from within an asyncio
+    event loop) and whenever `changes()` is called, so the cost of each
+    check is proportional to the number of changed files.
+    """
+
+    def __init__(self, root: str, ignore_matcher: IgnoreMatcher):
+        super().__init__(root, ignore_matcher)
+        self.fd: Optional[int] = None
+        self.watches: dict[int, str] = {}
+        self.dirty: set[str] = set()
+        self.lost_track = True
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.libc = None
+
+    def start(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        if self.libc is None:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+
+        self.fd = fd
+        self.watches = {}
+        try:
+            self._add_tree(self.root)
+        except OSError:
+            self.stop()
+            raise
+
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.loop.add_reader(self.fd, self._read_events)
+        except (RuntimeError, NotImplementedError):
+            # No event loop, we'll read the queued events when asked for changes
+            self.loop = None
+
+        log.debug(f"Watching {len(self.watches)} directories in {self.root} for changes")
+
+    def stop(self):
+        if self.fd is None:
+            return
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.remove_reader(self.fd)
+        self.loop = None
+        os.close(self.fd)
+        self.fd = None
+        self.watches = {}
+
+    def changes(self) -> Optional[set[str]]:
+        if self.fd is not None:
+            self._read_events()
+
+        if self.lost_track:
+            self.dirty = set()
+            self.lost_track = False
+            if self.fd is None:
+                try:
+                    self.start()
+                except OSError as err:
+                    log.warning(f"Error restarting workspace watcher, rescanning on every check: {err}")
+                    self.lost_track = True
+            return None
+
+        changed = self.dirty
+        self.dirty = set()
+        return changed
+
+    def _add_watch(self, full_path: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(full_path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"Error watching {full_path}: {os.strerror(err)}")
+        self.watches[wd] = full_path
+
+    def _add_tree(self, top: str) -> list[str]:
+        """
+        Watch a directory and all its (non-ignored) subdirectories.
+
+        :param top: Full path to the directory.
+        :return: Paths of all the files in the tree.
+        """
+        files = []
+        for dpath, filenames in self._walk(top):
+            self._add_watch(dpath)
+            files.extend(self._relpath(os.path.join(dpath, filename)) for filename in filenames)
+        return files
+
+    def _reset(self, reason: str):
+        log.debug(f"Workspace watcher lost track of changes ({reason}), will rescan")
+        self.stop()
+        self.lost_track = True
+
+    def _read_events(self):
+        while self.fd is not None:
+            try:
+                data = os.read(self.fd, READ_BUFFER_SIZE)
+            except BlockingIOError:
+                return
+            except OSError as err:
+                self._reset(str(err))
+                return
+            self._handle_events(data)
+
+    def _handle_events(self, data: bytes):
+        offset = 0
+        while offset < len(data) and self.fd is not None:
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                self._reset("event queue overflow")
+                return
+
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            dpath = self.watches.get(wd)
+            if dpath is None:
+                continue
+
+            if mask & IN_MOVE_SELF or (mask & IN_DELETE_SELF and dpath == self.root):
+                # Watches of moved directories would report stale paths
+                self._reset(f"{dpath} was moved or deleted")
+                return
+
+            if not name:
+                continue
+
+            full_path = os.path.join(dpath, os.fsdecode(name))
+            path = self._relpath(full_path)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.ignore_matcher.ignore(path):
+                    # Files may have been created in it before we started watching it
+                    try:
+                        self.dirty.update(self._add_tree(full_path))
+                    except OSError as err:
+                        self._reset(str(err))
+                        return
+                elif mask & IN_MOVED_FROM:
+                    self._reset(f"{full_path} was moved")
+                    return
+                elif mask & IN_DELETE:
+                    self.dirty.add(path)
+                continue
+
+            # The caller checks the file itself, as it may have already changed again
+            self.dirty.add(path)
+
+
+def create_watcher(root: str, ignore_matcher: IgnoreMatcher) -> WorkspaceWatcher:
+    """
+    Create and start the best available workspace watcher.
+
+    Uses inotify on Linux if available, and falls back to polling otherwise
+    (or if inotify can't be used, eg. because the watch limit is reached).
+
+    :param root: Root directory to watch.
+    :param ignore_matcher: Ignore matcher for the workspace.
+    :return: The started watcher.
+    """
+    watcher = InotifyWatcher(root, ignore_matcher)
+    try:
+        watcher.start()
+        return watcher
+    except OSError as err:
+        log.debug(f"Can't use inotify to watch {root}, falling back to polling: {err}")
+
+    watcher = PollingWatcher(root, ignore_matcher)
+    watcher.start()
+    return watcher
+
+
+__all__ = ["WorkspaceWatcher", "PollingWatcher", "InotifyWatcher", "create_watcher"]
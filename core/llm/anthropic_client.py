@@ -7,6 +7,7 @@ from anthropic import AsyncAnthropic, RateLimitError
 from httpx import Timeout
 
 from core.config import LLMProvider
+from core.llm.client_pool import LLMClientPool
 from core.llm.convo import Convo
 from core.log import get_logger
 
@@ -27,7 +28,9 @@ class AnthropicClient(BaseLLMClient):
     provider = LLMProvider.ANTHROPIC
 
     def _init_client(self):
-        self.client = AsyncAnthropic(
+        self.client = LLMClientPool.get(
+            AsyncAnthropic,
+            self.config,
             api_key=self.config.api_key,
             base_url=self.config.base_url,
             timeout=Timeout(
@@ -65,6 +68,9 @@ class AnthropicClient(BaseLLMClient):
                 )
         return messages
 
+    def _request_messages(self, convo: Convo) -> list[dict[str, str]]:
+        return self._adapt_messages(convo)
+
     async def _make_request(
         self, convo: Convo, temperature: Optional[float] = None, json_mode: bool = False, retry_count: int = 1
     ) -> Tuple[str, int, int]:
@@ -91,10 +97,10 @@ class AnthropicClient(BaseLLMClient):
 
             response = []
             async with self.client.messages.stream(**completion_kwargs) as stream:
+                self._update_rate_limits(getattr(stream, "response", None))
                 async for content in stream.text_stream:
                     response.append(content)
-                    if self.stream_handler:
-                        await self.stream_handler(content)
+                    await self._handle_chunk(content)
 
                 try:
                     final_message = await stream.get_final_message()
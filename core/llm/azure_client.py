@@ -2,6 +2,7 @@ from httpx import Timeout
 from openai import AsyncAzureOpenAI
 
 from core.config import LLMProvider
+from core.llm.client_pool import LLMClientPool
 from core.llm.openai_client import OpenAIClient
 from core.log import get_logger
 
@@ -16,7 +17,9 @@ class AzureClient(OpenAIClient):
         azure_deployment = self.config.extra.get("azure_deployment")
         api_version = self.config.extra.get("api_version")
 
-        self.client = AsyncAzureOpenAI(
+        self.client = LLMClientPool.get(
+            AsyncAzureOpenAI,
+            self.config,
             api_key=self.config.api_key,
             azure_endpoint=self.config.base_url,
             azure_deployment=azure_deployment,
@@ -1,19 +1,40 @@
 import asyncio
 import datetime
 import json
+from collections.abc import Mapping
+from contextvars import ContextVar
 from enum import Enum
 from time import time
-from typing import Any, Callable, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Optional, Tuple
 
 import httpx
 
-from core.config import LLMConfig, LLMProvider
+from core.config import ContextOverflowPolicy, LLMConfig, LLMProvider
 from core.llm.convo import Convo
+from core.llm.rate_limiter import RateLimitScheduler
 from core.llm.request_log import LLMRequestLog, LLMRequestStatus
+from core.llm.tokens import TokenCounter, get_context_window, trim_messages
 from core.log import get_logger
 
+if TYPE_CHECKING:
+    from core.llm.cache import LLMResponseCache
+
 log = get_logger(__name__)
 
+# Tokens to leave free in the context window for the response
+MAX_RESPONSE_RESERVE = 4096
+# Allowed error margin when checking estimated (not exactly counted) prompt sizes
+ESTIMATE_TOLERANCE = 0.1
+
+TOKEN_LIMIT_ERROR_MESSAGE = "".join(
+    [
+        "We sent too large request to the LLM, resulting in an error. ",
+        "This is usually caused by including framework files in an LLM request. ",
+        "Here's how you can get Pythagora to ignore those extra files: ",
+        "https://bit.ly/faq-token-limit-error",
+    ]
+)
+
 
 class LLMError(str, Enum):
     KEY_EXPIRED = "key_expired"
@@ -26,6 +47,24 @@ class APIError(Exception):
         self.message = message
 
 
+class ResponseAborted(ValueError):
+    """
+    The streamed response was aborted because it's malformed.
+
+    Raised from the stream when the parser's stream consumer
+    rejects the partial response.
+    """
+
+    def __init__(self, message: str, response: str):
+        super().__init__(message)
+        self.response = response
+
+
+# Stream consumer for the response to the current request, if the parser supports it.
+# This is a context variable because the same client can make multiple requests in parallel.
+_stream_consumer: ContextVar[Optional[Any]] = ContextVar("stream_consumer", default=None)
+
+
 class BaseLLMClient:
     """
     Base asynchronous streaming client for language models.
@@ -51,16 +90,22 @@ class BaseLLMClient:
         *,
         stream_handler: Optional[Callable] = None,
         error_handler: Optional[Callable] = None,
+        cache: Optional["LLMResponseCache"] = None,
     ):
         """
         Initialize the client with the given configuration.
 
         :param config: Configuration for the client.
         :param stream_handler: Optional handler for streamed responses.
+        :param error_handler: Optional handler for LLM API errors.
+        :param cache: Optional response cache to consult before calling the LLM.
         """
         self.config = config
         self.stream_handler = stream_handler
         self.error_handler = error_handler
+        self.cache = cache
+        self.rate_limiter = RateLimitScheduler.for_config(config)
+        self.token_counter = TokenCounter.for_provider(self.provider)
         self._init_client()
 
     def _init_client(self):
@@ -110,6 +155,132 @@ class BaseLLMClient:
                 )
         return messages
 
+    async def _handle_chunk(self, content: str):
+        """
+        Handle a chunk of the streamed response.
+
+        Clients should call this for each response chunk. The chunk is fed
+        to the parser's stream consumer (if any), which may reject it, and
+        passed on to the stream handler.
+
+        :param content: Response chunk.
+        :raise ResponseAborted: If the response so far is malformed.
+        """
+        consumer = _stream_consumer.get()
+        if consumer is not None:
+            try:
+                consumer.feed(content)
+            except ValueError as err:
+                raise ResponseAborted(str(err), consumer.text) from err
+
+        if self.stream_handler:
+            await self.stream_handler(content)
+
+    def _update_rate_limits(self, response: Optional[httpx.Response]):
+        """
+        Update the shared rate limit budgets from the LLM response headers.
+
+        Clients should call this as soon as they get the (streaming)
+        response, so that parallel requests are scheduled accordingly.
+
+        :param response: HTTP response from the LLM API (if available).
+        """
+        headers = getattr(response, "headers", None)
+        if isinstance(headers, Mapping):
+            self.rate_limiter.update(headers)
+
+    def _request_messages(self, convo: Convo) -> list[dict[str, Any]]:
+        """
+        Return the messages that would be sent to the LLM for the conversation.
+
+        Used to compute the response cache key and count the prompt tokens.
+        Clients that adapt the messages before sending them should override this.
+
+        :param convo: Conversation to send to the LLM.
+        :return: Messages as sent to the LLM.
+        """
+        return convo.messages
+
+    def _fit_context_window(self, convo: Convo) -> int:
+        """
+        Make sure the conversation fits in the model's context window.
+
+        If the prompt is too large, depending on the `context_overflow`
+        policy the oldest messages are dropped from the conversation (which
+        is modified in place), or APIError is raised, without sending the
+        request to the LLM.
+
+        :param convo: Conversation to send to the LLM.
+        :return: Number of prompt tokens (counted or estimated).
+        """
+        n_tokens = self.token_counter.count_messages(self._request_messages(convo))
+        context_window = get_context_window(self.config.model)
+        if context_window is None:
+            return n_tokens
+
+        max_tokens = context_window - min(MAX_RESPONSE_RESERVE, context_window // 4)
+        if not self.token_counter.exact:
+            max_tokens = int(max_tokens * (1 + ESTIMATE_TOLERANCE))
+        if n_tokens <= max_tokens:
+            return n_tokens
+
+        if self.config.context_overflow == ContextOverflowPolicy.TRIM:
+            trimmed = trim_messages(convo.messages, self.token_counter, max_tokens)
+            if trimmed is not None:
+                log.warning(
+                    f"Prompt for {self.config.model} has {n_tokens} tokens, more than the {max_tokens} that fit "
+                    f"in the context window; dropped {len(convo.messages) - len(trimmed)} oldest messages"
+                )
+                convo.messages = trimmed
+                return self.token_counter.count_messages(self._request_messages(convo))
+
+        log.warning(f"Prompt for {self.config.model} has {n_tokens} tokens, more than the {max_tokens} limit")
+        raise APIError(TOKEN_LIMIT_ERROR_MESSAGE)
+
+    async def _get_cached_response(
+        self,
+        cache_key: str,
+        convo: Convo,
+        request_log: LLMRequestLog,
+        parser: Optional[Callable],
+    ) -> Tuple[bool, Any]:
+        """
+        Try to serve the request from the response cache.
+
+        The cached response is parsed again (so the caller gets fresh
+        parsed objects) and sent to the stream handler in one chunk. If the
+        cached response can't be parsed, it's treated as a cache miss.
+
+        :param cache_key: Cache key for the request.
+        :param convo: Conversation to send to the LLM.
+        :param request_log: Request log to fill in.
+        :param parser: Optional parser for the response.
+        :return: Tuple of (cache hit, parsed response).
+        """
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return False, None
+
+        response, prompt_tokens, completion_tokens = cached
+        parsed = response
+        if parser:
+            try:
+                parsed = parser(response)
+            except ValueError as err:
+                log.debug(f"Ignoring cached {self.provider.value} response that fails to parse: {err}")
+                return False, None
+
+        if self.stream_handler:
+            await self.stream_handler(response)
+            await self.stream_handler(None)
+
+        request_log.messages = convo.snapshot()
+        request_log.response = response
+        request_log.prompt_tokens = prompt_tokens
+        request_log.completion_tokens = completion_tokens
+        request_log.cache_hit = True
+        return True, parsed
+
     async def __call__(
         self,
         convo: Convo,
@@ -130,7 +301,10 @@ class BaseLLMClient:
         response content (str) and returns the parsed response.
         On parse error, the parser should raise a ValueError with
         a descriptive error message that will be sent back to the LLM
-        to retry, up to max_retries.
+        to retry, up to max_retries. If the parser has a `stream_consumer()`
+        method, the consumer it returns (a new one for each attempt) is fed
+        the response chunks as they arrive, and the request is aborted (and
+        retried) as soon as the consumer raises a ValueError.
 
         :param convo: Conversation to send to the LLM.
         :param parser: Optional parser for the response.
@@ -153,12 +327,31 @@ class BaseLLMClient:
             prompts=convo.prompt_log,
         )
 
-        prompt_length_kb = len(json.dumps(convo.messages).encode("utf-8")) / 1024
+        request_messages = self._request_messages(convo)
+        prompt_length_kb = sum(len(str(msg["content"]).encode("utf-8")) for msg in request_messages) / 1024
+        n_tokens = self.token_counter.count_messages(request_messages)
         log.debug(
-            f"Calling {self.provider.value} model {self.config.model} (temp={temperature}), prompt length: {prompt_length_kb:.1f} KB"
+            f"Calling {self.provider.value} model {self.config.model} (temp={temperature}), "
+            f"prompt length: {prompt_length_kb:.1f} KB, {n_tokens} tokens"
+            f"{'' if self.token_counter.exact else ' (estimated)'}"
         )
         t0 = time()
 
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(
+                self.provider,
+                self.config.model,
+                temperature,
+                json_mode,
+                self._request_messages(convo),
+            )
+            hit, response = await self._get_cached_response(cache_key, convo, request_log, parser)
+            if hit:
+                request_log.duration = time() - t0
+                log.debug(f"Served {self.provider.value} model {self.config.model} response from cache")
+                return response, request_log
+
         remaining_retries = max_retries
         while True:
             if remaining_retries == 0:
@@ -179,18 +372,33 @@ class BaseLLMClient:
                 raise APIError(last_error_msg)
 
             remaining_retries -= 1
-            request_log.messages = convo.messages[:]
+            # Raises APIError if the prompt doesn't fit and can't be trimmed, no point in retrying that
+            estimated_tokens = self._fit_context_window(convo)
+            request_log.messages = convo.snapshot()
             request_log.response = None
             request_log.status = LLMRequestStatus.SUCCESS
             request_log.error = None
             response = None
 
+            stream_consumer = getattr(parser, "stream_consumer", None)
+            consumer_token = _stream_consumer.set(stream_consumer() if stream_consumer else None)
             try:
+                await self.rate_limiter.acquire(estimated_tokens)
                 response, prompt_tokens, completion_tokens = await self._make_request(
                     convo,
                     temperature=temperature,
                     json_mode=json_mode,
                 )
+            except ResponseAborted as err:
+                log.debug(f"Aborted malformed LLM response: {err}, asking LLM to retry")
+                request_log.response = err.response
+                request_log.error = f"Error parsing response: {err}"
+                request_log.status = LLMRequestStatus.ERROR
+                if self.stream_handler:
+                    await self.stream_handler(None)
+                convo.assistant(err.response)
+                convo.user(f"Error parsing response: {err}. Please output your response EXACTLY as requested.")
+                continue
             except (openai.APIConnectionError, anthropic.APIConnectionError, groq.APIConnectionError) as err:
                 log.warning(f"API connection error: {err}", exc_info=True)
                 request_log.error = str(f"API connection error: {err}")
@@ -210,8 +418,11 @@ class BaseLLMClient:
                 log.warning(f"Rate limit error: {err}", exc_info=True)
                 request_log.error = str(f"Rate limit error: {err}")
                 request_log.status = LLMRequestStatus.ERROR
+                self._update_rate_limits(err.response)
                 wait_time = self.rate_limit_sleep(err)
                 if wait_time:
+                    # Make other requests to the same provider wait as well
+                    self.rate_limiter.pause(wait_time.total_seconds())
                     message = f"We've hit {self.config.provider.value} rate limit. Sleeping for {wait_time.seconds} seconds..."
                     if self.error_handler:
                         await self.error_handler(LLMError.RATE_LIMITED, message)
@@ -259,15 +470,7 @@ class BaseLLMClient:
                 if err_code in ("request_too_large", "context_length_exceeded", "string_above_max_length"):
                     # Handle OpenAI and Groq token limit exceeded
                     # OpenAI will return `string_above_max_length` for prompts more than 1M characters
-                    message = "".join(
-                        [
-                            "We sent too large request to the LLM, resulting in an error. ",
-                            "This is usually caused by including framework files in an LLM request. ",
-                            "Here's how you can get Pythagora to ignore those extra files: ",
-                            "https://bit.ly/faq-token-limit-error",
-                        ]
-                    )
-                    raise APIError(message) from err
+                    raise APIError(TOKEN_LIMIT_ERROR_MESSAGE) from err
 
                 log.warning(f"API error: {err}", exc_info=True)
                 request_log.error = str(f"API error: {err}")
@@ -281,11 +484,15 @@ class BaseLLMClient:
                 request_log.error = f"LLM had an error processing our request: {err}"
                 request_log.status = LLMRequestStatus.ERROR
                 continue
+            finally:
+                _stream_consumer.reset(consumer_token)
 
             request_log.response = response
+            self.token_counter.calibrate(self._request_messages(convo), prompt_tokens)
 
             request_log.prompt_tokens += prompt_tokens
             request_log.completion_tokens += completion_tokens
+            raw_response = response
             if parser:
                 try:
                     response = parser(response)
@@ -300,6 +507,11 @@ class BaseLLMClient:
             else:
                 break
 
+        if cache_key is not None:
+            # The key is computed from the original conversation, so if it took a few
+            # attempts to get a parseable response, the final one is cached for it.
+            self.cache.put(cache_key, raw_response, prompt_tokens, completion_tokens)
+
         t1 = time()
         request_log.duration = t1 - t0
 
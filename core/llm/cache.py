@@ -0,0 +1,184 @@
+import json
+import os.path
+import sqlite3
+from hashlib import sha256
+from threading import Lock
+from time import time
+from typing import Any, Optional
+
+from core.config import LLMCacheConfig, LLMProvider
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+
+class LLMResponseCache:
+    """
+    Persistent, content-addressed cache of LLM responses.
+
+    Responses are keyed on the provider, model, temperature, JSON mode
+    and the exact messages sent to the LLM, and stored in a local SQLite
+    database. Entries older than `max_age` seconds are evicted, and if the
+    total size of cached responses exceeds `max_size` bytes, the least
+    recently used entries are evicted until it fits.
+
+    Example usage:
+
+    >>> cache = LLMResponseCache.from_config(config.llm_cache)
+    >>> key = cache.make_key(provider, model, temperature, json_mode, messages)
+    >>> cached = cache.get(key)
+    >>> if cached is None:
+    ...     cache.put(key, response, prompt_tokens, completion_tokens)
+    """
+
+    _instances: dict[str, "LLMResponseCache"] = {}
+
+    def __init__(self, path: str, *, max_size: int, max_age: int):
+        """
+        Open (or create) the cache database at the given path.
+
+        :param path: Path to the SQLite database file (or ":memory:").
+        :param max_size: Maximum total size of cached responses, in bytes.
+        :param max_age: Maximum age of a cached response, in seconds.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)")
+
+    @classmethod
+    def from_config(cls, config: LLMCacheConfig) -> "LLMResponseCache":
+        """
+        Return the shared cache instance for the given configuration.
+
+        All clients using the same cache path share the same instance
+        (and database connection).
+
+        :param config: LLM cache configuration.
+        :return: The cache instance.
+        """
+        if config.path not in cls._instances:
+            cls._instances[config.path] = cls(config.path, max_size=config.max_size, max_age=config.max_age)
+        return cls._instances[config.path]
+
+    @staticmethod
+    def make_key(
+        provider: LLMProvider,
+        model: str,
+        temperature: float,
+        json_mode: bool,
+        messages: list[dict[str, Any]],
+    ) -> str:
+        """
+        Compute the cache key for a request.
+
+        :param provider: LLM provider.
+        :param model: Model name.
+        :param temperature: Sampling temperature.
+        :param json_mode: Whether JSON mode was requested.
+        :param messages: Messages as sent to the LLM (after adapting them to the provider).
+        :return: Hex digest uniquely identifying the request.
+        """
+        payload = json.dumps(
+            [provider.value, model, temperature, json_mode, messages],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple[str, int, int]]:
+        """
+        Look up a cached response.
+
+        :param key: Cache key (see `make_key()`).
+        :return: Tuple of (response, prompt tokens, completion tokens), or None if not cached.
+        """
+        now = time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, prompt_tokens, completion_tokens, created_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            response, prompt_tokens, completion_tokens, created_at = row
+            if now - created_at > self.max_age:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return response, prompt_tokens, completion_tokens
+
+    def put(self, key: str, response: str, prompt_tokens: int, completion_tokens: int):
+        """
+        Store a response in the cache, evicting old entries if needed.
+
+        :param key: Cache key (see `make_key()`).
+        :param response: Raw (unparsed) response text.
+        :param prompt_tokens: Number of prompt tokens the original request used.
+        :param completion_tokens: Number of completion tokens the original request used.
+        """
+        now = time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, response, prompt_tokens, completion_tokens, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, response, prompt_tokens, completion_tokens, len(response.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """
+        Evict expired entries, then least recently used ones until the cache fits in `max_size`.
+
+        Must be called with the lock held.
+
+        :param now: Current timestamp.
+        """
+        self.db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+
+        (total_size,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total_size <= self.max_size:
+            return
+
+        evicted = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall():
+            if total_size <= self.max_size:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            evicted += 1
+
+        log.debug(f"Evicted {evicted} least recently used LLM responses from cache {self.path}")
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+
+
+__all__ = ["LLMResponseCache"]
@@ -0,0 +1,133 @@
+import asyncio
+from typing import Any, Callable, Optional
+
+import httpx
+
+from core.config import LLMConfig
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+
+class LLMClientPool:
+    """
+    Process-wide registry of long-lived LLM SDK clients.
+
+    Creating a new SDK client (eg. `AsyncOpenAI`) also creates a new HTTP
+    connection pool, so every request made through a fresh client pays
+    for a new TCP and TLS handshake. Instead, clients are created once
+    per connection-relevant configuration (provider, endpoint, key,
+    timeouts, pool limits) and event loop, and shared by all agents.
+
+    Example usage:
+
+    >>> client = LLMClientPool.get(AsyncOpenAI, config, api_key=config.api_key)
+    """
+
+    _clients: dict[tuple, Any] = {}
+    _http_clients: dict[tuple, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def _loop_id() -> Optional[int]:
+        # HTTP connections can't be shared between event loops, so each loop gets its own clients
+        try:
+            return id(asyncio.get_running_loop())
+        except RuntimeError:
+            return None
+
+    @classmethod
+    def _connection_key(cls, config: LLMConfig) -> tuple:
+        return (
+            cls._loop_id(),
+            config.provider,
+            config.base_url,
+            config.api_key,
+            config.connect_timeout,
+            config.read_timeout,
+            config.max_connections,
+            config.max_keepalive_connections,
+            config.http2,
+        )
+
+    @classmethod
+    def get_http_client(cls, config: LLMConfig) -> httpx.AsyncClient:
+        """
+        Get the shared HTTP client (connection pool) for the configuration.
+
+        :param config: LLM configuration.
+        :return: HTTP client with keep-alive connection pool.
+        """
+        key = cls._connection_key(config)
+        http_client = cls._http_clients.get(key)
+        if http_client is not None and not http_client.is_closed:
+            return http_client
+
+        http2 = config.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                log.warning("HTTP/2 requested for LLM API, but the `h2` package is not installed; using HTTP/1.1")
+                http2 = False
+
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                max(config.connect_timeout, config.read_timeout),
+                connect=config.connect_timeout,
+                read=config.read_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+            ),
+            http2=http2,
+            follow_redirects=True,
+        )
+        cls._http_clients[key] = http_client
+        return http_client
+
+    @classmethod
+    def get(cls, factory: Callable, config: LLMConfig, **kwargs) -> Any:
+        """
+        Get (or create) the shared SDK client for the configuration.
+
+        The client is created by calling `factory(**kwargs, http_client=...)`
+        with the shared HTTP client, so `factory` should be the SDK client
+        class (eg. `AsyncOpenAI` or `AsyncAnthropic`).
+
+        :param factory: SDK client class.
+        :param config: LLM configuration.
+        :param kwargs: Additional arguments for the SDK client constructor.
+        :return: SDK client instance.
+        """
+        key = (factory, cls._connection_key(config), repr(sorted(kwargs.items())))
+        client = cls._clients.get(key)
+        if client is not None and not cls.get_http_client(config).is_closed:
+            return client
+
+        log.debug(f"Creating new {config.provider.value} client for {config.base_url or 'default endpoint'}")
+        client = factory(**kwargs, http_client=cls.get_http_client(config))
+        cls._clients[key] = client
+        return client
+
+    @classmethod
+    async def close(cls):
+        """
+        Close all the shared HTTP connections.
+
+        Clients created afterwards will open new connection pools.
+        """
+        loop_id = cls._loop_id()
+        for key, http_client in list(cls._http_clients.items()):
+            if key[0] != loop_id:
+                continue
+            try:
+                await http_client.aclose()
+            except Exception as err:  # noqa
+                log.debug(f"Error closing LLM HTTP client: {err}")
+            del cls._http_clients[key]
+
+        cls._clients = {key: client for key, client in cls._clients.items() if key[1][0] != loop_id}
+
+
+__all__ = ["LLMClientPool"]
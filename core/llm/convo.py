@@ -1,5 +1,38 @@
-from copy import deepcopy
-from typing import Any, Iterator, Optional
+import re
+from copy import copy
+from typing import Any, Iterable, Iterator, Optional
+
+# Line boundaries recognized by `str.splitlines()` other than "\n"
+OTHER_LINE_BREAKS = re.compile(r"[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+# A line with trailing whitespace
+TRAILING_WHITESPACE = re.compile(r"[^\S\n]$", re.MULTILINE)
+# A line that isn't indented
+UNINDENTED_LINE = re.compile(r"^\S", re.MULTILINE)
+
+
+class Message(dict):
+    """
+    A single (immutable) message in a conversation.
+
+    Messages are shared between forked conversations (and the
+    request logs), so they can't be modified after creation. Copying
+    a message (including `deepcopy`) returns the message itself.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Conversation messages can't be modified")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self) -> "Message":
+        return self
+
+    def __deepcopy__(self, memo: dict) -> "Message":
+        return self
+
+    def __reduce__(self):
+        return (Message, (dict(self),))
 
 
 class Convo:
@@ -8,11 +41,14 @@ class Convo:
 
     Holds messages and an optional metadata log (list of dicts with
     prompt information).
+
+    Forking a conversation is cheap: the messages are immutable and
+    the message list is shared between the parent and the child until
+    one of them changes it (copy-on-write).
     """
 
     ROLES = ["system", "user", "assistant", "function"]
 
-    messages: list[dict[str, str]]
     prompt_log: list[dict[str, Any]]
 
     def __init__(self, content: Optional[str] = None):
@@ -21,12 +57,43 @@ class Convo:
 
         :param content: Initial system message (optional).
         """
-        self.messages = []
+        self._messages: list[Message] = []
+        # Whether the message list may be shared with another convo (or a request log)
+        self._shared = False
         self.prompt_log = []
 
         if content is not None:
             self.system(content)
 
+    @property
+    def messages(self) -> list[dict[str, str]]:
+        """
+        Messages in the conversation.
+
+        The list may be shared with forked conversations, so it
+        should not be modified in place. Use `add()` (or the
+        convenience methods) to add messages, or assign a new
+        list to replace them.
+        """
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: Iterable[dict[str, str]]):
+        self._messages = [msg if isinstance(msg, Message) else Message(msg) for msg in messages]
+        self._shared = False
+
+    def snapshot(self) -> list[dict[str, str]]:
+        """
+        Return the current messages without copying them.
+
+        The returned list won't change when the conversation is
+        later modified.
+
+        :return: List of messages.
+        """
+        self._shared = True
+        return self._messages
+
     @staticmethod
     def _dedent(text: str) -> str:
         """
@@ -35,6 +102,10 @@ class Convo:
         :param text: Text to dedent.
         :return: Dedented text.
         """
+        # Fast path for (potentially large) texts that are already dedented
+        if UNINDENTED_LINE.search(text) and not TRAILING_WHITESPACE.search(text) and not OTHER_LINE_BREAKS.search(text):
+            return text[:-1] if text.endswith("\n") else text
+
         indent = len(text)
         lines = text.splitlines()
         for line in lines:
@@ -69,7 +140,10 @@ class Convo:
         if name is not None:
             message["name"] = name
 
-        self.messages.append(message)
+        if self._shared:
+            self._messages = self._messages[:]
+            self._shared = False
+        self._messages.append(Message(message))
         return self
 
     def system(self, content: str, name: Optional[str] = None) -> "Convo":
@@ -119,15 +193,15 @@ class Convo:
         """
         Create an identical copy of the conversation.
 
-        This performs a deep copy of all the message
-        contents, so you can safely modify both the
-        parent and the child conversation.
+        The messages are shared until either the parent or the
+        child conversation is modified, so you can safely modify both.
 
-        :return: A copy of the conversation.
+        :return: A copy of the conversation (of the same type).
         """
-        child = Convo()
-        child.messages = deepcopy(self.messages)
-        child.prompt_log = deepcopy(self.prompt_log)
+        child = copy(self)
+        child._messages = self.snapshot()
+        child._shared = True
+        child.prompt_log = self.prompt_log[:]
         return child
 
     def after(self, parent: "Convo") -> "Convo":
@@ -144,7 +218,7 @@ class Convo:
             index += 1
 
         child = Convo()
-        child.messages = [deepcopy(msg) for msg in self.messages[index:]]
+        child.messages = self.messages[index:]
         return child
 
     def last(self) -> Optional[dict[str, str]]:
@@ -167,4 +241,4 @@ class Convo:
         return f"<Convo({self.messages})>"
 
 
-__all__ = ["Convo"]
+__all__ = ["Convo", "Message"]
@@ -1,24 +1,25 @@
 import datetime
 from typing import Optional
 
-import tiktoken
 from groq import AsyncGroq, RateLimitError
 from httpx import Timeout
 
 from core.config import LLMProvider
-from core.llm.base import BaseLLMClient
+from core.llm.base import BaseLLMClient, ResponseAborted
+from core.llm.client_pool import LLMClientPool
 from core.llm.convo import Convo
 from core.log import get_logger
 
 log = get_logger(__name__)
-tokenizer = tiktoken.get_encoding("cl100k_base")
 
 
 class GroqClient(BaseLLMClient):
     provider = LLMProvider.GROQ
 
     def _init_client(self):
-        self.client = AsyncGroq(
+        self.client = LLMClientPool.get(
+            AsyncGroq,
+            self.config,
             api_key=self.config.api_key,
             base_url=self.config.base_url,
             timeout=Timeout(
@@ -44,21 +45,26 @@ class GroqClient(BaseLLMClient):
             completion_kwargs["response_format"] = {"type": "json_object"}
 
         stream = await self.client.chat.completions.create(**completion_kwargs)
+        self._update_rate_limits(getattr(stream, "response", None))
         response = []
         prompt_tokens = 0
         completion_tokens = 0
 
-        async for chunk in stream:
-            if not chunk.choices:
-                continue
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
 
-            content = chunk.choices[0].delta.content
-            if not content:
-                continue
+                content = chunk.choices[0].delta.content
+                if not content:
+                    continue
 
-            response.append(content)
-            if self.stream_handler:
-                await self.stream_handler(content)
+                response.append(content)
+                await self._handle_chunk(content)
+        except ResponseAborted:
+            # Stop the generation, we won't use the rest of the response
+            await stream.close()
+            raise
 
         response_str = "".join(response)
 
@@ -69,8 +75,8 @@ class GroqClient(BaseLLMClient):
         if prompt_tokens == 0 and completion_tokens == 0:
             # FIXME: Here we estimate Groq tokens using the same method as for OpenAI....
             # See https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
-            prompt_tokens = sum(3 + len(tokenizer.encode(msg["content"])) for msg in convo.messages)
-            completion_tokens = len(tokenizer.encode(response_str))
+            prompt_tokens = self.token_counter.count_messages(convo.messages)
+            completion_tokens = self.token_counter.count_text(response_str)
 
         return response_str, prompt_tokens, completion_tokens
 
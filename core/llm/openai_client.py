@@ -2,17 +2,16 @@ import datetime
 import re
 from typing import Optional
 
-import tiktoken
 from httpx import Timeout
 from openai import AsyncOpenAI, RateLimitError
 
 from core.config import LLMProvider
-from core.llm.base import BaseLLMClient
+from core.llm.base import BaseLLMClient, ResponseAborted
+from core.llm.client_pool import LLMClientPool
 from core.llm.convo import Convo
 from core.log import get_logger
 
 log = get_logger(__name__)
-tokenizer = tiktoken.get_encoding("cl100k_base")
 
 
 class OpenAIClient(BaseLLMClient):
@@ -20,7 +19,9 @@ class OpenAIClient(BaseLLMClient):
     stream_options = {"include_usage": True}
 
     def _init_client(self):
-        self.client = AsyncOpenAI(
+        self.client = LLMClientPool.get(
+            AsyncOpenAI,
+            self.config,
             api_key=self.config.api_key,
             base_url=self.config.base_url,
             timeout=Timeout(
@@ -49,25 +50,30 @@ class OpenAIClient(BaseLLMClient):
             completion_kwargs["response_format"] = {"type": "json_object"}
 
         stream = await self.client.chat.completions.create(**completion_kwargs)
+        self._update_rate_limits(getattr(stream, "response", None))
         response = []
         prompt_tokens = 0
         completion_tokens = 0
 
-        async for chunk in stream:
-            if chunk.usage:
-                prompt_tokens += chunk.usage.prompt_tokens
-                completion_tokens += chunk.usage.completion_tokens
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    prompt_tokens += chunk.usage.prompt_tokens
+                    completion_tokens += chunk.usage.completion_tokens
 
-            if not chunk.choices:
-                continue
+                if not chunk.choices:
+                    continue
 
-            content = chunk.choices[0].delta.content
-            if not content:
-                continue
+                content = chunk.choices[0].delta.content
+                if not content:
+                    continue
 
-            response.append(content)
-            if self.stream_handler:
-                await self.stream_handler(content)
+                response.append(content)
+                await self._handle_chunk(content)
+        except ResponseAborted:
+            # Stop the generation, we won't use the rest of the response
+            await stream.close()
+            raise
 
         response_str = "".join(response)
 
@@ -77,8 +83,8 @@ class OpenAIClient(BaseLLMClient):
 
         if prompt_tokens == 0 and completion_tokens == 0:
             # See https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
-            prompt_tokens = sum(3 + len(tokenizer.encode(msg["content"])) for msg in convo.messages)
-            completion_tokens = len(tokenizer.encode(response_str))
+            prompt_tokens = self.token_counter.count_messages(convo.messages)
+            completion_tokens = self.token_counter.count_text(response_str)
             log.warning(
                 "OpenAI response did not include token counts, estimating with tiktoken: "
                 f"{prompt_tokens} input tokens, {completion_tokens} output tokens"
@@ -1,7 +1,9 @@
 import json
 import re
+import types
 from enum import Enum
-from typing import List, Optional, Union
+from functools import lru_cache
+from typing import Annotated, Any, Callable, List, Literal, Optional, Union, get_args, get_origin
 
 from pydantic import BaseModel, ValidationError, create_model
 
@@ -35,10 +37,38 @@ class DescriptiveCodeBlockParser:
     ... ```'''
     >>> result = parser(text)
     >>> assert result.blocks[0].description == "file: next.config.js"
+
+    If `on_block` callback is provided, it is called with each block as soon
+    as it has been streamed from the LLM (see `DescriptiveCodeBlockStream`),
+    before the complete response is available. If the request fails or is
+    retried, the blocks streamed so far are discarded (a new stream is
+    created for each attempt), so the callback must not apply any changes:
+    only the blocks of the final, parsed response should be acted upon.
     """
 
-    def __init__(self):
+    def __init__(self, on_block: Optional[Callable[[CodeBlock], Any]] = None):
         self.pattern = re.compile(r"^(.*?)\n```([a-z0-9]+\n)?(.*?)^```\s*", re.DOTALL | re.MULTILINE)
+        self.on_block = on_block
+
+    def stream_consumer(self) -> Optional["DescriptiveCodeBlockStream"]:
+        """
+        Create a stream parser that emits the blocks while the response is streamed.
+
+        The LLM client feeds it the response chunks (see `BaseLLMClient.__call__()`).
+
+        :return: Stream parser, or None if there's no `on_block` callback.
+        """
+        return DescriptiveCodeBlockStream(self.pattern, self.on_block) if self.on_block else None
+
+    @staticmethod
+    def _block(match: re.Match) -> Optional[CodeBlock]:
+        description = match.group(1).strip()
+        content = match.group(3).strip()
+
+        # Only add block if we have both description and content
+        if description and content:
+            return CodeBlock(description=description, content=content)
+        return None
 
     def __call__(self, text: str) -> ParsedBlocks:
         # Store original response
@@ -47,16 +77,61 @@ class DescriptiveCodeBlockParser:
         # Find all blocks with their preceding text
         blocks = []
         for match in self.pattern.finditer(text):
-            description = match.group(1).strip()
-            content = match.group(3).strip()
-
-            # Only add block if we have both description and content
-            if description and content:
-                blocks.append(CodeBlock(description=description, content=content))
+            block = self._block(match)
+            if block:
+                blocks.append(block)
 
         return ParsedBlocks(original_response=original_response, blocks=blocks)
 
 
+class DescriptiveCodeBlockStream:
+    """
+    Incrementally parse descriptive code blocks from a streamed response.
+
+    Calls `on_block` with each block as soon as the block is complete, so
+    the caller can start preparing it (eg. load the files it changes) while
+    the rest of the response is being generated. The emitted blocks are exactly the ones
+    `DescriptiveCodeBlockParser` would return for the complete response.
+
+    A block is considered complete once something other than whitespace
+    follows its closing fence, because the whitespace after the fence
+    affects where the next block is matched. The last block is therefore
+    only available from the complete response.
+    """
+
+    def __init__(self, pattern: re.Pattern, on_block: Callable[[CodeBlock], Any]):
+        self.pattern = pattern
+        self.on_block = on_block
+        self.text = ""
+        self._pos = 0
+        self._pending = False
+
+    def feed(self, chunk: str):
+        """
+        Parse the next chunk of the response.
+
+        :param chunk: Response chunk.
+        """
+        self.text += chunk
+        # A block can only be completed by a closing fence, or by the text following it
+        if "`" in chunk or (self._pending and chunk.strip()):
+            self._emit()
+
+    def _emit(self):
+        self._pending = False
+        while True:
+            match = self.pattern.search(self.text, self._pos)
+            if not match:
+                return
+            if match.end() == len(self.text):
+                self._pending = True
+                return
+            self._pos = match.end()
+            block = DescriptiveCodeBlockParser._block(match)
+            if block:
+                self.on_block(block)
+
+
 class MultiCodeBlockParser:
     """
     Parse multiple Markdown code blocks from a string.
@@ -133,6 +208,295 @@ class OptionalCodeBlockParser:
         return text
 
 
+# Kinds of JSON values, as far as the stream validator is concerned
+JSON_OBJECT = "object"
+JSON_ARRAY = "array"
+JSON_SCALAR = "scalar"
+
+# `X | Y` unions are only available on Python 3.10+
+UNION_TYPES = (Union, getattr(types, "UnionType", Union))
+# Characters a JSON value can start with (including `NaN`, `Infinity` and `-Infinity`,
+# which `json.loads()` accepts)
+JSON_VALUE_START = set('{["-0123456789tfnNI')
+# Markdown code block opening, optionally with a language
+CODE_BLOCK_START = re.compile(r"```[a-z0-9]*")
+
+
+def _value_kinds(annotation: Any) -> Optional[set[str]]:
+    """
+    Return the kinds of JSON values pydantic can accept for a type annotation.
+
+    :param annotation: Field type annotation.
+    :return: Set of JSON value kinds, or None if the kinds can't be determined.
+    """
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        return _value_kinds(get_args(annotation)[0])
+    if origin in UNION_TYPES:
+        kinds = set()
+        for arg in get_args(annotation):
+            arg_kinds = _value_kinds(arg)
+            if arg_kinds is None:
+                return None
+            kinds |= arg_kinds
+        return kinds
+    if origin is Literal or annotation is type(None):
+        return {JSON_SCALAR}
+    if origin in (list, tuple, set, frozenset) or annotation in (list, tuple, set, frozenset):
+        return {JSON_ARRAY}
+    if origin is dict or annotation is dict:
+        return {JSON_OBJECT}
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel):
+            return {JSON_OBJECT}
+        if issubclass(annotation, (str, int, float, bool, Enum)):
+            return {JSON_SCALAR}
+    return None
+
+
+def _container_annotation(annotation: Any, kind: str) -> Any:
+    """
+    Return the (only) member of the annotation that accepts the given kind of JSON container.
+
+    :param annotation: Field type annotation.
+    :param kind: JSON_OBJECT or JSON_ARRAY.
+    :return: The matching annotation, or None if there's none or more than one.
+    """
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        return _container_annotation(get_args(annotation)[0], kind)
+    if origin in UNION_TYPES:
+        matching = [arg for arg in get_args(annotation) if kind in (_value_kinds(arg) or ())]
+        return _container_annotation(matching[0], kind) if len(matching) == 1 else None
+    return annotation if kind in (_value_kinds(annotation) or ()) else None
+
+
+def _child_annotation(annotation: Any, key: Optional[str]) -> Any:
+    """
+    Return the type annotation for a value inside a JSON container.
+
+    :param annotation: Container annotation (pydantic model, dict or list type).
+    :param key: Object key (None for array items).
+    :return: Value annotation, or None if unknown.
+    """
+    if annotation is None:
+        return None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        for name, field in annotation.model_fields.items():
+            if key in (name, field.alias):
+                return field.annotation
+        return None
+    args = get_args(annotation)
+    origin = get_origin(annotation)
+    if origin is dict and len(args) == 2:
+        return args[1]
+    if origin in (list, set, frozenset) and len(args) == 1:
+        return args[0]
+    if origin is tuple and len(args) == 2 and args[1] is Ellipsis:
+        return args[0]
+    return None
+
+
+class _Frame:
+    """JSON container (or the top-level value) being parsed by JSONStreamValidator."""
+
+    def __init__(self, kind: Optional[str], annotation: Any, path: str, state: str):
+        self.kind = kind
+        self.annotation = annotation
+        self.path = path
+        self.state = state
+        self.key: Optional[str] = None
+        self.index = 0
+
+
+class JSONStreamValidator:
+    """
+    Incrementally validate a streamed JSON response.
+
+    Checks the response structure as the chunks arrive and raises a
+    ValueError as soon as it's clear the complete response would be
+    rejected by JSONParser anyway (eg. there's prose before or after the
+    JSON, the JSON syntax is broken, or a value has the wrong shape for
+    the pydantic spec), so the request can be aborted early.
+
+    The validator doesn't catch all errors (eg. it doesn't check scalar
+    values or missing fields) and never rejects a response that the
+    parser would accept.
+
+    Example usage:
+
+    >>> validator = JSONStreamValidator(spec)
+    >>> for chunk in stream:
+    ...     validator.feed(chunk)  # raises ValueError
+    """
+
+    def __init__(self, spec: Optional[type[BaseModel]] = None):
+        self.spec = spec
+        self.text = ""
+        self._prefix = ""
+        self._started = False
+        self._in_code_block = False
+        self._finished = False
+        self._stack = [_Frame(None, spec, "", "value")]
+        self._in_string = False
+        self._in_key = False
+        self._escape = False
+        self._key_chars: list[str] = []
+        self._in_scalar = False
+
+    def feed(self, chunk: str):
+        """
+        Validate the next chunk of the response.
+
+        :param chunk: Response chunk.
+        :raise ValueError: If the response is malformed.
+        """
+        self.text += chunk
+        for char in chunk:
+            if self._finished:
+                return
+            if not self._started:
+                self._feed_prefix(char)
+            else:
+                self._feed_json(char)
+
+    def _feed_prefix(self, char: str):
+        if not self._prefix and char.isspace():
+            return
+
+        if self._prefix or char == "`":
+            if char in '{["-' and self._prefix == "```":
+                # JSON on the same line as the code block opening
+                self._started = self._in_code_block = True
+                self._feed_json(char)
+                return
+            self._prefix += char
+            if "```".startswith(self._prefix) or CODE_BLOCK_START.fullmatch(self._prefix):
+                return
+            if self._prefix[-1] == "\n" and CODE_BLOCK_START.fullmatch(self._prefix[:-1]):
+                self._started = self._in_code_block = True
+                return
+            raise ValueError("Response doesn't start with JSON or a code block containing JSON")
+
+        self._started = True
+        self._feed_json(char)
+
+    def _error(self, frame: _Frame, message: str) -> ValueError:
+        where = f"`{frame.path}`" if frame.path else "Response"
+        return ValueError(f"{where} {message}")
+
+    def _start_value(self, frame: _Frame, char: str):
+        if char == "{":
+            kind = JSON_OBJECT
+        elif char == "[":
+            kind = JSON_ARRAY
+        elif char == '"' or char in JSON_VALUE_START:
+            kind = JSON_SCALAR
+        elif frame.kind is None:
+            raise ValueError("Response doesn't start with JSON")
+        else:
+            raise self._error(frame, f"has unexpected character {char!r}")
+
+        if frame.kind == JSON_OBJECT:
+            path, annotation = frame.key, _child_annotation(frame.annotation, frame.key)
+        elif frame.kind == JSON_ARRAY:
+            path, annotation = str(frame.index), _child_annotation(frame.annotation, None)
+            frame.index += 1
+        else:
+            path, annotation = "", frame.annotation
+        if frame.path:
+            path = f"{frame.path}.{path}"
+
+        kinds = _value_kinds(annotation)
+        if kinds is not None and kind not in kinds:
+            expected = " or ".join(sorted("value" if k == JSON_SCALAR else k for k in kinds))
+            where = f"`{path}`" if path else "Response"
+            raise ValueError(f"{where} should be a JSON {expected}, not {'a value' if kind == JSON_SCALAR else kind}")
+
+        frame.state = "done" if frame.kind is None else "comma_or_end"
+        if kind == JSON_OBJECT:
+            self._stack.append(_Frame(JSON_OBJECT, _container_annotation(annotation, kind), path, "key_or_end"))
+        elif kind == JSON_ARRAY:
+            self._stack.append(_Frame(JSON_ARRAY, _container_annotation(annotation, kind), path, "value_or_end"))
+        elif char == '"':
+            self._in_string = True
+        else:
+            self._in_scalar = True
+
+    def _feed_json(self, char: str):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._in_key:
+                    self._in_key = False
+                    self._stack[-1].key = "".join(self._key_chars)
+                    return
+            if self._in_key:
+                self._key_chars.append(char)
+            return
+
+        if self._in_scalar:
+            if char not in ",]}" and not char.isspace():
+                return
+            self._in_scalar = False
+
+        if char.isspace():
+            return
+
+        frame = self._stack[-1]
+        closing = "}" if frame.kind == JSON_OBJECT else "]"
+
+        if frame.state == "done":
+            if self._in_code_block and char == "`":
+                self._finished = True
+                return
+            raise ValueError("Response has unexpected text after the JSON")
+        elif frame.state in ("value", "value_or_end"):
+            if char == "]" and frame.state == "value_or_end":
+                self._stack.pop()
+            else:
+                self._start_value(frame, char)
+        elif frame.state in ("key", "key_or_end"):
+            if char == '"':
+                self._in_string = self._in_key = True
+                self._key_chars = []
+                frame.state = "colon"
+            elif char == "}" and frame.state == "key_or_end":
+                self._stack.pop()
+            else:
+                raise self._error(frame, f"has unexpected character {char!r} instead of a key")
+        elif frame.state == "colon":
+            if char != ":":
+                raise self._error(frame, f"has unexpected character {char!r} instead of ':'")
+            frame.state = "value"
+        elif frame.state == "comma_or_end":
+            if char == ",":
+                frame.state = "key" if frame.kind == JSON_OBJECT else "value"
+            elif char == closing:
+                self._stack.pop()
+            else:
+                raise self._error(frame, f"has unexpected character {char!r} instead of ',' or {closing!r}")
+
+
+@lru_cache(maxsize=256)
+def _extended_model(spec: type[BaseModel]) -> type[BaseModel]:
+    """
+    Create a model that includes the spec fields and the original response text.
+
+    :param spec: Pydantic model.
+    :return: Extended model class.
+    """
+    return create_model(
+        f"Extended{spec.__name__}",
+        original_response=(str, ...),
+        **{field_name: (field.annotation, field.default) for field_name, field in spec.model_fields.items()},
+    )
+
+
 class JSONParser:
     def __init__(self, spec: Optional[BaseModel] = None, strict: bool = True):
         self.spec = spec
@@ -143,6 +507,16 @@ class JSONParser:
     def schema(self):
         return self.spec.model_json_schema() if self.spec else None
 
+    def stream_consumer(self) -> Optional[JSONStreamValidator]:
+        """
+        Create a validator for checking the streamed response before it's complete.
+
+        The LLM client feeds it the response chunks (see `BaseLLMClient.__call__()`).
+
+        :return: Stream validator, or None if the parser isn't strict (and accepts any response).
+        """
+        return JSONStreamValidator(self.spec) if self.strict else None
+
     @staticmethod
     def errors_to_markdown(errors: list) -> str:
         error_txt = []
@@ -183,15 +557,8 @@ class JSONParser:
         except Exception as err:
             raise ValueError(f"Error parsing JSON: {err}") from err
 
-        # Create a new model that includes the original model fields and the original text
-        ExtendedModel = create_model(
-            f"Extended{self.spec.__name__}",
-            original_response=(str, ...),
-            **{field_name: (field.annotation, field.default) for field_name, field in self.spec.__fields__.items()},
-        )
-
-        # Instantiate the extended model
-        extended_model = ExtendedModel(original_response=self.original_response, **model.dict())
+        # Instantiate the model that includes the original model fields and the original text
+        extended_model = _extended_model(self.spec)(original_response=self.original_response, **model.dict())
 
         return extended_model
 
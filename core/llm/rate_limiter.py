@@ -0,0 +1,223 @@
+import asyncio
+import datetime
+import re
+from collections.abc import Mapping
+from time import monotonic
+from typing import Optional
+
+from core.config import LLMConfig
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Don't sleep longer than this in one go, so we can react to budget updates from other requests
+MAX_WAIT_STEP = 5.0
+# Waits shorter than this aren't worth sleeping for
+MIN_WAIT = 0.01
+
+# Parses OpenAI/Groq reset durations like "1s", "6m0s", "2m59.56s", "1h2m3s" or "20ms"
+DURATION_REGEX = re.compile(r"^(?:(\d+)h)?(?:(\d+)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+)ms)?$")
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """
+    Parse a rate limit reset duration in the "1h2m3.5s" format.
+
+    :param value: Duration string.
+    :return: Duration in seconds, or None if the value can't be parsed.
+    """
+    match = DURATION_REGEX.match(value.strip())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds, millis = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0) + int(millis or 0) / 1000
+
+
+def parse_timestamp(value: str) -> Optional[float]:
+    """
+    Parse a rate limit reset timestamp in RFC 3339 format.
+
+    :param value: Timestamp string.
+    :return: Seconds from now until the timestamp, or None if the value can't be parsed.
+    """
+    try:
+        reset_time = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset_time.tzinfo is None:
+        reset_time = reset_time.replace(tzinfo=datetime.timezone.utc)
+    return (reset_time - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds()
+
+
+class Budget:
+    """
+    A rate limit budget (requests or tokens) modelled as a token bucket.
+
+    The provider tells us the limit, how much of it is remaining and when
+    the bucket will be full again, from which we derive the refill rate.
+    Between updates, the bucket refills at that rate and our own
+    reservations are deducted from it.
+    """
+
+    def __init__(self):
+        self.limit: Optional[float] = None
+        self.level: Optional[float] = None
+        self.rate = 0.0
+        self.updated_at = 0.0
+
+    def update(self, limit: Optional[float], remaining: Optional[float], reset_in: Optional[float]):
+        if remaining is None:
+            return
+        self.limit = limit if limit is not None else max(self.limit or 0, remaining)
+        self.level = remaining
+        self.updated_at = monotonic()
+        if reset_in and reset_in > 0:
+            self.rate = max(self.limit - remaining, 0) / reset_in
+        else:
+            self.level = self.limit
+
+    def available(self, now: float) -> Optional[float]:
+        if self.level is None:
+            return None
+        return min(self.limit, self.level + self.rate * (now - self.updated_at))
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Return how long to wait until `amount` is available in the budget.
+        """
+        available = self.available(now)
+        # Requests larger than the whole budget can't ever fit, let the provider deal with them
+        if available is None or available >= min(amount, self.limit) or self.rate <= 0:
+            return 0.0
+        return (min(amount, self.limit) - available) / self.rate
+
+    def reserve(self, amount: float, now: float):
+        available = self.available(now)
+        if available is None:
+            return
+        self.level = available - amount
+        self.updated_at = now
+
+
+class RateLimitScheduler:
+    """
+    Proactive rate limit scheduler shared by all clients using the same
+    provider and API key.
+
+    The scheduler tracks the request and token budgets reported by the
+    provider in the rate limit headers of successful responses, and delays
+    new requests until there's enough budget for them, so that requests
+    made in parallel (eg. by multiple CodeMonkey agents) don't trigger
+    rate limit errors.
+
+    Example usage:
+
+    >>> scheduler = RateLimitScheduler.for_config(config)
+    >>> await scheduler.acquire(estimated_tokens)
+    >>> response = await make_request()
+    >>> scheduler.update(response.headers)
+    """
+
+    _schedulers: dict[tuple, "RateLimitScheduler"] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = Budget()
+        self.tokens = Budget()
+        self.paused_until = 0.0
+
+    @classmethod
+    def for_config(cls, config: LLMConfig) -> "RateLimitScheduler":
+        """
+        Get the shared scheduler for the provider and API key in the config.
+
+        :param config: LLM configuration.
+        :return: The rate limit scheduler.
+        """
+        key = (config.provider, config.base_url, config.api_key)
+        if key not in cls._schedulers:
+            cls._schedulers[key] = cls(f"{config.provider.value} ({config.base_url or 'default endpoint'})")
+        return cls._schedulers[key]
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now),
+        )
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Wait until the request and token budgets allow another request.
+
+        The request (and the estimated tokens) are then reserved from
+        the budget until the response headers update it.
+
+        :param tokens: Estimated number of tokens the request will use.
+        """
+        logged = False
+        while True:
+            now = monotonic()
+            wait = self._wait_time(tokens, now)
+            if wait < MIN_WAIT:
+                self.requests.reserve(1, now)
+                self.tokens.reserve(tokens, now)
+                return
+
+            if not logged:
+                log.info(f"Delaying request to {self.name} by {wait:.1f}s to stay within rate limits")
+                logged = True
+            await asyncio.sleep(min(wait, MAX_WAIT_STEP))
+
+    def pause(self, seconds: float):
+        """
+        Pause all requests for the given time (eg. after hitting a rate limit).
+
+        :param seconds: Time to pause for, in seconds.
+        """
+        self.paused_until = max(self.paused_until, monotonic() + seconds)
+
+    def update(self, headers: Mapping):
+        """
+        Update the budgets from the rate limit headers of a response.
+
+        Supports the OpenAI/Groq `x-ratelimit-*` headers and the
+        Anthropic `anthropic-ratelimit-*` headers.
+
+        :param headers: Response headers.
+        """
+
+        def num(name: str) -> Optional[float]:
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        def reset(name: str, parser) -> Optional[float]:
+            return parser(headers[name]) if name in headers else None
+
+        if "x-ratelimit-remaining-requests" in headers or "x-ratelimit-remaining-tokens" in headers:
+            self.requests.update(
+                num("x-ratelimit-limit-requests"),
+                num("x-ratelimit-remaining-requests"),
+                reset("x-ratelimit-reset-requests", parse_duration),
+            )
+            self.tokens.update(
+                num("x-ratelimit-limit-tokens"),
+                num("x-ratelimit-remaining-tokens"),
+                reset("x-ratelimit-reset-tokens", parse_duration),
+            )
+        elif "anthropic-ratelimit-requests-remaining" in headers or "anthropic-ratelimit-tokens-remaining" in headers:
+            self.requests.update(
+                num("anthropic-ratelimit-requests-limit"),
+                num("anthropic-ratelimit-requests-remaining"),
+                reset("anthropic-ratelimit-requests-reset", parse_timestamp),
+            )
+            self.tokens.update(
+                num("anthropic-ratelimit-tokens-limit"),
+                num("anthropic-ratelimit-tokens-remaining"),
+                reset("anthropic-ratelimit-tokens-reset", parse_timestamp),
+            )
+
+
+__all__ = ["RateLimitScheduler"]
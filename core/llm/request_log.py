@@ -25,6 +25,7 @@ class LLMRequestLog(BaseModel):
     duration: float = 0.0
     status: LLMRequestStatus = LLMRequestStatus.SUCCESS
     error: str = ""
+    cache_hit: bool = False
 
 
 __all__ = ["LLMRequestLog", "LLMRequestStatus"]
@@ -0,0 +1,196 @@
+from functools import lru_cache
+from typing import Any, Optional
+
+from core.config import LLMProvider
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Context window sizes (in tokens) for known models. Keys are matched as substrings
+# of the model name, in order, so more specific names must come first.
+MODEL_CONTEXT_WINDOWS = [
+    ("gpt-4o", 128_000),
+    ("gpt-4-turbo", 128_000),
+    ("gpt-4-0125", 128_000),
+    ("gpt-4-1106", 128_000),
+    ("gpt-4-32k", 32_768),
+    ("gpt-4", 8_192),
+    ("gpt-3.5-turbo", 16_385),
+    ("o1", 128_000),
+    ("claude-3", 200_000),
+    ("llama-3.1", 128_000),
+    ("llama3", 8_192),
+    ("mixtral", 32_768),
+]
+
+# Tokens added by the chat format for each message, and for priming the reply
+# See https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
+MESSAGE_OVERHEAD = 3
+REPLY_OVERHEAD = 3
+
+# Initial estimate for providers without a local tokenizer, adjusted from actual usage
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# How many (unique) message contents to keep token counts for
+TOKEN_CACHE_SIZE = 4096
+
+
+def get_context_window(model: str) -> Optional[int]:
+    """
+    Return the context window size for the model, if known.
+
+    :param model: Model name.
+    :return: Context window size in tokens, or None for unknown models.
+    """
+    for name, size in MODEL_CONTEXT_WINDOWS:
+        if name in model:
+            return size
+    return None
+
+
+class TokenCounter:
+    """
+    Local token counter for LLM prompts.
+
+    OpenAI and Groq prompts are counted exactly using `tiktoken`. Other
+    providers (or if the tokenizer can't be loaded) use an estimate based on
+    the number of characters per token, which is calibrated from the actual
+    token usage the provider reports.
+
+    Token counts are cached per message content, so counting a conversation
+    that grows by one message only tokenizes the new message.
+
+    Example usage:
+
+    >>> counter = TokenCounter.for_provider(LLMProvider.OPENAI)
+    >>> counter.count_messages(convo.messages)
+    """
+
+    _counters: dict[LLMProvider, "TokenCounter"] = {}
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        self._tokenizer = None
+        # Only OpenAI-compatible providers use the tiktoken tokenizer
+        self._tokenizer_loaded = provider not in (LLMProvider.OPENAI, LLMProvider.AZURE, LLMProvider.GROQ)
+        self.count_text = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._count_text)
+
+    @classmethod
+    def for_provider(cls, provider: LLMProvider) -> "TokenCounter":
+        """
+        Return the shared token counter for the provider.
+
+        :param provider: LLM provider.
+        :return: Token counter.
+        """
+        if provider not in cls._counters:
+            cls._counters[provider] = cls(provider)
+        return cls._counters[provider]
+
+    @property
+    def tokenizer(self):
+        """
+        The tiktoken tokenizer, or None if the provider doesn't use it (or it can't be loaded).
+
+        The tokenizer is loaded on first use as it may need to be downloaded.
+        """
+        if not self._tokenizer_loaded:
+            self._tokenizer_loaded = True
+            try:
+                import tiktoken
+
+                self._tokenizer = tiktoken.get_encoding("cl100k_base")
+            except Exception as err:  # noqa
+                log.warning(f"Can't load tiktoken tokenizer, estimating token counts instead: {err}")
+        return self._tokenizer
+
+    @property
+    def exact(self) -> bool:
+        """Whether the counter uses the actual tokenizer (as opposed to an estimate)."""
+        return self.tokenizer is not None
+
+    def _count_text(self, text: str) -> int:
+        tokenizer = self.tokenizer
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, disallowed_special=()))
+        return int(len(text) / self.chars_per_token) + 1
+
+    def count_messages(self, messages: list[dict[str, Any]]) -> int:
+        """
+        Count the tokens in the messages, including the chat format overhead.
+
+        :param messages: Messages to count (as sent to the LLM).
+        :return: Number of tokens.
+        """
+        total = REPLY_OVERHEAD
+        for msg in messages:
+            content = msg["content"]
+            total += MESSAGE_OVERHEAD + self.count_text(content if isinstance(content, str) else str(content))
+        return total
+
+    def calibrate(self, messages: list[dict[str, Any]], actual_tokens: int):
+        """
+        Adjust the estimate using the number of prompt tokens the provider reported.
+
+        Has no effect if the counter uses the actual tokenizer.
+
+        :param messages: Messages that were sent.
+        :param actual_tokens: Number of prompt tokens reported by the provider.
+        """
+        if self.exact or not isinstance(actual_tokens, int) or actual_tokens <= 0:
+            return
+
+        n_chars = sum(len(str(msg["content"])) for msg in messages)
+        if n_chars < 1000:
+            # Too short to tell, the overhead dominates
+            return
+
+        observed = n_chars / actual_tokens
+        # Exponential moving average, so a single odd response doesn't throw the estimate off
+        chars_per_token = 0.8 * self.chars_per_token + 0.2 * observed
+        if abs(chars_per_token - self.chars_per_token) > 0.01:
+            self.chars_per_token = chars_per_token
+            self.count_text.cache_clear()
+
+
+def trim_messages(
+    messages: list[dict[str, Any]],
+    counter: TokenCounter,
+    max_tokens: int,
+) -> Optional[list[dict[str, Any]]]:
+    """
+    Trim the conversation so it fits in the token budget.
+
+    The leading system messages, the first user message (which usually
+    describes the task) and the last message are always kept. The oldest
+    messages in between are dropped until the conversation fits.
+
+    :param messages: Messages to trim.
+    :param counter: Token counter to use.
+    :param max_tokens: Token budget.
+    :return: Trimmed messages, or None if they can't fit even after trimming.
+    """
+    n_head = 0
+    while n_head < len(messages) and messages[n_head]["role"] == "system":
+        n_head += 1
+    if n_head < len(messages):
+        n_head += 1
+
+    head = messages[:n_head]
+    middle = messages[n_head:-1]
+    tail = messages[-1:] if len(messages) > n_head else []
+
+    while middle and counter.count_messages(head + middle + tail) > max_tokens:
+        middle = middle[1:]
+        # Don't start the kept part of the conversation with an assistant reply to a dropped message
+        while middle and middle[0]["role"] == "assistant":
+            middle = middle[1:]
+
+    trimmed = head + middle + tail
+    if counter.count_messages(trimmed) > max_tokens:
+        return None
+    return trimmed
+
+
+__all__ = ["TokenCounter", "get_context_window", "trim_messages"]
@@ -0,0 +1,461 @@
+import asyncio
+import json
+import os
+import os.path
+import platform
+import shutil
+import sqlite3
+import stat
+import sys
+import threading
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Optional
+
+from core.config import InstallCacheConfig, get_config
+from core.log import get_logger
+
+if TYPE_CHECKING:
+    from core.proc.process_manager import ProcessManager
+
+log = get_logger(__name__)
+
+NPM_INSTALL = "npm install"
+INSTALL_DIR = "node_modules"
+# Files determining the installed dependencies (the lockfile is restored too, if missing)
+PACKAGE_FILE = "package.json"
+LOCK_FILE = "package-lock.json"
+
+# Linux ioctl cloning a file (copy-on-write), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class InstallCache:
+    """
+    Shared cache of installed dependency trees (`node_modules`).
+
+    Trees are keyed on the contents of `package.json` and `package-lock.json`
+    (and the platform and Node.js version). The files of all the trees are
+    kept in a content-addressed object store, so the files shared between
+    the trees (most of them, usually) are stored once, and each tree is
+    described by a manifest listing its directories, files and symlinks.
+
+    On a hit, the tree is restored into the workspace by cloning the files
+    from the store (reflinks, where the filesystem supports them), or by
+    copying them. Optionally (`hardlink`), the files are hard-linked instead
+    of copied: a hard link shares the stored object, so changing the mode or
+    the content of a restored file (eg. `chmod` by npm, or patching a package
+    in place) changes it for every project restored from the cache. Only
+    enable it if the installed dependencies are never modified in place.
+
+    Entries older than `max_age` seconds are evicted, and if the total size
+    of the stored files exceeds `max_size` bytes, the least recently used
+    trees are evicted until it fits. The numbers of hits, misses, stored
+    and evicted trees are kept in the cache (see `stats()`).
+
+    Example usage:
+
+    >>> cache = InstallCache.from_config(config.install_cache)
+    >>> status_code = await cache.install(process_manager)
+    """
+
+    _instances: dict[str, "InstallCache"] = {}
+
+    def __init__(self, path: str, *, max_size: int, max_age: int, hardlink: bool = False):
+        """
+        Open (or create) the cache in the given directory.
+
+        :param path: Directory holding the cache.
+        :param max_size: Maximum total size of the cached files, in bytes.
+        :param max_age: Maximum age of a cached tree, in seconds.
+        :param hardlink: Whether to hard-link the files that can't be reflinked, instead of copying
+            them (the restored files then share the stored objects, see above).
+        """
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hardlink = hardlink
+        self.objects_dir = os.path.join(path, "objects")
+        self.trees_dir = os.path.join(path, "trees")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.trees_dir, exist_ok=True)
+
+        # Disabled after the first failure (eg. the filesystem doesn't support it)
+        self._can_reflink = sys.platform == "linux"
+        self._can_hardlink = hardlink
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(path, "index.db"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        self.db.execute("pragma journal_mode=wal")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trees (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_trees_accessed_at ON trees (accessed_at);
+            CREATE TABLE IF NOT EXISTS objects (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tree_objects (
+                key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (key, hash)
+            );
+            CREATE INDEX IF NOT EXISTS ix_tree_objects_hash ON tree_objects (hash);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+
+    @classmethod
+    def from_config(cls, config: InstallCacheConfig) -> "InstallCache":
+        """
+        Return the shared cache instance for the given configuration.
+
+        :param config: Install cache configuration.
+        :return: The cache instance.
+        """
+        if config.path not in cls._instances:
+            cls._instances[config.path] = cls(
+                config.path,
+                max_size=config.max_size,
+                max_age=config.max_age,
+                hardlink=config.hardlink,
+            )
+        return cls._instances[config.path]
+
+    @staticmethod
+    def make_key(root: str, runtime_version: str = "") -> Optional[str]:
+        """
+        Compute the cache key for the dependencies of a project.
+
+        :param root: Project root directory.
+        :param runtime_version: Version of the runtime the dependencies are installed for.
+        :return: Hex digest identifying the dependencies, or None if there's no package file.
+        """
+        digest = sha256(f"{sys.platform}\0{platform.machine()}\0{runtime_version}".encode())
+        for name in [PACKAGE_FILE, LOCK_FILE]:
+            try:
+                with open(os.path.join(root, name), "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                if name == PACKAGE_FILE:
+                    return None
+                content = b""
+            digest.update(f"\0{name}\0{len(content)}\0".encode())
+            digest.update(content)
+        return digest.hexdigest()
+
+    async def install(self, process_manager: "ProcessManager", *, show_output: bool = True) -> Optional[int]:
+        """
+        Install the project dependencies, restoring them from the cache if possible.
+
+        If the dependencies are already installed (there's a `node_modules`
+        directory), or there's no `package.json`, this just runs
+        `npm install`. After a successful install, the installed tree is
+        added to the cache.
+
+        :param process_manager: Process manager to run the commands with (in its root directory).
+        :param show_output: Show the command output in the UI.
+        :return: Status code of `npm install` (0 if the dependencies were restored from the cache).
+        """
+        root = process_manager.root_dir
+        key = None
+        if not os.path.exists(os.path.join(root, INSTALL_DIR)):
+            _, node_version, _ = await process_manager.run_command("node --version", show_output=False)
+            key = self.make_key(root, node_version.strip())
+
+        if key is not None:
+            t0 = perf_counter()
+            if await asyncio.to_thread(self.restore, key, root):
+                log.info(f"Restored {INSTALL_DIR} from the install cache in {perf_counter() - t0:.2f}s ({key})")
+                return 0
+            log.debug(f"Install cache miss ({key})")
+
+        status_code, _, _ = await process_manager.run_command(NPM_INSTALL, show_output=show_output)
+        if key is not None and status_code == 0:
+            try:
+                await asyncio.to_thread(self.store, key, root)
+            except OSError as err:
+                log.warning(f"Error storing {INSTALL_DIR} in the install cache: {err}", exc_info=True)
+        return status_code
+
+    def restore(self, key: str, root: str) -> bool:
+        """
+        Restore a cached dependency tree into the project.
+
+        :param key: Cache key (see `make_key()`).
+        :param root: Project root directory (without `node_modules`).
+        :return: True if the tree was restored, False if it's not cached (or couldn't be restored).
+        """
+        now = time()
+        with self.lock:
+            row = self.db.execute("SELECT created_at FROM trees WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[0] > self.max_age:
+                self._count("misses")
+                return False
+            self.db.execute("UPDATE trees SET accessed_at = ? WHERE key = ?", (now, key))
+
+        install_dir = os.path.join(root, INSTALL_DIR)
+        try:
+            with open(self._manifest_path(key), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            for path, kind, value, mode in manifest["entries"]:
+                target = os.path.join(root, path)
+                if kind == "d":
+                    os.makedirs(target, exist_ok=True)
+                elif kind == "l":
+                    os.symlink(value, target)
+                else:
+                    self._place(self._object_path(value), target, mode)
+            lock_hash = manifest.get("lockfile")
+            if lock_hash and not os.path.exists(os.path.join(root, LOCK_FILE)):
+                shutil.copyfile(self._object_path(lock_hash), os.path.join(root, LOCK_FILE))
+                os.chmod(os.path.join(root, LOCK_FILE), 0o644)
+        except (OSError, ValueError, KeyError) as err:
+            # Eg. the tree was evicted by another process in the meantime
+            log.warning(f"Error restoring {INSTALL_DIR} from the install cache: {err}")
+            shutil.rmtree(install_dir, ignore_errors=True)
+            with self.lock:
+                self._count("misses")
+            return False
+
+        with self.lock:
+            self._count("hits")
+        return True
+
+    def store(self, key: str, root: str):
+        """
+        Add the dependency tree installed in the project to the cache.
+
+        :param key: Cache key (see `make_key()`), computed before the install.
+        :param root: Project root directory.
+        """
+        install_dir = os.path.join(root, INSTALL_DIR)
+        entries = []
+        objects: dict[str, int] = {}
+        for dirpath, dirnames, filenames in os.walk(install_dir):
+            entries.append((os.path.relpath(dirpath, root), "d", None, None))
+            for name in sorted(dirnames) + sorted(filenames):
+                path = os.path.join(dirpath, name)
+                rel_path = os.path.relpath(path, root)
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    # Symlinked directories are listed in dirnames, but not walked into
+                    entries.append((rel_path, "l", os.readlink(path), None))
+                elif stat.S_ISREG(st.st_mode):
+                    obj_hash, size = self._add_object(path, st.st_mode)
+                    objects[obj_hash] = size
+                    entries.append((rel_path, "f", obj_hash, stat.S_IMODE(st.st_mode)))
+
+        manifest = {"entries": entries}
+        lock_path = os.path.join(root, LOCK_FILE)
+        if os.path.exists(lock_path):
+            lock_hash, size = self._add_object(lock_path, 0o644)
+            objects[lock_hash] = size
+            manifest["lockfile"] = lock_hash
+
+        with NamedTemporaryFile("w", dir=self.trees_dir, delete=False, encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(f.name, self._manifest_path(key))
+
+        now = time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR IGNORE INTO objects (hash, size) VALUES (?, ?)", objects.items())
+            self.db.execute("DELETE FROM tree_objects WHERE key = ?", (key,))
+            self.db.executemany(
+                "INSERT INTO tree_objects (key, hash) VALUES (?, ?)",
+                [(key, obj_hash) for obj_hash in objects],
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO trees (key, size, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, sum(objects.values()), now, now),
+            )
+            self._count("stored")
+            self.db.execute("COMMIT")
+            self._evict(now)
+
+        log.debug(f"Stored {INSTALL_DIR} with {len(entries)} entries in the install cache ({key})")
+
+    def _add_object(self, path: str, mode: int) -> tuple[str, int]:
+        """
+        Add a file to the object store (if it's not already there).
+
+        The objects are named by the hash of their content and whether
+        they're executable, and made read-only. Small files (most of them)
+        are read once, for both hashing and storing.
+
+        :param path: Path to the file.
+        :param mode: File mode.
+        :return: Tuple of (object hash, size).
+        """
+        digest = sha256()
+        size = 0
+        data = None
+        with open(path, "rb") as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                data = block if size == 0 else None
+                digest.update(block)
+                size += len(block)
+        executable = mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        obj_hash = digest.hexdigest() + ("x" if executable else "")
+
+        obj_path = self._object_path(obj_hash)
+        if not os.path.exists(obj_path):
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            tmp_path = f"{obj_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if data is not None or size == 0:
+                with open(tmp_path, "wb") as f:
+                    f.write(data or b"")
+            else:
+                shutil.copyfile(path, tmp_path)
+            os.chmod(tmp_path, 0o555 if executable else 0o444)
+            os.replace(tmp_path, obj_path)
+        return obj_hash, size
+
+    def _place(self, obj_path: str, target: str, mode: int):
+        """
+        Restore a file from the object store.
+
+        :param obj_path: Path to the object.
+        :param target: Path to restore the file to.
+        :param mode: File mode (unless hard-linked).
+        """
+        if self._can_reflink:
+            try:
+                import fcntl
+
+                with open(obj_path, "rb") as src, open(target, "wb") as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                os.chmod(target, mode)
+                return
+            except OSError:
+                log.debug(f"Can't reflink files from the install cache to {target}, falling back")
+                self._can_reflink = False
+                if os.path.exists(target):
+                    os.remove(target)
+
+        if self._can_hardlink:
+            try:
+                os.link(obj_path, target)
+                return
+            except OSError:
+                log.debug(f"Can't hard-link files from the install cache to {target}, falling back to copying")
+                self._can_hardlink = False
+
+        shutil.copyfile(obj_path, target)
+        os.chmod(target, mode)
+
+    def _object_path(self, obj_hash: str) -> str:
+        return os.path.join(self.objects_dir, obj_hash[:2], obj_hash)
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self.trees_dir, f"{key}.json")
+
+    def _count(self, name: str, n: int = 1):
+        """
+        Increment a counter (see `stats()`).
+
+        Must be called with the lock held.
+        """
+        self.db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + ?",
+            (name, n, n),
+        )
+
+    def _evict(self, now: float):
+        """
+        Evict expired trees, then least recently used ones until the cache fits in `max_size`.
+
+        The objects no longer used by any tree are removed from the store.
+        Must be called with the lock held.
+
+        :param now: Current timestamp.
+        """
+        expired = [
+            key for (key,) in self.db.execute("SELECT key FROM trees WHERE created_at < ?", (now - self.max_age,))
+        ]
+        lru = [key for (key,) in self.db.execute("SELECT key FROM trees ORDER BY accessed_at ASC")]
+        (total_size,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        if not expired and total_size <= self.max_size:
+            return
+
+        evicted = 0
+        for key in expired + [key for key in lru if key not in expired]:
+            if key not in expired and total_size <= self.max_size:
+                break
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM trees WHERE key = ?", (key,))
+            self.db.execute("DELETE FROM tree_objects WHERE key = ?", (key,))
+            unused = self.db.execute(
+                "SELECT hash, size FROM objects WHERE hash NOT IN (SELECT hash FROM tree_objects)"
+            ).fetchall()
+            self.db.executemany("DELETE FROM objects WHERE hash = ?", [(obj_hash,) for obj_hash, _ in unused])
+            self._count("evicted")
+            self.db.execute("COMMIT")
+
+            for obj_hash, size in unused:
+                try:
+                    os.remove(self._object_path(obj_hash))
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+            try:
+                os.remove(self._manifest_path(key))
+            except FileNotFoundError:
+                pass
+            evicted += 1
+
+        log.debug(f"Evicted {evicted} dependency trees from install cache {self.path}")
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the cache statistics.
+
+        :return: Numbers of hits, misses, stored and evicted trees, cached trees, and the total size of the files.
+        """
+        with self.lock:
+            counters = dict(self.db.execute("SELECT name, value FROM counters"))
+            (trees,) = self.db.execute("SELECT COUNT(*) FROM trees").fetchone()
+            (size,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "stored": counters.get("stored", 0),
+            "evicted": counters.get("evicted", 0),
+            "trees": trees,
+            "size": size,
+        }
+
+
+async def npm_install(process_manager: "ProcessManager", *, show_output: bool = True) -> Optional[int]:
+    """
+    Install the Node.js dependencies of the project, using the install cache if it's enabled.
+
+    :param process_manager: Process manager to run the commands with (in its root directory).
+    :param show_output: Show the command output in the UI.
+    :return: Status code of `npm install` (0 if the dependencies were restored from the cache).
+    """
+    config = get_config().install_cache
+    if config.enabled:
+        return await InstallCache.from_config(config).install(process_manager, show_output=show_output)
+
+    status_code, _, _ = await process_manager.run_command(NPM_INSTALL, show_output=show_output)
+    return status_code
+
+
+__all__ = ["InstallCache", "npm_install"]
@@ -0,0 +1,296 @@
+import os
+import os.path
+import shutil
+from collections import deque
+from tempfile import mkdtemp
+from typing import Optional, TextIO, Union
+
+from core.config import ProcessOutputConfig, get_config
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Share of the excerpt taken from the beginning of the output (the rest is from the end,
+# where the errors and the final status usually are)
+EXCERPT_HEAD_RATIO = 0.25
+
+
+def omitted_marker(n_omitted: int) -> str:
+    return f"\n[... {n_omitted} characters omitted ...]\n"
+
+
+def excerpt(text: str, max_size: int) -> str:
+    """
+    Shorten the text to at most `max_size` characters (plus the omission marker).
+
+    Keeps the beginning and (mostly) the end of the text, and replaces
+    the middle part with a marker saying how much was omitted.
+
+    :param text: Text (eg. command output) to shorten.
+    :param max_size: Maximum number of characters to keep.
+    :return: The text, or its excerpt if it's longer than `max_size`.
+    """
+    if len(text) <= max_size:
+        return text
+    head_size = int(max_size * EXCERPT_HEAD_RATIO)
+    tail_size = max_size - head_size
+    return text[:head_size] + omitted_marker(len(text) - max_size) + text[len(text) - tail_size :]
+
+
+class OutputSegment:
+    """
+    A part of the output saved to a file on disk.
+    """
+
+    def __init__(self, path: str, start: int):
+        self.path = path
+        self.start = start
+        self.size = 0
+
+    def read(self) -> str:
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            return f.read()
+
+
+class OutputCapture:
+    """
+    Bounded capture of the output stream of a process.
+
+    Keeps the first `head_size` characters of the output, and a ring
+    buffer of the last `tail_size` characters, so that the memory use
+    stays flat for long-running processes (like development servers)
+    no matter how much output they produce. The output in between is
+    discarded, unless spilling is enabled, in which case the whole output
+    is also written to segment files on disk (up to `spill_max_size`
+    characters, after which the oldest segments are removed), and can be
+    read back with `read()` and `tail()`.
+
+    All the sizes and offsets are in characters (of the decoded output).
+    """
+
+    def __init__(
+        self,
+        *,
+        head_size: int,
+        tail_size: int,
+        spill: bool = False,
+        spill_dir: Optional[str] = None,
+        spill_segment_size: int = 1024 * 1024,
+        spill_max_size: int = 256 * 1024 * 1024,
+    ):
+        """
+        Create a new output capture.
+
+        :param head_size: Number of characters kept from the beginning of the output.
+        :param tail_size: Number of characters kept from the end of the output.
+        :param spill: Whether to save the whole output to disk.
+        :param spill_dir: Directory to save the output in (defaults to the system temporary directory).
+        :param spill_segment_size: Number of characters saved per segment file.
+        :param spill_max_size: Maximum number of characters kept on disk.
+        """
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.size = 0
+
+        self._head: list[str] = []
+        self._head_len = 0
+        self._tail: deque[str] = deque()
+        self._tail_len = 0
+
+        self._spill_dir = mkdtemp(prefix="output-", dir=spill_dir) if spill else None
+        self._segment_size = spill_segment_size
+        self._max_segments = max(1, spill_max_size // spill_segment_size)
+        self._segments: deque[OutputSegment] = deque()
+        self._segment_file: Optional[TextIO] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[ProcessOutputConfig] = None) -> "OutputCapture":
+        """
+        Create a new output capture with the configured sizes.
+
+        :param config: Output capture configuration (defaults to the current config).
+        :return: New output capture.
+        """
+        if config is None:
+            config = get_config().process_output
+        return cls(
+            head_size=config.head_size,
+            tail_size=config.tail_size,
+            spill=config.spill,
+            spill_dir=config.spill_dir,
+            spill_segment_size=config.spill_segment_size,
+            spill_max_size=config.spill_max_size,
+        )
+
+    @property
+    def spilled(self) -> bool:
+        """Whether the output is saved to disk."""
+        return self._spill_dir is not None
+
+    @property
+    def dropped(self) -> int:
+        """Number of characters discarded from memory (between the head and the tail)."""
+        return self.size - self._head_len - self._tail_len
+
+    @property
+    def _tail_start(self) -> int:
+        return self.size - self._tail_len
+
+    def write(self, text: str):
+        """
+        Capture a chunk of the output.
+
+        :param text: Decoded output.
+        """
+        if not text:
+            return
+        if self._spill_dir is not None:
+            self._spill(text)
+        self.size += len(text)
+
+        if self._head_len < self.head_size:
+            part = text[: self.head_size - self._head_len]
+            self._head.append(part)
+            self._head_len += len(part)
+            text = text[len(part) :]
+            if not text:
+                return
+
+        self._tail.append(text)
+        self._tail_len += len(text)
+        while self._tail_len - len(self._tail[0]) >= self.tail_size:
+            self._tail_len -= len(self._tail.popleft())
+        if self._tail_len > self.tail_size:
+            excess = self._tail_len - self.tail_size
+            self._tail[0] = self._tail[0][excess:]
+            self._tail_len -= excess
+
+    def _spill(self, text: str):
+        while text:
+            if self._segment_file is None or self._segments[-1].size >= self._segment_size:
+                self._new_segment()
+            segment = self._segments[-1]
+            part = text[: self._segment_size - segment.size]
+            self._segment_file.write(part)
+            segment.size += len(part)
+            text = text[len(part) :]
+
+    def _new_segment(self):
+        if self._segment_file is not None:
+            self._segment_file.close()
+        start = self._segments[-1].start + self._segments[-1].size if self._segments else 0
+        segment = OutputSegment(os.path.join(self._spill_dir, f"{start:012d}.log"), start)
+        self._segment_file = open(segment.path, "w", encoding="utf-8", newline="")
+        self._segments.append(segment)
+        if len(self._segments) > self._max_segments:
+            os.remove(self._segments.popleft().path)
+
+    @staticmethod
+    def _compact(chunks: Union[list[str], deque[str]]) -> str:
+        if len(chunks) > 1:
+            text = "".join(chunks)
+            chunks.clear()
+            chunks.append(text)
+        return chunks[0] if chunks else ""
+
+    def getvalue(self) -> str:
+        """
+        Get the captured output.
+
+        If some of the output was discarded, it's replaced with a marker
+        saying how much was omitted.
+
+        :return: The beginning and the end of the output.
+        """
+        head = self._compact(self._head)
+        tail = self._compact(self._tail)
+        if self.dropped:
+            return head + omitted_marker(self.dropped) + tail
+        return head + tail
+
+    def excerpt(self, max_size: int) -> str:
+        """
+        Get an excerpt of the output of at most `max_size` characters (plus the omission marker).
+
+        See `excerpt()`; the marker accounts for the output discarded
+        from memory as well.
+
+        :param max_size: Maximum number of characters.
+        :return: The output, or its excerpt.
+        """
+        if self.size <= max_size and not self.dropped:
+            return self._compact(self._head) + self._compact(self._tail)
+        head_size = min(int(max_size * EXCERPT_HEAD_RATIO), self._head_len)
+        tail_size = min(max_size - head_size, self._tail_len)
+        head = self._compact(self._head)[:head_size]
+        tail = self._compact(self._tail)[self._tail_len - tail_size :]
+        return head + omitted_marker(self.size - head_size - tail_size) + tail
+
+    def read(self, offset: int, size: int) -> str:
+        """
+        Read the captured output, starting at `offset`.
+
+        The output is read from disk if it was saved there, or from memory
+        otherwise. This may return less than `size` characters if the
+        output after `offset` was only partially kept.
+
+        :param offset: Offset (in characters from the start of the output) to read from.
+        :param size: Maximum number of characters to read.
+        :return: The output at the offset.
+        :raises ValueError: If the output at the offset was discarded.
+        """
+        if offset < 0 or offset > self.size:
+            raise ValueError(f"Offset {offset} is outside the output (0-{self.size})")
+        end = min(offset + size, self.size)
+
+        if self._segments and offset >= self._segments[0].start:
+            return self._read_segments(offset, end)
+        if offset >= self._tail_start:
+            return self._compact(self._tail)[offset - self._tail_start : end - self._tail_start]
+        if offset < self._head_len:
+            text = self._compact(self._head)[offset:end]
+            if end > self._head_len and not self.dropped:
+                text += self._compact(self._tail)[: end - self._tail_start]
+            return text
+        raise ValueError(f"Output at offset {offset} was discarded")
+
+    def _read_segments(self, offset: int, end: int) -> str:
+        if self._segment_file is not None:
+            self._segment_file.flush()
+        parts = []
+        for segment in self._segments:
+            if segment.start + segment.size <= offset:
+                continue
+            if segment.start >= end:
+                break
+            text = segment.read()
+            parts.append(text[max(0, offset - segment.start) : end - segment.start])
+        return "".join(parts)
+
+    def tail(self, size: int) -> str:
+        """
+        Read the last `size` characters of the output (or as much of them as was kept).
+
+        :param size: Number of characters.
+        :return: The end of the output.
+        """
+        first_available = self._tail_start if self.dropped else 0
+        if self._segments:
+            first_available = min(first_available, self._segments[0].start)
+        offset = max(self.size - size, first_available)
+        return self.read(offset, self.size - offset)
+
+    def close(self):
+        """
+        Remove the output saved to disk (the output kept in memory is still available).
+        """
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._segment_file = None
+        self._segments.clear()
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+
+__all__ = ["OutputCapture", "excerpt"]
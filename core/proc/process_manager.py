@@ -1,9 +1,9 @@
 import asyncio
+import codecs
 import signal
 import sys
-import time
 from copy import deepcopy
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from os import environ
 from os.path import abspath, join
 from typing import Callable, Optional
@@ -12,24 +12,56 @@ from uuid import UUID, uuid4
 import psutil
 
 from core.log import get_logger
+from core.proc.output_capture import OutputCapture
 
 log = get_logger(__name__)
 
 NONBLOCK_READ_TIMEOUT = 0.01
-BUSY_WAIT_INTERVAL = 0.1
-WATCHER_IDLE_INTERVAL = 1.0
+READ_CHUNK_SIZE = 64 * 1024
+# Time to wait for the rest of the output after the process exits (its
+# output may be kept open by the child processes)
+OUTPUT_DRAIN_TIMEOUT = 0.1
+# Time to wait for the processes to exit after signalling them
+TERMINATE_TIMEOUT = 1.0
 MAX_COMMAND_TIMEOUT = 180
 
 
+class _ExitTrackingProtocol(asyncio.subprocess.SubprocessStreamProtocol):
+    """
+    Subprocess protocol that resolves the `exited` future as soon as the process exits.
+
+    The exit is reported by the event loop (through its child watcher),
+    independently of the output pipes, so there's no need to poll the
+    process state.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exited = asyncio.get_running_loop().create_future()
+
+    def process_exited(self):
+        super().process_exited()
+        if not self.exited.done():
+            self.exited.set_result(None)
+
+
 @dataclass
 class LocalProcess:
     id: UUID
     cmd: str
     cwd: str
     env: dict[str, str]
-    stdout: str
-    stderr: str
     _process: asyncio.subprocess.Process
+    # Resolved when the process exits
+    _exited: asyncio.Future
+    # Output read so far (see the `stdout` and `stderr` properties)
+    stdout_capture: OutputCapture = field(default_factory=OutputCapture.from_config)
+    stderr_capture: OutputCapture = field(default_factory=OutputCapture.from_config)
+    # Output chunks not yet consumed by `read_output()`, as (stdout, stderr) tuples
+    _pending: list[tuple[str, str]] = field(default_factory=list)
+    _output_ready: asyncio.Event = field(default_factory=asyncio.Event)
+    _readers: list[asyncio.Task] = field(default_factory=list)
+    _open_streams: int = 2
 
     def __hash__(self) -> int:
         return hash(self.id)
@@ -43,7 +75,10 @@ class LocalProcess:
         bg: bool = False,
     ) -> "LocalProcess":
         log.debug(f"Starting process: {cmd} (cwd={cwd})")
-        _process = await asyncio.create_subprocess_shell(
+        loop = asyncio.get_running_loop()
+        # This is what `asyncio.create_subprocess_shell()` does, with a protocol that tracks the exit
+        transport, protocol = await loop.subprocess_shell(
+            lambda: _ExitTrackingProtocol(limit=READ_CHUNK_SIZE, loop=loop),
             cmd,
             cwd=cwd,
             env=env,
@@ -52,75 +87,149 @@ class LocalProcess:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
+        _process = asyncio.subprocess.Process(transport, protocol, loop)
         if bg:
             _process.stdin.close()
 
-        return LocalProcess(
+        process = LocalProcess(
             id=uuid4(),
             cmd=cmd,
             cwd=cwd,
             env=env,
-            stdout="",
-            stderr="",
             _process=_process,
+            _exited=protocol.exited,
         )
+        # Wake up the readers waiting for the output (see `read_output()`)
+        protocol.exited.add_done_callback(lambda _: process._output_ready.set())
+        process._readers = [
+            asyncio.create_task(process._read_stream(_process.stdout, process.stdout_capture, is_stderr=False)),
+            asyncio.create_task(process._read_stream(_process.stderr, process.stderr_capture, is_stderr=True)),
+        ]
+        return process
 
     async def wait(self, timeout: Optional[float] = None) -> int:
+        """
+        Wait for the process to exit, terminating it after `timeout` seconds.
+
+        :param timeout: Time to wait for the process (None or 0 to wait indefinitely).
+        :return: Process exit code.
+        """
         try:
-            future = self._process.wait()
-            if timeout:
-                future = asyncio.wait_for(future, timeout)
-            retcode = await future
+            await asyncio.wait_for(asyncio.shield(self._exited), timeout or None)
         except asyncio.TimeoutError:
             log.debug(f"Process {self.cmd} still running after {timeout}s, terminating")
             await self.terminate()
             # FIXME: this may still hang if we don't manage to kill the process.
-            retcode = await self._process.wait()
+            await self._exited
 
-        return retcode
+        return self._process.returncode
 
-    @staticmethod
-    async def _nonblock_read(reader: asyncio.StreamReader, timeout: float) -> str:
+    async def _read_stream(self, reader: asyncio.StreamReader, output: OutputCapture, *, is_stderr: bool):
         """
-        Reads data from a stream reader without blocking (for long).
+        Read the output stream of the process until it's closed.
 
-        This wraps the read in a (short) timeout to avoid blocking the event loop for too long.
+        The output is read in chunks as soon as it's available, and decoded
+        incrementally, so the multi-byte characters split between the chunks
+        are decoded correctly.
 
         :param reader: Async stream reader to read from.
-        :param timeout: Timeout for the read operation (should not be too long).
-        :return: Data read from the stream reader, or empty string.
+        :param output: Capture to store the decoded output in.
+        :param is_stderr: Whether the stream is stderr (or stdout).
         """
-        buffer = ""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
         while True:
+            data = await reader.read(READ_CHUNK_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                output.write(text)
+                self._pending.append(("", text) if is_stderr else (text, ""))
+                self._output_ready.set()
+            if not data:
+                break
+
+        self._open_streams -= 1
+        if self._open_streams == 0:
+            # Wake up the readers waiting for more output
+            self._output_ready.set()
+
+    @property
+    def output_closed(self) -> bool:
+        """Whether all the output of the process was read (its output streams are closed)."""
+        return self._open_streams == 0 and not self._pending
+
+    async def read_output(self, timeout: Optional[float] = NONBLOCK_READ_TIMEOUT) -> tuple[str, str]:
+        """
+        Get the output of the process received since the last call.
+
+        If there's no new output, this waits for it for up to `timeout`
+        seconds (or until the output streams are closed, or the process exits).
+
+        :param timeout: Time to wait for the output, or None to wait until there's some.
+        :return: Tuple of (new stdout, new stderr), may be empty strings.
+        """
+        if not self._pending and (self._open_streams > 0 or self.is_running):
             try:
-                data = await asyncio.wait_for(reader.read(1), timeout)
-                if not data:
-                    return buffer
-                buffer += data.decode("utf-8", errors="ignore")
+                await asyncio.wait_for(self._output_ready.wait(), timeout)
             except asyncio.TimeoutError:
-                return buffer
+                pass
+
+        pending = self._pending
+        self._pending = []
+        self._output_ready.clear()
+        return "".join(out for out, _ in pending), "".join(err for _, err in pending)
 
-    async def read_output(self, timeout: float = NONBLOCK_READ_TIMEOUT) -> tuple[str, str]:
-        new_stdout = await self._nonblock_read(self._process.stdout, timeout)
-        new_stderr = await self._nonblock_read(self._process.stderr, timeout)
-        self.stdout += new_stdout
-        self.stderr += new_stderr
-        return (new_stdout, new_stderr)
+    async def wait_for_output(self, timeout: float):
+        """
+        Wait until all the output of the process is read.
+
+        The output streams may be kept open by the child processes after the
+        process itself exits, so this waits for at most `timeout` seconds.
+
+        :param timeout: Maximum time to wait.
+        """
+        await asyncio.wait(self._readers, timeout=timeout)
+
+    @property
+    def stdout(self) -> str:
+        return self.stdout_capture.getvalue()
+
+    @property
+    def stderr(self) -> str:
+        return self.stderr_capture.getvalue()
+
+    def close_output(self):
+        """
+        Remove the output of the process saved to disk (if any).
+
+        The output kept in memory is still available.
+        """
+        self.stdout_capture.close()
+        self.stderr_capture.close()
 
     async def _terminate_process_tree(self, signal: int):
-        # This is a recursive function that terminates the entire process tree
-        # of the current process. It first terminates all child processes, then
-        # terminates itself.
-        shell_process = psutil.Process(self._process.pid)
-        processes = shell_process.children(recursive=True)
-        processes.append(shell_process)
-        for proc in processes:
+        # Terminates the entire process tree of the current process, from a single
+        # snapshot of the tree taken up front: first all the child processes, then
+        # the process itself. The process exit is awaited directly, and the other
+        # processes (which aren't our children) are waited for in a thread.
+        if not self.is_running:
+            # Its children (if any) were already reparented, and its PID may be reused
+            return
+        try:
+            shell_process = psutil.Process(self._process.pid)
+            children = shell_process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+
+        for proc in [*children, shell_process]:
             try:
                 proc.send_signal(signal)
             except psutil.NoSuchProcess:
                 pass
 
-        psutil.wait_procs(processes, timeout=1)
+        await asyncio.gather(
+            asyncio.wait([self._exited], timeout=TERMINATE_TIMEOUT),
+            asyncio.to_thread(psutil.wait_procs, children, timeout=TERMINATE_TIMEOUT),
+        )
 
     async def terminate(self, kill: bool = True):
         if kill and sys.platform != "win32":
@@ -131,10 +240,7 @@ class LocalProcess:
 
     @property
     def is_running(self) -> bool:
-        try:
-            return psutil.Process(self._process.pid).is_running()
-        except psutil.NoSuchProcess:
-            return False
+        return not self._exited.done()
 
     @property
     def pid(self) -> int:
@@ -153,55 +259,59 @@ class ProcessManager:
         if env is None:
             env = deepcopy(environ)
         self.processes: dict[UUID, LocalProcess] = {}
+        # Tasks passing the output of the background processes to the output handler,
+        # and calling the exit handler when they exit
+        self.output_tasks: dict[UUID, asyncio.Task] = {}
+        self.exit_tasks: dict[UUID, asyncio.Task] = {}
         self.default_env = env
         self.root_dir = root_dir
-        self.watcher_should_run = True
-        self.watcher_task = asyncio.create_task(self.watcher())
+        self.watching = True
         self.output_handler = output_handler
         self.exit_handler = exit_handler
 
     async def stop_watcher(self):
         """
-        Stop the process watcher.
+        Stop watching over the background processes (their output and exit).
 
         This should only be done when the ProcessManager is no longer needed.
         """
-        if not self.watcher_should_run:
+        if not self.watching:
             raise ValueError("Process watcher is not running")
 
-        self.watcher_should_run = False
-        await self.watcher_task
+        self.watching = False
+        tasks = [*self.exit_tasks.values(), *self.output_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for process in self.processes.values():
+            process.close_output()
+
+    async def _handle_exit(self, process: LocalProcess):
+        """
+        Wait for a background process to exit and call the exit handler.
+
+        We're not removing the complete process from the self.processes
+        list to give time to the rest of the system to read its outputs.
 
-    async def watcher(self):
+        :param process: The process.
+        """
+        await process.wait()
+        output_task = self.output_tasks.get(process.id)
+        if output_task:
+            await asyncio.wait([output_task], timeout=OUTPUT_DRAIN_TIMEOUT)
+        if self.exit_handler:
+            await self.exit_handler(process)
+
+    async def _forward_output(self, process: LocalProcess):
         """
-        Watch over the processes and manage their output and lifecycle.
+        Pass the output of a background process to the output handler until its output is closed.
 
-        This is a separate coroutine running independently of the caller
-        coroutine.
+        :param process: The process.
         """
-        # IDs of processes whos output has been fully read after they finished
-        complete_processes = set()
-
-        while self.watcher_should_run:
-            procs = [p for p in self.processes.values() if p.id not in complete_processes]
-            if len(procs) == 0:
-                await asyncio.sleep(WATCHER_IDLE_INTERVAL)
-                continue
-
-            for process in procs:
-                out, err = await process.read_output()
-                if self.output_handler and (out or err):
-                    await self.output_handler(out, err)
-
-                if not process.is_running:
-                    # We're not removing the complete process from the self.processes
-                    # list to give time to the rest of the system to read its outputs
-                    complete_processes.add(process.id)
-                    if self.exit_handler:
-                        await self.exit_handler(process)
-
-            # Sleep a bit to avoid busy-waiting
-            await asyncio.sleep(BUSY_WAIT_INTERVAL)
+        while not process.output_closed:
+            out, err = await process.read_output(timeout=None)
+            if self.output_handler and (out or err):
+                await self.output_handler(out, err)
 
     async def start_process(
         self,
@@ -216,6 +326,8 @@ class ProcessManager:
         process = await LocalProcess.start(cmd, cwd=abs_cwd, env=env, bg=bg)
         if bg:
             self.processes[process.id] = process
+            self.output_tasks[process.id] = asyncio.create_task(self._forward_output(process))
+            self.exit_tasks[process.id] = asyncio.create_task(self._handle_exit(process))
         return process
 
     async def run_command(
@@ -244,9 +356,11 @@ class ProcessManager:
         terminated = False
         process = await self.start_process(cmd, cwd=cwd, env=env, bg=False)
 
-        t0 = time.time()
-        while process.is_running and (time.time() - t0) < timeout:
-            out, err = await process.read_output(BUSY_WAIT_INTERVAL)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while process.is_running and loop.time() < deadline:
+            # Returns as soon as there's some output or the process exits
+            out, err = await process.read_output(deadline - loop.time())
             if self.output_handler and (out or err) and show_output:
                 await self.output_handler(out, err)
 
@@ -254,10 +368,9 @@ class ProcessManager:
             log.debug(f"Process {cmd} still running after {timeout}s, terminating")
             await process.terminate()
             terminated = True
-        else:
-            await process.wait()
 
-        out, err = await process.read_output()
+        await process.wait_for_output(OUTPUT_DRAIN_TIMEOUT)
+        out, err = await process.read_output(timeout=0)
         if self.output_handler and (out or err) and show_output:
             await self.output_handler(out, err)
 
@@ -266,6 +379,7 @@ class ProcessManager:
         else:
             status_code = process._process.returncode or 0
 
+        process.close_output()
         return (status_code, process.stdout, process.stderr)
 
     def list_running_processes(self):
@@ -276,7 +390,15 @@ class ProcessManager:
             raise ValueError(f"Process {process_id} not found")
 
         process = self.processes[process_id]
+        # The exit handler isn't called for the processes we terminate
+        exit_task = self.exit_tasks.pop(process_id, None)
+        if exit_task:
+            exit_task.cancel()
         await process.terminate(kill=False)
         del self.processes[process_id]
+        output_task = self.output_tasks.pop(process_id, None)
+        if output_task:
+            await asyncio.wait([output_task], timeout=OUTPUT_DRAIN_TIMEOUT)
 
+        process.close_output()
         return (process.stdout, process.stderr)
@@ -5,15 +5,28 @@ from contextlib import asynccontextmanager
 from typing import TYPE_CHECKING, Optional
 from uuid import UUID, uuid4
 
-from sqlalchemy import inspect, select
+from sqlalchemy import select
 from tenacity import retry, stop_after_attempt, wait_fixed
 
 from core.config import FileSystemType, get_config
-from core.db.models import Branch, ExecLog, File, FileContent, LLMRequest, Project, ProjectState, UserInput
+from core.db.models import (
+    Branch,
+    ExecLog,
+    File,
+    FileContent,
+    FileManifest,
+    LLMMessage,
+    LLMRequest,
+    Project,
+    ProjectState,
+    UserInput,
+)
 from core.db.models.specification import Complexity, Specification
 from core.db.session import SessionManager
 from core.disk.ignore import IgnoreMatcher
+from core.disk.index import WORKSPACE_INDEX_PATH, WorkspaceIndex
 from core.disk.vfs import LocalDiskVFS, MemoryVFS, VirtualFileSystem
+from core.disk.watcher import create_watcher
 from core.llm.request_log import LLMRequestLog, LLMRequestStatus
 from core.log import get_logger
 from core.proc.exec_log import ExecLog as ExecLogData
@@ -49,6 +62,7 @@ class StateManager:
         self.current_state = None
         self.next_state = None
         self.current_session = None
+        self._commit_task = None
         self.blockDb = False
         self.git_available = False
         self.git_used = False
@@ -56,6 +70,7 @@ class StateManager:
 
     @asynccontextmanager
     async def db_blocker(self):
+        await self.wait_for_commit()
         while self.blockDb:
             await asyncio.sleep(0.1)  # Wait if blocked
 
@@ -113,7 +128,9 @@ class StateManager:
         rows = await Project.delete_by_id(session, project_id)
         if rows > 0:
             await Specification.delete_orphans(session)
+            await FileManifest.delete_orphans(session)
             await FileContent.delete_orphans(session)
+            await LLMMessage.delete_orphans(session)
 
         await session.commit()
 
@@ -236,20 +253,51 @@ class StateManager:
             log.error(f"Commit failed: {str(e)}")
             raise
 
-    async def commit(self) -> ProjectState:
+    async def commit(self, wait: bool = True) -> ProjectState:
         """
         Commit the new project state to the database.
 
-        This commits `next_state` to the database, making the changes
-        permanent, then creates a new state for further changes.
+        This makes `next_state` the current state, creates a new state for
+        further changes, and commits the state to the database in a background
+        task. Commits are written in order, one at a time.
 
+        With `wait=False`, this returns before the state is written, so the
+        caller can work on the new state in the meantime (eg. wait for the LLM
+        response). The database session is not available until the state is
+        written: the methods that need it wait for the commit to finish first
+        (see `wait_for_commit()`), and raise the error if it failed.
+
+        :param wait: Whether to wait until the state is written to the database.
         :return: The committed state.
         """
+        await self.wait_for_commit()
+        if self.next_state is None:
+            raise ValueError("No state to commit.")
+        if self.current_session is None:
+            raise ValueError("No database session open.")
+
+        state = self.next_state
+        await state.awaitable_attrs.files
+        self.current_state = state
+        self.next_state = state.build_next_state()
+
+        self._commit_task = asyncio.create_task(self._write_state(state))
+        self.current_session.info["commit_task"] = self._commit_task
+        telemetry.inc("num_steps")
+
+        if wait:
+            await self.wait_for_commit()
+        return state
+
+    async def _write_state(self, state: ProjectState):
+        """
+        Write the committed state to the database and start a new session.
+
+        :param state: The committed state.
+        """
         try:
-            if self.next_state is None:
-                raise ValueError("No state to commit.")
-            if self.current_session is None:
-                raise ValueError("No database session open.")
+            # The state is read-only now, so the changes to its files must be stored explicitly
+            await self.current_session.run_sync(state._store_files)
 
             log.debug("Committing session")
             await self.commit_with_retry()
@@ -258,35 +306,110 @@ class StateManager:
             # Having a shorter-lived sessions is considered a good practice in SQLAlchemy,
             # so we close and recreate the session for each state. This uses db
             # connection from a connection pool, so it is fast. Note that SQLite uses
-            # no connection pool by default because it's all in-process so it's fast anyway.
+            # no connection pool by default because it's all in-process (unless the
+            # performance profile is used, see `SQLiteProfile`).
             self.current_session.expunge_all()
             await self.session_manager.close()
             self.current_session = await self.session_manager.start()
+            await self._compact_history(state)
 
-            self.current_state = self.next_state
-            self.current_session.add(self.next_state)
-            self.next_state = await self.current_state.create_next_state()
-
-            # After the next_state becomes the current_state, we need to load
-            # the FileContent model, which was previously loaded by the load_project(),
-            # but is not populated by the `create_next_state()`
-            for f in self.current_state.files:
-                await f.awaitable_attrs.content
-
-            telemetry.inc("num_steps")
-
-            # FIXME: write a test to verify files (and file content) are preloaded
-            return self.current_state
+            next_state = state.next_state
+            next_state.link_prev_state()
+            self.current_session.add(state)
+            self.current_session.add(next_state)
 
         except Exception as e:
             log.error(f"Error during commit: {str(e)}")
             log.error(traceback.format_exc())
             raise
 
+    async def _compact_history(self, state: ProjectState):
+        """
+        Periodically compact the history of the branch (see `Branch.compact()`).
+
+        This is done in the new session before the committed state is added
+        to it, so the compaction doesn't interfere with the states in use.
+        Errors are logged, but otherwise ignored.
+
+        :param state: The committed state.
+        """
+        config = get_config().history
+        if not config.compact_interval or state.step_index % config.compact_interval != 0:
+            return
+
+        session = self.current_session
+        try:
+            branch = await Branch.get_by_id(session, state.branch_id)
+            n_deleted = await branch.compact(config.keep_last)
+            await session.commit()
+            if n_deleted:
+                log.info(f"Compacted the project history, deleted {n_deleted} old states")
+        except Exception as e:
+            log.warning(f"Error compacting the project history: {e}", exc_info=True)
+            await session.rollback()
+        finally:
+            # The loaded branch and project would conflict with ours, added with the states
+            session.expunge_all()
+
+    async def compact_history(self, project_id: Optional[UUID] = None) -> int:
+        """
+        Compact the history of all the branches of the project, or of all the projects.
+
+        This uses a new database session, so it can't be used while working
+        on a project (the current project is compacted periodically when
+        the states are committed, see `commit()`).
+
+        :param project_id: Project ID (optional, compacts all the projects if not provided).
+        :return: Number of deleted project states.
+        """
+        keep_last = get_config().history.keep_last
+        n_deleted = 0
+        async with self.session_manager as session:
+            query = select(Branch)
+            if project_id is not None:
+                query = query.where(Branch.project_id == project_id)
+            branches = (await session.execute(query)).scalars().all()
+            for branch in branches:
+                n_deleted += await branch.compact(keep_last)
+                await session.commit()
+
+        log.info(f"Compacted the history of {len(branches)} branches, deleted {n_deleted} old states")
+        return n_deleted
+
+    async def wait_for_commit(self):
+        """
+        Wait until the last committed state is written to the database.
+
+        This must be done before using the database session after `commit()`,
+        and before any user-visible action that assumes the state is saved.
+        It's safe to call concurrently (eg. from agents run in parallel): all
+        the callers wait until the state is written, and all get the error.
+
+        :raises Exception: The error from the commit, if it failed.
+        """
+        commit_task = self._commit_task
+        if commit_task is None:
+            return
+
+        try:
+            # Cancelling one of the callers doesn't cancel the commit for the others
+            await asyncio.shield(commit_task)
+        finally:
+            if commit_task.done() and self._commit_task is commit_task:
+                self._commit_task = None
+
     async def rollback(self):
         """
         Abandon (rollback) the next state changes.
+
+        The state committed before that is still written to the database.
         """
+        try:
+            await self.wait_for_commit()
+        except Exception:
+            # Already logged, and the session is rolled back anyway
+            pass
+
         if not self.current_session:
             return
         await self.current_session.rollback()
@@ -312,7 +435,7 @@ class StateManager:
                     request_log.duration,
                     request_log.status != LLMRequestStatus.SUCCESS,
                 )
-                LLMRequest.from_request_log(self.current_state, agent, request_log)
+                await LLMRequest.from_request_log(self.current_state, agent, request_log)
 
             except Exception as e:
                 if self.ui:
@@ -330,6 +453,7 @@ class StateManager:
         :param question: The question asked.
         :param response: The user response.
         """
+        await self.wait_for_commit()
         telemetry.inc("num_inputs")
         UserInput.from_user_input(self.current_state, question, response)
 
@@ -344,6 +468,7 @@ class StateManager:
 
         :param exec_log: The command execution log.
         """
+        await self.wait_for_commit()
         telemetry.inc("num_commands")
         ExecLog.from_exec_log(self.current_state, exec_log)
 
@@ -378,9 +503,12 @@ class StateManager:
         """
         Get a file from the current project state, by the file path.
 
+        The file content is loaded as well.
+
         :param path: The file path.
         :return: The file object, or None if not found.
         """
+        await self.current_state.load_file_contents([path])
         return self.current_state.get_file_by_path(path)
 
     async def save_file(
@@ -401,27 +529,74 @@ class StateManager:
         :param metadata: Optional metadata (eg. description) to save with the file.
         :param from_template: Whether the file is part of a template.
         """
-        try:
-            original_content = self.file_system.read(path)
-        except ValueError:
-            original_content = ""
+        await self.save_files({path: content}, {path: metadata} if metadata else None, from_template)
+
+    async def save_files(
+        self,
+        files: dict[str, str],
+        metadata: Optional[dict[str, dict]] = None,
+        from_template: bool = False,
+    ):
+        """
+        Save multiple files to the project.
 
-        # FIXME: VFS methods should probably be async
-        self.file_system.save(path, content)
+        This works like `save_file()`, but stores all the file contents to
+        the database at once.
+
+        :param files: File contents by their paths.
+        :param metadata: Optional metadata (eg. description) to save with the files, by their paths.
+        :param from_template: Whether the files are part of a template.
+        """
+        metadata = metadata or {}
+        original_contents = {}
+        hashes = {}
+        for path, content in files.items():
+            try:
+                original_contents[path] = self.file_system.read(path)
+            except ValueError:
+                original_contents[path] = ""
+
+            # FIXME: VFS methods should probably be async
+            self.file_system.save(path, content)
+            hashes[path] = self.file_system.hash_string(content)
 
-        hash = self.file_system.hash_string(content)
         async with self.db_blocker():
-            file_content = await FileContent.store(self.current_session, hash, content)
+            file_contents = await FileContent.store_many(
+                self.current_session,
+                {hashes[path]: content for path, content in files.items()},
+            )
+            # The original contents are remembered in the modified files
+            await self.next_state.load_file_contents(files)
 
-        file = self.next_state.save_file(path, file_content)
-        # if self.ui and not from_template:
-        #     await self.ui.open_editor(self.file_system.get_full_path(path))
-        if metadata:
-            file.meta = metadata
+        for path, content in files.items():
+            file = self.next_state.save_file(path, file_contents[hashes[path]])
+            # if self.ui and not from_template:
+            #     await self.ui.open_editor(self.file_system.get_full_path(path))
+            if metadata.get(path):
+                file.meta = metadata[path]
 
-        if not from_template:
-            delta_lines = len(content.splitlines()) - len(original_content.splitlines())
-            telemetry.inc("created_lines", delta_lines)
+            if not from_template:
+                delta_lines = len(content.splitlines()) - len(original_contents[path].splitlines())
+                telemetry.inc("created_lines", delta_lines)
+
+    async def stage_files(self, files: dict[str, str]):
+        """
+        Store the contents of files that are about to be saved.
+
+        The contents are stored to the database, but the files aren't saved
+        (neither to the file system nor to the project state), so a later
+        `save_files()` with the same contents has nothing left to store. As
+        the contents are addressed by their hash, this is safe to do for
+        changes that end up never being saved: unreferenced contents are
+        deleted later (see `FileContent.delete_orphans()`).
+
+        :param files: File contents by their paths.
+        """
+        async with self.db_blocker():
+            await FileContent.store_many(
+                self.current_session,
+                {self.file_system.hash_string(content): content for content in files.values()},
+            )
 
     async def init_file_system(self, load_existing: bool) -> VirtualFileSystem:
         """
@@ -440,6 +615,9 @@ class StateManager:
         """
         config = get_config()
 
+        if self.file_system is not None:
+            self.file_system.close()
+
         if config.fs.type == FileSystemType.MEMORY:
             return MemoryVFS()
 
@@ -455,11 +633,21 @@ class StateManager:
             )
 
             try:
-                return LocalDiskVFS(root, allow_existing=load_existing, ignore_matcher=ignore_matcher)
+                vfs = LocalDiskVFS(
+                    root,
+                    allow_existing=load_existing,
+                    ignore_matcher=ignore_matcher,
+                    index=WorkspaceIndex(os.path.join(root, WORKSPACE_INDEX_PATH)),
+                )
             except FileExistsError:
                 self.project.folder_name = self.project.folder_name + "-" + uuid4().hex[:7]
                 log.warning(f"Directory {root} already exists, changing project folder to {self.project.folder_name}")
                 await self.current_session.commit()
+                continue
+
+            if config.fs.watch:
+                vfs.watcher = create_watcher(root, ignore_matcher)
+            return vfs
 
     def get_full_project_root(self) -> str:
         """
@@ -487,19 +675,28 @@ class StateManager:
         imported_files = []
         removed_files = []
 
-        for path in self.file_system.list():
+        # Only read the files whose content hash differs from the saved one
+        contents = {}
+        for path, hash in self.file_system.list_hashes().items():
             files_in_workspace.add(path)
-            content = self.file_system.read(path)
             saved_file = known_files.get(path)
 
-            if saved_file and saved_file.content.content == content:
+            if saved_file and saved_file.content_id == hash:
                 continue
 
             # TODO: unify this with self.save_file() / refactor that whole bit
-            hash = self.file_system.hash_string(content)
-            log.debug(f"Importing file {path} (hash={hash}, size={len(content)} bytes)")
-            file_content = await FileContent.store(self.current_session, hash, content)
-            file = self.next_state.save_file(path, file_content, external=True)
+            contents[path] = self.file_system.read(path)
+
+        hashes = {path: self.file_system.hash_string(content) for path, content in contents.items()}
+        if contents:
+            await self.wait_for_commit()
+        file_contents = await FileContent.store_many(
+            self.current_session,
+            {hashes[path]: content for path, content in contents.items()},
+        )
+        for path, content in contents.items():
+            log.debug(f"Importing file {path} (hash={hashes[path]}, size={len(content)} bytes)")
+            file = self.next_state.save_file(path, file_contents[hashes[path]], external=True)
             imported_files.append(file)
 
         for path, file in known_files.items():
@@ -526,6 +723,7 @@ class StateManager:
             if disk_f not in known_files:
                 self.file_system.remove(disk_f)
 
+        await self.current_state.load_file_contents()
         restored_files = []
         for path, file in known_files.items():
             restored_files.append(file)
@@ -541,11 +739,10 @@ class StateManager:
         """
 
         modified_files = []
-        files_in_workspace = self.file_system.list()
-        for path in files_in_workspace:
-            content = self.file_system.read(path)
+        files_in_workspace = self.file_system.list_hashes()
+        for path, hash in files_in_workspace.items():
             saved_file = self.current_state.get_file_by_path(path)
-            if saved_file and saved_file.content.content == content:
+            if saved_file and saved_file.content_id == hash:
                 continue
             modified_files.append(path)
 
@@ -567,12 +764,22 @@ class StateManager:
         """
 
         modified_files = []
-        files_in_workspace = self.file_system.list()
+        files_in_workspace = self.file_system.list_hashes()
+        await self.current_state.awaitable_attrs.files
 
-        for path in files_in_workspace:
-            content = self.file_system.read(path)
+        changed_paths = []
+        for path, hash in files_in_workspace.items():
             saved_file = self.current_state.get_file_by_path(path)
+            if not saved_file or saved_file.content_id != hash:
+                changed_paths.append(path)
+
+        removed_files = [file for file in self.current_state.files if file.path not in files_in_workspace]
+        # Only the old contents of the changed files are needed
+        await self.current_state.load_file_contents(changed_paths + [file.path for file in removed_files])
 
+        for path in changed_paths:
+            saved_file = self.current_state.get_file_by_path(path)
+            content = self.file_system.read(path)
             # If there's a saved file, serialize its content; otherwise, set it to None
             saved_file_content = saved_file.content.content if saved_file else None
 
@@ -588,16 +795,14 @@ class StateManager:
             )
 
         # Handle files removed from disk
-        await self.current_state.awaitable_attrs.files
-        for db_file in self.current_state.files:
-            if db_file.path not in files_in_workspace:
-                modified_files.append(
-                    {
-                        "path": db_file.path,
-                        "file_old": db_file.content.content,  # Serialized content
-                        "file_new": "",  # Empty string as the file is removed
-                    }
-                )
+        for db_file in removed_files:
+            modified_files.append(
+                {
+                    "path": db_file.path,
+                    "file_old": db_file.content.content,  # Serialized content
+                    "file_new": "",  # Empty string as the file is removed
+                }
+            )
 
         return modified_files
 
@@ -670,13 +875,14 @@ class StateManager:
         :return: List of APIs.
         """
         apis = []
+        await self.wait_for_commit()
+        await self.next_state.load_file_contents(
+            file.path for file in self.next_state.files if "client/src/api" in file.path
+        )
         for file in self.next_state.files:
             if "client/src/api" not in file.path:
                 continue
-            session = inspect(file).async_session
-            result = await session.execute(select(FileContent).where(FileContent.id == file.content_id))
-            file_content = result.scalar_one_or_none()
-            content = file_content.content
+            content = file.content.content
             lines = content.splitlines()
             for i, line in enumerate(lines):
                 if "// Description:" in line:
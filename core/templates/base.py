@@ -106,15 +106,15 @@ class BaseProjectTemplate:
             self.filter,
         )
 
-        for file_name, file_content in files.items():
-            desc = self.file_descriptions.get(file_name)
-            metadata = {"description": desc} if desc else None
-            await self.state_manager.save_file(
-                file_name,
-                file_content,
-                metadata=metadata,
-                from_template=True,
-            )
+        await self.state_manager.save_files(
+            files,
+            metadata={
+                file_name: {"description": self.file_descriptions[file_name]}
+                for file_name in files
+                if self.file_descriptions.get(file_name)
+            },
+            from_template=True,
+        )
 
         try:
             await self.install_hook()
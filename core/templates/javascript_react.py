@@ -1,3 +1,5 @@
+from core.proc.install_cache import npm_install
+
 from .base import BaseProjectTemplate, NoOptions
 
 
@@ -32,4 +34,4 @@ class JavascriptReactProjectTemplate(BaseProjectTemplate):
     options_description = ""
 
     async def install_hook(self):
-        await self.process_manager.run_command("npm install")
+        await npm_install(self.process_manager)
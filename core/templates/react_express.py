@@ -4,6 +4,7 @@ from typing import Optional
 from pydantic import BaseModel, Field
 
 from core.log import get_logger
+from core.proc.install_cache import npm_install
 
 from .base import BaseProjectTemplate
 
@@ -82,7 +83,7 @@ class ReactExpressProjectTemplate(BaseProjectTemplate):
     options_description = TEMPLATE_OPTIONS.strip()
 
     async def install_hook(self):
-        await self.process_manager.run_command("npm install")
+        await npm_install(self.process_manager)
         if self.options.db_type == DatabaseType.SQL:
             await self.process_manager.run_command("npx prisma generate")
             await self.process_manager.run_command("npx prisma migrate dev --name initial")
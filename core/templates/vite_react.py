@@ -1,3 +1,5 @@
+from core.proc.install_cache import npm_install
+
 from .base import BaseProjectTemplate, NoOptions
 
 
@@ -133,4 +135,4 @@ class ViteReactProjectTemplate(BaseProjectTemplate):
     ]
 
     async def install_hook(self):
-        await self.process_manager.run_command("npm install", show_output=False)
+        await npm_install(self.process_manager, show_output=False)
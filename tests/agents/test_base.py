@@ -41,7 +41,7 @@ async def test_stream_handler():
 @pytest.mark.asyncio
 async def test_ask_question():
     ui = MagicMock()
-    state_manager = MagicMock(log_user_input=AsyncMock())
+    state_manager = MagicMock(log_user_input=AsyncMock(), wait_for_commit=AsyncMock())
     agent = AgentUnderTest(state_manager, ui)
     ui.ask_question = AsyncMock(return_value="response")
 
@@ -62,6 +62,7 @@ async def test_ask_question():
         placeholder=None,
     )
 
+    state_manager.wait_for_commit.assert_awaited_once()
     state_manager.log_user_input.assert_awaited_once()
     state_manager.log_user_input.assert_called_once_with("How are you?", "response")
 
@@ -0,0 +1,33 @@
+import pytest
+
+from core.agents.developer import Developer, TaskSteps
+
+
+@pytest.mark.asyncio
+async def test_set_next_steps_resolves_ordering_hints(agentcontext):
+    sm, _, ui, _ = agentcontext
+
+    response = TaskSteps.model_validate(
+        {
+            "steps": [
+                {"type": "save_file", "save_file": {"path": "package.json"}},
+                {"type": "save_file", "save_file": {"path": "server.js"}},
+                {"type": "save_file", "save_file": {"path": "package.json"}, "depends_on": [2]},
+                {"type": "command", "command": {"command": "npm install", "timeout": 60}, "depends_on": [3, 1, 7]},
+                {"type": "command", "command": {"command": "npm test", "timeout": 60}},
+            ]
+        }
+    )
+    dev = Developer(sm, ui)
+    dev.set_next_steps(response, "test")
+
+    steps = sm.next_state.steps
+    # The duplicate step for package.json is dropped, and the hints referring to it refer to the kept one
+    assert [step.get("save_file", step.get("command")) for step in steps] == [
+        {"path": "package.json"},
+        {"path": "server.js"},
+        {"command": "npm install", "timeout": 60, "success_message": ""},
+        {"command": "npm test", "timeout": 60, "success_message": ""},
+    ]
+    assert [step["depends_on"] for step in steps] == [None, None, [steps[0]["id"]], None]
+    assert len({step["id"] for step in steps}) == 4
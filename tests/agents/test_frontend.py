@@ -0,0 +1,94 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core.agents.convo import AgentConvo
+from core.agents.frontend import Frontend
+from core.db.models import FileContent
+
+RESPONSE = """Let's create the app.
+
+file: src/App.jsx
+```jsx
+export default function App() {}
+```
+
+file: src/main.jsx
+```jsx
+import App from './App';
+```
+
+command:
+```
+npm install
+```
+DONE
+"""
+
+RETRIED_RESPONSE = """file: src/Broken.jsx
+```jsx
+export default function Broken() {}
+```
+
+command:
+```
+rm -rf src
+```
+"""
+
+
+@pytest.mark.asyncio
+async def test_blocks_are_prepared_while_streaming(agentcontext):
+    sm, pm, ui, _ = agentcontext
+    ui.send_file_status = AsyncMock()
+    ui.generate_diff = AsyncMock()
+    pm.run_command = AsyncMock()
+    await sm.save_file("src/App.jsx", "old")
+    await sm.commit()
+
+    fe = Frontend(sm, ui, process_manager=pm)
+    while_streaming = {}
+
+    def diffs():
+        return [call.args[0] for call in ui.generate_diff.await_args_list]
+
+    async def llm(convo, parser):
+        # The first attempt fails mid-stream and is retried, each attempt gets a new stream
+        for response in [RETRIED_RESPONSE, RESPONSE]:
+            stream = parser.stream_consumer()
+            for i in range(0, len(response), 10):
+                stream.feed(response[i : i + 10])
+                await asyncio.sleep(0)
+        # Give the worker a chance to prepare the emitted files
+        for _ in range(100):
+            if len(diffs()) == 3:
+                break
+            await asyncio.sleep(0.01)
+        while_streaming["diffs"] = diffs()
+        while_streaming["stored"] = sm.file_system.hash_string("import App from './App';") in FileContent.cache
+        while_streaming["saved"] = [file.path for file in sm.next_state.files if file.content.content != "old"]
+        while_streaming["commands"] = pm.run_command.await_count
+        return parser(RESPONSE)
+
+    response = await fe.generate_and_process(llm, AgentConvo(fe))
+
+    assert [block.description for block in response.blocks] == [
+        "Let's create the app.\n\nfile: src/App.jsx",
+        "file: src/main.jsx",
+        "command:",
+    ]
+    # The diffs are shown and the contents stored while streaming, but nothing is saved or run
+    # until the request succeeds
+    assert while_streaming == {
+        "diffs": ["src/Broken.jsx", "src/App.jsx", "src/main.jsx"],
+        "stored": True,
+        "saved": [],
+        "commands": 0,
+    }
+    pm.run_command.assert_awaited_once_with("cd client && npm install")
+
+    # Only the final response is applied, and the diffs shown while streaming aren't repeated
+    assert sorted(file.path for file in sm.next_state.files) == ["src/App.jsx", "src/main.jsx"]
+    assert sm.next_state.get_file_content_by_path("src/App.jsx") == "export default function App() {}"
+    assert diffs() == ["src/Broken.jsx", "src/App.jsx", "src/main.jsx"]
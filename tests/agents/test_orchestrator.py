@@ -1,8 +1,12 @@
-from unittest.mock import AsyncMock, Mock
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 
+from core.agents.code_monkey import CodeMonkey
+from core.agents.error_handler import ErrorHandler
+from core.agents.executor import Executor
 from core.agents.orchestrator import Orchestrator
+from core.agents.response import AgentResponse, ResponseType
 
 
 @pytest.mark.asyncio
@@ -97,3 +101,109 @@ async def test_import_if_deleted_files(agentcontext):
     assert state != sm.current_state
 
     assert len(sm.current_state.files) == 0
+
+
+def test_handle_parallel_responses():
+    orca = Orchestrator(state_manager=AsyncMock(), ui=AsyncMock())
+    monkey = CodeMonkey(AsyncMock(), AsyncMock(), step={"type": "save_file"})
+    executor = Executor(AsyncMock(), AsyncMock())
+
+    response = orca.handle_parallel_responses(monkey, [AgentResponse.done(monkey), AgentResponse.done(executor)])
+    assert response.type == ResponseType.DONE
+
+    response = orca.handle_parallel_responses(
+        monkey,
+        [
+            AgentResponse.input_required(monkey, [{"file": "a.js", "line": 1}]),
+            AgentResponse.done(executor),
+            AgentResponse.input_required(monkey, [{"file": "b.js", "line": 2}]),
+        ],
+    )
+    assert response.type == ResponseType.INPUT_REQUIRED
+    assert response.data["files"] == [{"file": "a.js", "line": 1}, {"file": "b.js", "line": 2}]
+
+    # Errors take precedence, and are returned as is (so the error handler knows which agent failed)
+    error = AgentResponse.error(executor, "Command failed")
+    response = orca.handle_parallel_responses(
+        monkey, [AgentResponse.input_required(monkey, [{"file": "a.js", "line": 1}]), error]
+    )
+    assert response is error
+
+
+@pytest.mark.asyncio
+async def test_create_agent_for_ready_steps(agentcontext):
+    sm, _, ui, _ = agentcontext
+    state = sm.current_state
+    state.epics = [{"name": "Initial Project", "source": "app", "completed": False}]
+    state.specification.description = "Test app"
+    state.specification.architecture = "Node.js"
+    state.tasks = [{"description": "Build the app", "status": "todo"}]
+    state.steps = [
+        {"id": "a", "type": "save_file", "save_file": {"path": "a.js"}, "completed": False},
+        {"id": "b", "type": "save_file", "save_file": {"path": "b.js"}, "completed": False},
+        {"id": "c", "type": "command", "command": {"command": "npm test", "timeout": 60}, "completed": False},
+    ]
+
+    orca = Orchestrator(state_manager=sm, ui=ui)
+    orca.executor = Executor(sm, ui)
+
+    # The steps that don't depend on each other are run in parallel
+    agents = orca.create_agent(None)
+    assert [agent.__class__ for agent in agents] == [CodeMonkey, CodeMonkey]
+    assert [agent.step["id"] for agent in agents] == ["a", "b"]
+
+    # A single ready step is run by itself
+    state.steps[0]["completed"] = True
+    state.steps[1]["completed"] = True
+    agent = orca.create_agent(None)
+    assert agent is orca.executor
+    assert agent.step["id"] == "c"
+
+
+@pytest.mark.asyncio
+async def test_command_error_alongside_file_write(agentcontext):
+    sm, _, ui, mock_get_llm = agentcontext
+    sm.current_state.epics = [{"name": "Initial Project", "source": "app", "completed": False}]
+    sm.current_state.specification.description = "Test app"
+    sm.current_state.specification.architecture = "Node.js"
+    sm.current_state.tasks = [{"description": "Build the app", "status": "todo"}]
+    sm.current_state.steps = [
+        {"id": "a", "type": "save_file", "save_file": {"path": "a.js"}, "completed": False, "depends_on": []},
+        {
+            "id": "b",
+            "type": "command",
+            "command": {"command": "npm test", "timeout": 60},
+            "completed": False,
+            "depends_on": [],
+        },
+        {"id": "c", "type": "save_file", "save_file": {"path": "c.js"}, "completed": False},
+    ]
+    await sm.commit()
+
+    orca = Orchestrator(state_manager=sm, ui=ui)
+    orca.executor = Executor(sm, ui)
+    monkey, executor = orca.create_agent(None)
+    assert [monkey.step["id"], executor.step["id"]] == ["a", "b"]
+
+    # The file is written and the command fails in the same batch
+    sm.next_state.complete_step("save_file", "a")
+    executor.complete()
+    error = AgentResponse.error(executor, "Tests failed", {"cmd": "npm test", "status_code": 1, "step_id": "b"})
+    response = orca.handle_parallel_responses(monkey, [AgentResponse.done(monkey), error])
+
+    handler = orca.create_agent(response)
+    assert isinstance(handler, ErrorHandler)
+    ui.ask_question.return_value.button = "yes"
+    ui.ask_question.return_value.cancelled = False
+    handler.get_llm = mock_get_llm(return_value="Fix the tests")
+    with patch("core.agents.error_handler.AgentConvo") as mock_convo:
+        response = await handler.run()
+    assert response.type == ResponseType.DONE
+
+    # The prompt is about the failed command, not the first unfinished step (the file write)
+    assert mock_convo.return_value.template.call_args.kwargs["step_index"] == 1
+    # The file written in parallel stays completed, the failed command and the rest are dropped
+    assert sm.next_state.steps == [
+        {"id": "a", "type": "save_file", "save_file": {"path": "a.js"}, "completed": True, "depends_on": []},
+    ]
+    assert sm.next_state.iterations[-1]["description"] == "Fix the tests"
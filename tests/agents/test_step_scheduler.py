@@ -0,0 +1,87 @@
+from core.agents.step_scheduler import ready_steps, step_dependencies
+
+
+def save_file(id: str, path: str, **kwargs) -> dict:
+    return {"id": id, "type": "save_file", "save_file": {"path": path}, "completed": False, **kwargs}
+
+
+def command(id: str, cmd: str = "npm install", **kwargs) -> dict:
+    return {"id": id, "type": "command", "command": {"command": cmd, "timeout": 60}, "completed": False, **kwargs}
+
+
+def ids(steps: list[dict]) -> list[str]:
+    return [step["id"] for step in steps]
+
+
+def test_step_dependencies():
+    steps = [
+        save_file("a", "server.js"),
+        save_file("b", "models/user.js"),
+        save_file("c", "./server.js"),
+        command("d"),
+        save_file("e", "routes/api.js"),
+        {"id": "f", "type": "human_intervention", "human_intervention_description": "Set API key"},
+        {"id": "g", "type": "utility_function", "file": "utils.js"},
+        save_file("h", "client/app.js"),
+    ]
+    assert step_dependencies(steps) == [
+        set(),
+        set(),
+        {0},
+        {0, 1, 2},
+        {3},
+        {0, 1, 2, 3, 4},
+        {0, 1, 2, 3, 4, 5},
+        {3, 5, 6},
+    ]
+
+
+def test_step_dependencies_with_hints():
+    steps = [
+        save_file("a", "server.js"),
+        save_file("b", "package.json"),
+        command("c", depends_on=["b"]),
+        save_file("d", "routes/api.js", depends_on=[]),
+        command("e", "npm test"),
+        save_file("f", "server.js", depends_on=[]),
+    ]
+    assert step_dependencies(steps) == [
+        set(),
+        set(),
+        {1},
+        set(),
+        {0, 1, 2, 3},
+        {0},
+    ]
+
+
+def test_ready_steps():
+    steps = [
+        save_file("a", "server.js"),
+        save_file("b", "models/user.js"),
+        save_file("c", "server.js"),
+        command("d"),
+        save_file("e", "routes/api.js", depends_on=[]),
+    ]
+    assert ids(ready_steps(steps)) == ["a", "b", "e"]
+    assert ids(ready_steps(steps, 2)) == ["a", "b"]
+
+    # The steps are returned in the task order, regardless of which finished first
+    steps[1]["completed"] = True
+    assert ids(ready_steps(steps)) == ["a", "e"]
+    steps[0]["completed"] = True
+    assert ids(ready_steps(steps)) == ["c", "e"]
+    steps[2]["completed"] = True
+    assert ids(ready_steps(steps)) == ["d", "e"]
+
+
+def test_ready_steps_always_includes_current_step():
+    steps = [
+        {"id": "a", "type": "review_task", "completed": False},
+        save_file("b", "server.js"),
+    ]
+    assert ids(ready_steps(steps, 1)) == ["a"]
+    steps[0]["completed"] = True
+    assert ids(ready_steps(steps)) == ["b"]
+    steps[1]["completed"] = True
+    assert ready_steps(steps) == []
@@ -49,6 +49,7 @@ def test_parse_arguments(mock_ArgumentParser):
         "--list-json",
         "--project",
         "--delete",
+        "--compact",
         "--branch",
         "--step",
         "--llm-endpoint",
@@ -287,6 +288,7 @@ def test_init(tmp_path):
         (["--list"], False, True),
         (["--list-json"], False, True),
         (["--show-config"], False, True),
+        (["--compact"], False, True),
         (["--project", "ca7a0cc9-767f-472a-aefb-0c8d3377c9bc"], False, False),
         (["--branch", "ca7a0cc9-767f-472a-aefb-0c8d3377c9bc"], False, False),
         (["--step", "123"], False, False),
@@ -6,7 +6,7 @@ import pytest
 import pytest_asyncio
 
 from core.config import DBConfig
-from core.db.models import Base
+from core.db.models import Base, FileContent
 from core.db.session import SessionManager
 from core.state.state_manager import StateManager
 
@@ -16,6 +16,14 @@ def disable_test_telemetry(monkeypatch):
     os.environ["DISABLE_TELEMETRY"] = "1"
 
 
+@pytest.fixture(autouse=True)
+def clear_file_content_cache():
+    """
+    Start each test with an empty file content cache (shared by all databases).
+    """
+    FileContent.cache.clear()
+
+
 @pytest_asyncio.fixture
 async def testmanager():
     """
@@ -1,8 +1,21 @@
+from copy import deepcopy
 from uuid import uuid4
 
 import pytest
-
-from core.db.models import Branch, Project
+from sqlalchemy import func, select
+
+from core.db.models import (
+    Branch,
+    FileContent,
+    FileManifest,
+    LLMMessage,
+    LLMRequest,
+    Project,
+    ProjectState,
+    UserInput,
+)
+from core.db.models.project_state import TaskStatus
+from core.llm.request_log import LLMRequestLog
 
 from .factories import create_project_state
 
@@ -66,3 +79,137 @@ async def test_get_last_state_no_session():
 
     with pytest.raises(ValueError):
         await branch.get_last_state()
+
+
+@pytest.mark.asyncio
+async def test_get_state_at_step_rebuilds_delta_encoded_states(testdb, monkeypatch):
+    monkeypatch.setattr(ProjectState, "SNAPSHOT_INTERVAL", 3)
+
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+
+    expected = {}
+    for i in range(7):
+        state = await state.create_next_state()
+        state.tasks = state.tasks + [{"description": f"Task {i}", "status": "todo"}]
+        state.epics = [{"name": f"Epic {i}", "completed": False}]
+        await testdb.commit()
+        expected[state.step_index] = (deepcopy(state.epics), deepcopy(state.tasks))
+
+    branch_id = state.branch.id
+    rows = (await testdb.execute(select(ProjectState.step_index, ProjectState.patch, ProjectState.tasks))).all()
+    for step_index, patch, tasks in rows:
+        if step_index % 3 == 0 or step_index == 1:
+            assert patch is None and tasks is not None
+        else:
+            assert patch is not None and tasks is None
+
+    testdb.expunge_all()
+    branch = await Branch.get_by_id(testdb, branch_id)
+    for step_index, (epics, tasks) in expected.items():
+        s = await branch.get_state_at_step(step_index)
+        assert s.epics == epics
+        assert s.tasks == tasks
+
+    last = await branch.get_last_state()
+    assert last.tasks == expected[8][1]
+
+
+@pytest.mark.asyncio
+async def test_compact(testdb, monkeypatch):
+    monkeypatch.setattr(ProjectState, "SNAPSHOT_INTERVAL", 5)
+
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+    state.save_file("b.txt", FileContent(id="b", content="unchanged"), external=True)
+    await testdb.commit()
+
+    expected = {}
+    state_ids = {}
+    for i in range(20):
+        state = await state.create_next_state()
+        if state.step_index == 2:
+            state.tasks = [{"description": f"Task {n}", "status": "todo"} for n in range(3)]
+        elif state.step_index in (7, 12):
+            state.current_task["status"] = TaskStatus.DONE
+            state.flag_tasks_as_modified()
+        state.steps = state.steps + [{"id": i}]
+        state.save_file("a.txt", FileContent(id=f"a{i}", content=f"version {i}"), external=True)
+        testdb.add(UserInput(project_state=state, branch=state.branch, question=f"Q{i}", cancelled=False))
+        request_log = LLMRequestLog(
+            provider="openai",
+            model="gpt-4o",
+            temperature=0.5,
+            messages=[{"role": "system", "content": "You're a developer"}, {"role": "user", "content": f"Step {i}"}],
+        )
+        await LLMRequest.from_request_log(state, None, request_log)
+        await testdb.commit()
+        expected[state.step_index] = (deepcopy(state.tasks), deepcopy(state.steps))
+        state_ids[state.step_index] = state.id
+
+    branch_id = state.branch.id
+    testdb.expunge_all()
+    branch = await Branch.get_by_id(testdb, branch_id)
+    assert await branch.compact(keep_last=5) == 12
+    await testdb.commit()
+
+    # The task boundaries and the last states are kept, linked to each other
+    rows = (
+        await testdb.execute(
+            select(ProjectState.id, ProjectState.step_index, ProjectState.prev_state_id).order_by(
+                ProjectState.step_index
+            )
+        )
+    ).all()
+    assert [row.step_index for row in rows] == [1, 2, 7, 12, 17, 18, 19, 20, 21]
+    assert [row.prev_state_id for row in rows[1:]] == [row.id for row in rows[:-1]]
+    assert branch.compacted_step == 16
+
+    testdb.expunge_all()
+    branch = await Branch.get_by_id(testdb, branch_id)
+    for row in rows[1:]:
+        s = await branch.get_state_at_step(row.step_index)
+        assert (s.tasks, s.steps) == expected[row.step_index]
+
+    # The logs are pruned, except the user inputs, moved to the next kept state
+    llm_requests = (await testdb.execute(select(LLMRequest.project_state_id))).scalars().all()
+    assert set(llm_requests) == {row.id for row in rows[1:]}
+    messages = (await testdb.execute(select(LLMMessage.data))).scalars().all()
+    assert len(messages) == 1 + len(rows[1:])
+    user_inputs = (await testdb.execute(select(UserInput.project_state_id))).scalars().all()
+    assert len(user_inputs) == 20
+    assert user_inputs.count(state_ids[7]) == 5
+
+    # Only the contents and manifests of the kept states are left
+    contents = (await testdb.execute(select(FileContent.id))).scalars().all()
+    assert sorted(contents) == ["a0", "a10", "a15", "a16", "a17", "a18", "a19", "a5", "b"]
+    n_manifests = (await testdb.execute(select(func.count()).select_from(FileManifest))).scalar_one()
+    await FileManifest.delete_orphans(testdb)
+    assert (await testdb.execute(select(func.count()).select_from(FileManifest))).scalar_one() == n_manifests
+
+    # The compacted states are not processed again
+    assert await branch.compact(keep_last=5) == 0
+
+
+@pytest.mark.asyncio
+async def test_compact_after_loading_earlier_step(testdb):
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+    for i in range(5):
+        state = await state.create_next_state()
+        state.steps = [{"id": i}]
+        await testdb.commit()
+
+    branch = state.branch
+    assert await branch.compact(keep_last=1) == 4
+    await testdb.commit()
+    assert branch.compacted_step == 5
+
+    # The steps after the loaded one will be created again
+    first = await branch.get_state_at_step(1)
+    await first.delete_after()
+    await testdb.commit()
+    assert branch.compacted_step == 1
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import select, text
+
+from core.db.compression import ENCODING_RAW, ENCODING_ZLIB, compress, decompress
+from core.db.models import FileContent, LLMRequest
+
+from .factories import create_project_state
+
+
+@pytest.mark.parametrize(
+    ("text", "encoding"),
+    [
+        ("", ENCODING_RAW),
+        ("short", ENCODING_RAW),
+        ("héllo wörld " * 100, ENCODING_ZLIB),
+    ],
+)
+def test_compress_roundtrip(text, encoding):
+    value = compress(text)
+    assert value[:1] == encoding
+    assert decompress(value) == text
+
+
+def test_decompress_unknown_encoding():
+    with pytest.raises(ValueError):
+        decompress(b"\xffdata")
+
+
+@pytest.mark.asyncio
+async def test_columns_are_compressed_transparently(testdb):
+    content = "print('hello world')\n" * 500
+    testdb.add(FileContent(id="test", content=content))
+
+    state = create_project_state()
+    testdb.add(state)
+    testdb.add(
+        LLMRequest(
+            branch=state.branch,
+            project_state=state,
+            provider="openai",
+            model="gpt-4o",
+            temperature=0.5,
+            response=content,
+            prompt_tokens=100,
+            completion_tokens=100,
+            duration=1.0,
+            status="success",
+        )
+    )
+    await testdb.commit()
+
+    raw = (await testdb.execute(text("SELECT content FROM file_contents WHERE id = 'test'"))).scalar_one()
+    assert len(raw) < len(content) / 10
+
+    testdb.expunge_all()
+    fc = (await testdb.execute(select(FileContent).where(FileContent.id == "test"))).scalar_one()
+    assert fc.content == content
+    req = (await testdb.execute(select(LLMRequest))).scalar_one()
+    assert req.response == content
+
+
+@pytest.mark.asyncio
+async def test_uncompressed_values_are_read_as_is(testdb):
+    await testdb.execute(text("INSERT INTO file_contents (id, content) VALUES ('legacy', 'hello world')"))
+    fc = (await testdb.execute(select(FileContent).where(FileContent.id == "legacy"))).scalar_one()
+    assert fc.content == "hello world"
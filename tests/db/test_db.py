@@ -1,8 +1,9 @@
 import pytest
-from sqlalchemy import func, select
+from sqlalchemy import func, select, text
 
-from core.config import DBConfig
+from core.config import DBConfig, SQLiteProfile
 from core.db.models import Project, ProjectState
+from core.db.session import SessionManager
 from core.db.setup import run_migrations
 
 from .factories import create_project_state
@@ -64,3 +65,28 @@ async def test_deleting_project_state_clears_back_references(testdb):
     # Alternative is to just assert `prev_state_id is None`, which works
     # without the attribute_names
     assert state2.prev_state is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_performance_profile(tmp_path):
+    db_cfg = DBConfig(url=f"sqlite+aiosqlite:///{tmp_path}/test.db", sqlite_profile=SQLiteProfile.PERFORMANCE)
+    run_migrations(db_cfg)
+    manager = SessionManager(db_cfg)
+
+    connections = []
+    for _ in range(2):
+        async with manager as session:
+            session.add(create_project_state())
+            await session.commit()
+            assert (await session.execute(text("pragma journal_mode"))).scalar_one() == "wal"
+            assert (await session.execute(text("pragma foreign_keys"))).scalar_one() == 1
+            connection = await session.connection()
+            connections.append((await connection.get_raw_connection()).dbapi_connection)
+    assert connections[0] is connections[1]
+    assert (tmp_path / "test.db-wal").exists()
+
+    await manager.dispose()
+    assert not (tmp_path / "test.db-wal").exists()
+
+    async with manager as session:
+        assert (await session.execute(select(func.count()).select_from(Project))).scalar_one() == 2
@@ -0,0 +1,128 @@
+import pytest
+from sqlalchemy import select
+
+from core.db.models import File, FileContent, ProjectState
+from core.db.models.file_content import FileContentCache
+
+from .factories import create_project_state
+
+
+def test_cache_evicts_least_recently_used():
+    cache = FileContentCache(max_size=10)
+    a, b, c = (FileContent(id=x, content=x * 4) for x in "abc")
+
+    cache.add(a)
+    cache.add(b)
+    assert cache.get("a") is a
+    cache.add(c)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.size == 8
+    # Line counts are remembered after eviction
+    assert cache.get_line_count("b") == 1
+
+
+def test_cache_keeps_contents_added_together():
+    cache = FileContentCache(max_size=10)
+    cache.add(FileContent(id="a", content="a" * 4))
+    cache.add(*(FileContent(id=x, content=x * 4) for x in "bcd"))
+
+    assert len(cache) == 3
+    assert "a" not in cache
+    assert cache.size == 12
+
+
+@pytest.mark.asyncio
+async def test_file_contents_are_loaded_on_demand(testdb):
+    state = create_project_state()
+    state.files = [
+        File(path="a.txt", content=FileContent(id="a", content="a\nb")),
+        File(path="b.txt", content=FileContent(id="b", content="b")),
+    ]
+    testdb.add(state)
+    await testdb.commit()
+
+    testdb.expunge_all()
+    FileContent.cache.clear()
+
+    s = (await testdb.execute(select(ProjectState).where(ProjectState.id == state.id))).scalar_one()
+    files = await s.awaitable_attrs.files
+    assert [f.content_id for f in files] == ["a", "b"]
+    assert len(FileContent.cache) == 0
+    with pytest.raises(ValueError):
+        files[0].content
+
+    await s.load_file_contents(["a.txt"])
+    assert files[0].content.content == "a\nb"
+    assert "b" not in FileContent.cache
+
+    assert await s.count_lines() == 3
+
+
+@pytest.mark.asyncio
+async def test_next_state_stores_new_contents(testdb):
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+
+    next_state = await state.create_next_state()
+    next_state.save_file("a.txt", FileContent(id="a", content="new"))
+    await testdb.commit()
+    FileContent.cache.clear()
+
+    # The clone doesn't keep the stored content
+    third_state = await next_state.create_next_state()
+    with pytest.raises(ValueError):
+        third_state.files[0].content
+
+    await third_state.load_file_contents()
+    assert third_state.files[0].content.content == "new"
+
+
+@pytest.mark.asyncio
+async def test_store_many_inserts_only_missing_contents(testdb):
+    testdb.add(FileContent(id="a", content="old"))
+    await testdb.commit()
+    testdb.expunge_all()
+    FileContent.cache.clear()
+
+    stored = await FileContent.store_many(testdb, {"a": "old", "b": "new"})
+    assert {hash: fc.content for hash, fc in stored.items()} == {"a": "old", "b": "new"}
+    await testdb.commit()
+
+    # Storing again is a no-op, and doesn't conflict with the objects in the session
+    FileContent.cache.clear()
+    await FileContent.store_many(testdb, {"a": "old", "b": "new", "c": "newer"})
+    await testdb.commit()
+
+    testdb.expunge_all()
+    result = await testdb.execute(select(FileContent).order_by(FileContent.id))
+    assert [(fc.id, fc.content) for fc in result.scalars()] == [("a", "old"), ("b", "new"), ("c", "newer")]
+
+
+@pytest.mark.asyncio
+async def test_loaded_contents_are_kept_by_the_files(testdb, monkeypatch):
+    state = create_project_state()
+    state.files = [File(path=f"{x}.txt", content=FileContent(id=x, content=x * 10)) for x in "abcd"]
+    testdb.add(state)
+    await testdb.commit()
+    testdb.expunge_all()
+
+    # The cache can only hold two of the contents
+    monkeypatch.setattr(FileContent, "cache", FileContentCache(max_size=20))
+    s = (await testdb.execute(select(ProjectState).where(ProjectState.id == state.id))).scalar_one()
+    files = await s.awaitable_attrs.files
+
+    await s.load_file_contents(["a.txt", "b.txt"])
+
+    # The next state doesn't keep the contents that are already stored
+    next_state = await s.create_next_state()
+    assert not any(file.is_content_loaded for file in next_state.files)
+
+    # Loading more contents evicts the ones that weren't requested from the cache, but not from the files
+    await next_state.load_file_contents(["a.txt", "c.txt", "d.txt"])
+    assert "a" in FileContent.cache
+    assert "b" not in FileContent.cache
+    assert [file.content.content for file in files[:2]] == ["a" * 10, "b" * 10]
+    assert [file.content.content for file in next_state.files if file.path != "b.txt"] == [x * 10 for x in "acd"]
@@ -0,0 +1,43 @@
+from copy import deepcopy
+
+import pytest
+
+from core.db.json_patch import apply_patch, make_patch
+
+
+@pytest.mark.parametrize(
+    ("old", "new"),
+    [
+        ({}, {}),
+        ({"a": 1}, {"a": 2}),
+        ({"a": 1}, {"b": 1}),
+        ({"a": [1, 2, 3]}, {"a": [1, 2]}),
+        ({"a": [1, 2]}, {"a": [1, 2, 3, 4]}),
+        ({"a": []}, {"a": [{"x": 1}]}),
+        ({"a": [{"x": 1, "y": [1]}]}, {"a": [{"x": 2, "y": [1, 2]}]}),
+        ({"a": {"b": None}}, {"a": {"b": {"c": True}}}),
+        ({"a/b": 1, "c~d": 2}, {"a/b": 3, "c~d": 4}),
+        ({"a": 1}, {"a": 1.0}),
+    ],
+)
+def test_patch_roundtrip(old, new):
+    patch = make_patch(old, new)
+    assert apply_patch(deepcopy(old), patch) == new
+
+
+def test_unchanged_document_has_empty_patch():
+    doc = {"tasks": [{"description": "a", "status": "done"}]}
+    assert make_patch(doc, deepcopy(doc)) == []
+
+
+def test_appended_item_is_a_single_op():
+    old = {"tasks": [{"description": "a"}] * 100}
+    new = {"tasks": [{"description": "a"}] * 100 + [{"description": "b"}]}
+    assert make_patch(old, new) == [{"op": "add", "path": "/tasks/-", "value": {"description": "b"}}]
+
+
+def test_patch_is_not_affected_by_later_changes():
+    new = {"tasks": [{"status": "todo"}]}
+    patch = make_patch({"tasks": []}, new)
+    new["tasks"][0]["status"] = "done"
+    assert apply_patch({"tasks": []}, patch) == {"tasks": [{"status": "todo"}]}
@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import func, select, text
+
+from core.db.models import LLMMessage, LLMRequest, LLMRequestMessage
+from core.llm.request_log import LLMRequestLog
+
+from .factories import create_project_state
+
+
+def make_request_log(messages, prompts=None):
+    return LLMRequestLog(
+        provider="openai",
+        model="gpt-4o",
+        temperature=0.5,
+        messages=messages,
+        prompts=prompts or [],
+        response="ok",
+    )
+
+
+@pytest.mark.asyncio
+async def test_messages_are_stored_once(testdb):
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+
+    system = {"role": "system", "content": "You're a developer\n" * 100}
+    user = {"role": "user", "content": "Write a test"}
+    reply = {"role": "assistant", "content": "Done"}
+    prompts = [{"template": "developer/system.prompt", "context": {"name": "dev"}}]
+    await LLMRequest.from_request_log(state, None, make_request_log([system, user], prompts))
+    await LLMRequest.from_request_log(state, None, make_request_log([system, user, reply, user], prompts))
+    await testdb.commit()
+
+    n_messages = (await testdb.execute(select(func.count()).select_from(LLMMessage))).scalar_one()
+    assert n_messages == 4
+    n_refs = (await testdb.execute(select(func.count()).select_from(LLMRequestMessage))).scalar_one()
+    assert n_refs == 8
+
+    raw = (await testdb.execute(text("SELECT data FROM llm_messages"))).scalars().all()
+    assert max(len(data) for data in raw) < len(system["content"]) / 10
+
+    testdb.expunge_all()
+    first, second = (await testdb.execute(select(LLMRequest).order_by(LLMRequest.id))).scalars().all()
+    assert await first.get_messages() == [system, user]
+    assert await second.get_messages() == [system, user, reply, user]
+    assert await second.get_prompts() == prompts
+
+
+@pytest.mark.asyncio
+async def test_delete_unreferenced_messages(testdb):
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+
+    shared = {"role": "system", "content": "shared"}
+    only = {"role": "user", "content": "only in the first request"}
+    first = await LLMRequest.from_request_log(state, None, make_request_log([shared, only]))
+    await LLMRequest.from_request_log(state, None, make_request_log([shared]))
+    await testdb.commit()
+
+    await testdb.delete(first)
+    await testdb.flush()
+    await LLMMessage.delete_unreferenced(testdb, {LLMMessage.hash_message(shared), LLMMessage.hash_message(only)})
+    await testdb.commit()
+
+    assert (await testdb.execute(select(LLMMessage.data))).scalars().all() == [shared]
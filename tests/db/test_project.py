@@ -1,8 +1,9 @@
 from uuid import uuid4
 
 import pytest
+from sqlalchemy import func, insert, select
 
-from core.db.models import Branch, Project
+from core.db.models import Branch, Project, ProjectState
 
 from .factories import create_project_state
 
@@ -41,6 +42,38 @@ async def test_delete_by_id(testdb):
     assert await Project.get_by_id(testdb, project.id) is None
 
 
+@pytest.mark.asyncio
+async def test_delete_long_history(testdb):
+    # More states than the SQLite limit of nested cascades (1000)
+    state = create_project_state()
+    testdb.add(state)
+    await testdb.commit()
+    states = []
+    prev_state_id = state.id
+    for step_index in range(2, 1202):
+        states.append(
+            {
+                "id": uuid4(),
+                "branch_id": state.branch_id,
+                "prev_state_id": prev_state_id,
+                "specification_id": state.specification_id,
+                "step_index": step_index,
+            }
+        )
+        prev_state_id = states[-1]["id"]
+    await testdb.execute(insert(ProjectState), states)
+    await testdb.commit()
+
+    await state.delete_after()
+    await testdb.commit()
+    assert (await testdb.execute(select(func.count()).select_from(ProjectState))).scalar_one() == 1
+
+    await testdb.execute(insert(ProjectState), states)
+    await Project.delete_by_id(testdb, state.branch.project_id)
+    await testdb.commit()
+    assert (await testdb.execute(select(func.count()).select_from(ProjectState))).scalar_one() == 0
+
+
 @pytest.mark.asyncio
 async def test_get_branch_no_match(testdb):
     project = Project(name="test")
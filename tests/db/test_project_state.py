@@ -1,7 +1,7 @@
 import pytest
 from sqlalchemy import select
 
-from core.db.models import Branch, File, FileContent, Project, ProjectState
+from core.db.models import Branch, File, FileContent, FileManifest, Project, ProjectState
 from core.db.models.project_state import IterationStatus
 
 from .factories import create_project_state
@@ -28,7 +28,7 @@ async def test_get_last_state_no_session():
 
 
 @pytest.mark.asyncio
-async def test_get_by_id_preloads_branch_project_files(testdb):
+async def test_get_by_id_preloads_branch_project_and_loads_files(testdb):
     f = File(path="test.txt", content=FileContent(id="test", content="hello world"))
 
     state = create_project_state()
@@ -40,11 +40,12 @@ async def test_get_by_id_preloads_branch_project_files(testdb):
 
     s = (await testdb.execute(select(ProjectState).where(ProjectState.id == state.id))).scalar_one_or_none()
 
-    # If "get_by_id" doesn't populate branch and project and load the files,
-    # this will crash because they can't be lazy-loaded without an await.
+    # If "get_by_id" doesn't populate branch and project, this will crash
+    # because they can't be lazy-loaded without an await.
     assert s.branch.id == state.branch.id
     assert s.branch.project.id == state.branch.project.id
-    assert s.files[0].content.content == "hello world"
+    files = await s.awaitable_attrs.files
+    assert files[0].content.content == "hello world"
 
 
 @pytest.mark.asyncio
@@ -60,8 +61,9 @@ async def test_create_next_state_clones_files(testdb):
     next_state = await state.create_next_state()
 
     # Check that the new state has a new file with the same content
-    assert next_state.files[0].id != state.files[0].id
+    assert next_state.files[0] is not state.files[0]
     assert next_state.files[0].content_id == f.content_id
+    assert next_state.manifest_id == state.manifest_id
 
 
 @pytest.mark.asyncio
@@ -107,16 +109,60 @@ async def test_deleting_state_removes_child_objects(testdb):
     # Double-check that objects are in the database
     s = (await testdb.execute(select(ProjectState).where(ProjectState.id == next_state.id))).scalar_one_or_none()
     assert s == next_state
-    f = (await testdb.execute(select(File).where(File.id == file.id))).scalar_one_or_none()
-    assert f == file
+    m = (await testdb.execute(select(FileManifest).where(FileManifest.id == next_state.manifest_id))).scalar_one()
+    assert m.entries == {"test.txt": {"content_id": "test"}}
 
     await state.delete_after()
+    await FileManifest.delete_orphans(testdb)
+    await FileContent.delete_orphans(testdb)
 
     # Verify they're deleted
     s = (await testdb.execute(select(ProjectState).where(ProjectState.id == next_state.id))).scalar_one_or_none()
     assert s is None
-    f = (await testdb.execute(select(File).where(File.id == file.id))).scalar_one_or_none()
-    assert f is None
+    m = (
+        await testdb.execute(select(FileManifest).where(FileManifest.id == next_state.manifest_id))
+    ).scalar_one_or_none()
+    assert m is None
+    fc = (await testdb.execute(select(FileContent).where(FileContent.id == "test"))).scalar_one_or_none()
+    assert fc is None
+
+
+@pytest.mark.asyncio
+async def test_unchanged_states_share_file_manifests(testdb):
+    state = create_project_state()
+    for path in ["README.md", "src/main.py", "src/lib/util.py", "tests/test_main.py"]:
+        state.files.append(File(path=path, content=FileContent(id=path, content=path)))
+    testdb.add(state)
+    await testdb.commit()
+
+    manifests = (await testdb.execute(select(FileManifest))).scalars().all()
+    assert len(manifests) == 4
+
+    # No changes to the files, no new manifests
+    state2 = await state.create_next_state()
+    await testdb.commit()
+    assert state2.manifest_id == state.manifest_id
+    assert len((await testdb.execute(select(FileManifest))).scalars().all()) == 4
+
+    # Only the manifests on the changed file's path are created
+    state3 = await state2.create_next_state()
+    state3.save_file("src/main.py", FileContent(id="new", content="new"))
+    state3.get_file_by_path("README.md").meta = {"description": "Readme"}
+    await testdb.commit()
+    assert state3.manifest_id != state2.manifest_id
+    assert len((await testdb.execute(select(FileManifest))).scalars().all()) == 6
+
+    testdb.expunge_all()
+    s = (await testdb.execute(select(ProjectState).where(ProjectState.id == state3.id))).scalar_one()
+    files = {f.path: f for f in await s.awaitable_attrs.files}
+    assert sorted(files) == ["README.md", "src/lib/util.py", "src/main.py", "tests/test_main.py"]
+    assert files["src/main.py"].content.content == "new"
+    assert files["README.md"].meta == {"description": "Readme"}
+
+    s = (await testdb.execute(select(ProjectState).where(ProjectState.id == state2.id))).scalar_one()
+    files = {f.path: f for f in await s.awaitable_attrs.files}
+    assert files["src/main.py"].content.content == "src/main.py"
+    assert files["README.md"].meta == {}
 
 
 @pytest.mark.asyncio
@@ -219,3 +265,19 @@ async def test_completing_unfinished_epics(testdb):
     await testdb.refresh(state)
 
     assert state.current_epic is None
+
+
+def test_complete_step_by_id():
+    state = create_project_state()
+    state.steps = [
+        {"id": "a", "completed": False, "type": "save_file"},
+        {"id": "b", "completed": False, "type": "command"},
+        {"id": "c", "completed": False, "type": "save_file"},
+    ]
+
+    state.complete_step("save_file", "c")
+    assert [step["id"] for step in state.unfinished_steps] == ["a", "b"]
+
+    # Without (a known) ID, the first unfinished step of the type is completed
+    state.complete_step("save_file", "unknown")
+    assert [step["id"] for step in state.unfinished_steps] == ["b"]
@@ -1,12 +1,18 @@
-from io import StringIO
+import os
 from os.path import join
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
 import pytest
 
 from core.disk.ignore import IgnoreMatcher
 
 
+def write_file(path, content: bytes = b"hello"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
 @pytest.mark.parametrize(
     ("path", "expected"),
     [
@@ -15,30 +21,52 @@ from core.disk.ignore import IgnoreMatcher
         (join("module", "test.py"), False),
         (join("module", "test.pyc"), True),
         ("node_modules", True),
+        (join("node_modules", "lib", "index.js"), True),
         (join("docs", "_build"), True),
         (join("some", "lower", "dir"), True),
         (join("tests", "some", "lower", "dir"), False),
         (join("module", "migrations", "0001_initial.py"), True),
-        (join("module", "another", "migrations", "0001_initial.py"), True),
+        # "*" doesn't match across directories, same as in .gitignore
+        (join("module", "another", "migrations", "0001_initial.py"), False),
         (join("module", "migrations", "0001_initial.json"), False),
+        (join("module", "another", "fixtures", "data.json"), True),
+        ("important.pyc", False),
+        (join("build", "main.js"), True),
+        (join("src", "build"), False),
     ],
 )
-@patch("os.path.isfile", return_value=True)
-@patch("builtins.open", return_value=MagicMock(read=StringIO("")))
-def test_ignore_paths(_mock_open, _mock_isfile, path, expected):
+def test_ignore_paths(tmp_path, path, expected):
+    write_file(join(tmp_path, path))
     matcher = IgnoreMatcher(
-        "/tmp",
+        tmp_path,
         [
             "*.pyc",
+            "!important.pyc",
             "node_modules",
             "_build",
             "some/lower/dir",
             "*/migrations/*.py",
+            "**/fixtures/*.json",
+            "/build/",
         ],
     )
     assert matcher.ignore(path) == expected
 
 
+def test_negated_path_in_ignored_directory(tmp_path):
+    write_file(join(tmp_path, "logs", "keep.txt"))
+    matcher = IgnoreMatcher(tmp_path, ["logs", "!keep.txt"])
+
+    # As with git, files can't be re-included if their parent directory is ignored
+    assert matcher.ignore(join("logs", "keep.txt")) is True
+
+
+def test_ignore_missing_file(tmp_path):
+    matcher = IgnoreMatcher(tmp_path, [])
+    assert matcher.ignore("missing.txt") is True
+    assert matcher.ignore("missing.txt", check_content=False) is False
+
+
 @pytest.mark.parametrize(
     ("path", "size", "expected"),
     [
@@ -46,27 +74,36 @@ def test_ignore_paths(_mock_open, _mock_isfile, path, expected):
         ("test.py", 101, True),
     ],
 )
-@patch("os.path.isfile", return_value=True)
-@patch("builtins.open", return_value=MagicMock(read=StringIO("")))
-@patch("os.path.getsize")
-def test_ignore_large_files(
-    _mock_getsize,
-    _mock_open,
-    _mock_isfile,
-    path,
-    size,
-    expected,
-):
-    _mock_getsize.return_value = size
-    matcher = IgnoreMatcher("/tmp", [], ignore_size_threshold=100)
+def test_ignore_large_files(tmp_path, path, size, expected):
+    write_file(join(tmp_path, path), b"x" * size)
+    matcher = IgnoreMatcher(tmp_path, [], ignore_size_threshold=100)
     assert matcher.ignore(path) == expected
 
 
-@patch("os.path.isfile", return_value=True)
-@patch("builtins.open")
-def test_ignore_binary(_mock_open, _mock_isfile):
-    _mock_open.return_value.__enter__.return_value.read.side_effect = UnicodeDecodeError(
-        "utf-8", b"", 0, 1, "invalid start byte"
-    )
-    matcher = IgnoreMatcher("/tmp", [])
-    assert matcher.ignore("test.py") is True
+@pytest.mark.parametrize(
+    ("content", "expected"),
+    [
+        (b"hello world", False),
+        ("héllo wörld".encode("utf-8"), False),
+        (b"hello\0world", True),
+        (b"\xff\xfe\xfd", True),
+    ],
+)
+def test_ignore_binary(tmp_path, content, expected):
+    write_file(join(tmp_path, "test.py"), content)
+    matcher = IgnoreMatcher(tmp_path, [])
+    assert matcher.ignore("test.py") is expected
+
+
+def test_binary_check_is_cached(tmp_path):
+    write_file(join(tmp_path, "test.py"), b"hello world")
+    matcher = IgnoreMatcher(tmp_path, [])
+
+    with patch("builtins.open", wraps=open) as mock_open:
+        assert matcher.ignore("test.py") is False
+        assert matcher.ignore("test.py") is False
+        assert mock_open.call_count == 1
+
+        # The file is checked again once it changes
+        write_file(join(tmp_path, "test.py"), b"hello\0world, again")
+        assert matcher.ignore("test.py") is True
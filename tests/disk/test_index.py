@@ -0,0 +1,84 @@
+import os
+from os.path import join
+from time import time
+from unittest.mock import patch
+
+from core.disk.index import WorkspaceIndex
+from core.disk.vfs import LocalDiskVFS
+
+
+def write_old_file(path, content: str, age: int = 60):
+    with open(path, "w") as f:
+        f.write(content)
+    mtime = time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def test_index_lookup(tmp_path):
+    path = join(tmp_path, "test.txt")
+    write_old_file(path, "hello world")
+
+    index = WorkspaceIndex()
+    assert index.lookup("test.txt", os.lstat(path)) is None
+
+    index.update("test.txt", os.lstat(path), "abc")
+    assert index.lookup("test.txt", os.lstat(path)) == "abc"
+
+    # Same size, different modification time
+    write_old_file(path, "HELLO WORLD", age=30)
+    assert index.lookup("test.txt", os.lstat(path)) is None
+
+
+def test_index_skips_recently_modified_files(tmp_path):
+    path = join(tmp_path, "test.txt")
+    with open(path, "w") as f:
+        f.write("hello world")
+
+    index = WorkspaceIndex()
+    index.update("test.txt", os.lstat(path), "abc")
+    assert index.lookup("test.txt", os.lstat(path)) is None
+
+
+def test_index_persistence(tmp_path):
+    path = join(tmp_path, "test.txt")
+    write_old_file(path, "hello world")
+    index_path = join(tmp_path, ".gpt-pilot", "index.json")
+
+    index = WorkspaceIndex(index_path)
+    index.update("test.txt", os.lstat(path), "abc")
+    index.save()
+
+    assert WorkspaceIndex(index_path).lookup("test.txt", os.lstat(path)) == "abc"
+
+    with open(index_path, "w") as f:
+        f.write("garbage")
+    assert WorkspaceIndex(index_path).entries == {}
+
+
+def test_list_hashes_reads_only_changed_files(tmp_path):
+    write_old_file(join(tmp_path, "a.txt"), "file a")
+    write_old_file(join(tmp_path, "b.txt"), "file b")
+    index_path = join(tmp_path, ".gpt-pilot", "index.json")
+
+    vfs = LocalDiskVFS(tmp_path, index=WorkspaceIndex(index_path))
+    hashes = vfs.list_hashes()
+    assert hashes == {
+        "a.txt": vfs.hash_string("file a"),
+        "b.txt": vfs.hash_string("file b"),
+    }
+
+    write_old_file(join(tmp_path, "b.txt"), "file b, changed", age=30)
+
+    # A fresh VFS picks up the persisted index
+    vfs = LocalDiskVFS(tmp_path, index=WorkspaceIndex(index_path))
+    with patch("builtins.open", wraps=open) as mock_open:
+        hashes = vfs.list_hashes()
+
+    assert hashes["b.txt"] == vfs.hash_string("file b, changed")
+    opened = [os.path.basename(call.args[0]) for call in mock_open.call_args_list]
+    assert "a.txt" not in opened
+    assert "b.txt" in opened
+
+    os.remove(join(tmp_path, "a.txt"))
+    assert list(vfs.list_hashes()) == ["b.txt"]
+    assert "a.txt" not in vfs.index.entries
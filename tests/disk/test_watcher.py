@@ -0,0 +1,101 @@
+import os
+import shutil
+import sys
+from os.path import join
+from unittest.mock import patch
+
+import pytest
+
+from core.disk.ignore import IgnoreMatcher
+from core.disk.vfs import LocalDiskVFS
+from core.disk.watcher import InotifyWatcher, PollingWatcher, create_watcher
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on Linux")
+
+
+def write_file(path, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.mark.parametrize(
+    "watcher_class",
+    [pytest.param(InotifyWatcher, marks=linux_only), PollingWatcher],
+)
+def test_watcher_reports_changes(watcher_class, tmp_path):
+    write_file(join(tmp_path, "existing.txt"), "hello")
+    write_file(join(tmp_path, "node_modules", "lib.js"), "ignored")
+
+    watcher = watcher_class(tmp_path, IgnoreMatcher(tmp_path, ["node_modules"]))
+    watcher.start()
+    try:
+        assert watcher.changes() is None
+        assert watcher.changes() == set()
+
+        write_file(join(tmp_path, "new.txt"), "new")
+        write_file(join(tmp_path, "existing.txt"), "hello, world")
+        write_file(join(tmp_path, "subdir", "nested", "file.txt"), "nested")
+        write_file(join(tmp_path, "node_modules", "other.js"), "ignored")
+        assert watcher.changes() == {"new.txt", "existing.txt", "subdir/nested/file.txt"}
+
+        os.remove(join(tmp_path, "new.txt"))
+        assert watcher.changes() == {"new.txt"}
+    finally:
+        watcher.stop()
+
+
+@linux_only
+def test_inotify_watcher_rescans_after_directory_move(tmp_path):
+    write_file(join(tmp_path, "subdir", "file.txt"), "hello")
+
+    watcher = InotifyWatcher(tmp_path, IgnoreMatcher(tmp_path, []))
+    watcher.start()
+    try:
+        assert watcher.changes() is None
+
+        os.rename(join(tmp_path, "subdir"), join(tmp_path, "moved"))
+        assert watcher.changes() is None
+
+        write_file(join(tmp_path, "moved", "file.txt"), "changed")
+        assert watcher.changes() == {"moved/file.txt"}
+    finally:
+        watcher.stop()
+
+
+def test_create_watcher_falls_back_to_polling(tmp_path):
+    with patch.object(InotifyWatcher, "start", side_effect=OSError("no inotify")):
+        watcher = create_watcher(tmp_path, IgnoreMatcher(tmp_path, []))
+
+    assert isinstance(watcher, PollingWatcher)
+
+
+@linux_only
+def test_vfs_uses_watcher_changes(tmp_path):
+    write_file(join(tmp_path, "a.txt"), "file a")
+    write_file(join(tmp_path, "subdir", "b.txt"), "file b")
+    write_file(join(tmp_path, "subdir", "c.txt"), "file c")
+
+    matcher = IgnoreMatcher(tmp_path, ["*.log"])
+    vfs = LocalDiskVFS(tmp_path, ignore_matcher=matcher, watcher=create_watcher(tmp_path, matcher))
+    try:
+        assert vfs.list() == ["a.txt", "subdir/b.txt", "subdir/c.txt"]
+
+        with patch.object(vfs, "_walk_files") as mock_walk:
+            write_file(join(tmp_path, "a.txt"), "file a, changed")
+            write_file(join(tmp_path, "d.txt"), "file d")
+            write_file(join(tmp_path, "debug.log"), "ignored")
+            hashes = vfs.list_hashes()
+            assert hashes == {
+                "a.txt": vfs.hash_string("file a, changed"),
+                "d.txt": vfs.hash_string("file d"),
+                "subdir/b.txt": vfs.hash_string("file b"),
+                "subdir/c.txt": vfs.hash_string("file c"),
+            }
+
+            shutil.rmtree(join(tmp_path, "subdir"))
+            assert vfs.list() == ["a.txt", "d.txt"]
+
+        mock_walk.assert_not_called()
+    finally:
+        vfs.close()
@@ -0,0 +1,108 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from core.config import LLMConfig, LLMProvider
+from core.llm.base import BaseLLMClient
+from core.llm.cache import LLMResponseCache
+from core.llm.convo import Convo
+
+
+class FakeClient(BaseLLMClient):
+    provider = LLMProvider.OPENAI
+
+    def _init_client(self):
+        self.requests = []
+
+    async def _make_request(self, convo, temperature=None, json_mode=False):
+        self.requests.append(convo.messages[:])
+        return f"response {len(self.requests)}", 10, 5
+
+
+def test_make_key_depends_on_request_params():
+    messages = [{"role": "user", "content": "hello"}]
+    key = LLMResponseCache.make_key(LLMProvider.OPENAI, "gpt-4o", 0.0, False, messages)
+
+    assert key == LLMResponseCache.make_key(LLMProvider.OPENAI, "gpt-4o", 0.0, False, messages)
+    assert key != LLMResponseCache.make_key(LLMProvider.ANTHROPIC, "gpt-4o", 0.0, False, messages)
+    assert key != LLMResponseCache.make_key(LLMProvider.OPENAI, "gpt-4o-mini", 0.0, False, messages)
+    assert key != LLMResponseCache.make_key(LLMProvider.OPENAI, "gpt-4o", 0.5, False, messages)
+    assert key != LLMResponseCache.make_key(LLMProvider.OPENAI, "gpt-4o", 0.0, True, messages)
+    assert key != LLMResponseCache.make_key(
+        LLMProvider.OPENAI, "gpt-4o", 0.0, False, [{"role": "user", "content": "hi"}]
+    )
+
+
+def test_get_put():
+    cache = LLMResponseCache(":memory:", max_size=1000, max_age=60)
+    assert cache.get("key") is None
+
+    cache.put("key", "response", 10, 5)
+    assert cache.get("key") == ("response", 10, 5)
+
+
+def test_evicts_least_recently_used():
+    cache = LLMResponseCache(":memory:", max_size=20, max_age=60)
+
+    with patch("core.llm.cache.time", side_effect=[1, 2, 3, 4, 5, 6, 7]):
+        cache.put("a", "x" * 8, 1, 1)
+        cache.put("b", "x" * 8, 1, 1)
+        cache.get("a")
+        cache.put("c", "x" * 8, 1, 1)
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+
+
+def test_evicts_expired():
+    cache = LLMResponseCache(":memory:", max_size=1000, max_age=60)
+
+    with patch("core.llm.cache.time", return_value=100):
+        cache.put("key", "response", 10, 5)
+    with patch("core.llm.cache.time", return_value=200):
+        assert cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_client_uses_cache():
+    cache = LLMResponseCache(":memory:", max_size=1000, max_age=60)
+    stream_handler = AsyncMock()
+    llm = FakeClient(LLMConfig(model="gpt-4o", temperature=0.0), stream_handler=stream_handler, cache=cache)
+    convo = Convo("system").user("user")
+
+    response, req_log = await llm(convo)
+    assert response == "response 1"
+    assert req_log.cache_hit is False
+
+    response, req_log = await llm(convo)
+    assert response == "response 1"
+    assert req_log.cache_hit is True
+    assert req_log.response == "response 1"
+    assert req_log.prompt_tokens == 10
+    assert req_log.completion_tokens == 5
+    assert len(llm.requests) == 1
+    stream_handler.assert_any_await("response 1")
+
+    response, req_log = await llm(Convo("system").user("other"))
+    assert response == "response 2"
+    assert req_log.cache_hit is False
+
+
+@pytest.mark.asyncio
+async def test_client_ignores_unparseable_cached_response():
+    cache = LLMResponseCache(":memory:", max_size=1000, max_age=60)
+    llm = FakeClient(LLMConfig(model="gpt-4o", temperature=0.0), cache=cache)
+    convo = Convo("system").user("user")
+    key = cache.make_key(LLMProvider.OPENAI, "gpt-4o", 0.0, False, convo.messages)
+    cache.put(key, "garbage", 1, 1)
+
+    def parser(text):
+        if text == "garbage":
+            raise ValueError("Invalid response")
+        return text
+
+    response, req_log = await llm(convo, parser=parser)
+    assert response == "response 1"
+    assert req_log.cache_hit is False
+    assert cache.get(key) == ("response 1", 10, 5)
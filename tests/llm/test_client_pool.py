@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.config import LLMConfig, LLMProvider
+from core.llm.client_pool import LLMClientPool
+
+
+@pytest.mark.asyncio
+async def test_client_is_reused_for_same_connection_config():
+    factory = MagicMock()
+    cfg1 = LLMConfig(model="gpt-4o", temperature=0.0)
+    cfg2 = LLMConfig(model="gpt-4o-mini", temperature=0.5)
+
+    client1 = LLMClientPool.get(factory, cfg1, api_key="key")
+    client2 = LLMClientPool.get(factory, cfg2, api_key="key")
+
+    assert client1 is client2
+    factory.assert_called_once()
+    assert factory.call_args.kwargs["http_client"] is LLMClientPool.get_http_client(cfg1)
+
+    await LLMClientPool.close()
+
+
+@pytest.mark.asyncio
+async def test_separate_clients_for_different_endpoints():
+    factory = MagicMock(side_effect=lambda **kwargs: object())
+    cfg1 = LLMConfig(model="gpt-4o", base_url="http://one/")
+    cfg2 = LLMConfig(model="gpt-4o", base_url="http://two/")
+    cfg3 = LLMConfig(provider=LLMProvider.ANTHROPIC, model="claude", base_url="http://one/")
+
+    client1 = LLMClientPool.get(factory, cfg1, base_url=cfg1.base_url)
+    client2 = LLMClientPool.get(factory, cfg2, base_url=cfg2.base_url)
+    client3 = LLMClientPool.get(factory, cfg3, base_url=cfg3.base_url)
+
+    assert len({id(client1), id(client2), id(client3)}) == 3
+    assert LLMClientPool.get_http_client(cfg1) is not LLMClientPool.get_http_client(cfg2)
+
+    await LLMClientPool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_limits_and_close():
+    cfg = LLMConfig(model="gpt-4o", max_connections=3, max_keepalive_connections=2)
+    http_client = LLMClientPool.get_http_client(cfg)
+    pool = http_client._transport._pool
+    assert pool._max_connections == 3
+    assert pool._max_keepalive_connections == 2
+
+    await LLMClientPool.close()
+    assert http_client.is_closed
+    assert LLMClientPool.get_http_client(cfg) is not http_client
+
+    await LLMClientPool.close()
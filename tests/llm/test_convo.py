@@ -205,6 +205,41 @@ def test_convo_fork_with_multiple_messages():
     assert convo1.messages != convo2.messages
 
 
+def test_convo_fork_shares_messages_until_modified():
+    convo1 = Convo("Init").user("Hello!")
+    convo2 = convo1.fork()
+    assert convo2.messages is convo1.messages
+
+    convo2.assistant("Hi!")
+    assert convo2.messages is not convo1.messages
+    assert convo2.messages[0] is convo1.messages[0]
+    assert len(convo1.messages) == 2
+
+
+def test_snapshot_doesnt_change():
+    convo = Convo("Init").user("Hello!")
+    snapshot = convo.snapshot()
+    convo.assistant("Hi!")
+    assert len(snapshot) == 2
+    assert len(convo.messages) == 3
+
+
+def test_messages_are_immutable():
+    convo = Convo().user("Hello")
+    with pytest.raises(TypeError):
+        convo.messages[0]["content"] = "Changed"
+    with pytest.raises(TypeError):
+        convo.messages[0].update(content="Changed")
+
+
+def test_assigned_messages_are_immutable():
+    convo = Convo()
+    convo.messages = [{"role": "user", "content": "Hello"}]
+    assert convo.messages == [{"role": "user", "content": "Hello"}]
+    with pytest.raises(TypeError):
+        convo.messages[0]["content"] = "Changed"
+
+
 def test_after_with_empty_convos():
     convo1 = Convo()
     convo2 = Convo()
@@ -7,6 +7,7 @@ from core.config import LLMConfig
 from core.llm.base import APIError
 from core.llm.convo import Convo
 from core.llm.openai_client import OpenAIClient
+from core.llm.parser import JSONParser
 
 
 async def mock_response_generator(*content):
@@ -118,6 +119,39 @@ async def test_openai_parser_fails(mock_AsyncOpenAI):
         await llm(convo, parser=parser, max_retries=1)
 
 
+class MockStream:
+    def __init__(self, *content):
+        self.chunks = mock_response_generator(*content)
+        self.close = AsyncMock()
+
+    def __aiter__(self):
+        return self.chunks
+
+
+@pytest.mark.asyncio
+@patch("core.llm.openai_client.AsyncOpenAI")
+async def test_openai_aborts_malformed_json_stream(mock_AsyncOpenAI):
+    cfg = LLMConfig(model="gpt-4-turbo")
+    convo = Convo("system").user("user")
+
+    malformed = MockStream("Sure! ", "Here is ", "the JSON", ": {}")
+    valid = MockStream('{"a"', ": 1}")
+    stream = AsyncMock(side_effect=[malformed, valid])
+    mock_AsyncOpenAI.return_value.chat.completions.create = stream
+    stream_handler = AsyncMock()
+
+    llm = OpenAIClient(cfg, stream_handler=stream_handler)
+    response, req_log = await llm(convo, parser=JSONParser())
+
+    assert response == {"a": 1}
+    malformed.close.assert_awaited_once()
+    valid.close.assert_not_awaited()
+    # The rest of the malformed response wasn't consumed
+    assert stream_handler.await_args_list[0] == call(None)
+    assert req_log.messages[-2] == {"role": "assistant", "content": "Sure!"}
+    assert req_log.messages[-1]["content"].startswith("Error parsing response: Response doesn't start with JSON")
+
+
 @pytest.mark.asyncio
 @patch("core.llm.openai_client.AsyncOpenAI")
 async def test_openai_error_handler_success(mock_AsyncOpenAI):
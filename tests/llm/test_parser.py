@@ -1,10 +1,18 @@
 from enum import Enum
-from typing import Tuple
+from typing import Optional, Tuple
 
 import pytest
 from pydantic import BaseModel, field_validator
 
-from core.llm.parser import CodeBlockParser, EnumParser, JSONParser, MultiCodeBlockParser, OptionalCodeBlockParser
+from core.llm.parser import (
+    CodeBlockParser,
+    DescriptiveCodeBlockParser,
+    EnumParser,
+    JSONParser,
+    JSONStreamValidator,
+    MultiCodeBlockParser,
+    OptionalCodeBlockParser,
+)
 
 
 @pytest.mark.parametrize(
@@ -145,6 +153,80 @@ def test_parse_json_with_spec(input, expected):
         assert result.model_dump() == {**expected, "original_response": input.strip()}
 
 
+def test_parse_json_reuses_extended_model():
+    class TestModel(BaseModel):
+        name: str
+
+    parser = JSONParser(spec=TestModel)
+    first = parser('{"name": "John"}')
+    second = JSONParser(spec=TestModel)('{"name": "Jane"}')
+    assert type(first) is type(second)
+    assert type(first).__name__ == "ExtendedTestModel"
+    assert second.original_response == '{"name": "Jane"}'
+
+
+class StreamChild(BaseModel):
+    name: str
+    geo: Tuple[float, float]
+
+
+class StreamParent(BaseModel):
+    name: str
+    age: Optional[int] = None
+    children: list[StreamChild] = []
+
+
+def feed_in_chunks(validator: JSONStreamValidator, text: str, size: int = 3):
+    for i in range(0, len(text), size):
+        validator.feed(text[i : i + size])
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"name": "John", "children": [{"name": "Jane", "geo": [1.0, 2.0]}]}',
+        '  {"name": "John \\"Q\\" {[", "age": null}  ',
+        '```json\n{"name": "John"}\n```\nSome text after the block',
+        '```\n{"name": "John", "children": []}\n```',
+        '{"name": "John", "unknown": [1, {"x": "y"}]}',
+        '{"name": "John", "age": "5"}',
+        '{"name": "John", "children": [{"name": "Jane", "geo": [NaN, Infinity]}]}',
+        '{"name": "John", "children": [{"name": "Jane", "geo": [-Infinity, 1]}]}',
+    ],
+)
+def test_stream_consumer_accepts_valid_json(text):
+    parser = JSONParser(spec=StreamParent)
+    parser(text)
+    feed_in_chunks(parser.stream_consumer(), text)
+
+
+@pytest.mark.parametrize(
+    ("text", "error"),
+    [
+        ('Sure, here is the JSON: {"name": "John"}', "doesn't start with JSON"),
+        ('```python\nimport json\n{"name": "John"}', "doesn't start with JSON"),
+        ('["John"]', "should be a JSON object"),
+        ('{"name": "John", "children": {"name": "Jane"}}', "`children` should be a JSON array"),
+        ('{"name": "John", "children": [{"name": "Jane", "geo": 1.0}]}', "`children.0.geo` should be a JSON array"),
+        ('{"name": "John"} I hope this helps!', "unexpected text after the JSON"),
+        ('{"name": "John" "age": 3}', "unexpected character"),
+        ("{name: 'John'}", "instead of a key"),
+    ],
+)
+def test_stream_consumer_rejects_malformed_json(text, error):
+    parser = JSONParser(spec=StreamParent)
+    with pytest.raises(ValueError):
+        parser(text)
+
+    with pytest.raises(ValueError, match=error):
+        feed_in_chunks(parser.stream_consumer(), text)
+
+
+def test_stream_consumer_not_used_if_not_strict():
+    assert JSONParser(strict=False).stream_consumer() is None
+    assert JSONParser().stream_consumer() is not None
+
+
 def test_parse_json_schema():
     class TestModel(BaseModel):
         name: str
@@ -204,3 +286,23 @@ def test_enum_parser(input, expected):
 def test_optional_block_parser(input, expected):
     parser = OptionalCodeBlockParser()
     assert parser(input) == expected
+
+
+def test_descriptive_code_block_stream_emits_completed_blocks():
+    text = "Intro\nfile: a.js\n```js\nA\n```\n\nfile: b.js\n```\nB\n```\nDONE"
+    blocks = []
+    parser = DescriptiveCodeBlockParser(on_block=blocks.append)
+    stream = parser.stream_consumer()
+
+    stream.feed("Intro\nfile: a.js\n```js\nA\n```\n")
+    # Not emitted until something follows the closing fence
+    assert blocks == []
+    stream.feed("\nfile: b.js\n```\nB")
+    assert [block.content for block in blocks] == ["A"]
+    stream.feed("\n```\nDONE")
+
+    assert blocks == parser(text).blocks
+
+
+def test_descriptive_code_block_parser_without_callback_has_no_stream():
+    assert DescriptiveCodeBlockParser().stream_consumer() is None
@@ -0,0 +1,116 @@
+import datetime
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from core.config import LLMConfig, LLMProvider
+from core.llm.rate_limiter import RateLimitScheduler, parse_duration, parse_timestamp
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("1s", 1),
+        ("20ms", 0.02),
+        ("6m0s", 360),
+        ("2m59.56s", 179.56),
+        ("1h2m3s", 3723),
+        ("", None),
+        ("soon", None),
+    ],
+)
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == (pytest.approx(expected) if expected is not None else None)
+
+
+def test_parse_timestamp():
+    reset = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    assert parse_timestamp(reset.isoformat()) == pytest.approx(30, abs=1)
+    assert parse_timestamp("invalid") is None
+
+
+def test_scheduler_is_shared_per_provider_and_key():
+    cfg1 = LLMConfig(model="gpt-4o", api_key="key1")
+    cfg2 = LLMConfig(model="gpt-4o-mini", api_key="key1")
+    cfg3 = LLMConfig(model="gpt-4o", api_key="key2")
+    cfg4 = LLMConfig(provider=LLMProvider.ANTHROPIC, model="claude", api_key="key1")
+
+    assert RateLimitScheduler.for_config(cfg1) is RateLimitScheduler.for_config(cfg2)
+    assert RateLimitScheduler.for_config(cfg1) is not RateLimitScheduler.for_config(cfg3)
+    assert RateLimitScheduler.for_config(cfg1) is not RateLimitScheduler.for_config(cfg4)
+
+
+@pytest.mark.asyncio
+async def test_acquire_without_budget_info_doesnt_wait():
+    scheduler = RateLimitScheduler("test")
+    with patch("core.llm.rate_limiter.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        await scheduler.acquire(1000)
+    mock_sleep.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@patch("core.llm.rate_limiter.monotonic", return_value=100.0)
+async def test_acquire_waits_for_openai_token_budget(mock_monotonic):
+    scheduler = RateLimitScheduler("test")
+    scheduler.update(
+        {
+            "x-ratelimit-limit-requests": "100",
+            "x-ratelimit-remaining-requests": "99",
+            "x-ratelimit-reset-requests": "600ms",
+            "x-ratelimit-limit-tokens": "10000",
+            "x-ratelimit-remaining-tokens": "1000",
+            "x-ratelimit-reset-tokens": "9s",
+        }
+    )
+    assert scheduler.tokens.rate == pytest.approx(1000)
+
+    async def advance(seconds):
+        mock_monotonic.return_value += seconds
+
+    with patch("core.llm.rate_limiter.asyncio.sleep", side_effect=advance) as mock_sleep:
+        # Fits in the remaining budget
+        await scheduler.acquire(800)
+        mock_sleep.assert_not_awaited()
+
+        # Needs 1800 tokens more than is remaining, at 1000 tokens/s
+        await scheduler.acquire(2000)
+        assert mock_monotonic.return_value == pytest.approx(101.8)
+
+
+@pytest.mark.asyncio
+@patch("core.llm.rate_limiter.monotonic", return_value=100.0)
+async def test_acquire_waits_for_anthropic_request_budget(mock_monotonic):
+    reset = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(seconds=60)
+    scheduler = RateLimitScheduler("test")
+    scheduler.update(
+        {
+            "anthropic-ratelimit-requests-limit": "50",
+            "anthropic-ratelimit-requests-remaining": "0",
+            "anthropic-ratelimit-requests-reset": reset.isoformat(),
+        }
+    )
+
+    async def advance(seconds):
+        mock_monotonic.return_value += seconds
+
+    with patch("core.llm.rate_limiter.asyncio.sleep", side_effect=advance):
+        await scheduler.acquire()
+
+    # 50 requests per 60 seconds means one request every 1.2 seconds
+    assert mock_monotonic.return_value == pytest.approx(101.2, abs=0.1)
+
+
+@pytest.mark.asyncio
+@patch("core.llm.rate_limiter.monotonic", return_value=100.0)
+async def test_pause(mock_monotonic):
+    scheduler = RateLimitScheduler("test")
+    scheduler.pause(12)
+
+    async def advance(seconds):
+        mock_monotonic.return_value += seconds
+
+    with patch("core.llm.rate_limiter.asyncio.sleep", side_effect=advance) as mock_sleep:
+        await scheduler.acquire()
+
+    assert mock_monotonic.return_value == pytest.approx(112)
+    assert mock_sleep.await_count == 3
@@ -0,0 +1,140 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.config import ContextOverflowPolicy, LLMConfig, LLMProvider
+from core.llm.base import APIError, BaseLLMClient
+from core.llm.convo import Convo
+from core.llm.tokens import DEFAULT_CHARS_PER_TOKEN, TokenCounter, get_context_window, trim_messages
+
+
+class FakeClient(BaseLLMClient):
+    provider = LLMProvider.ANTHROPIC
+
+    def _init_client(self):
+        self.requests = []
+
+    async def _make_request(self, convo, temperature=None, json_mode=False):
+        self.requests.append(convo.messages[:])
+        return "response", 10, 5
+
+
+@pytest.fixture(autouse=True)
+def fresh_token_counters():
+    # Calibration from fake responses would otherwise leak between tests
+    with patch.dict(TokenCounter._counters, clear=True):
+        yield
+
+
+def test_get_context_window():
+    assert get_context_window("gpt-4o-2024-05-13") == 128_000
+    assert get_context_window("gpt-4-0613") == 8_192
+    assert get_context_window("claude-3-5-sonnet-20240620") == 200_000
+    assert get_context_window("some-local-model") is None
+
+
+def test_count_messages_estimate():
+    counter = TokenCounter(LLMProvider.ANTHROPIC)
+    assert not counter.exact
+
+    messages = [{"role": "user", "content": "x" * 35}]
+    # 35 chars at 3.5 chars per token + message and reply overhead
+    assert counter.count_messages(messages) == 11 + 3 + 3
+
+
+def test_count_text_is_cached():
+    counter = TokenCounter(LLMProvider.ANTHROPIC)
+    counter.count_text("hello world")
+    counter.count_text("hello world")
+    assert counter.count_text.cache_info().hits == 1
+
+
+def test_uses_tiktoken_for_openai():
+    tokenizer = MagicMock()
+    tokenizer.encode.return_value = [1, 2, 3]
+
+    with patch("tiktoken.get_encoding", return_value=tokenizer) as mock_get_encoding:
+        counter = TokenCounter(LLMProvider.OPENAI)
+        assert counter.exact
+        assert counter.count_text("hello world") == 3
+        assert counter.count_text("something else") == 3
+
+    mock_get_encoding.assert_called_once_with("cl100k_base")
+
+
+def test_falls_back_to_estimate_if_tiktoken_fails():
+    with patch("tiktoken.get_encoding", side_effect=ConnectionError("offline")):
+        counter = TokenCounter(LLMProvider.GROQ)
+        assert not counter.exact
+        assert counter.count_text("x" * 35) == 11
+
+
+def test_calibrate():
+    counter = TokenCounter(LLMProvider.ANTHROPIC)
+    messages = [{"role": "user", "content": "x" * 4000}]
+    before = counter.count_messages(messages)
+
+    # Provider says the prompt was only 1000 tokens, so there are more chars per token
+    counter.calibrate(messages, 1000)
+    assert counter.chars_per_token == pytest.approx(0.8 * DEFAULT_CHARS_PER_TOKEN + 0.2 * 4)
+    assert counter.count_messages(messages) < before
+
+    # Short prompts are ignored
+    counter.calibrate([{"role": "user", "content": "hi"}], 100)
+    assert counter.chars_per_token == pytest.approx(0.8 * DEFAULT_CHARS_PER_TOKEN + 0.2 * 4)
+
+
+def test_trim_messages_keeps_task_and_last_message():
+    counter = TokenCounter(LLMProvider.ANTHROPIC)
+    messages = [
+        {"role": "system", "content": "system prompt"},
+        {"role": "user", "content": "task description"},
+        {"role": "assistant", "content": "a" * 350},
+        {"role": "user", "content": "b" * 350},
+        {"role": "assistant", "content": "c" * 350},
+        {"role": "user", "content": "last question"},
+    ]
+
+    trimmed = trim_messages(messages, counter, 250)
+    assert trimmed == [messages[0], messages[1], messages[3], messages[4], messages[5]]
+
+    # Dropping a user message doesn't leave its reply dangling
+    trimmed = trim_messages(messages, counter, 150)
+    assert trimmed == [messages[0], messages[1], messages[5]]
+
+    assert trim_messages(messages, counter, 10) is None
+
+
+@pytest.mark.asyncio
+async def test_oversized_prompt_fails_without_calling_llm():
+    client = FakeClient(LLMConfig(provider=LLMProvider.ANTHROPIC, model="claude-3-haiku-20240307"))
+    convo = Convo("system").user("x" * 1_000_000)
+
+    with pytest.raises(APIError):
+        await client(convo)
+
+    assert client.requests == []
+
+
+@pytest.mark.asyncio
+async def test_oversized_prompt_is_trimmed():
+    client = FakeClient(
+        LLMConfig(
+            provider=LLMProvider.ANTHROPIC,
+            model="claude-3-haiku-20240307",
+            context_overflow=ContextOverflowPolicy.TRIM,
+        )
+    )
+    convo = Convo("system").user("task")
+    for i in range(10):
+        convo.assistant(f"{i}" * 100_000)
+        convo.user("continue")
+
+    response, request_log = await client(convo)
+
+    assert response == "response"
+    sent = client.requests[0]
+    assert sent[:2] == convo.messages[:2]
+    assert sent[-1] == convo.messages[-1]
+    assert len(sent) < len(convo.messages)
+    assert request_log.messages == sent
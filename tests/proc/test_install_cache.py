@@ -0,0 +1,143 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from core.proc.install_cache import InstallCache
+
+
+def make_project(root, deps: str = '{"a": "1.0.0"}'):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, "package.json"), "w") as f:
+        f.write(f'{{"dependencies": {deps}}}')
+
+
+def make_node_modules(root, version: str = "1.0.0"):
+    pkg = os.path.join(root, "node_modules", "a")
+    os.makedirs(os.path.join(pkg, "lib"))
+    os.makedirs(os.path.join(root, "node_modules", ".bin"))
+    with open(os.path.join(pkg, "package.json"), "w") as f:
+        f.write(f'{{"name": "a", "version": "{version}"}}')
+    with open(os.path.join(pkg, "lib", "index.js"), "w") as f:
+        f.write("module.exports = 42;\n")
+    with open(os.path.join(pkg, "cli.js"), "w") as f:
+        f.write("#!/usr/bin/env node\n")
+    os.chmod(os.path.join(pkg, "cli.js"), 0o755)
+    os.symlink("../a/cli.js", os.path.join(root, "node_modules", ".bin", "a"))
+    with open(os.path.join(root, "package-lock.json"), "w") as f:
+        f.write(f'{{"lockfileVersion": 3, "version": "{version}"}}')
+
+
+def read(*path):
+    with open(os.path.join(*path)) as f:
+        return f.read()
+
+
+def test_make_key(tmp_path):
+    assert InstallCache.make_key(tmp_path, "v20.0.0") is None
+
+    make_project(tmp_path)
+    key = InstallCache.make_key(tmp_path, "v20.0.0")
+    assert key == InstallCache.make_key(tmp_path, "v20.0.0")
+    assert key != InstallCache.make_key(tmp_path, "v22.0.0")
+
+    with open(tmp_path / "package-lock.json", "w") as f:
+        f.write("{}")
+    assert key != InstallCache.make_key(tmp_path, "v20.0.0")
+
+
+@pytest.mark.parametrize("hardlink", [True, False])
+def test_store_restore(tmp_path, hardlink):
+    cache = InstallCache(str(tmp_path / "cache"), max_size=1024 * 1024, max_age=60, hardlink=hardlink)
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    make_project(src)
+    make_node_modules(src)
+    make_project(dst)
+
+    assert cache.restore("key", str(dst)) is False
+    cache.store("key", str(src))
+    assert cache.restore("key", str(dst)) is True
+
+    assert read(dst, "node_modules", "a", "lib", "index.js") == "module.exports = 42;\n"
+    assert os.readlink(dst / "node_modules" / ".bin" / "a") == "../a/cli.js"
+    assert os.access(dst / "node_modules" / ".bin" / "a", os.X_OK)
+    assert read(dst, "package-lock.json") == read(src, "package-lock.json")
+
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "stored": 1,
+        "evicted": 0,
+        "trees": 1,
+        "size": sum(
+            os.path.getsize(src / path)
+            for path in [
+                "package-lock.json",
+                "node_modules/a/package.json",
+                "node_modules/a/lib/index.js",
+                "node_modules/a/cli.js",
+            ]
+        ),
+    }
+
+
+def test_restored_files_are_independent_of_the_cache(tmp_path):
+    cache = InstallCache(str(tmp_path / "cache"), max_size=1024 * 1024, max_age=60)
+    src = tmp_path / "src"
+    make_project(src)
+    make_node_modules(src)
+    cache.store("key", str(src))
+
+    # Modifying a restored file (eg. patching a package) doesn't affect the other projects
+    assert cache.restore("key", str(tmp_path / "dst1")) is True
+    index_js = tmp_path / "dst1" / "node_modules" / "a" / "lib" / "index.js"
+    os.chmod(index_js, 0o644)
+    with open(index_js, "w") as f:
+        f.write("patched")
+
+    assert cache.restore("key", str(tmp_path / "dst2")) is True
+    assert read(tmp_path, "dst2", "node_modules", "a", "lib", "index.js") == "module.exports = 42;\n"
+
+
+def test_eviction_removes_unused_objects(tmp_path):
+    cache = InstallCache(str(tmp_path / "cache"), max_size=150, max_age=60)
+    for version in ["1.0.0", "2.0.0"]:
+        root = tmp_path / version
+        make_project(root)
+        make_node_modules(root, version)
+        cache.store(version, str(root))
+
+    # The files shared with the second tree are kept
+    stats = cache.stats()
+    assert stats["trees"] == 1
+    assert stats["evicted"] == 1
+    assert stats["size"] <= 150
+    assert cache.restore("1.0.0", str(tmp_path / "dst1")) is False
+    assert cache.restore("2.0.0", str(tmp_path / "dst2")) is True
+    assert read(tmp_path, "dst2", "node_modules", "a", "package.json") == '{"name": "a", "version": "2.0.0"}'
+
+    objects = [name for _, _, files in os.walk(tmp_path / "cache" / "objects") for name in files]
+    assert len(objects) == 4
+
+
+@pytest.mark.asyncio
+async def test_install(tmp_path):
+    cache = InstallCache(str(tmp_path / "cache"), max_size=1024 * 1024, max_age=60)
+
+    async def run_command(cmd, **kwargs):
+        if cmd == "npm install":
+            make_node_modules(pm.root_dir)
+        return 0, "v20.0.0\n", ""
+
+    for name in ["first", "second"]:
+        pm = MagicMock(root_dir=str(tmp_path / name), run_command=AsyncMock(side_effect=run_command))
+        make_project(pm.root_dir)
+        assert await cache.install(pm) == 0
+        assert read(pm.root_dir, "node_modules", "a", "lib", "index.js") == "module.exports = 42;\n"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    # npm install was only run for the first project
+    assert [call.args[0] for call in pm.run_command.call_args_list] == ["node --version"]
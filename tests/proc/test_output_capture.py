@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from core.config import ProcessOutputConfig
+from core.proc.output_capture import OutputCapture, excerpt
+
+
+def test_excerpt():
+    assert excerpt("hello", 5) == "hello"
+
+    text = "a" * 10 + "b" * 80 + "c" * 30
+    assert excerpt(text, 40) == "a" * 10 + "\n[... 80 characters omitted ...]\n" + "c" * 30
+
+
+def test_capture_short_output():
+    capture = OutputCapture(head_size=10, tail_size=20)
+    capture.write("hello ")
+    capture.write("world")
+
+    assert capture.size == 11
+    assert capture.dropped == 0
+    assert capture.getvalue() == "hello world"
+    assert capture.excerpt(100) == "hello world"
+    assert capture.read(3, 5) == "lo wo"
+    assert capture.tail(8) == "lo world"
+
+
+def test_capture_keeps_head_and_tail():
+    capture = OutputCapture(head_size=10, tail_size=20)
+    text = "".join(f"{i:04d}" for i in range(1000))
+    for i in range(0, len(text), 7):
+        capture.write(text[i : i + 7])
+
+    assert capture.size == 4000
+    assert capture.dropped == 3970
+    assert capture.getvalue() == text[:10] + "\n[... 3970 characters omitted ...]\n" + text[-20:]
+    assert capture.excerpt(16) == text[:4] + "\n[... 3984 characters omitted ...]\n" + text[-12:]
+
+    assert capture.read(2, 5) == text[2:7]
+    assert capture.read(5, 100) == text[5:10]
+    assert capture.read(3990, 100) == text[3990:]
+    assert capture.tail(5) == text[-5:]
+    assert capture.tail(1000) == text[-20:]
+    with pytest.raises(ValueError):
+        capture.read(100, 5)
+
+
+def test_capture_spill(tmp_path):
+    config = ProcessOutputConfig(
+        head_size=10,
+        tail_size=20,
+        spill=True,
+        spill_dir=str(tmp_path),
+        spill_segment_size=100,
+        spill_max_size=1000,
+    )
+    capture = OutputCapture.from_config(config)
+    text = "".join(f"{i:03d}é\n" for i in range(500))
+    for i in range(0, len(text), 33):
+        capture.write(text[i : i + 33])
+
+    assert capture.spilled
+    (spill_dir,) = os.listdir(tmp_path)
+    assert len(os.listdir(tmp_path / spill_dir)) == 10
+
+    # The output in the last 10 segments is read from disk, the head from memory
+    assert capture.read(1634, 150) == text[1634:1784]
+    assert capture.read(2000, 1000) == text[2000:]
+    assert capture.read(3, 4) == text[3:7]
+    assert capture.tail(50) == text[-50:]
+    assert capture.tail(5000) == text[-1000:]
+    with pytest.raises(ValueError):
+        capture.read(500, 10)
+
+    capture.close()
+    assert os.listdir(tmp_path) == []
+    assert capture.tail(5000) == text[-20:]
+    assert capture.getvalue() == text[:10] + "\n[... 2470 characters omitted ...]\n" + text[-20:]
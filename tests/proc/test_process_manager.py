@@ -1,11 +1,13 @@
+import asyncio
 from os import getenv, makedirs
 from os.path import join
-from sys import platform
+from sys import executable, platform
 from unittest.mock import patch
 
 import pytest
 from psutil import Process
 
+from core.config import get_config
 from core.proc.process_manager import LocalProcess, ProcessManager
 
 
@@ -54,7 +56,6 @@ async def test_local_process_wait(tmp_path):
 
 
 @pytest.mark.asyncio
-@patch("core.proc.process_manager.WATCHER_IDLE_INTERVAL", 0.1)
 async def test_process_manager_run_command_capture_stdout(tmp_path):
     pm = ProcessManager(root_dir=tmp_path)
 
@@ -71,7 +72,6 @@ async def test_process_manager_run_command_capture_stdout(tmp_path):
 
 
 @pytest.mark.asyncio
-@patch("core.proc.process_manager.WATCHER_IDLE_INTERVAL", 0.1)
 async def test_process_manager_run_command_capture_stderr(tmp_path):
     pm = ProcessManager(root_dir=tmp_path)
 
@@ -88,7 +88,6 @@ async def test_process_manager_run_command_capture_stderr(tmp_path):
 
 
 @pytest.mark.asyncio
-@patch("core.proc.process_manager.WATCHER_IDLE_INTERVAL", 0.1)
 async def test_process_manager_start_list_terminate(tmp_path):
     cmd = "timeout 5" if platform == "win32" else "sleep 5"
     cwd = join("some", "sub", "directory")
@@ -115,7 +114,6 @@ async def test_process_manager_start_list_terminate(tmp_path):
 
 
 @pytest.mark.asyncio
-@patch("core.proc.process_manager.WATCHER_IDLE_INTERVAL", 0.1)
 async def test_watcher(tmp_path):
     stdout = ""
     stderr = ""
@@ -148,3 +146,63 @@ async def test_watcher(tmp_path):
     assert lp.stderr == ""
 
     await pm.stop_watcher()
+
+
+@pytest.mark.asyncio
+@patch("core.proc.process_manager.READ_CHUNK_SIZE", 3)
+async def test_local_process_decodes_split_characters(tmp_path):
+    cmd = f"{executable} -c \"import sys; sys.stdout.buffer.write('aé€😀'.encode() * 100)\""
+    lp = await LocalProcess.start(cmd, cwd=tmp_path, env={"PATH": getenv("PATH")}, bg=False)
+
+    await lp.wait()
+    await lp.wait_for_output(1)
+    out, err = await lp.read_output(0)
+
+    assert out == "aé€😀" * 100
+    assert err == ""
+    assert lp.stdout == out
+    assert lp.output_closed
+
+
+@pytest.mark.asyncio
+async def test_process_manager_run_command_large_output(tmp_path):
+    chunks = []
+
+    async def output_handler(out, err):
+        chunks.append(out)
+
+    pm = ProcessManager(root_dir=tmp_path, output_handler=output_handler)
+    cmd = f"{executable} -c \"import sys; sys.stdout.write(('x' * 99 + chr(10)) * 100000)\""
+    return_code, stdout, stderr = await pm.run_command(cmd)
+
+    await pm.stop_watcher()
+
+    config = get_config().process_output
+    output = "".join(chunks)
+    assert return_code == 0
+    assert len(output) == 10_000_000
+    assert stdout.startswith(output[: config.head_size])
+    assert stdout.endswith(output[-config.tail_size :])
+    assert f"[... {10_000_000 - config.head_size - config.tail_size} characters omitted ...]" in stdout
+    assert stderr == ""
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(platform == "win32", reason="Uses a POSIX shell")
+async def test_exit_handler_with_open_output(tmp_path):
+    exited = asyncio.Event()
+
+    async def exit_handler(process):
+        exited.set()
+
+    pm = ProcessManager(root_dir=tmp_path, exit_handler=exit_handler)
+
+    # The child process keeps the output open after the shell exits
+    lp = await pm.start_process("sleep 2 & echo hello", bg=True)
+    await asyncio.wait_for(exited.wait(), 1)
+
+    assert not lp.is_running
+    assert not lp.output_closed
+    assert lp.stdout.strip() == "hello"
+
+    await pm.stop_watcher()
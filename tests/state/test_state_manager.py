@@ -1,9 +1,12 @@
+import asyncio
 import os
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from sqlalchemy import select
 
-from core.config import FileSystemConfig
+from core.config import FileSystemConfig, HistoryConfig
+from core.db.models import ProjectState
 from core.state.state_manager import StateManager
 
 
@@ -128,6 +131,86 @@ async def test_commit(mock_get_config, testmanager):
     assert next_state.steps == [{"id": "step-012"}]
 
 
+@pytest.mark.asyncio
+@patch("core.state.state_manager.get_config")
+async def test_commit_in_background(mock_get_config, testmanager):
+    mock_get_config.return_value.fs.type = "memory"
+    sm = StateManager(testmanager)
+    project = await sm.create_project("test")
+    project_id = project.id
+    await sm.commit()
+
+    sm.next_state.epics = [{"id": "epic-1"}]
+    state = await sm.commit(wait=False)
+
+    # The next state can be worked on while the state is being written
+    assert sm.current_state is state
+    assert sm.next_state.prev_state is state
+    sm.next_state.epics.append({"id": "epic-2"})
+    await sm.save_file("test.txt", "Hello, world!")
+
+    # Commits are written in order
+    next_state = await sm.commit(wait=False)
+    state_ids = (state.id, next_state.id)
+    await sm.wait_for_commit()
+
+    await sm.rollback()
+    sm2 = StateManager(testmanager)
+    loaded = await sm2.load_project(project_id=project_id)
+    assert (loaded.prev_state_id, loaded.id) == state_ids
+    assert loaded.epics == [{"id": "epic-1"}, {"id": "epic-2"}]
+    assert (await sm2.get_file_by_path("test.txt")).content.content == "Hello, world!"
+
+
+@pytest.mark.asyncio
+@patch("core.state.state_manager.get_config")
+async def test_commit_in_background_error(mock_get_config, testmanager):
+    mock_get_config.return_value.fs.type = "memory"
+    sm = StateManager(testmanager)
+    await sm.create_project("test")
+    await sm.commit()
+
+    sm.commit_with_retry = AsyncMock(side_effect=RuntimeError("disk full"))
+    await sm.commit(wait=False)
+
+    # The error is raised by the next operation that needs the database
+    with pytest.raises(RuntimeError, match="disk full"):
+        await sm.save_file("test.txt", "Hello, world!")
+
+
+@pytest.mark.asyncio
+@patch("core.state.state_manager.get_config")
+async def test_commit_compacts_history(mock_get_config, testmanager):
+    mock_get_config.return_value.fs.type = "memory"
+    mock_get_config.return_value.history = HistoryConfig(keep_last=2, compact_interval=4)
+    sm = StateManager(testmanager)
+    project = await sm.create_project("test")
+    project_id = project.id
+
+    for i in range(9):
+        await sm.save_file("test.txt", f"version {i}")
+        await sm.commit(wait=False)
+    await sm.wait_for_commit()
+
+    # Compacted at steps 4 and 8, and the project can still be worked on
+    result = await sm.current_session.execute(
+        select(ProjectState.step_index).where(ProjectState.step_index <= 9).order_by(ProjectState.step_index)
+    )
+    assert result.scalars().all() == [1, 7, 8, 9]
+    for content in ["new version", "final version"]:
+        await sm.save_file("test.txt", content)
+        await sm.commit()
+
+    await sm.rollback()
+    loaded = await sm.load_project(project_id=project_id)
+    assert loaded.step_index == 11
+    assert (await sm.get_file_by_path("test.txt")).content.content == "final version"
+    await sm.rollback()
+
+    # Steps 7-9 are no longer among the last ones
+    assert await sm.compact_history(project_id) == 3
+
+
 @pytest.mark.asyncio
 @patch("core.state.state_manager.get_config")
 async def test_save_file(mock_get_config, testmanager):
@@ -161,6 +244,28 @@ async def test_save_file(mock_get_config, testmanager):
     assert file.content.content == "Hello, world!"
 
 
+@pytest.mark.asyncio
+@patch("core.state.state_manager.get_config")
+async def test_save_files(mock_get_config, testmanager):
+    mock_get_config.return_value.fs.type = "memory"
+    sm = StateManager(testmanager)
+    await sm.create_project("test")
+    await sm.commit()
+
+    await sm.save_files(
+        {"a.txt": "content a", "b.txt": "content b", "c.txt": "content a"},
+        metadata={"b.txt": {"description": "File B"}},
+    )
+    await sm.commit()
+
+    assert sm.file_system.read("b.txt") == "content b"
+    files = {f.path: f for f in sm.current_state.files}
+    assert files["a.txt"].content_id == files["c.txt"].content_id
+    assert files["b.txt"].meta == {"description": "File B"}
+    assert (await sm.get_file_by_path("b.txt")).content.content == "content b"
+    assert sm.current_state.modified_files == {"a.txt": "", "b.txt": "", "c.txt": ""}
+
+
 @pytest.mark.asyncio
 @patch("core.state.state_manager.get_config")
 async def test_importing_changed_files_to_db(mock_get_config, tmpdir, testmanager):
@@ -220,3 +325,30 @@ async def test_restoring_files_from_db(mock_get_config, tmpdir, testmanager):
         assert open(os.path.join(tmpdir, "test1", "file1.txt")).read() == "this is the content 1"
         assert open(os.path.join(tmpdir, "test1", "file2.txt")).read() == "this is the content 2"
         assert open(os.path.join(tmpdir, "test1", "file3.txt")).read() == "this is the content 3"
+
+
+@pytest.mark.asyncio
+@patch("core.state.state_manager.get_config")
+async def test_concurrent_wait_for_commit(mock_get_config, testmanager):
+    mock_get_config.return_value.fs.type = "memory"
+    sm = StateManager(testmanager)
+    await sm.create_project("test")
+    await sm.commit()
+
+    written = asyncio.Event()
+
+    async def commit_with_retry():
+        await asyncio.sleep(0.01)
+        written.set()
+        raise RuntimeError("disk full")
+
+    sm.commit_with_retry = commit_with_retry
+    await sm.commit(wait=False)
+
+    async def waiter():
+        await sm.wait_for_commit()
+
+    # All the callers wait until the state is written, and all of them get the error
+    results = await asyncio.gather(waiter(), waiter(), waiter(), return_exceptions=True)
+    assert written.is_set()
+    assert [str(result) for result in results] == ["disk full"] * 3